@@ -0,0 +1,222 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Arbitration of the access to serial ports / buses that are shared by several threads (e.g. the heater block controller thread and the main thread of curvetrace).
+
+The drivers get the arbiter of their port with get_arbiter(port), and hold the bus while talking to the device:
+	with get_arbiter(port):
+		...
+or, with a max. waiting time (RuntimeError if the bus is not available in time):
+	with get_arbiter(port).hold(timeout):
+		...
+Threads waiting for the bus are served in the order of their requests. Coroutines (see psu_io.py) hold the bus as asyncio tasks, and wait for it with await acquire_async(timeout). The arbiter keeps statistics about the contention of the bus (see bus_arbiter.stats).
+'''
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+import pypsucurvetrace.clock as clock
+
+POLL_INTERVAL = 0.001 # polling interval of tasks waiting for the bus (s)
+
+
+def _holder():
+	# the asyncio task if called from a coroutine, the thread otherwise:
+	try:
+		task = asyncio.current_task()
+	except RuntimeError:
+		task = None # no event loop running in this thread
+	if task is None:
+		return threading.current_thread()
+	return task
+
+
+class bus_arbiter:
+	'''
+	Exclusive access to a shared bus, with fair (first come, first served) queuing of the waiting threads and tasks. The thread or asyncio task holding the bus may acquire it again (the bus is released after the matching number of releases).
+	'''
+
+	def __init__(self, name=''):
+		'''
+		bus_arbiter(name='')
+		name: name of the bus / port (string, used in messages)
+		'''
+
+		self.name = name
+		self._cond = threading.Condition(threading.Lock())
+		self._queue = deque() # tickets of the waiting threads, in the order of their requests
+		self._owner = None    # thread or task holding the bus
+		self._depth = 0       # number of nested acquisitions by the owner
+
+		# contention statistics:
+		self.stats = { 'acquisitions': 0, 'contended': 0, 'timeouts': 0, 'wait_time': 0.0, 'max_wait_time': 0.0 }
+
+
+	def acquire(self, timeout=None):
+		'''
+		ok = bus_arbiter.acquire(timeout=None)
+
+		Wait until the bus is available, and take it.
+
+		INPUT:
+		timeout: max. time to wait for the bus (s), or None to wait forever
+
+		OUTPUT:
+		ok: True if the bus was acquired, False if the timeout expired
+		'''
+
+		me = _holder()
+		with self._cond:
+			if self._owner is me:
+				self._depth += 1
+				return True
+
+			t0 = clock.monotonic()
+			ticket = object()
+			self._queue.append(ticket)
+			contended = self._owner is not None or self._queue[0] is not ticket
+			ok = self._cond.wait_for(lambda: self._owner is None and self._queue[0] is ticket, timeout)
+			self._queue.remove(ticket)
+			dt = clock.monotonic() - t0
+
+			if contended:
+				self.stats['contended'] += 1
+				self.stats['wait_time'] += dt
+				self.stats['max_wait_time'] = max(self.stats['max_wait_time'], dt)
+			if not ok:
+				self.stats['timeouts'] += 1
+				self._cond.notify_all() # the next thread in the queue may now be first
+				return False
+
+			self._owner = me
+			self._depth = 1
+			self.stats['acquisitions'] += 1
+			return True
+
+
+	async def acquire_async(self, timeout=None):
+		'''
+		ok = await bus_arbiter.acquire_async(timeout=None)
+
+		Wait until the bus is available without blocking the asyncio event loop, and take it for the current task.
+
+		INPUT:
+		timeout: max. time to wait for the bus (s), or None to wait forever
+
+		OUTPUT:
+		ok: True if the bus was acquired, False if the timeout expired
+		'''
+
+		me = _holder()
+		loop = asyncio.get_running_loop()
+		with self._cond:
+			if self._owner is me:
+				self._depth += 1
+				return True
+			t0 = clock.monotonic()
+			t_end = None if timeout is None else loop.time() + timeout
+			ticket = object()
+			self._queue.append(ticket)
+			contended = self._owner is not None or self._queue[0] is not ticket
+
+		# the holder may be a task of the same event loop, so poll instead of waiting on the condition:
+		while True:
+			with self._cond:
+				ok = self._owner is None and self._queue[0] is ticket
+				if ok or ((t_end is not None) and (loop.time() >= t_end)):
+					self._queue.remove(ticket)
+					dt = clock.monotonic() - t0
+					if contended:
+						self.stats['contended'] += 1
+						self.stats['wait_time'] += dt
+						self.stats['max_wait_time'] = max(self.stats['max_wait_time'], dt)
+					if not ok:
+						self.stats['timeouts'] += 1
+						self._cond.notify_all() # the next thread in the queue may now be first
+						return False
+					self._owner = me
+					self._depth = 1
+					self.stats['acquisitions'] += 1
+					return True
+			try:
+				await asyncio.sleep(POLL_INTERVAL)
+			except BaseException:
+				# task cancelled while waiting: give up the place in the queue
+				with self._cond:
+					self._queue.remove(ticket)
+					self._cond.notify_all()
+				raise
+
+
+	def release(self):
+		'''
+		bus_arbiter.release()
+
+		Release the bus (after the last of nested acquisitions), and hand it over to the next waiting thread.
+		'''
+
+		with self._cond:
+			if self._owner is not _holder():
+				raise RuntimeError('Cannot release bus ' + self.name + ' (not held by this thread / task).')
+			self._depth -= 1
+			if self._depth == 0:
+				self._owner = None
+				self._cond.notify_all()
+
+
+	@contextmanager
+	def hold(self, timeout=None):
+		'''
+		with bus_arbiter.hold(timeout=None):
+			...
+
+		Hold the bus within the with block. A RuntimeError is raised if the bus is not available within the timeout (s, None: wait forever).
+		'''
+
+		if not self.acquire(timeout):
+			raise RuntimeError('Timeout waiting for access to ' + self.name + ' (held by another thread).')
+		try:
+			yield self
+		finally:
+			self.release()
+
+
+	def __enter__(self):
+		self.acquire()
+		return self
+
+
+	def __exit__(self, *args):
+		self.release()
+
+
+# arbiters of the ports in use (port -> arbiter):
+_arbiters = {}
+_arbiters_lock = threading.Lock()
+
+
+def get_arbiter(port):
+	'''
+	a = get_arbiter(port)
+
+	Return the arbiter of the given port / bus (the same object for all drivers using this port).
+	'''
+
+	with _arbiters_lock:
+		if port not in _arbiters:
+			_arbiters[port] = bus_arbiter(str(port))
+		return _arbiters[port]
@@ -0,0 +1,161 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Clock used by the sweep engine (PSU settling and readings, idling, heaterblock waits, timing instrumentation).
+The system clock is used by default. In simulation runs (VIRTUAL PSUs only), a virtual clock can be used instead, which advances the time without waiting, so that a full sweep with pre-heating and idling finishes in a fraction of a second.
+
+Usage:
+	import pypsucurvetrace.clock as clock
+	t0 = clock.time()
+	clock.sleep(0.5)
+	await clock.sleep_async(0.5) # in coroutines (see psu_io.py)
+'''
+
+import asyncio
+import threading
+import time as _time
+
+
+class system_clock:
+	'''
+	Wall-clock time (time module).
+	'''
+
+	# look up the time module functions at every call (so that they can be patched at run time, e.g. in tests):
+	def time(self):
+		return _time.time()
+
+	def monotonic(self):
+		return _time.monotonic()
+
+	def sleep(self, seconds):
+		if seconds > 0.0:
+			_time.sleep(seconds)
+
+	async def sleep_async(self, seconds):
+		await asyncio.sleep(max(seconds, 0.0))
+
+
+class virtual_clock:
+	'''
+	Simulated time: sleep() advances the time right away, without waiting.
+	'''
+
+	def __init__(self, t0=0.0, tick=1E-3):
+		'''
+		virtual_clock(t0=0.0, tick=1E-3)
+		t0: start time (s)
+		tick: time increment at each reading of the clock (s). This makes sure that polling loops without sleep() calls time out as with the system clock.
+		'''
+
+		self._t = float(t0)
+		self._t0 = float(t0)
+		self._tick = float(tick)
+		self._lock = threading.Lock() # the clock is shared by the worker threads of the PSUs
+
+	def time(self):
+		with self._lock:
+			self._t += self._tick
+			return self._t
+
+	def monotonic(self):
+		return self.time()
+
+	def sleep(self, seconds):
+		if seconds > 0.0:
+			with self._lock:
+				self._t += seconds
+
+	async def sleep_async(self, seconds):
+		self.sleep(seconds)
+		await asyncio.sleep(0) # let the other tasks run
+
+	def elapsed(self):
+		'''
+		t = elapsed()
+
+		Simulated time since the clock was started (s).
+		'''
+
+		with self._lock:
+			return self._t - self._t0
+
+
+# clock in use:
+_clock = system_clock()
+
+
+def get_clock():
+	'''
+	c = get_clock()
+
+	Return the clock in use.
+	'''
+
+	return _clock
+
+
+def set_clock(c):
+	'''
+	previous = set_clock(c)
+
+	Use clock c (system_clock or virtual_clock object) from now on, and return the clock used before.
+	'''
+
+	global _clock
+	previous = _clock
+	_clock = c
+	return previous
+
+
+def time():
+	'''
+	t = time()
+
+	Current time of the clock in use (s, see time.time()).
+	'''
+
+	return _clock.time()
+
+
+def monotonic():
+	'''
+	t = monotonic()
+
+	Monotonic time of the clock in use (s, see time.monotonic()).
+	'''
+
+	return _clock.monotonic()
+
+
+def sleep(seconds):
+	'''
+	sleep(seconds)
+
+	Wait for the given number of seconds on the clock in use (see time.sleep()).
+	'''
+
+	_clock.sleep(seconds)
+
+
+async def sleep_async(seconds):
+	'''
+	await sleep_async(seconds)
+
+	Wait for the given number of seconds on the clock in use without blocking the asyncio event loop (see asyncio.sleep()).
+	'''
+
+	await _clock.sleep_async(seconds)
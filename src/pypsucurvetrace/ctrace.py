@@ -17,7 +17,7 @@ import argparse
 import configparser
 import datetime
 import numpy as np
-import time
+import os
 ### import logging
 import matplotlib.pyplot as plt
 import multiprocessing
@@ -25,8 +25,11 @@ from pathlib import Path
 
 import pypsucurvetrace.powersupply as powersupply
 import pypsucurvetrace.heaterblock as heaterblock
-from pypsucurvetrace.curvetrace_tools import error_and_exit, say_hello, printit, connect_PSU, configure_test_PSU, configure_idle_PSU, do_idle, start_new_logfile, format_PSU_reading, get_logger
+import pypsucurvetrace.clock as clock
+from pypsucurvetrace.curvetrace_tools import error_and_exit, say_hello, printit, connect_PSU, connect_virtual_DUT, configure_test_PSU, configure_idle_PSU, configure_test_settings, do_idle, start_new_logfile, resume_logfile, format_PSU_reading, get_logger, concurrent_PSU_reader
 from pypsucurvetrace.plot_curves import curve_plotter
+from pypsucurvetrace.timing import phase_timer
+from pypsucurvetrace.sweep import coarse_indices, refine_indices, upward_sweep_length, limit_predictor, sweep_journal, current_limit, compile_sweep_plan, estimate_duration
 
 
 # set up logger:
@@ -70,6 +73,660 @@ def cleanup_exit(PSU1, PSU2, HEATER, queue, plt_proc):
 	plt_proc.join()
 
 
+def over_limit(predictor, PSU1, V1, margin):
+###################################################
+# check if PSU1 current is predicted to hit limit #
+###################################################
+
+	# skip points if prediction is enabled and the predicted current, increased by the margin for the prediction error, exceeds the limit
+	# (the point is then not set at the PSU, so that the DUT does not run into the limiter):
+	if margin is None:
+		return False
+	I = predictor.predict(V1)
+	if I is None:
+		return False
+	return I * (1.0 + margin) > current_limit(PSU1, V1)
+
+
+def measure_point(PSU1, PSU2, HEATER, reader, V1, V2, I2LIM, N_rep, T_idle, AVGFUNCTION, pulsed=False, terminal_output=True, timer=None):
+#######################################
+# measure one point of the I/V curves #
+#######################################
+
+	# init measurement values		
+	V1MEAS = []
+	I1MEAS = []
+	LIMIT1 = 0
+	V2MEAS = []
+	I2MEAS = []
+	LIMIT2 = 0
+	T_HB   = []
+	T_PULSE = []
+
+	# timing instrumentation (disabled if no timer is given):
+	if timer is None:
+		timer = phase_timer()
+	timer.start_point()
+
+	# measurement loop:
+	for i in range(N_rep):
+
+		# if heaterblock is configured and turned on:
+		# make sure the heaterblock temperature is within tolerance before doing the measurement,
+		# allow turning off the DUT to prevent (excessive) heat input from DUT to heaterblock
+		with timer.phase('heater wait'):
+			HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=PSU1, terminal_output=terminal_output)
+
+		# idle (if configured)
+		if T_idle > 0.0:
+			with timer.phase('idle'):
+				do_idle(PSU1,PSU2,HEATER,T_idle,terminal_output=terminal_output)
+
+			# return to required PSU2 output:
+			if PSU2.CONFIGURED and not pulsed:
+				with timer.phase('set PSU2'):
+					PSU2.setCurrent(I2LIM,False)
+					PSU2.setVoltage(V2,True)
+
+		# Determine PSU1 current limit:
+		I1LIM = current_limit(PSU1, V1)
+
+		# start of pulse (pulsed mode): switch from idle to PSU2 test conditions
+		# (the pulse duration includes the settle times of PSU2 and PSU1, the DUT is away from idle conditions from here on)
+		t0 = clock.time()
+		if pulsed and PSU2.CONFIGURED:
+			with timer.phase('set PSU2'):
+				PSU2.setCurrent(I2LIM,False)
+				PSU2.setVoltage(V2,True)
+
+		# set up PSU1 measurement conditions:
+		if PSU1.CONFIGURED:
+			with timer.phase('set PSU1'):
+				PSU1.setCurrent(I1LIM,False) # set current limit at PSU1
+				PSU1.setVoltage(V1,True) # set voltage at PSU1
+
+		# read PSU output voltages and currents (PSU1 and PSU2 concurrently):
+		if pulsed:
+			# fastest possible reading, then return to idle conditions right away:
+			with timer.phase('read'):
+				r = reader.read(N=1)
+			T_PULSE.append(clock.time()-t0) # end of pulse: PSUs are returned to idle conditions right away
+			with timer.phase('idle'):
+				for p in [PSU1, PSU2]:
+					if p.CONFIGURED:
+						p.setCurrent(p.TEST_IIDLE,False)
+						p.setVoltage(p.TEST_VIDLE,False)
+		else:
+			with timer.phase('read'):
+				r = reader.read()
+
+		V1MEAS.append(r[0][0])
+		I1MEAS.append(r[0][1])
+		V2MEAS.append(r[1][0])
+		I2MEAS.append(r[1][1])
+		if r[0][2] == 'CC':
+			LIMIT1 = LIMIT1 + 1
+		if r[1][2] == 'CC':
+			LIMIT2 = LIMIT2 + 1
+
+		# Determine heaterblock temperature:
+		T_HB.append(HEATER.get_temperature())
+
+	# Determine median or mean of repeated readings:
+	if AVGFUNCTION == 'MEDIAN':
+		avg = np.median
+	else:
+		avg = np.mean
+	V1MEAS = avg(V1MEAS)
+	I1MEAS = avg(I1MEAS)
+	V2MEAS = avg(V2MEAS)
+	I2MEAS = avg(I2MEAS)
+	try:
+		T_HB = avg(T_HB)
+	except:
+		T_HB = None
+		pass
+
+	# Check current limits (some PSUs are not very careful with this):
+	if I1MEAS > I1LIM:
+		LIMIT1 = 1
+	if I2MEAS > I2LIM:
+		LIMIT2 = 1
+
+	# Parse limiter flags:
+	if LIMIT1 > 0:
+		LIMIT1 = 1
+	else:
+		LIMIT1 = 0
+	if LIMIT2 > 0:
+		LIMIT2 = 1
+	else:
+		LIMIT2 = 0
+
+	# data line (with PSU polarities applied):
+	u = [ V1*PSU1.TEST_POLARITY, I1LIM*PSU1.TEST_POLARITY, V1MEAS*PSU1.TEST_POLARITY, I1MEAS*PSU1.TEST_POLARITY, LIMIT1, V2*PSU2.TEST_POLARITY, I2LIM*PSU2.TEST_POLARITY, V2MEAS*PSU2.TEST_POLARITY, I2MEAS*PSU2.TEST_POLARITY, LIMIT2, T_HB ]
+	if pulsed:
+		# pulse duration (time away from idle conditions, including the settle times of the PSUs):
+		u.append(avg(T_PULSE))
+
+	timer.end_point(V1, V2)
+
+	return u, (LIMIT1 > 0) or (LIMIT2 > 0)
+
+
+def format_point(u, PSU1, PSU2):
+###############################################
+# format data line for terminal and data file #
+###############################################
+
+	try:
+		T_HB = "{:.2f}".format(u[10])
+	except:
+		T_HB = "NA"
+		pass
+
+	t =  format_PSU_reading(u[0], PSU1.VRESSET) + ' ' + \
+	     format_PSU_reading(u[1], PSU1.IRESSET) + ' ' + \
+	     format_PSU_reading(u[2], PSU1.VRESREAD) + ' ' + \
+	     format_PSU_reading(u[3], PSU1.IRESREAD) + ' ' + \
+	     "{:1d}".format(u[4])                   + ' ' + \
+	     format_PSU_reading(u[5], PSU2.VRESSET) + ' ' + \
+	     format_PSU_reading(u[6], PSU2.IRESSET) + ' ' + \
+	     format_PSU_reading(u[7], PSU2.VRESREAD) + ' ' + \
+	     format_PSU_reading(u[8], PSU2.IRESREAD) + ' ' + \
+	     "{:1d}".format(u[9])                   + ' ' + \
+	     T_HB
+	if len(u) > 11:
+		t = t + ' ' + "{:.3f}".format(u[11])
+	return t
+
+
+def check_test_setup(PSU1, PSU2, configDUT, settings, logger=logger, interactive=True):
+###################################################################
+# configure idle conditions and check / fix the PSU test settings #
+###################################################################
+
+	T_idle    = settings['IDLESECS']
+	T_preheat = settings['PREHEATSECS']
+	PULSED    = settings['PULSED']
+
+	# set up idle conditions (for pre-heat or idle between readings)
+	if (T_idle > 0.0) or (T_preheat > 0.0) or PULSED:
+		if PSU1.CONFIGURED:
+			if 'PSU1' in configDUT:
+				PSU1 = configure_idle_PSU (PSU1,configDUT['PSU1'],interactive)
+			else:
+				PSU1 = configure_idle_PSU (PSU1,None,interactive)
+		if PSU2.CONFIGURED:
+			if 'PSU2' in configDUT:
+				PSU2 = configure_idle_PSU (PSU2,configDUT['PSU2'],interactive)
+			else:
+				PSU2 = configure_idle_PSU (PSU2,None,interactive)
+
+		if PSU1.CONNECTED and PSU2.CONNECTED:
+			if (not PSU1.TEST_VIDLE_MAX == PSU1.TEST_VIDLE_MIN) and (not PSU2.TEST_VIDLE_MAX == PSU2.TEST_VIDLE_MIN):
+				raise ValueError('Both PSUs are configured with variable idle voltages. This cannot work.')
+
+	# check voltage / power / current limits (and fix where possible and necessary):
+	logger.info('Checking voltage / current settings...')
+	for p in [PSU1,PSU2]:
+		if p.CONNECTED:
+			if p.TEST_VSTART < p.VMIN:
+				logger.info('  ' + p.LABEL + ': Adjusting start voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
+				p.TEST_VSTART = p.VMIN
+			if p.TEST_VSTART > p.VMAX:
+				logger.info('  ' + p.LABEL + ': Adjusting start voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
+				p.TEST_VSTART = p.VMAX
+			if p.TEST_VEND < p.VMIN:
+				logger.info('  ' + p.LABEL + ': Adjusting end voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
+				p.TEST_VEND = p.VMIN
+			if p.TEST_VEND > p.VMAX:
+				logger.info('  ' + p.LABEL + ': Adjusting end voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
+				p.TEST_VEND = p.VMAX
+			if p.TEST_VEND == p.TEST_VSTART:
+				# logger.info('  ' + p.LABEL + ': Same start and end voltage, test will run at fixed voltage (' + str(p.TEST_VSTART) + ' V).')
+				p.TEST_VSTEP = 0
+			if abs(p.TEST_VEND-p.TEST_VSTART) < p.VRESSET:
+				logger.info('  ' + p.LABEL + ': Test voltage range is less than voltage setting resolution of the PSU. Test will run at fixed voltage (' + str(p.TEST_VSTART) + ' V).')
+				p.TEST_VSTEP = 0
+				p.TEST_VEND = p.TEST_VSTART
+			if p.TEST_VSTEP > 0.0:
+				if p.TEST_VSTEP > abs(p.TEST_VEND-p.TEST_VSTART):
+					p.TEST_VSTEP = abs(p.TEST_VEND-p.TEST_VSTART)
+					logger.info('  ' + p.LABEL + ': Voltage step size exceeds test voltage range. Adjusting step size to ' + str(p.TEST_VSTEP) + ' V.')
+				if p.TEST_VSTEP < p.VRESSET:
+					logger.info('  ' + p.LABEL + ': Voltage step size is less than PSU resolution of voltage setting. Adjusting step size to ' + str(p.VRESSET) + ' V.')
+					p.TEST_VSTEP = p.VRESSET
+				if p.TEST_VSTEP/p.VRESSET < p.VRESSET:
+					logger.info('  ' + p.LABEL + ': Voltage step size is less than PSU resolution of voltage setting. Adjusting step size to ' + str(p.VRESSET) + ' V.')
+					p.TEST_VSTEP = p.VRESSET
+				if not ( p.TEST_VSTEP / p.VRESSET == round(p.TEST_VSTEP / p.VRESSET) ):
+					u = p.TEST_VSTEP
+					p.TEST_VSTEP = round(p.TEST_VSTEP / p.VRESSET) * p.VRESSET
+					logger.info('  ' + p.LABEL + ': Voltage step size (' + str(u) + ' V) is not consistent with PSU resolution of voltage setting. Adjusting step size to ' + str(p.TEST_VSTEP) + ' V.')
+			if p.TEST_VSTEP_MAX is not None:
+				if p is PSU2:
+					logger.info('  ' + p.LABEL + ': Adaptive voltage steps are only supported for PSU1. Ignoring VSTEP_MAX.')
+					p.TEST_VSTEP_MAX = None
+				elif (p.TEST_VSTEP == 0) or (p.TEST_VSTEP_MAX <= p.TEST_VSTEP):
+					logger.info('  ' + p.LABEL + ': Max. voltage step size is not larger than the voltage step size. Using fixed voltage steps.')
+					p.TEST_VSTEP_MAX = None
+				elif not ( p.TEST_VSTEP_MAX / p.TEST_VSTEP == round(p.TEST_VSTEP_MAX / p.TEST_VSTEP) ):
+					u = p.TEST_VSTEP_MAX
+					p.TEST_VSTEP_MAX = round(p.TEST_VSTEP_MAX / p.TEST_VSTEP) * p.TEST_VSTEP
+					logger.info('  ' + p.LABEL + ': Max. voltage step size (' + str(u) + ' V) is not a multiple of the voltage step size. Adjusting max. step size to ' + str(p.TEST_VSTEP_MAX) + ' V.')
+			if p.TEST_ILIMIT > p.IMAX:
+				logger.info('  ' + p.LABEL + ': Adjusting current limit to max. value possible with the power supply (' + str(p.IMAX) + ' A).')
+				p.TEST_ILIMIT = p.IMAX
+			if p.TEST_PLIMIT > p.PMAX:
+				logger.info('  ' + p.LABEL + ': Adjusting power limit to max. value possible with the power supply (' + str(p.PMAX) + ' W).')
+				p.TEST_PLIMIT = p.PMAX
+			if (T_idle > 0.0) or (T_preheat > 0.0) or PULSED:
+				if p.TEST_PIDLELIMIT > p.PMAX:
+					logger.info('  ' + p.LABEL + ': Adjusting idle power limit to max. value possible with the power supply (' + str(p.PMAX) + ' W).')
+					p.TEST_PIDLELIMIT = p.PMAX
+				if p.TEST_VIDLE > p.VMAX:
+					logger.info('  ' + p.LABEL + ': Adjusting idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
+					p.TEST_VIDLE = p.VMAX
+				if p.TEST_VIDLE < p.VMIN:
+					logger.info('  ' + p.LABEL + ': Adjusting idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
+					p.TEST_VIDLE = p.VMIN
+				if p.TEST_VIDLE_MAX > p.VMAX:
+					logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
+					p.TEST_VIDLE_MAX = p.VMAX
+				if p.TEST_VIDLE_MAX < p.VMIN:
+					logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
+					p.TEST_VIDLE_MAX = p.VMIN
+				if p.TEST_VIDLE_MIN > p.VMAX:
+					logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
+					p.TEST_VIDLE_MIN = p.VMAX
+				if p.TEST_VIDLE_MIN < p.VMIN:
+					logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
+					p.TEST_VIDLE_MIN = p.VMIN
+				if p.TEST_VIDLE_MIN > p.TEST_VIDLE_MAX:
+					logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to ' + str(p.TEST_VIDLE) + ' V).')
+					p.TEST_VIDLE_MIN = p.TEST_VIDLE
+				if p.TEST_VIDLE_MAX < p.TEST_VIDLE_MIN:
+					logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to ' + str(p.TEST_VIDLE) + ' V).')
+					p.TEST_VIDLE_MAX = p.TEST_VIDLE
+				if p.TEST_IIDLE > p.IMAX:
+					logger.info('  ' + p.LABEL + ': Adjusting idle current to max. value possible with the power supply (' + str(p.IMAX) + ' A).')
+					p.TEST_IIDLE = p.IMAX
+				if p.TEST_VIDLE * p.TEST_IIDLE > p.PMAX:
+					p.TEST_IIDLE = p.PMAX / p.TEST_VIDLE
+					logger.info('  ' + p.LABEL + ': Idle current limit is higher than PSU power limit (' + str(p.PMAX) + ' W). Adjusting idle current limit to ' + str(p.TEST_IIDLE) + ' A.' )
+
+	if settings['SERPENTINE'] and (PSU1.TEST_VSTEP_MAX is not None):
+		logger.info('  Serpentine sweep order is not supported with adaptive voltage steps. Using upward sweeps.')
+		settings['SERPENTINE'] = False
+
+	return PSU1, PSU2
+
+
+def r2control_text(R2CONTROL):
+#################################
+# R2CONTROL line of data header #
+#################################
+
+	u = 'NOT SPECIFIED'
+	if R2CONTROL is not None:
+		u = str(R2CONTROL) + ' Ohm'
+	return '* R2CONTROL = ' + ' ' + u
+
+
+def journal_plan(V_steps, PSU1, PSU2, settings):
+######################################################
+# test parameters recorded in the checkpoint journal #
+######################################################
+
+	return {
+		'V1': [ float(v) for v in V_steps[0] ],
+		'V2': [ float(v) for v in V_steps[1] ],
+		'VSTEP_MAX': PSU1.TEST_VSTEP_MAX,
+		'ILIMIT': [ PSU1.TEST_ILIMIT, PSU2.TEST_ILIMIT ],
+		'PLIMIT': [ PSU1.TEST_PLIMIT, PSU2.TEST_PLIMIT ],
+		'POLARITY': [ PSU1.TEST_POLARITY, PSU2.TEST_POLARITY ],
+		'NREP': settings['NREP'],
+		'IDLESECS': settings['IDLESECS'],
+		'PULSED': settings['PULSED']
+	}
+
+
+def write_header(logfile, samplename, settings, quick_mode=False, resumed=False):
+########################################
+# write header / column labels to file #
+########################################
+
+	if resumed:
+		printit('* Resuming interrupted test run (the data below continue the sweep above)',logfile,'%', terminal_output=False)
+	printit('* Sample: ' + samplename,logfile,'%', terminal_output=False)
+	printit('* Date / time: ' + str(datetime.datetime.now()),logfile,'%', terminal_output=False)
+	printit (r2control_text(settings['R2CONTROL']),logfile,'%', terminal_output=False)
+	if quick_mode:
+		printit ('* Running in quick mode (pre-heating only, no curve tracing)',logfile,'%', terminal_output=False)
+	else:
+		printit ('Column 1:  PSU1 nominal voltage setting (V)',logfile,'%', terminal_output=False)
+		printit ('Column 2:  PSU1 nominal current setting (A)',logfile,'%', terminal_output=False)
+		printit ('Column 3:  PSU1 voltage measurement (V)',logfile,'%', terminal_output=False)
+		printit ('Column 4:  PSU1 current measurement (I)',logfile,'%', terminal_output=False)
+		printit ('Column 5:  PSU1 limiter flag',logfile,'%', terminal_output=False)
+		printit ('Column 6:  PSU2 nominal voltage setting (V)',logfile,'%', terminal_output=False)
+		printit ('Column 7:  PSU2 nominal current setting (A)',logfile,'%', terminal_output=False)
+		printit ('Column 8:  PSU2 voltage measurement (V)',logfile,'%', terminal_output=False)
+		printit ('Column 9:  PSU2 current measurement (I)',logfile,'%', terminal_output=False)
+		printit ('Column 10: PSU2 limiter flag',logfile,'%', terminal_output=False)
+		printit ('Column 11: Heaterblock temperature (°C)',logfile,'%', terminal_output=False)
+		if settings['PULSED']:
+			printit ('Column 12: Pulse duration (s), time away from idle conditions including the settle times of the PSUs',logfile,'%', terminal_output=False)
+
+
+def trace_curves(PSU1, PSU2, HEATER, reader, sweep_plan, settings, logfile, journal, queue=None, terminal_output=True, progress=None, logger=logger, timer=None):
+################################################
+# run the curve sweeps given by the sweep plan #
+################################################
+
+	N_rep         = settings['NREP']
+	T_idle        = settings['IDLESECS']
+	AVGFUNCTION   = settings['AVGFUNCTION']
+	PULSED        = settings['PULSED']
+	LIMIT_PREDICT = settings['LIMIT_PREDICT']
+	SERPENTINE    = settings['SERPENTINE']
+
+	# voltage step values:
+	V_steps = [ sweep_plan['V1'][sweep_plan['j2'] == 0] , sweep_plan['V2'][sweep_plan['j1'] == 0] ]
+
+	N_done = 0 # number of points written to the data file
+	def write_point(j2, j1, u, terminal):
+		# send data to curve plotter (if any), write data file and journal, report progress:
+		nonlocal N_done
+		if queue is not None:
+			queue.put(u)
+		printit(format_point(u, PSU1, PSU2), logfile, terminal_output=terminal)
+		journal.add_point(j2, j1)
+		N_done = N_done + 1
+		if progress is not None:
+			progress(N_done, len(sweep_plan))
+
+	logger.info('Curve tracing started...')
+
+	if PULSED:
+		# start from idle conditions (each reading is a pulse from the idle conditions to the test conditions and back):
+		for p in [PSU1, PSU2]:
+			if p.CONFIGURED:
+				p.setCurrent(p.TEST_IIDLE,False)
+				p.setVoltage(p.TEST_VIDLE,True)
+
+	downward = False # direction of the V1 sweep of the next curve (serpentine sweep order)
+	j_top = len(V_steps[0])-1 # highest V1 index of the last curve
+	predictor = limit_predictor() # prediction of PSU1 current (to skip points beyond the current / power limit)
+	N_skip = 0 # number of curves ended early by the limit prediction
+
+	for j2, V2 in enumerate(V_steps[1]):
+	# outer loop (V2)
+
+		if journal.curve_done(j2):
+			if SERPENTINE:
+				downward = not downward # keep the sweep direction of the remaining curves as in an uninterrupted run
+			continue # curve was completed before the run was interrupted
+
+		predictor.new_curve()
+
+		# get rid of numerical imprecisions (truncate values to voltage resolution of PSU):
+		# V2 = round(V2/PSU2.VRESSET) * PSU2.VRESSET
+
+		limit = 0 # number of CC events at a given step
+		limit_max = 2 # max. number of CC events before breaking from the loop
+
+
+		# PSU2 current limit (from the sweep plan):
+		I2LIM = sweep_plan['I2LIM'][sweep_plan['j2'] == j2][0]
+
+		if PSU2.CONFIGURED and not PULSED:
+
+			# set PSU2 voltage + current (pulsed mode: PSU2 is set at the start of each pulse):
+			PSU2.setCurrent(I2LIM,False)
+			PSU2.setVoltage(V2,True)
+
+		if (PSU1.TEST_VSTEP_MAX is None) and (not downward):
+			# fixed voltage steps:
+			for j1, V1 in enumerate(V_steps[0]):
+			# inner loop (V1)
+
+				if journal.point_done(j2, j1):
+					continue # point was measured before the run was interrupted
+
+				if over_limit(predictor, PSU1, V1, LIMIT_PREDICT):
+					N_skip = N_skip + 1
+					j1 = j1 - 1 # this step is not set at the PSU, the last curve ends at the step before
+					break # skip the remaining V1 steps and continue with the next V2 step
+
+				u, is_limited = measure_point(PSU1, PSU2, HEATER, reader, V1, V2, I2LIM, N_rep, T_idle, AVGFUNCTION, PULSED, terminal_output, timer)
+				predictor.add(V1, u[3]*PSU1.TEST_POLARITY, is_limited)
+
+				# Check if current / power limit has been reached:
+				if not is_limited:
+					limit = 0 # reset counter
+				else:
+					limit = limit + 1
+					if limit >= limit_max:
+						break # break out of the inner loop (V1 steps) and continue with the next V2 step
+
+				# send data to curve plotter thread, print results to terminal and data file:
+				write_point(j2, j1, u, terminal_output)
+
+			j_top = max(j1, 0)
+
+		elif PSU1.TEST_VSTEP_MAX is None:
+			# fixed voltage steps, serpentine sweep order: continue from the end point of the last curve.
+			# First extend the sweep upwards until the limit is reached (if the limit is higher than on the last curve), then sweep down.
+			rows = {} # measured data, indexed by the position of V1 in the V1 steps
+			def measure_row(j):
+				u, is_limited = measure_point(PSU1, PSU2, HEATER, reader, V_steps[0][j], V2, I2LIM, N_rep, T_idle, AVGFUNCTION, PULSED, terminal_output, timer)
+				predictor.add(V_steps[0][j], u[3]*PSU1.TEST_POLARITY, is_limited)
+				if terminal_output:
+					print(format_point(u, PSU1, PSU2))
+				rows[j] = (u, is_limited)
+				return is_limited
+
+			for j in range(j_top, len(V_steps[0])):
+				if over_limit(predictor, PSU1, V_steps[0][j], LIMIT_PREDICT):
+					N_skip = N_skip + 1
+					break # stop extending the sweep upwards
+				if not measure_row(j):
+					limit = 0 # reset counter
+				else:
+					limit = limit + 1
+					if limit >= limit_max or j == j_top:
+						break # stop extending the sweep upwards (if the start point is limited, the limit onset is below it anyway)
+
+			j_low = j_top # lowest V1 index measured so far
+			limited = [ j for j in rows if rows[j][1] ]
+			if len(limited) > 0:
+				# the limit is already reached at the start point of this curve (the limit onset moved to lower V1 than on the last curve).
+				# Don't sweep down through the limited points: search the onset downwards with growing steps, so that only a few points run into the limiter...
+				j_lim = min(limited) # lowest limited point
+				# the PSU limits the current at this point, so that its voltage reading is below the limit onset: start the search below this voltage
+				V_CC = rows[j_lim][0][2]*PSU1.TEST_POLARITY
+				j = max([ k for k in range(j_lim) if V_steps[0][k] <= V_CC ], default=j_lim-1)
+				step = 1
+				while j >= 0:
+					if not measure_row(j):
+						break
+					j_lim = j
+					step = 2*step
+					j = max(j_lim - step, 0) if j_lim > 0 else -1
+				j_low = j
+
+				# ... then sweep up from the last point below the limit until the limit is reached (as an upward sweep would do):
+				limit = 0
+				for j in range(j_low+1, len(V_steps[0])):
+					if j not in rows:
+						if over_limit(predictor, PSU1, V_steps[0][j], LIMIT_PREDICT):
+							N_skip = N_skip + 1
+							break
+						measure_row(j)
+					if not rows[j][1]:
+						limit = 0 # reset counter
+					else:
+						limit = limit + 1
+						if limit >= limit_max:
+							break
+
+			for j in range(j_low-1, -1, -1):
+				measure_row(j)
+
+			# send data to curve plotter thread and data file (in order of V1 steps, same points as with an upward sweep; the points above a gap left by the onset search are not used):
+			idx = []
+			while len(idx) in rows:
+				idx.append(len(idx))
+			for j in idx[:upward_sweep_length([ rows[j][1] for j in idx ], limit_max)]:
+				if journal.point_done(j2, j):
+					continue # point was written before the run was interrupted
+				write_point(j2, j, rows[j][0], False)
+
+		else:
+			# adaptive voltage steps: start with coarse steps, then refine where the I1 curve bends or runs into the limiter
+			rows = {} # measured data, indexed by the position of V1 in the (fine) V1 steps
+			beyond = [] # V1 steps predicted to exceed the limit (not measured, they bound the refinement towards the limit onset like limited points)
+			k = int(round(PSU1.TEST_VSTEP_MAX / PSU1.TEST_VSTEP))
+			for j in coarse_indices(len(V_steps[0]), k):
+				if over_limit(predictor, PSU1, V_steps[0][j], LIMIT_PREDICT):
+					N_skip = N_skip + 1
+					beyond.append(j)
+					break # skip the remaining coarse steps
+				u, is_limited = measure_point(PSU1, PSU2, HEATER, reader, V_steps[0][j], V2, I2LIM, N_rep, T_idle, AVGFUNCTION, PULSED, terminal_output, timer)
+				predictor.add(V_steps[0][j], u[3]*PSU1.TEST_POLARITY, is_limited)
+				if not is_limited:
+					limit = 0 # reset counter
+				else:
+					limit = limit + 1
+					if limit >= limit_max:
+						break # skip the remaining coarse steps
+				if terminal_output:
+					print(format_point(u, PSU1, PSU2))
+				rows[j] = (u, is_limited)
+
+			while len(rows) + len(beyond) > 1:
+				idx = sorted(list(rows) + beyond)
+				new_idx = refine_indices(idx, [ rows[j][0][3] if j in rows else 0.0 for j in idx ], [ rows[j][1] if j in rows else True for j in idx ], PSU1.TEST_ADAPTIVE_ITOL)
+				if len(new_idx) == 0:
+					break # no further refinement required
+				for j in new_idx:
+					if over_limit(predictor, PSU1, V_steps[0][j], LIMIT_PREDICT):
+						beyond.append(j)
+						continue # don't run into the limit, refine towards the predicted limit onset instead
+					u, is_limited = measure_point(PSU1, PSU2, HEATER, reader, V_steps[0][j], V2, I2LIM, N_rep, T_idle, AVGFUNCTION, PULSED, terminal_output, timer)
+					predictor.add(V_steps[0][j], u[3]*PSU1.TEST_POLARITY, is_limited)
+					if terminal_output:
+						print(format_point(u, PSU1, PSU2))
+					rows[j] = (u, is_limited)
+
+			# send data to curve plotter thread and data file (in order of V1 steps):
+			for j in sorted(rows):
+				if journal.point_done(j2, j):
+					continue # point was written before the run was interrupted
+				write_point(j2, j, rows[j][0], False)
+
+		journal.add_curve(j2)
+		if SERPENTINE:
+			downward = not downward
+
+	logger.info('Curve tracing completed.')
+	if N_skip > 0:
+		logger.info('Limit prediction ended ' + str(N_skip) + ' curve(s) before running into the current / power limit.')
+	journal.close(remove=True)
+
+
+def run_test(PSU1, PSU2, HEATER, reader, sweep_plan, settings, samplename, logfile, journal, queue=None, quick_mode=False, resumed=False, terminal_output=True, progress=None, logger=logger):
+############################################################
+# run one test (header, pre-heat, curve tracing, PSUs off) #
+############################################################
+
+	# Print header / column labels:
+	write_header(logfile, samplename, settings, quick_mode, resumed)
+	if terminal_output:
+		print ('\n')
+
+	# timing instrumentation (optional), phase times of each point go to a timing file next to the data file:
+	if settings['TIMING']:
+		timer = phase_timer(True, open(os.path.splitext(logfile.name)[0] + '.timing', logfile.mode))
+	else:
+		timer = phase_timer()
+	for p in [PSU1, PSU2]:
+		p.timer = timer
+
+	try:
+		# Make sure the heater is turned on (if possible/configured):
+		HEATER.turn_on()
+
+		# if heaterblock is configured and turned on:
+		# make sure the heaterblock temperature is within tolerance before configuring the measurement,
+		HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=None, terminal_output=terminal_output)
+
+		# turn on PSU outputs:
+		for p in [PSU1, PSU2]:
+			if p.CONFIGURED:
+				p.setCurrent(0,False)
+				p.setVoltage(p.VMIN,False)
+				p.turnOn()
+
+		# DUT break-in / pre-heat
+		if settings['PREHEATSECS'] > 0.0:
+
+			logger.info('DUT break-in / pre-heat...')
+
+			# set idle conditions:
+			if settings['T_TARGET'] != None:
+				do_TEMP_wait = True
+			else:
+				do_TEMP_wait = False
+
+			# do idle/preheat:
+			with timer.phase('preheat'):
+				do_idle(PSU1, PSU2, HEATER, settings['PREHEATSECS'], file=logfile, wait_for_TEMP=do_TEMP_wait, terminal_output=terminal_output)
+
+		if not quick_mode:
+			trace_curves(PSU1, PSU2, HEATER, reader, sweep_plan, settings, logfile, journal, queue, terminal_output, progress, logger, timer)
+
+		# Turn off PSUs:
+		for p in [PSU1, PSU2]:
+			if p.CONNECTED:
+				p.turnOff()
+
+	finally:
+		# timing summary (also if the test failed half-way):
+		if timer.enabled:
+			logger.info('Timing summary:')
+			for l in timer.summary():
+				logger.info('  ' + l)
+			timer.close()
+		for p in [PSU1, PSU2]:
+			p.timer = phase_timer()
+
+
+def virtual_tester(configTESTER):
+################################################
+# check for simulation run (VIRTUAL PSUs only) #
+################################################
+
+	# all PSUs of all stations must be VIRTUAL or replayed from transcripts, and there must be no heaterblock (real hardware):
+	N = 0
+	for section in configTESTER.sections():
+		name = section.split(':')[-1]
+		if name == 'HEATERBLOCK':
+			return False
+		if name in [ 'PSU1', 'PSU2' ]:
+			if 'REPLAY_TRANSCRIPT' in configTESTER[section]:
+				N += 1
+				continue # no hardware, replay of recorded transcript
+			types = configTESTER[section].get('TYPE', '')
+			types = [ t.strip(' \'"') for t in types.strip('()[] ').split(',') if t.strip(' \'"') ]
+			if len(types) == 0 or any(t.upper() != 'VIRTUAL' for t in types):
+				return False
+			N += 1
+	return N > 0
+
+
 def ctrace():
     ################
     # main program #
@@ -80,6 +737,13 @@ def ctrace():
     parser.add_argument('-c', '--config', help='path to configuration file with DUT test parameters')
     parser.add_argument('-b', '--batch', action='store_true', help='batch mode (loop of repeated test tuns)')
     parser.add_argument('-q', '--quick', action='store_true', help='quick mode (pre-heating only, no curve tracing)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='compile the sweep plan and print the number of points and an estimate of the test duration, without running the test')
+    parser.add_argument('-r', '--resume', metavar='SAMPLE', help='resume an interrupted test run of SAMPLE from its checkpoint journal (SAMPLE.journal), and append the remaining data to SAMPLE.dat')
+    parser.add_argument('-j', '--job', metavar='MANIFEST', help='headless mode: run the tests specified in the job manifest file MANIFEST (DUT configuration, sample name, step range, output directory), without user interaction and without plotting')
+    parser.add_argument('-s', '--station', nargs=3, action='append', metavar=('NAME', 'DUT_CONFIG', 'SAMPLE'), help='run the test of SAMPLE with the DUT test parameters in DUT_CONFIG on tester station NAME (PSUs and heaterblock in the [NAME:PSU1], [NAME:PSU2] and [NAME:HEATERBLOCK] sections of the configuration file). Use several times to run several stations at the same time, without user interaction.')
+
+    # virtual clock (simulation mode):
+    parser.add_argument('--virtual-clock', action='store_true', help='simulation mode: use a virtual clock, which advances the time without waiting (pre-heating, idling, settle times). Only possible if all PSUs are VIRTUAL or replayed from transcripts, and no heaterblock is configured.')
 
     # do not show a "hello" message
     parser.add_argument('--nohello', action='store_true', help='Do not print the hello / about message (useful when the output needs further processing).')
@@ -99,6 +763,47 @@ def ctrace():
     configTESTER = configparser.ConfigParser()
     configTESTER.read(cfgfile)
 
+    # virtual clock for simulation runs:
+    if args.virtual_clock:
+	    if not virtual_tester(configTESTER):
+		    error_and_exit(logger, 'The virtual clock can only be used with VIRTUAL or replayed PSUs and without heaterblock.')
+	    logger.info('Using virtual clock (simulation mode)...')
+	    clock.set_clock(clock.virtual_clock())
+
+    # headless mode / multi-station mode (no user interaction):
+    if args.job or args.station:
+	    if args.batch or args.quick or args.resume or args.dry_run or args.config:
+		    error_and_exit(logger, 'Job and station modes cannot be combined with the -c, -b, -q, -n, or -r options.')
+	    if args.job and args.station:
+		    error_and_exit(logger, 'Job mode cannot be combined with station mode.')
+
+    if args.job:
+	    from pypsucurvetrace.job import read_job_manifest, run_job
+	    try:
+		    job = read_job_manifest(args.job)
+	    except ValueError as e:
+		    error_and_exit(logger, 'Invalid job manifest', e)
+	    try:
+		    N_fail = run_job(configTESTER, job)
+	    except KeyboardInterrupt:
+		    logger.info('Caught keyboard interrupt, exiting...')
+		    return
+	    except Exception as e:
+		    error_and_exit(logger, 'Could not run job', e)
+	    if N_fail > 0:
+		    error_and_exit(logger, str(N_fail) + ' of ' + str(len(job['samples'])) + ' tests failed.')
+	    return
+
+    if args.station:
+	    from pypsucurvetrace.station import run_stations
+	    try:
+		    run_stations(configTESTER, args.station)
+	    except KeyboardInterrupt:
+		    logger.info('Caught keyboard interrupt, exiting...')
+	    except Exception as e:
+		    error_and_exit(logger, 'Could not run tester stations', e)
+	    return
+
     # check for batch mode:
     batch_mode = False
     if args.batch:
@@ -111,6 +816,12 @@ def ctrace():
 	    logger.info('Running in quick mode (pre-heating only, no curve tracing)...')
 	    quick_mode = True
 
+    # check for resume mode:
+    if args.resume:
+	    if batch_mode or quick_mode:
+		    error_and_exit(logger, 'Resuming an interrupted test run is not possible in batch or quick mode.')
+	    logger.info('Resuming interrupted test run of ' + args.resume + '...')
+
     # read DUT test config file (if any):
     configDUT = []
     if args.config:
@@ -118,21 +829,35 @@ def ctrace():
 	    configDUT = configparser.ConfigParser()
 	    configDUT.read(args.config)
 	    
-    # connect to PSUs:
+    # connect to PSUs (dry run: nominal specifications of the PSU types, no connection to the PSUs):
     try:
-        PSU1 = connect_PSU(configTESTER, 'PSU1', logger);
+        PSU1 = connect_PSU(configTESTER, 'PSU1', logger, nominal=args.dry_run);
     except Exception as e:
         error_and_exit(logger, 'Could not connect to PSU1', e)
     try:
-        PSU2 = connect_PSU(configTESTER, 'PSU2', logger);
+        PSU2 = connect_PSU(configTESTER, 'PSU2', logger, nominal=args.dry_run);
     except Exception as e:
         error_and_exit(logger, 'Could not connect to PSU1', e)
 
-    # set up heaterblock:
-    HEATER = heaterblock.heater( config=configTESTER, target_temperature=0.0, DUT_PSU1=PSU1, DUT_PSU2=PSU2 )
-    HEATER.turn_off()
+    HEATER = None
+    if not args.dry_run:
 
-    logfile, samplename, basename, step = start_new_logfile(logger, batch_mode)
+        # simulated DUT (VIRTUAL PSUs only):
+        try:
+            connect_virtual_DUT(configTESTER, PSU1, PSU2, logger)
+        except ValueError as e:
+            error_and_exit(logger, 'Could not set up virtual DUT', e)
+
+        # set up heaterblock:
+        HEATER = heaterblock.heater( config=configTESTER, target_temperature=0.0, DUT_PSU1=PSU1, DUT_PSU2=PSU2 )
+        HEATER.turn_off()
+
+    if args.dry_run:
+	    logfile = samplename = basename = step = None
+    elif args.resume:
+	    logfile, samplename, basename, step = resume_logfile(logger, args.resume)
+    else:
+	    logfile, samplename, basename, step = start_new_logfile(logger, batch_mode)
 
     # configure voltage values / current and power limits:
     if 'PSU1' in configDUT:
@@ -149,156 +874,22 @@ def ctrace():
 	    if not PSU2.CONFIGURED:
 		    error_and_exit(logger, 'No power supply configured.')
 
-    # determine R2CONTROL (opitonal, may be missing in DUT config file):
-    R2CONTROL = None
+    # configure test settings (repeats, idle / pre-heat times, extra options):
     try:
-	    R2CONTROL = float(configDUT['EXTRA']['R2CONTROL'])
-    except:
-	    pass
-
-    # set up temperature control (optional, may be missing in DUT config file):
-    TEMP_val = None
-    TEMP_tol = None
+	    settings = configure_test_settings(configDUT, logger)
+    except (KeyError, ValueError) as e:
+	    error_and_exit(logger, 'Could not configure test settings', e)
+    if HEATER is not None:
+	    HEATER.set_target_temperature(settings['T_TARGET'], settings['T_TOL'])
+    N_rep     = settings['NREP']
+    T_idle    = settings['IDLESECS']
+    T_preheat = settings['PREHEATSECS']
+
+    # set up idle conditions (for pre-heat or idle between readings), check voltage / power / current limits:
     try:
-	    TEMP_val = float(configDUT['EXTRA']['T_TARGET'])
-	    TEMP_tol = float(configDUT['EXTRA']['T_TOL'])
-    except:
-	    pass
-    HEATER.set_target_temperature(TEMP_val, TEMP_tol)
-
-    # set up repeats:
-    if 'EXTRA' in configDUT:
-        try:
-            N_rep = int(configDUT['EXTRA']['NREP'])
-        except:
-            N_rep = 1
-    else:
-	    try:
-		    N_rep = int(input('\nOPTIONAL: Number of repeats per reading [default=1]: '))
-	    except ValueError:
-		    logger.info('  Using default: single reading.')
-		    N_rep = 1
-    if N_rep <= 0:
-	    raise ValueError('Number of repeats must be positive.')
-
-    # set up idle time between readings:
-    if 'EXTRA' in configDUT:
-	    T_idle    = float(configDUT['EXTRA']['IDLESECS'])
-    else:
-	    try:
-		    T_idle = float(input('\nOPTIONAL: idle time between readings (s) [default=0]: '))
-	    except ValueError:
-		    logger.info('  Using default: no idle time.')
-		    T_idle = 0.0
-    if T_idle < 0:
-	    raise ValueError('Idle time must not be negative.')
-
-    # set up pre-heat time between readings:
-    if 'EXTRA' in configDUT:
-	    T_preheat    = float(configDUT['EXTRA']['PREHEATSECS'])
-    else:
-	    try:
-		    T_preheat = float(input('\nOPTIONAL: pre-heat time before starting the test (s) [default=0]: '))
-	    except ValueError:
-		    logger.info('  Using default: no pre-heating.')
-		    T_preheat = 0.0
-    if T_preheat < 0:
-	    raise ValueError('Pre-heat time must not be negative.')
-
-    # set up idle conditions (for pre-heat or idle between readings)
-    if (T_idle > 0.0) or (T_preheat > 0.0):
-	    if PSU1.CONFIGURED:
-		    if 'PSU1' in configDUT:
-			    PSU1 = configure_idle_PSU (PSU1,configDUT['PSU1'])
-		    else:
-			    PSU1 = configure_idle_PSU (PSU1,None)
-	    if PSU2.CONFIGURED:
-		    if 'PSU2' in configDUT:
-			    PSU2 = configure_idle_PSU (PSU2,configDUT['PSU2'])
-		    else:
-			    PSU2 = configure_idle_PSU (PSU2,None)
-
-	    if PSU1.CONNECTED and PSU2.CONNECTED:
-		    if (not PSU1.TEST_VIDLE_MAX == PSU1.TEST_VIDLE_MIN) and (not PSU2.TEST_VIDLE_MAX == PSU2.TEST_VIDLE_MIN):
-			    error_and_exit(logger, 'Both PSUs are configured with variable idle voltages. This cannot work.')
-
-    # check voltage / power / current limits (and fix where possible and necessary):
-    logger.info('Checking voltage / current settings...')
-    for p in [PSU1,PSU2]:
-	    if p.CONNECTED:
-		    if p.TEST_VSTART < p.VMIN:
-			    logger.info('  ' + p.LABEL + ': Adjusting start voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
-			    p.TEST_VSTART = p.VMIN
-		    if p.TEST_VSTART > p.VMAX:
-			    logger.info('  ' + p.LABEL + ': Adjusting start voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
-			    p.TEST_VSTART = p.VMAX
-		    if p.TEST_VEND < p.VMIN:
-			    logger.info('  ' + p.LABEL + ': Adjusting end voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
-			    p.TEST_VEND = p.VMIN
-		    if p.TEST_VEND > p.VMAX:
-			    logger.info('  ' + p.LABEL + ': Adjusting end voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
-			    p.TEST_VEND = p.VMAX
-		    if p.TEST_VEND == p.TEST_VSTART:
-			    # logger.info('  ' + p.LABEL + ': Same start and end voltage, test will run at fixed voltage (' + str(p.TEST_VSTART) + ' V).')
-			    p.TEST_VSTEP = 0
-		    if abs(p.TEST_VEND-p.TEST_VSTART) < p.VRESSET:
-			    logger.info('  ' + p.LABEL + ': Test voltage range is less than voltage setting resolution of the PSU. Test will run at fixed voltage (' + str(p.TEST_VSTART) + ' V).')
-			    p.TEST_VSTEP = 0
-			    p.TEST_VEND = p.TEST_VSTART
-		    if p.TEST_VSTEP > 0.0:
-			    if p.TEST_VSTEP > abs(p.TEST_VEND-p.TEST_VSTART):
-				    p.TEST_VSTEP = abs(p.TEST_VEND-p.TEST_VSTART)
-				    logger.info('  ' + p.LABEL + ': Voltage step size exceeds test voltage range. Adjusting step size to ' + str(p.TEST_VSTEP) + ' V.')
-			    if p.TEST_VSTEP < p.VRESSET:
-				    logger.info('  ' + p.LABEL + ': Voltage step size is less than PSU resolution of voltage setting. Adjusting step size to ' + str(p.VRESSET) + ' V.')
-				    p.TEST_VSTEP = p.VRESSET
-			    if p.TEST_VSTEP/p.VRESSET < p.VRESSET:
-				    logger.info('  ' + p.LABEL + ': Voltage step size is less than PSU resolution of voltage setting. Adjusting step size to ' + str(p.VRESSET) + ' V.')
-				    p.TEST_VSTEP = p.VRESSET
-			    if not ( p.TEST_VSTEP / p.VRESSET == round(p.TEST_VSTEP / p.VRESSET) ):
-				    u = p.TEST_VSTEP
-				    p.TEST_VSTEP = round(p.TEST_VSTEP / p.VRESSET) * p.VRESSET
-				    logger.info('  ' + p.LABEL + ': Voltage step size (' + str(u) + ' V) is not consistent with PSU resolution of voltage setting. Adjusting step size to ' + str(p.TEST_VSTEP) + ' V.')
-		    if p.TEST_ILIMIT > p.IMAX:
-			    logger.info('  ' + p.LABEL + ': Adjusting current limit to max. value possible with the power supply (' + str(p.IMAX) + ' A).')
-			    p.TEST_ILIMIT = p.IMAX
-		    if p.TEST_PLIMIT > p.PMAX:
-			    logger.info('  ' + p.LABEL + ': Adjusting power limit to max. value possible with the power supply (' + str(p.PMAX) + ' W).')
-			    p.TEST_PLIMIT = p.PMAX
-		    if (T_idle > 0.0) or (T_preheat > 0.0):
-			    if p.TEST_PIDLELIMIT > p.PMAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting idle power limit to max. value possible with the power supply (' + str(p.PMAX) + ' W).')
-				    p.TEST_PIDLELIMIT = p.PMAX
-			    if p.TEST_VIDLE > p.VMAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
-				    p.TEST_VIDLE = p.VMAX
-			    if p.TEST_VIDLE < p.VMIN:
-				    logger.info('  ' + p.LABEL + ': Adjusting idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
-				    p.TEST_VIDLE = p.VMIN
-			    if p.TEST_VIDLE_MAX > p.VMAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
-				    p.TEST_VIDLE_MAX = p.VMAX
-			    if p.TEST_VIDLE_MAX < p.VMIN:
-				    logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
-				    p.TEST_VIDLE_MAX = p.VMIN
-			    if p.TEST_VIDLE_MIN > p.VMAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to max. value possible with the power supply (' + str(p.VMAX) + ' V).')
-				    p.TEST_VIDLE_MIN = p.VMAX
-			    if p.TEST_VIDLE_MIN < p.VMIN:
-				    logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to min. value possible with the power supply (' + str(p.VMIN) + ' V).')
-				    p.TEST_VIDLE_MIN = p.VMIN
-			    if p.TEST_VIDLE_MIN > p.TEST_VIDLE_MAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting min.-idle voltage to ' + str(p.TEST_VIDLE) + ' V).')
-				    p.TEST_VIDLE_MIN = p.TEST_VIDLE
-			    if p.TEST_VIDLE_MAX < p.TEST_VIDLE_MIN:
-				    logger.info('  ' + p.LABEL + ': Adjusting max.-idle voltage to ' + str(p.TEST_VIDLE) + ' V).')
-				    p.TEST_VIDLE_MAX = p.TEST_VIDLE
-			    if p.TEST_IIDLE > p.IMAX:
-				    logger.info('  ' + p.LABEL + ': Adjusting idle current to max. value possible with the power supply (' + str(p.IMAX) + ' A).')
-				    p.TEST_IIDLE = p.IMAX
-			    if p.TEST_VIDLE * p.TEST_IIDLE > p.PMAX:
-				    p.TEST_IIDLE = p.PMAX / p.TEST_VIDLE
-				    logger.info('  ' + p.LABEL + ': Idle current limit is higher than PSU power limit (' + str(p.PMAX) + ' W). Adjusting idle current limit to ' + str(p.TEST_IIDLE) + ' A.' )
+	    PSU1, PSU2 = check_test_setup(PSU1, PSU2, configDUT, settings)
+    except ValueError as e:
+	    error_and_exit(logger, str(e))
 
     # Print summary of test setup:
     print('\nTest setup:')
@@ -317,8 +908,10 @@ def ctrace():
 
 		    if p.TEST_VSTEP == 0:
 			    print ('  - voltage output = ' + str(p.TEST_VSTART) + ' V (fixed)')
-		    else:
+		    elif p.TEST_VSTEP_MAX is None:
 			    print ('  - voltage output = ' + str(p.TEST_VSTART) + ' V ... ' + str(p.TEST_VEND) + ' V (' + str(p.TEST_VSTEP) + ' V steps)')
+		    else:
+			    print ('  - voltage output = ' + str(p.TEST_VSTART) + ' V ... ' + str(p.TEST_VEND) + ' V (adaptive steps: ' + str(p.TEST_VSTEP) + ' V ... ' + str(p.TEST_VSTEP_MAX) + ' V, current tolerance ' + str(p.TEST_ADAPTIVE_ITOL) + ' A)')
 		    print ('  - current limit = ' + str(p.TEST_ILIMIT) + ' A')
 		    print ('  - power limit = ' + str(p.TEST_PLIMIT) + ' W')
 		    if p.TEST_POLARITY == 1:
@@ -327,6 +920,14 @@ def ctrace():
 			    print ('  - polarity: inverted')
 
     print ('* Repeats per reading = ' + str(N_rep))
+    if settings['SERPENTINE']:
+	    print ('* Serpentine sweep order (' + PSU1.LABEL + ' voltage alternating up and down)')
+    if settings['PULSED']:
+	    print ('* Pulsed measurements (return to idle conditions right after each reading)')
+    if settings['TIMING']:
+	    print ('* Timing instrumentation (phase times of each point are written to a .timing file next to the data file)')
+    if settings['LIMIT_PREDICT'] is not None:
+	    print ('* Skip ' + PSU1.LABEL + ' steps that are predicted to exceed the current / power limit (with a margin of ' + str(100*settings['LIMIT_PREDICT']) + '% for the prediction error)')
     if T_idle == 0.0:
 	    print ('* No idle time between measurements')
     else:
@@ -335,7 +936,7 @@ def ctrace():
 	    print ('* No pre-heating before measurements')
     else:
 	    print ('* Pre-heat time before measurements (at idle conditions): ' + str(T_preheat) + ' seconds')
-    if (T_idle > 0.0) or (T_preheat > 0.0):
+    if (T_idle > 0.0) or (T_preheat > 0.0) or settings['PULSED']:
 	    for p in [PSU1, PSU2]:
 		    if p.CONNECTED == False:
 			    print ('* ' + p.LABEL + ' Idle / pre-heat conditions not configured')
@@ -347,18 +948,38 @@ def ctrace():
 			    print ('* ' + p.LABEL + ' idle / pre-heat current = ' + str(p.TEST_IIDLE) + ' A')
 			    print ('* ' + p.LABEL + ' max. idle / pre-heat power = ' + str(p.TEST_PIDLELIMIT) + ' W')
 
-    print ('* Heaterblock temperature (current) = ' + str(HEATER.get_temperature_string()))
-    print ('* Heaterblock temperature (target)  = ' + str(HEATER.get_target_temperature_string()))
+    if HEATER is not None:
+	    print ('* Heaterblock temperature (current) = ' + str(HEATER.get_temperature_string()))
+	    print ('* Heaterblock temperature (target)  = ' + str(HEATER.get_target_temperature_string()))
+
+    print (r2control_text(settings['R2CONTROL']))
+
+    # compile sweep plan (all points with current limits, on the integer grid of the PSU voltage setting resolution):
+    sweep_plan = compile_sweep_plan(PSU1, PSU2, T_idle, T_preheat)
 
-    R2CTL_txt = '* R2CONTROL = '
-    u = 'NOT SPECIFIED'
-    if R2CONTROL is not None:
+    # determine voltage step values:
+    V_steps = [ sweep_plan['V1'][sweep_plan['j2'] == 0] , sweep_plan['V2'][sweep_plan['j1'] == 0] ]
+
+    # dry run: print sweep plan summary and exit
+    if args.dry_run:
+	    t = estimate_duration(sweep_plan, PSU1, PSU2, N_rep, settings['PULSED'])
+	    print ('\nSweep plan:')
+	    print ('* ' + str(len(V_steps[1])) + ' curves x ' + str(len(V_steps[0])) + ' steps = ' + str(len(sweep_plan)) + ' points (' + str(N_rep) + ' reading(s) per point)')
+	    if quick_mode:
+		    print ('* Estimated duration: ' + str(datetime.timedelta(seconds=round(T_preheat))) + ' (quick mode, pre-heating only)')
+	    else:
+		    print ('* Estimated duration: ' + str(datetime.timedelta(seconds=round(t))) + ' (upper limit, curves ending at the current / power limit and adaptive steps take less time)')
+	    print ('* PSU specifications and timing: nominal values of the PSU types (PSUs not connected)')
+	    return
+
+    # set up checkpoint journal (for resuming interrupted runs):
+    journal = None
+    if not quick_mode:
+	    plan = journal_plan(V_steps, PSU1, PSU2, settings)
 	    try:
-		    u = str(R2CONTROL) + ' Ohm'
-	    except:
-		    R2CONTROL = None
-    R2CTL_txt = R2CTL_txt + ' ' + u
-    print (R2CTL_txt)
+		    journal = sweep_journal(samplename + '.journal', plan, resume=args.resume is not None)
+	    except Exception as e:
+		    error_and_exit(logger, 'Could not set up checkpoint journal', e)
 
     # set up plotting environment
     plt.ion()
@@ -369,28 +990,8 @@ def ctrace():
     plt_proc = multiprocessing.Process(target=curve_plotter, args=(queue,)) # plotting process
     plt_proc.start() # start the plotting process
 
-    # set function to calculate the "average" value:
-    AVGFUNCTION = 'MEAN'
-    # AVGFUNCTION = 'MEDIAN'
-
-    # determine voltage step values:
-    V_steps = []
-
-    for p in [PSU1,PSU2]:
-	    if not p.CONFIGURED:
-		    V_steps.append( [ 0 ] )
-	    else:
-		    if p.TEST_VSTEP == 0:
-			    # V_steps.append( np.linspace(p.TEST_VSTART,p.TEST_VSTART,1) )
-			    V_steps.append( [ p.TEST_VSTART ] )
-		    else:
-			    if p.TEST_VSTART <= p.TEST_VEND:
-				    u = np.arange( p.TEST_VSTART , p.TEST_VEND+PSU1.TEST_VSTEP ,  p.TEST_VSTEP )
-				    u = [i for i in u if (i >= p.TEST_VSTART) and (i <= p.TEST_VEND) ] # filter out "outliers" that may happen with large VSTEPs
-			    else:
-				    u = np.arange( p.TEST_VSTART , p.TEST_VEND-PSU1.TEST_VSTEP , -p.TEST_VSTEP )
-				    u = [i for i in u if (i >= p.TEST_VEND) and (i <= p.TEST_VSTART) ] # filter out "outliers" that may happen with large VSTEPs
-			    V_steps.append(u)
+    # set up concurrent readout of PSU1 and PSU2:
+    reader = concurrent_PSU_reader([PSU1, PSU2])
 
     try:
 
@@ -406,232 +1007,15 @@ def ctrace():
 		    # Ask if okay to start the test
 		    input ('\nReady for testing of ' + samplename + '? Press ENTER to start testing or CTRL+C to abort...')
 
-		    # Print header / column labels:
-		    printit('* Sample: ' + samplename,logfile,'%', terminal_output=False)
-		    printit('* Date / time: ' + str(datetime.datetime.now()),logfile,'%', terminal_output=False)
-		    printit (R2CTL_txt,logfile,'%', terminal_output=False)
-		    if quick_mode:
-			    printit ('* Running in quick mode (pre-heating only, no curve tracing)',logfile,'%', terminal_output=False)
-		    else:
-			    printit ('Column 1:  PSU1 nominal voltage setting (V)',logfile,'%', terminal_output=False)
-			    printit ('Column 2:  PSU1 nominal current setting (A)',logfile,'%', terminal_output=False)
-			    printit ('Column 3:  PSU1 voltage measurement (V)',logfile,'%', terminal_output=False)
-			    printit ('Column 4:  PSU1 current measurement (I)',logfile,'%', terminal_output=False)
-			    printit ('Column 5:  PSU1 limiter flag',logfile,'%', terminal_output=False)
-			    printit ('Column 6:  PSU2 nominal voltage setting (V)',logfile,'%', terminal_output=False)
-			    printit ('Column 7:  PSU2 nominal current setting (A)',logfile,'%', terminal_output=False)
-			    printit ('Column 8:  PSU2 voltage measurement (V)',logfile,'%', terminal_output=False)
-			    printit ('Column 9:  PSU2 current measurement (I)',logfile,'%', terminal_output=False)
-			    printit ('Column 10: PSU2 limiter flag',logfile,'%', terminal_output=False)
-			    printit ('Column 11: Heaterblock temperature (°C)',logfile,'%', terminal_output=False)
-		    print ('\n')
-
-		    # Make sure the heater is turned on (if possible/configured):
-		    HEATER.turn_on()
-
-		    # if heaterblock is configured and turned on:
-		    # make sure the heaterblock temperature is within tolerance before configuring the measurement,
-		    HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=None, terminal_output=True)
-		    
-		    # turn on PSU outputs:
-		    for p in [PSU1, PSU2]:
-			    if p.CONFIGURED:
-				    p.setCurrent(0,False)
-				    p.setVoltage(p.VMIN,False)
-				    p.turnOn()
-
-		    # DUT break-in / pre-heat
-		    if T_preheat > 0.0:
-			    
-			    logger.info('DUT break-in / pre-heat...')
-
-			    # set idle conditions:
-			    if TEMP_val != None:
-				    do_TEMP_wait = True
-			    else:
-				    do_TEMP_wait = False
-			    
-			    # do idle/preheat:
-			    do_idle(PSU1, PSU2, HEATER, T_preheat, file=logfile, wait_for_TEMP=do_TEMP_wait)
-
-		    if not quick_mode:
-			    logger.info('Curve tracing started...')
-
-			    for V2 in V_steps[1]:
-			    # outer loop (V2)
-
-				    # get rid of numerical imprecisions (truncate values to voltage resolution of PSU):
-				    # V2 = round(V2/PSU2.VRESSET) * PSU2.VRESSET
-
-				    limit = 0 # number of CC events at a given step
-				    limit_max = 2 # max. number of CC events before breaking from the loop
-
-
-				    if PSU2.CONFIGURED:
-
-					    # Determine PSU2 current limit (based on DUT limits):
-					    if V2 > 0.0:
-						    I2LIM = min (PSU2.TEST_ILIMIT,PSU2.TEST_PLIMIT/V2)
-					    else:
-						    I2LIM = PSU2.TEST_ILIMIT
-
-					    # Check if current limit is within power capability of PSU2 (and adjust if necessary):
-					    if (V2*I2LIM) > PSU2.PMAX:
-						    I2LIM = PSU2.PMAX / V2
-					    
-					    # set PSU2 voltage + current:
-					    PSU2.setCurrent(I2LIM,False)
-					    PSU2.setVoltage(V2,True)
-
-				    for V1 in V_steps[0]:
-				    # inner loop (V1)
-
-					    # get rid of numerical imprecisions (truncate values to voltage resolution of PSU):
-					    # V1 = round(V1/PSU1.VRESSET) * PSU1.VRESSET
-
-					    # init measurement values		
-					    V1MEAS = []
-					    I1MEAS = []
-					    LIMIT1 = 0
-					    V2MEAS = []
-					    I2MEAS = []
-					    LIMIT2 = 0
-					    T_HB   = []
-
-					    # measurement loop:
-					    for i in range(N_rep):
-
-						    # if heaterblock is configured and turned on:
-						    # make sure the heaterblock temperature is within tolerance before doing the measurement,
-						    # allow turning off the DUT to prevent (excessive) heat input from DUT to heaterblock
-						    HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=PSU1, terminal_output=True)
-						    
-
-						    # idle (if configured)
-						    if T_idle > 0.0:
-						        do_idle(PSU1,PSU2,HEATER,T_idle)
-						        
-						        # return to required PSU2 output:
-						        if PSU2.CONFIGURED:
-						            PSU2.setCurrent(I2LIM,False)
-						            PSU2.setVoltage(V2,True)
-
-						    # Determine PSU1 current limit:
-						    if V1 > 0.0:
-							    I1LIM = min (PSU1.TEST_ILIMIT,PSU1.TEST_PLIMIT/V1)
-						    else:
-							    I1LIM = PSU1.TEST_ILIMIT
-
-						    # Check if current limit is within power capability of PSU1 (and adjust if necessary):
-						    if (V1*I1LIM) > PSU1.PMAX:
-							    I1LIM = PSU1.PMAX / V1
-
-						    # set up PSU1 measurement conditions:
-						    if PSU1.CONFIGURED:
-							    PSU1.setCurrent(I1LIM,False) # set current limit at PSU1
-							    PSU1.setVoltage(V1,True) # set voltage at PSU1
-
-						    # read PSU output voltages and currents:
-						    r = []
-						    for p in [PSU1, PSU2]:
-							    if p.CONFIGURED:
-								    r.append(p.read(p.NSTABLEREADINGS))
-							    else:
-								    r.append([0.0,0.0,'NONE'])
-						    
-						    V1MEAS.append(r[0][0])
-						    I1MEAS.append(r[0][1])
-						    V2MEAS.append(r[1][0])
-						    I2MEAS.append(r[1][1])
-						    if r[0][2] == 'CC':
-							    LIMIT1 = LIMIT1 + 1
-						    if r[1][2] == 'CC':
-							    LIMIT2 = LIMIT2 + 1
-
-						    # Determine heaterblock temperature:
-						    T_HB.append(HEATER.get_temperature())
-
-					    # Determine median or mean of repeated readings:
-					    if AVGFUNCTION == 'MEDIAN':
-						    V1MEAS = np.median(V1MEAS)
-						    I1MEAS = np.median(I1MEAS)
-						    V2MEAS = np.median(V2MEAS)
-						    I2MEAS = np.median(I2MEAS)
-						    try:
-							    T_HB   = np.median(T_HB)
-						    except:
-							    T_HB = None
-							    pass
-					    else:
-						    V1MEAS = np.mean(V1MEAS)
-						    I1MEAS = np.mean(I1MEAS)
-						    V2MEAS = np.mean(V2MEAS)
-						    I2MEAS = np.mean(I2MEAS)
-						    try:
-							    T_HB   = np.mean(T_HB)
-						    except:
-							    T_HB = None
-							    pass
-						    
-					    # Check current limits (some PSUs are not very careful with this):
-					    if I1MEAS > I1LIM:
-						    LIMIT1 = 1
-					    if I2MEAS > I2LIM:
-						    LIMIT2 = 1
-
-					    # Parse limiter flags:
-					    if LIMIT1 > 0:
-						    LIMIT1 = 1
-					    else:
-						    LIMIT1 = 0
-					    if LIMIT2 > 0:
-						    LIMIT2 = 1
-					    else:
-						    LIMIT2 = 0
-
-					    # Check if current / power limit has been reached:
-					    if (LIMIT1 == 0) and (LIMIT2 == 0):
-						    limit = 0 # reset counter
-					    else:
-						    limit = limit + 1
-						    if limit >= limit_max:
-							    break # break out of the inner loop (V1 steps) and continue with the next V2 step
-
-					    # send data to curve plotter thread:
-					    u = [ V1*PSU1.TEST_POLARITY, I1LIM*PSU1.TEST_POLARITY, V1MEAS*PSU1.TEST_POLARITY, I1MEAS*PSU1.TEST_POLARITY, LIMIT1, V2*PSU2.TEST_POLARITY, I2LIM*PSU2.TEST_POLARITY, V2MEAS*PSU2.TEST_POLARITY, I2MEAS*PSU2.TEST_POLARITY, LIMIT2, T_HB ]
-					    queue.put(u)
-					    
-					    # Print results to terminal:
-					    try:
-						    T_HB = "{:.2f}".format(T_HB)
-					    except:
-						    T_HB = "NA"
-						    pass
-					    
-					    t =  format_PSU_reading(V1*PSU1.TEST_POLARITY, PSU1.VRESSET)      + ' ' + \
-					         format_PSU_reading(I1LIM*PSU1.TEST_POLARITY, PSU1.IRESSET)   + ' ' + \
-					         format_PSU_reading(V1MEAS*PSU1.TEST_POLARITY, PSU1.VRESREAD) + ' ' + \
-					         format_PSU_reading(I1MEAS*PSU1.TEST_POLARITY, PSU1.IRESREAD) + ' ' + \
-					         "{:1d}".format(LIMIT1)				          + ' ' + \
-					         format_PSU_reading(V2*PSU2.TEST_POLARITY, PSU2.VRESSET)      + ' ' + \
-					         format_PSU_reading(I2LIM*PSU2.TEST_POLARITY, PSU2.IRESSET)   + ' ' + \
-					         format_PSU_reading(V2MEAS*PSU2.TEST_POLARITY, PSU2.VRESREAD) + ' ' + \
-					         format_PSU_reading(I2MEAS*PSU2.TEST_POLARITY, PSU2.IRESREAD) + ' ' + \
-					         "{:1d}".format(LIMIT2)                                       + ' ' + \
-					         T_HB
-					    printit(t, logfile )
-
-			    logger.info('Curve tracing completed.')
-			    
-		    # Turn off PSUs:
-		    for p in [PSU1, PSU2]:
-			    if p.CONNECTED:
-				    p.turnOff()
+		    # run the test:
+		    run_test(PSU1, PSU2, HEATER, reader, sweep_plan, settings, samplename, logfile, journal, queue, quick_mode, resumed=args.resume is not None)
 	    
 		    if batch_mode:
 		    
 			    # prepare next step and file:
 			    logfile, samplename, _, step = start_new_logfile(logger, batch_mode, basename, step+1)
+			    if not quick_mode:
+				    journal = sweep_journal(samplename + '.journal', plan)
 			    
 			    # reset initial values for idle conditions:
 			    if PSU1.CONFIGURED: PSU1.TEST_VIDLE = Uc_ini_1
@@ -650,4 +1034,7 @@ def ctrace():
 	    logger.warning('Oooops, something went wrong during testing: ' + repr(e))
 
     finally:
+	    reader.close()
+	    if journal is not None:
+		    journal.close()
 	    cleanup_exit(PSU1, PSU2, HEATER, queue, plt_proc)
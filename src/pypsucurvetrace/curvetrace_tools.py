@@ -4,12 +4,14 @@ Helper functions for use with curvetrace programs
 
 
 import sys
-import time
+import pypsucurvetrace.clock as clock
 import math
 import os.path
 import ast
 import logging
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 
 #############
@@ -139,6 +141,28 @@ def start_new_logfile(logger, do_batch=False, basename=None, step=None):
 	return logfile, samplename, basename, step
 
 
+###########################################################
+# function to re-open the data file of an interrupted run #
+###########################################################
+
+def resume_logfile(logger, samplename):
+
+	# allow sample name with or without file extension:
+	samplename = samplename.strip()
+	if samplename.endswith('.dat'):
+		samplename = samplename[:-4]
+	logfilename = samplename + '.dat'
+
+	if not os.path.exists(logfilename):
+		error_and_exit(logger, 'Cannot resume: data / log file ' + logfilename + ' does not exist.')
+
+	# append to existing logfile:
+	logfile = open(logfilename,'a')
+	logger.info('Appending output to ' + logfilename + '...')
+
+	return logfile, samplename, samplename, None
+
+
 #############################################################
 # function to print output both to console and to data file #
 #############################################################
@@ -179,9 +203,10 @@ def __parse_tuple_literal(value, what):
 # connect to power supply #
 ###########################
 
-def connect_PSU(configTESTER, label, logger):
+def connect_PSU(configTESTER, label, logger, nominal=False):
 
 	import pypsucurvetrace.powersupply as powersupply
+	import pypsucurvetrace.transcript as transcript
 
 	if not (label in configTESTER):
 		# print(label + ' not specified in configuration file. Leaving ' + label + ' unconfigured.')
@@ -244,9 +269,31 @@ def connect_PSU(configTESTER, label, logger):
 			I_READ_CALPOLY = (0, 1)
 			pass
 
-		# connect to PSU(s):
-		logger.info ('Connecting to power supply ' + label + '...')
-		P = powersupply.PSU(port, commandset, label, V_SET_CALPOLY, V_READ_CALPOLY, I_SET_CALPOLY, I_READ_CALPOLY)
+		# record or replay the communication with the PSU(s), if specified (one transcript file per PSU unit):
+		for key in ['RECORD_TRANSCRIPT', 'REPLAY_TRANSCRIPT']:
+			if key in configTESTER[label] and not nominal:
+				files = configTESTER[label][key]
+				if num_PSU > 1:
+					files = __parse_tuple_literal(files, key)
+				else:
+					files = (files,)
+				ports = port if num_PSU > 1 else (port,)
+				if len(files) != len(ports):
+					raise ValueError(label + ': number of ' + key + ' files does not match the number of PSU units.')
+				for p, f in zip(ports, files):
+					if key == 'RECORD_TRANSCRIPT':
+						logger.info('Recording communication with ' + label + ' at ' + p + ' to ' + f + '...')
+						transcript.record(p, f)
+					else:
+						logger.info('Replaying transcript ' + f + ' in place of ' + label + ' at ' + p + '...')
+						transcript.replay(p, f, float(configTESTER[label].get('REPLAY_SCALE', 1.0)))
+
+		# connect to PSU(s), or use their nominal specifications without connecting (dry run):
+		if nominal:
+			logger.info ('Using nominal specifications of power supply ' + label + ' (not connected)...')
+		else:
+			logger.info ('Connecting to power supply ' + label + '...')
+		P = powersupply.PSU(port, commandset, label, V_SET_CALPOLY, V_READ_CALPOLY, I_SET_CALPOLY, I_READ_CALPOLY, nominal=nominal)
 
 		# set number of consistent readings for measurements (optional):
 		if 'NUMSTABLEREAD' in configTESTER[label]:
@@ -258,7 +305,8 @@ def connect_PSU(configTESTER, label, logger):
 		if P.CONNECTED:
 
 			# make sure the PSU output is turned off:
-			P.turnOff()
+			if not nominal:
+				P.turnOff()
 
 			# show summary
 			for k in range(len(P._PSU)):
@@ -282,11 +330,50 @@ def connect_PSU(configTESTER, label, logger):
 
 
 
+#########################################################
+# connect VIRTUAL PSU units to a simulated DUT (if any) #
+#########################################################
+
+def connect_virtual_DUT(configTESTER, PSU1, PSU2, logger):
+
+	from pypsucurvetrace.powersupply_VIRTUAL import virtual_DUT
+	from pypsucurvetrace.dut_models import get_model
+
+	units = [ [ u for u in P._PSU if u.COMMANDSET == 'VIRTUAL' ] if P.CONNECTED else [] for P in [PSU1, PSU2] ]
+	if len(units[0]) + len(units[1]) == 0:
+		return None
+
+	# DUT model and parameters from the [VIRTUAL_DUT] section (optional, default: triode):
+	name = 'TRIODE'
+	params = {}
+	if 'VIRTUAL_DUT' in configTESTER:
+		params = dict(configTESTER['VIRTUAL_DUT'])
+		name = params.pop('model', name)
+	logger.info('Simulating DUT with ' + name.upper() + ' model...')
+	DUT = virtual_DUT(get_model(name, **params))
+
+	for channel in range(2):
+		for u in units[channel]:
+			DUT.connect(u, channel)
+
+	return DUT
+
+
+
+####################################################
+# refuse missing DUT parameter (no user prompting) #
+####################################################
+
+def __missing_parameter(PSU, key):
+	raise ValueError(PSU.LABEL + ': ' + key + ' is not specified in the DUT configuration.')
+
+
+
 ###############################
 # configure PSU test settings #
 ###############################
 
-def configure_test_PSU(PSU, logger, configDUT = []):
+def configure_test_PSU(PSU, logger, configDUT = [], interactive = True):
 	
 	if not PSU.CONNECTED:
 		logger.info (PSU.LABEL + ' is not connected (or connection is not configured).')
@@ -299,32 +386,52 @@ def configure_test_PSU(PSU, logger, configDUT = []):
 
 		if 'VSTART' in configDUT:
 			PSU.TEST_VSTART = float(configDUT['VSTART'])
-		else:
+		elif interactive:
 			PSU.TEST_VSTART = __get_number('* ' + PSU.LABEL + ' start voltage (V): ',allowZero=True,allowNegative=False,typ='float')
+		else:
+			__missing_parameter(PSU, 'VSTART')
 
 		if 'VEND' in configDUT:
 			PSU.TEST_VEND   = float(configDUT['VEND'])
-		else:
+		elif interactive:
 			PSU.TEST_VEND   = __get_number('* ' + PSU.LABEL + ' end voltage (V): ',allowZero=True,allowNegative=False,typ='float')
+		else:
+			__missing_parameter(PSU, 'VEND')
 
 		if PSU.TEST_VSTART == PSU.TEST_VEND:
 			PSU.TEST_VSTEP = 0
 		else:
 			if 'VSTEP' in configDUT:
 				PSU.TEST_VSTEP  = float(configDUT['VSTEP'])
-			else:
+			elif interactive:
 				PSU.TEST_VSTEP      = __get_number('* ' + PSU.LABEL + ' voltage step size (V): ',allowZero=False,allowNegative=False,typ='float')
+			else:
+				__missing_parameter(PSU, 'VSTEP')
 
 		if 'IMAX' in configDUT:
 			PSU.TEST_ILIMIT = float(configDUT['IMAX'])
-		else:
+		elif interactive:
 			PSU.TEST_ILIMIT = __get_number('* ' + PSU.LABEL + ' maximum allowed current (A): ',allowZero=False,allowNegative=False,typ='float')
+		else:
+			__missing_parameter(PSU, 'IMAX')
 
 		if 'PMAX' in configDUT:
 			PSU.TEST_PLIMIT = float(configDUT['PMAX'])
-		else:
+		elif interactive:
 			PSU.TEST_PLIMIT = __get_number('* ' + PSU.LABEL + ' maximum allowed power (W): ',allowZero=False,allowNegative=False,typ='float')
-			
+		else:
+			__missing_parameter(PSU, 'PMAX')
+
+		# adaptive voltage steps (optional, only from DUT config file):
+		if 'VSTEP_MAX' in configDUT:
+			PSU.TEST_VSTEP_MAX = float(configDUT['VSTEP_MAX'])
+		else:
+			PSU.TEST_VSTEP_MAX = None
+		if 'ADAPTIVE_ITOL' in configDUT:
+			PSU.TEST_ADAPTIVE_ITOL = float(configDUT['ADAPTIVE_ITOL'])
+		else:
+			PSU.TEST_ADAPTIVE_ITOL = 0.01 * PSU.TEST_ILIMIT # 1% of the current limit
+
 		if 'POLARITY' in configDUT:
 			if int(configDUT['POLARITY']) > 0:
 			    PSU.TEST_POLARITY = 1
@@ -332,6 +439,9 @@ def configure_test_PSU(PSU, logger, configDUT = []):
 			    PSU.TEST_POLARITY = -1
 			else:
 			    raise ValueError('PSU must either be positive or negative.')
+		elif not interactive:
+			logger.info ('  ' + PSU.LABEL + ': Using default: normal polarity.')
+			PSU.TEST_POLARITY = 1
 		else:
 			try:
 				pol = (input('* OPTIONAL: ' + PSU.LABEL + ' polarity of outputs -- N: normal / I: inverted [default=N]: '))
@@ -353,12 +463,15 @@ def configure_test_PSU(PSU, logger, configDUT = []):
 # configure PSU idle settings #
 ###############################
 
-def configure_idle_PSU(PSU,configDUT):
+def configure_idle_PSU(PSU,configDUT,interactive=True):
 	
 	if PSU.CONFIGURED:
 
 		if configDUT:
 			# take configuration from DUT config file:
+			for key in ['VIDLE', 'IIDLE']:
+				if not key in configDUT:
+					__missing_parameter(PSU, key)
 			PSU.TEST_VIDLE = float(configDUT['VIDLE'])
 			if not 'VIDLE_MIN' in configDUT:
 				PSU.TEST_VIDLE_MIN = PSU.TEST_VIDLE # fixed idle voltage
@@ -378,6 +491,9 @@ def configure_idle_PSU(PSU,configDUT):
 				PSU.TEST_IDLE_GM = float(configDUT['IDLE_GM']) # unknown transconductance (delta-I1 / delta-U2 or delta-U2 / delta-I1 in A/V)
 			PSU.TEST_IIDLE = float(configDUT['IIDLE'])
 
+		elif not interactive:
+			__missing_parameter(PSU, 'VIDLE')
+
 		else:
 			print ('\n' + 'configure ' + PSU.LABEL + ' idle settings:')
 			PSU.TEST_VIDLE = __get_number('* ' + PSU.LABEL + ' idle voltage (V): ',allowZero=True,allowNegative=False,typ='float')
@@ -401,11 +517,120 @@ def configure_idle_PSU(PSU,configDUT):
 	return PSU
 
 
+########################################################
+# configure test settings (repeats, idle, extras etc.) #
+########################################################
+
+def configure_test_settings(configDUT, logger, interactive=True):
+
+	settings = {}
+
+	# determine R2CONTROL (opitonal, may be missing in DUT config file):
+	settings['R2CONTROL'] = None
+	try:
+		settings['R2CONTROL'] = float(configDUT['EXTRA']['R2CONTROL'])
+	except:
+		pass
+
+	# determine SERPENTINE sweep order (optional, may be missing in DUT config file):
+	settings['SERPENTINE'] = False
+	try:
+		settings['SERPENTINE'] = int(configDUT['EXTRA']['SERPENTINE']) > 0
+	except:
+		pass
+
+	# determine PULSED measurement mode (optional, may be missing in DUT config file):
+	settings['PULSED'] = False
+	try:
+		settings['PULSED'] = int(configDUT['EXTRA']['PULSED']) > 0
+	except:
+		pass
+
+	# determine LIMIT_PREDICT margin (optional, may be missing in DUT config file):
+	settings['LIMIT_PREDICT'] = None
+	try:
+		settings['LIMIT_PREDICT'] = float(configDUT['EXTRA']['LIMIT_PREDICT'])
+	except:
+		pass
+	if (settings['LIMIT_PREDICT'] is not None) and (settings['LIMIT_PREDICT'] < 0):
+		raise ValueError('LIMIT_PREDICT margin must not be negative.')
+
+	# determine TIMING instrumentation (optional, may be missing in DUT config file):
+	settings['TIMING'] = False
+	try:
+		settings['TIMING'] = int(configDUT['EXTRA']['TIMING']) > 0
+	except:
+		pass
+
+	# temperature control (optional, may be missing in DUT config file):
+	settings['T_TARGET'] = None
+	settings['T_TOL'] = None
+	try:
+		settings['T_TARGET'] = float(configDUT['EXTRA']['T_TARGET'])
+		settings['T_TOL'] = float(configDUT['EXTRA']['T_TOL'])
+	except:
+		pass
+
+	# set up repeats:
+	if 'EXTRA' in configDUT:
+		try:
+			N_rep = int(configDUT['EXTRA']['NREP'])
+		except:
+			N_rep = 1
+	elif not interactive:
+		N_rep = 1
+	else:
+		try:
+			N_rep = int(input('\nOPTIONAL: Number of repeats per reading [default=1]: '))
+		except ValueError:
+			logger.info('  Using default: single reading.')
+			N_rep = 1
+	if N_rep <= 0:
+		raise ValueError('Number of repeats must be positive.')
+	settings['NREP'] = N_rep
+
+	# set up idle time between readings:
+	if 'EXTRA' in configDUT:
+		T_idle    = float(configDUT['EXTRA']['IDLESECS'])
+	elif not interactive:
+		raise ValueError('IDLESECS is not specified in the DUT configuration.')
+	else:
+		try:
+			T_idle = float(input('\nOPTIONAL: idle time between readings (s) [default=0]: '))
+		except ValueError:
+			logger.info('  Using default: no idle time.')
+			T_idle = 0.0
+	if T_idle < 0:
+		raise ValueError('Idle time must not be negative.')
+	settings['IDLESECS'] = T_idle
+
+	# set up pre-heat time between readings:
+	if 'EXTRA' in configDUT:
+		T_preheat    = float(configDUT['EXTRA']['PREHEATSECS'])
+	elif not interactive:
+		raise ValueError('PREHEATSECS is not specified in the DUT configuration.')
+	else:
+		try:
+			T_preheat = float(input('\nOPTIONAL: pre-heat time before starting the test (s) [default=0]: '))
+		except ValueError:
+			logger.info('  Using default: no pre-heating.')
+			T_preheat = 0.0
+	if T_preheat < 0:
+		raise ValueError('Pre-heat time must not be negative.')
+	settings['PREHEATSECS'] = T_preheat
+
+	# set function to calculate the "average" value:
+	settings['AVGFUNCTION'] = 'MEAN'
+	# settings['AVGFUNCTION'] = 'MEDIAN'
+
+	return settings
+
+
 ##########################
 # do idle / DUT break-in #
 ##########################
 
-def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
+def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False, terminal_output=True):
 	
 	REG = None
 
@@ -424,7 +649,7 @@ def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
 				p.setCurrent(p.TEST_IIDLE,False)
 				p.setVoltage(p.TEST_VIDLE,False) # don't check for stable voltage, since current limiter may upset the the voltage value
 		# wait pre-heat time:
-		time.sleep(seconds)
+		clock.sleep(seconds)
 
 	else: # fixed output on FIX power supply and regulated output on REG power supply
 
@@ -442,14 +667,14 @@ def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
 		REG.setVoltage(REG.TEST_VIDLE,True) # set last-used idle setting
 
 		# start idling:
-		t0 = time.time()
-		timenow = time.time()
+		t0 = clock.time()
+		timenow = clock.time()
 		heater_delays = 0.0
 		while timenow < t0+seconds+heater_delays:
 
 			# wait for heaterblock to reach prescribed temperature (if configured/available/required):
 			if wait_for_TEMP:
-				heater_delays += HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=None, terminal_output=True)
+				heater_delays += HEATER.wait_for_stable_T(DUT_PSU_allowed_turn_off=None, terminal_output=terminal_output)
 
 			# read and print voltages and currents at FIX and REG outputs:
 			f = FIX.read()
@@ -464,13 +689,14 @@ def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
 			T_HB = HEATER.get_temperature_string(do_read=False)
 
 			# output string / line			
-			t = "Idling ({:.1f}".format(time.time()-t0-heater_delays) + ' of ' + "{:.1f}".format(seconds) + ' s): ' + \
+			t = "Idling ({:.1f}".format(clock.time()-t0-heater_delays) + ' of ' + "{:.1f}".format(seconds) + ' s): ' + \
 			    "U1 = " + format_PSU_reading(FIX.TEST_POLARITY*Uf, FIX.VRESREAD) + " V" + '  ' + \
 			    "I1 = " + format_PSU_reading(FIX.TEST_POLARITY*If, FIX.IRESREAD) + " A" + '  ' + \
 			    "U2 = " + format_PSU_reading(REG.TEST_POLARITY*Ur, REG.VRESREAD) + " V" + '  ' + \
 			    "I2 = " + format_PSU_reading(REG.TEST_POLARITY*Ir, REG.IRESREAD) + " A" + '  ' + \
 			    "T = " + T_HB + " °C"
-			print (t, end="\r")
+			if terminal_output:
+				print (t, end="\r")
 
 			if f[2] == "CC":
 				If = IFIXLIM * (1+(FIX.TEST_VIDLE-Uf)/FIX.TEST_VIDLE)
@@ -488,11 +714,12 @@ def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
 					REG.TEST_VIDLE = REG.TEST_VIDLE - dUr
 				REG.setVoltage(REG.TEST_VIDLE,True)
 
-			time.sleep(dt)
-			timenow = time.time()
+			clock.sleep(dt)
+			timenow = clock.time()
 
 		# Clear the terminal:
-		print (' '*len(t), end="\r")
+		if terminal_output:
+			print (' '*len(t), end="\r")
 
 		# write idle / preheat conditions to file:
 		if file is not None:
@@ -505,17 +732,107 @@ def do_idle(PSU1, PSU2, HEATER, seconds, file=None, wait_for_TEMP=False):
 			printit(t, file , '%')
 
 
+###############################################
+# read PSU outputs concurrently (PSU1 + PSU2) #
+###############################################
+
+class concurrent_PSU_reader:
+	'''
+	Read the outputs of several PSUs concurrently (one worker thread per PSU). The readings of all PSUs are started at the same instant, so that the V/I values of the different PSUs correspond to the same point in time.
+	'''
+
+	def __init__(self, PSUs, timeout=10.0):
+		'''
+		concurrent_PSU_reader(PSUs, timeout)
+		PSUs: list of PSU objects
+		timeout: max. time to wait for all PSU threads to be ready for reading (s)
+		'''
+		self._PSUs = PSUs
+		self._timeout = timeout
+		self._pool = ThreadPoolExecutor(max_workers=max(len(PSUs),1), initializer=set_log_station, initargs=(get_log_station(),))
+		self.timestamps = [None]*len(PSUs) # mid-point times of the last readings (s)
+
+
+	def _read(self, p, barrier, N):
+		barrier.wait() # wait until all PSU threads are ready to start
+		t0 = clock.time()
+		if N is None:
+			N = p.NSTABLEREADINGS
+		r = p.read(N)
+		return r, 0.5*(t0+clock.time())
+
+
+	def read(self, N=None):
+		'''
+		r = concurrent_PSU_reader.read(N=None)
+
+		Read voltage, current and limiter mode of all PSUs.
+
+		INPUT:
+		N (optional): number of consistent readings required from each PSU (default: NSTABLEREADINGS of each PSU, use N = 1 for the fastest reading)
+
+		OUTPUT:
+		r: list of readings (V, I, L) of the PSUs. Readings of PSUs that are not configured are [0.0, 0.0, 'NONE'].
+		'''
+
+		num_PSU = len([ p for p in self._PSUs if p.CONFIGURED ])
+		barrier = threading.Barrier(max(num_PSU,1), timeout=self._timeout)
+		futures = []
+		for p in self._PSUs:
+			if p.CONFIGURED:
+				futures.append(self._pool.submit(self._read, p, barrier, N))
+			else:
+				futures.append(None)
+
+		r = []
+		for k in range(len(futures)):
+			if futures[k] is None:
+				r.append([0.0,0.0,'NONE'])
+				self.timestamps[k] = None
+			else:
+				x, self.timestamps[k] = futures[k].result()
+				r.append(x)
+
+		return r
+
+
+	def close(self):
+		self._pool.shutdown()
+
+
 ###############
 # get logger  #
 ###############
 
+# station name of the current thread, shown in the log messages of multi-station runs (see set_log_station()):
+_log_station = threading.local()
+
+
+def set_log_station(name):
+    # tag the log messages of the current thread with the station name (None: no tag)
+    _log_station.name = name
+
+
+def get_log_station():
+    return getattr(_log_station, 'name', None)
+
+
+class _log_station_filter(logging.Filter):
+    # add the station name of the current thread to the log record:
+    def filter(self, record):
+        name = get_log_station()
+        record.station = '' if name is None else name + '/'
+        return True
+
+
 def get_logger(name):
     logger = logging.getLogger(name)
     if not logger.handlers:
         logger.setLevel(logging.DEBUG)
         ch = logging.StreamHandler()
         ch.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(levelname)s (%(name)s): %(message)s')
+        ch.addFilter(_log_station_filter())
+        formatter = logging.Formatter('%(levelname)s (%(station)s%(name)s): %(message)s')
         ch.setFormatter(formatter)
         logger.addHandler(ch)
     
@@ -0,0 +1,245 @@
+"""
+DUT models for the VIRTUAL power supply driver.
+
+Each model computes the currents at the terminals of the DUT connected to PSU1 and PSU2 from the PSU voltages:
+
+    I1, I2 = model.I(V1, V2)
+
+V1, V2: output voltages of PSU1 and PSU2 (V, including the polarity of the PSU connections). Scalars or NumPy arrays of any shape that can be broadcast against each other.
+I1, I2: currents drawn from PSU1 and PSU2 (A, NumPy arrays of the broadcast shape of V1 and V2).
+
+The models are registered by name in MODELS, and can be selected in the [VIRTUAL_DUT] section of the tester configuration file (curvetrace_config.txt):
+
+    [VIRTUAL_DUT]
+    MODEL = MOSFET
+    VTH   = 3.5
+    K     = 0.8
+
+All parameters that are not specified in the configuration use the default values of the model (PARAMETERS).
+"""
+
+import numpy as np
+
+
+# limit exponent arguments to avoid overflow (the currents are limited by the PSU current limits anyway):
+_EXP_MAX = 80.0
+
+
+def _exp(x):
+    return np.exp(np.minimum(x, _EXP_MAX))
+
+
+def _softplus(x):
+    # numerically stable log(1 + exp(x)):
+    return np.log1p(np.exp(-np.abs(x))) + np.maximum(x, 0.0)
+
+
+class dut_model(object):
+    """
+    Base class of the DUT models
+    """
+
+    # model parameters and their default values:
+    PARAMETERS = {}
+
+    def __init__(self, **params):
+        """
+        dut_model(**params)
+        params: model parameters (names as in PARAMETERS, case insensitive). Parameters that are not specified use the default values.
+        """
+
+        self.params = {name: float(value) for name, value in self.PARAMETERS.items()}
+        for name, value in params.items():
+            key = name.lower()
+            if key not in self.PARAMETERS:
+                raise ValueError(
+                    "Unknown parameter " + name + " for DUT model " + type(self).__name__.upper() + " (known parameters: " + ", ".join(sorted(self.PARAMETERS)).upper() + ")."
+                )
+            self.params[key] = float(value)
+
+    def I(self, V1, V2):
+        """
+        I1, I2 = I(V1, V2)
+
+        Currents drawn from PSU1 and PSU2 at PSU voltages V1 and V2 (vectorized).
+        """
+
+        V1, V2 = np.broadcast_arrays(np.asarray(V1, dtype=float), np.asarray(V2, dtype=float))
+        I1, I2 = self._currents(self.params, V1, V2)
+        return np.broadcast_to(I1, V1.shape).astype(float), np.broadcast_to(I2, V1.shape).astype(float)
+
+    def _currents(self, p, V1, V2):
+        # currents for parameter dict p (implemented by the models)
+        raise NotImplementedError
+
+
+class triode(dut_model):
+    """
+    Triode (Koren model). PSU1: anode, PSU2: grid (use negative grid polarity).
+    """
+
+    PARAMETERS = {"mu": 20.0, "kg1": 1200.0, "kp": 300.0, "kvb": 300.0, "ex": 1.4, "kg2": 1e-4, "eg": 1.5}
+
+    def _currents(self, p, Va, Vg):
+        va = np.maximum(Va, 0.0)
+        e1 = (va / p["kp"]) * _softplus(p["kp"] * (1.0 / p["mu"] + Vg / np.sqrt(p["kvb"] + va * va)))
+        ia = np.maximum(e1, 0.0) ** p["ex"] / p["kg1"]
+        ig = p["kg2"] * np.maximum(Vg, 0.0) ** p["eg"]
+        return ia, ig
+
+
+class pentode(dut_model):
+    """
+    Pentode (Koren model) with fixed screen grid voltage VG2. PSU1: anode, PSU2: control grid (use negative grid polarity).
+    """
+
+    PARAMETERS = {"mu": 10.0, "kg1": 1000.0, "kp": 40.0, "kvb": 20.0, "ex": 1.35, "vg2": 250.0, "kg2": 1e-4, "eg": 1.5}
+
+    def _currents(self, p, Va, Vg):
+        e1 = (p["vg2"] / p["kp"]) * _softplus(p["kp"] * (1.0 / p["mu"] + Vg / p["vg2"]))
+        ia = np.maximum(e1, 0.0) ** p["ex"] / p["kg1"] * np.arctan(np.maximum(Va, 0.0) / p["kvb"])
+        ig = p["kg2"] * np.maximum(Vg, 0.0) ** p["eg"]
+        return ia, ig
+
+
+class mosfet(dut_model):
+    """
+    N-channel enhancement MOSFET (square law with channel-length modulation). PSU1: drain, PSU2: gate.
+    """
+
+    PARAMETERS = {"vth": 3.0, "k": 0.5, "lambda": 0.01}
+
+    def _currents(self, p, Vds, Vgs):
+        vov = np.maximum(Vgs - p["vth"], 0.0)
+        vds = np.maximum(Vds, 0.0)
+        id_sat = 0.5 * p["k"] * vov**2
+        id_lin = p["k"] * (vov - 0.5 * vds) * vds
+        i = np.where(vds < vov, id_lin, id_sat) * (1.0 + p["lambda"] * vds)
+        return i, np.zeros_like(i)
+
+
+class mosfet_ekv(dut_model):
+    """
+    N-channel MOSFET (simplified EKV model, continuous from weak to strong inversion). PSU1: drain, PSU2: gate.
+    """
+
+    PARAMETERS = {"vth": 3.0, "is": 0.01, "n": 1.5, "ut": 0.0258, "lambda": 0.01}
+
+    def _currents(self, p, Vds, Vgs):
+        vds = np.maximum(Vds, 0.0)
+        a = 2.0 * p["n"] * p["ut"]
+        i_f = _softplus((Vgs - p["vth"]) / a) ** 2
+        i_r = _softplus((Vgs - p["vth"] - p["n"] * vds) / a) ** 2
+        i = p["is"] * (i_f - i_r) * (1.0 + p["lambda"] * vds)
+        return i, np.zeros_like(i)
+
+
+class jfet(dut_model):
+    """
+    N-channel JFET (square law with channel-length modulation). PSU1: drain, PSU2: gate (use negative gate polarity).
+    """
+
+    PARAMETERS = {"idss": 0.01, "vp": -2.0, "lambda": 0.01, "isg": 1e-12, "vt": 0.0258}
+
+    def _currents(self, p, Vds, Vgs):
+        vov = np.maximum(Vgs - p["vp"], 0.0)
+        vds = np.maximum(Vds, 0.0)
+        beta = p["idss"] / p["vp"]**2
+        id_sat = beta * vov**2
+        id_lin = beta * (2.0 * vov - vds) * vds
+        i = np.where(vds < vov, id_lin, id_sat) * (1.0 + p["lambda"] * vds)
+        ig = p["isg"] * (_exp(Vgs / p["vt"]) - 1.0) # forward biased gate junction
+        return i, np.maximum(ig, 0.0)
+
+
+class bjt(dut_model):
+    """
+    NPN bipolar transistor (Ebers-Moll forward mode with Early effect), base driven by PSU2 through resistor R2 (see R2CONTROL in the DUT configuration). PSU1: collector, PSU2: base resistor.
+    """
+
+    PARAMETERS = {"beta": 200.0, "is": 1e-14, "vt": 0.0258, "va": 100.0, "r2": 10000.0}
+
+    def _currents(self, p, Vce, V2):
+        Is = p["is"] / p["beta"] # saturation current of the base-emitter junction (base current)
+        vce = np.maximum(Vce, 0.0)
+
+        # base-emitter voltage (solve V2 = Vbe + R2 * Ib(Vbe) by Newton iterations, vectorized):
+        if p["r2"] > 0.0:
+            vbe = np.minimum(np.maximum(V2, 0.0), p["vt"] * np.log(1.0 + np.maximum(V2, 0.0) / (p["r2"] * Is)))
+            for k in range(50):
+                e = _exp(vbe / p["vt"])
+                f = vbe + p["r2"] * Is * (e - 1.0) - V2
+                vbe = vbe - f / (1.0 + p["r2"] * Is * e / p["vt"])
+        else:
+            vbe = V2
+
+        ib = np.maximum(Is * (_exp(vbe / p["vt"]) - 1.0), 0.0)
+        ic = p["beta"] * ib * (1.0 + vce / p["va"]) * (1.0 - np.exp(-vce / p["vt"])) # soft saturation at low Vce
+        return ic, ib
+
+
+class resistor(dut_model):
+    """
+    Resistors R1 and R2 connected to PSU1 and PSU2.
+    """
+
+    PARAMETERS = {"r1": 1000.0, "r2": 1e12}
+
+    def _currents(self, p, V1, V2):
+        return np.maximum(V1, 0.0) / p["r1"], np.maximum(V2, 0.0) / p["r2"]
+
+
+class diode(dut_model):
+    """
+    Diode (Shockley equation). PSU1: anode.
+    """
+
+    PARAMETERS = {"is": 1e-12, "n": 1.8, "vt": 0.0258}
+
+    def _currents(self, p, V1, V2):
+        i = np.maximum(p["is"] * (_exp(V1 / (p["n"] * p["vt"])) - 1.0), 0.0)
+        return i, np.zeros_like(i)
+
+
+# registry of the DUT models (name -> model class):
+MODELS = {
+    "TRIODE": triode,
+    "PENTODE": pentode,
+    "MOSFET": mosfet,
+    "MOSFET_EKV": mosfet_ekv,
+    "JFET": jfet,
+    "BJT": bjt,
+    "RESISTOR": resistor,
+    "DIODE": diode,
+}
+
+
+def register_model(name, model):
+    """
+    register_model(name, model)
+
+    Add a DUT model class (subclass of dut_model) to the registry.
+    """
+
+    MODELS[name.upper()] = model
+
+
+def get_model(name, **params):
+    """
+    model = get_model(name, **params)
+
+    Return a DUT model object.
+
+    INPUT:
+    name: model name (see MODELS, case insensitive)
+    params: model parameters (optional)
+
+    OUTPUT:
+    model: DUT model object
+    """
+
+    try:
+        model = MODELS[name.upper()]
+    except KeyError:
+        raise ValueError("Unknown DUT model " + name + " (known models: " + ", ".join(sorted(MODELS)) + ").")
+    return model(**params)
@@ -3,18 +3,24 @@ Python class for heaterblock object.
 """
 
 import logging
-import time
 import numpy as np
 
 from simple_pid import PID
-from threading import Thread
+from threading import Thread, Event, Condition
 from pypsucurvetrace.temperaturesensor_MAXIM import temperaturesensor_MAXIM as TSENS
 from pypsucurvetrace.powersupply import PSU
-from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.thermal_model import thermal_model
+from pypsucurvetrace.arbiter import get_arbiter
+import pypsucurvetrace.clock as clock
+from pypsucurvetrace.curvetrace_tools import get_logger, get_log_station, set_log_station
 
 # set up logger:
 logger = get_logger('heaterblock')
 
+HEATER_CONTROL_PERIOD = 1.0 # default period of the heater controller (s)
+HEATER_MODEL_REFIT = 10 # number of controller iterations between fits of the thermal model
+HEATER_PSU_LOCK_TIMEOUT = 10.0 # max. time to wait for the heater PSU if another thread is using it (s)
+
 
 # heater class (dummy):
 class heater:
@@ -24,6 +30,7 @@ class heater:
 		
 		# set / init all fields before trying to read from config file (which may not have all fields):
 		self._PSU   = None
+		self._PSU_bus = None # arbiter for access to the heater PSU by the controller thread and the others
 		self._TSENS = None
 		self._power_is_on = False
 		self._target_T = target_temperature
@@ -33,6 +40,13 @@ class heater:
 		# thread to read T sensor and for PID control:
 		self._controller = None
 
+		# thermal model of the heaterblock (for feedforward control and prediction of settling time):
+		self._model = None
+
+		# last T sensor reading (temperature, time of reading), shared by the controller thread and the others:
+		self._T_sample = None
+		self._T_sample_cond = Condition()
+
 
 		# try to connect / configure PSU and TSENSOR, and start controller thread:
 		try:
@@ -40,7 +54,7 @@ class heater:
 			# read from config file and set up heater accordingly:
 			self._T_buffer         = tuple(None for i in range(int(config['HEATERBLOCK']['TBUFFER_NUM'])))
 			self._T_buffer_seconds = float(config['HEATERBLOCK']['TBUFFER_INTERVAL'])
-			self._T_buffer_last    = time.time() - self._T_buffer_seconds
+			self._T_buffer_last    = clock.time() - self._T_buffer_seconds
 			if config['HEATERBLOCK']['TEMPSENS_TYPE'].upper() != 'DS1820':
 				raise ValueError('Unknown T sensor type ' + config['HEATERBLOCK']['TEMPSENS_TYPE'] + '.')
 			
@@ -52,9 +66,11 @@ class heater:
 
 			# connect / configure PSU:
 			self._PSU = PSU(config['HEATERBLOCK']['PSU_COMPORT'],config['HEATERBLOCK']['PSU_TYPE'],'HEATERBLOCK_PSU')
+			self._PSU_bus = get_arbiter(config['HEATERBLOCK']['PSU_COMPORT'])
 			self.turn_off()
-			self._PSU.setVoltage(0.0,wait_stable=False)
-			self._PSU.setCurrent(0.0,wait_stable=False)
+			with self._PSU_bus.hold(HEATER_PSU_LOCK_TIMEOUT):
+				self._PSU.setVoltage(0.0,wait_stable=False)
+				self._PSU.setCurrent(0.0,wait_stable=False)
 			
 			self._heater_R         = float(config['HEATERBLOCK']['HEATER_RESISTANCE'])
 			
@@ -70,9 +86,23 @@ class heater:
 			self._PID_Kp = float(config['HEATERBLOCK']['KP'])
 			self._PID_Ki = float(config['HEATERBLOCK']['KI'])
 			self._PID_Kd = float(config['HEATERBLOCK']['KD'])
+
+			# control period (optional):
+			try:
+				control_period = float(config['HEATERBLOCK']['CONTROL_PERIOD'])
+			except KeyError:
+				control_period = HEATER_CONTROL_PERIOD
+
+			# thermal model (optional, off by default):
+			try:
+				use_model = bool(int(config['HEATERBLOCK']['THERMAL_MODEL']))
+			except KeyError:
+				use_model = False
+			if use_model:
+				self._model = thermal_model()
 			
 			# heater controller thread:
-			self._controller = heater_control_thread(self)
+			self._controller = heater_control_thread(self, control_period)
 			self._controller.start()
 
 			# turn heater on (if required):
@@ -98,10 +128,13 @@ class heater:
 
 
 	def set_power(self, power):
-		# set heater power:
+		# set heater power, return heater power applied:
+		applied = 0.0
 		if self._PSU != None:
-			if self._power_is_on:
-				try:
+			try:
+				with self._PSU_bus.hold(HEATER_PSU_LOCK_TIMEOUT):
+				    if not self._power_is_on:
+				        return applied
 				    dut_power = self.get_DUT_heating_power()
 				    if dut_power > 0.0:
 					    power -= dut_power  # subtract heat input from the DUT
@@ -112,29 +145,57 @@ class heater:
 				    voltage = np.sqrt(power*self._heater_R)
 				    voltage = min( voltage, self._PSU.VMAX )
 				    self._PSU.setVoltage(voltage,wait_stable=False)
-				except Exception as e:
-					logger.warning('Could not set heater power: ' + repr(e))
+				    applied = voltage**2 / self._heater_R
+			except Exception as e:
+				logger.warning('Could not set heater power: ' + repr(e))
+		return applied
 	
 		
+	def read_temperature(self):
+		# read T sensor (bus transaction), and update the T sample and the T buffer (returns None if the sensor could not be read, e.g. if the bus was busy for too long; the sample is then skipped):
+		temp,unit = self._TSENS.temperature()
+		if temp is None:
+			return None
+		if unit != 'deg.C':
+			raise ValueError('T value has wrong unit (' + unit + ').')
+
+		now = clock.time()
+		with self._T_sample_cond:
+			self._T_sample = (temp, now)
+
+			# add to T buffer:
+			if self._T_buffer_last + self._T_buffer_seconds < now:
+				self._T_buffer = self._T_buffer[1:] + (temp,)
+				self._T_buffer_last = now
+
+			self._T_sample_cond.notify_all()
+
+		return temp
+
+
+	def get_temperature_sample(self):
+		# get last T sensor reading and its time stamp (no bus transaction):
+		with self._T_sample_cond:
+			if self._T_sample is None:
+				return None, None
+			return self._T_sample
+
+
+	def wait_for_temperature_sample(self, timeout=None):
+		# wait until the controller thread has taken a new T sensor reading (returns False if timeout expired):
+		with self._T_sample_cond:
+			last = self._T_sample
+			return self._T_sample_cond.wait_for(lambda: self._T_sample is not last, timeout)
+
+
 	def get_temperature(self, do_read = True):
-		# get T sensor reading:
+		# get T sensor reading (if the controller thread is running, it reads the T sensor periodically, and the last reading is returned without a bus transaction):
 		if self._TSENS is None:
 			temp = None
 		else:
-			if self._T_buffer[-1] is None:
-				do_read = True
-			if do_read:
-				temp,unit = self._TSENS.temperature()
-				if unit != 'deg.C':
-					raise ValueError('T value has wrong unit (' + unit + ').')
-				
-				# add to T buffer:
-				now = time.time()
-				if self._T_buffer_last + self._T_buffer_seconds < now:
-					self._T_buffer = self._T_buffer[1:] + (temp,)
-					self._T_buffer_last = now
-
-			temp = self._T_buffer[-1] # return last entry in T_buffer
+			temp, t = self.get_temperature_sample()
+			if t is None or ( do_read and not self.controller_is_running() ):
+				temp = self.read_temperature()
 
 		return temp
 		
@@ -166,6 +227,27 @@ class heater:
 		return is_stable
 
 
+	def predict_stable_delay(self):
+		# predict time until the heaterblock temperature is stable, using the thermal model (None if not available):
+		if self._model is None or not self._model.is_valid():
+			return None
+		T, t = self.get_temperature_sample()
+		T_tgt, T_tol = self.get_target_temperature()
+		if T is None or T_tgt is None:
+			return None
+		P_DUT = self.get_DUT_heating_power()
+		dt = self._model.settling_time(T, T_tgt, T_tol, P_min=P_DUT, P_max=P_DUT+self.max_power)
+		if dt is None:
+			return None
+		# add the time needed to fill the T buffer with readings within tolerance:
+		return dt + len(self._T_buffer) * self._T_buffer_seconds
+
+
+	def get_thermal_model(self):
+		# get the thermal model of the heaterblock (None if not used):
+		return self._model
+
+
 	def set_target_temperature(self, T_value, T_tolerance):
 		# set target temperature:
 		self._target_T_val = T_value
@@ -192,10 +274,11 @@ class heater:
 		# turn on PSU / heater power:
 		if self._PSU != None:
 			try:
-				self._PSU.turnOn()
-				self._PSU.setVoltage(0.0,wait_stable=False) # set V = 0 to avoid uncontrolled power / current draw
-				self._PSU.setCurrent(self._PSU.IMAX,wait_stable=False) # set current to max. to allow power control based on voltage limit only
-				self._power_is_on = True
+				with self._PSU_bus.hold(HEATER_PSU_LOCK_TIMEOUT):
+					self._PSU.turnOn()
+					self._PSU.setVoltage(0.0,wait_stable=False) # set V = 0 to avoid uncontrolled power / current draw
+					self._PSU.setCurrent(self._PSU.IMAX,wait_stable=False) # set current to max. to allow power control based on voltage limit only
+					self._power_is_on = True
 			except Exception as e:
 				logger.warning('Could not turn on the heater: ' + repr(e))
 
@@ -204,8 +287,9 @@ class heater:
 		# turn off PSU / heater power:
 		if self._PSU != None:
 			try:
-				self._PSU.turnOff()
-				self._power_is_on = False
+				with self._PSU_bus.hold(HEATER_PSU_LOCK_TIMEOUT):
+					self._PSU.turnOff()
+					self._power_is_on = False
 			except Exception as e:
 				logger.warning('Could not turn off the heater: ' + repr(e))
 
@@ -220,7 +304,7 @@ class heater:
 			delay = 0.0
 			
 		else:
-			t0 = time.time()
+			t0 = clock.time()
 												
 			# wait for heaterblock to attain required temperature:
 			is_first_line = True
@@ -239,9 +323,11 @@ class heater:
 
 				# if necessary and allowed: turn DUT PSU off (to speed up / allow cooling of heaterblock without heat input from DUT)
 				T_tgt, T_tol = self.get_target_temperature()
+				if self.controller_is_running():
+					self.wait_for_temperature_sample(timeout=2*self._controller.period)
 				T_now        = self.get_temperature(do_read=True)
 				
-				if T_now > T_tgt + T_tol:
+				if T_now is not None and T_now > T_tgt + T_tol:
 				    if DUT_PSU_allowed_turn_off is not None:
 				        if T_last is not None:
 				            if T_now >= T_last:
@@ -253,44 +339,69 @@ class heater:
 				                        DUT_PSU_allowed_turn_off.turnOff()
 				                        PSU_turned_off = True
 							        
-				msg = 'Waiting for heaterblock temperature (current: ' + self.get_temperature_string() +' °C, target: ' + self.get_target_temperature_string() + ' °C)...'
-				print (msg, end="\r")
-				# time.sleep(0.5)
-				# T_now = HEATER.get_temperature()
-				T_last = T_now
+				msg = 'Waiting for heaterblock temperature (current: ' + self.get_temperature_string() +' °C, target: ' + self.get_target_temperature_string() + ' °C'
+				dt = self.predict_stable_delay()
+				if dt is not None:
+					msg += ', expected in ' + '{:.0f}'.format(dt) + ' s'
+				msg += ')...'
+				if terminal_output:
+					print (msg, end="\r")
+				if T_now is not None:
+					T_last = T_now
 			
-			if not is_first_line:
+			if terminal_output and not is_first_line:
 				print (' '*len(msg), end="\r") # clear previous line from terminal
 				
 			# turn DUT PSU on again (if necessary):
 			if PSU_turned_off:
 				DUT_PSU_allowed_turn_off.turnOn()
 			
-			delay = time.time() - t0
+			delay = clock.time() - t0
 		
 		return delay
 		
 
+	def controller_is_running(self):
+		return self._controller is not None and self._controller.is_alive()
+
+
+	def get_controller_stats(self):
+		# get statistics of the controller thread (None if there is no controller):
+		if self._controller is None:
+			return None
+		return dict(self._controller.stats)
+
+
 	def terminate_controller_thread(self):
 		# turn off PSU / heater power:
 		if self._controller is not None:
 			self._controller.terminate()
+			s = self._controller.stats
+			if s['iterations'] > 0:
+				logger.debug('Heaterblock controller: ' + str(s['iterations']) + ' iterations, ' + str(s['deadline_misses']) + ' deadline misses (max. lateness ' + '{:.3f}'.format(s['max_lateness']) + ' s).')
 
 
 
-# thread to read T sensor set heater power in the background (PID controller):
+# thread to read T sensor set heater power in the background (PID controller), at a fixed rate:
 class heater_control_thread(Thread):
 
 
-	def __init__(self, heaterblock):
-	### def __init__(self, heaterblock, interval_seconds=1):
+	def __init__(self, heaterblock, period=None):
 		Thread.__init__(self)
 		
 		self._heaterblock = heaterblock
-		### self._interval = interval_seconds
+		self._log_station = get_log_station() # tag the log messages of the controller with the station of the heaterblock
+		self.period = HEATER_CONTROL_PERIOD if period is None else float(period)
+		if self.period <= 0.0:
+			raise ValueError('Heaterblock control period must be positive.')
+		self._stop_event = Event()
+
+		# statistics (number of control iterations, number of iterations that missed their deadline, max. lateness in seconds, number of iterations without T reading):
+		self.stats = { 'iterations': 0, 'deadline_misses': 0, 'max_lateness': 0.0, 'skipped_samples': 0 }
 		
 		# Init and configure PID controller:
 		self._pid = None
+		self._feedforward = False # use feedforward from the thermal model (once it is fitted)?
 		self._is_running = False
 		self._do_run = False
 		try:
@@ -305,20 +416,23 @@ class heater_control_thread(Thread):
 		
 	def run(self):
 	
+		set_log_station(self._log_station)
 		try:
 			self._is_running = True
+			t_next = clock.monotonic()
+			model = self._heaterblock.get_thermal_model()
 
 			while self._do_run:
 			
-				# sleep between PID iterations:
-				### last_time = time.time()
-				### while time.time() < last_time + self._interval:
-				### 	time.sleep(self._interval/10)
-				
 				# get heaterblock temperature:
-				T = self._heaterblock.get_temperature(do_read=True)
+				T = self._heaterblock.read_temperature()
+				t = clock.monotonic()
+				if T is None:
+					# no reading (sensor bus busy or sensor failed): keep the heater power until the next iteration
+					self.stats['skipped_samples'] += 1
 
 				# determine and set heating power:
+				P_heater = 0.0
 				if self._heaterblock.is_on():
 					if T != None:
 						
@@ -329,7 +443,28 @@ class heater_control_thread(Thread):
 						else:
 							self._pid.setpoint = T_target  # update target value for PID
 							power = self._pid(T)                             # determine heater power
-							self._heaterblock.set_power(power)               # set heater power
+							if self._feedforward:
+								power += model.steady_state_power(T_target)  # add power needed to hold the target temperature (the PID only corrects the model error)
+							P_heater = self._heaterblock.set_power(power)    # set heater power
+
+				# log heat input to the block and update the thermal model:
+				if model is not None and T != None:
+					model.add_sample(t, T, P_heater + self._heaterblock.get_DUT_heating_power())
+					if self.stats['iterations'] % HEATER_MODEL_REFIT == HEATER_MODEL_REFIT-1:
+						if model.fit() and not self._feedforward:
+							logger.debug('Heaterblock thermal model: C = ' + '{:.1f}'.format(model.C) + ' J/K, R = ' + '{:.3f}'.format(model.R) + ' K/W, T_amb = ' + '{:.1f}'.format(model.T_amb) + ' °C. Using feedforward control.')
+							self._enable_feedforward()
+
+				# sleep until the next iteration is due:
+				self.stats['iterations'] += 1
+				t_next += self.period
+				late = clock.monotonic() - t_next
+				if late > 0.0:
+					# deadline missed (reading T and setting the power took longer than the control period): skip the missed periods instead of running the controller back-to-back
+					self.stats['deadline_misses'] += 1
+					self.stats['max_lateness'] = max(self.stats['max_lateness'], late)
+					t_next += self.period * (int(late / self.period) + 1)
+				self._stop_event.wait(t_next - clock.monotonic())
 							
 		except Exception as e:
 			logger.warning('Heaterblock PID controller failed: ' + repr(e))
@@ -346,7 +481,15 @@ class heater_control_thread(Thread):
 			self._is_running = False		
 	
 	
+	def _enable_feedforward(self):
+		# the PID now corrects the feedforward power, so it may need to go below zero:
+		self._pid.output_limits = (-self._heaterblock.max_power, self._heaterblock.max_power)
+		self._pid.reset()
+		self._feedforward = True
+	
+	
 	def terminate(self):
 		self._do_run = False
-		while self._is_running:
-			time.sleep(0.01)
+		self._stop_event.set()
+		if self.is_alive():
+			self.join()
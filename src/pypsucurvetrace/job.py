@@ -0,0 +1,162 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Headless job runner: run the tests listed in a job manifest without any user interaction.
+'''
+
+import configparser
+import os
+import shlex
+import subprocess
+
+from pypsucurvetrace.curvetrace_tools import get_logger, configure_test_PSU, configure_idle_PSU, configure_test_settings
+from pypsucurvetrace.station import station
+
+
+# set up logger:
+logger = get_logger('job')
+
+
+#################################################################
+# validate the DUT test parameters (before any PSU is connected) #
+#################################################################
+
+class _DUT_parameters:
+	# stand-in for a connected PSU, takes the TEST_xyz parameters read from the DUT configuration
+	def __init__(self, label):
+		self.LABEL = label
+		self.CONNECTED = True
+		self.CONFIGURED = False
+
+def validate_DUT_config(configDUT, filename):
+	'''
+	validate_DUT_config(configDUT, filename)
+
+	Read the test parameters of the DUT configuration the same way as the station does after connecting the PSUs (no user prompting), and raise a ValueError naming the configuration file if a parameter is missing or invalid. PSU limits and resolutions are checked later, once the PSUs are connected.
+	'''
+
+	try:
+		settings = configure_test_settings(configDUT, logger, interactive=False)
+		PSUs = []
+		for label in ['PSU1', 'PSU2']:
+			if label in configDUT:
+				PSU = configure_test_PSU(_DUT_parameters(label), logger, configDUT[label], interactive=False)
+				if (settings['IDLESECS'] > 0.0) or (settings['PREHEATSECS'] > 0.0) or settings['PULSED']:
+					PSU = configure_idle_PSU(PSU, configDUT[label], interactive=False)
+				PSUs.append(PSU)
+		if len(PSUs) == 0:
+			raise ValueError('No [PSU1] or [PSU2] section.')
+		if len(PSUs) == 2 and hasattr(PSUs[0], 'TEST_VIDLE'):
+			if (not PSUs[0].TEST_VIDLE_MAX == PSUs[0].TEST_VIDLE_MIN) and (not PSUs[1].TEST_VIDLE_MAX == PSUs[1].TEST_VIDLE_MIN):
+				raise ValueError('Both PSUs are configured with variable idle voltages. This cannot work.')
+	except (ValueError, KeyError) as e:
+		raise ValueError('Invalid DUT configuration ' + str(filename) + ': ' + str(e))
+
+	return settings
+
+
+
+#########################################
+# read and validate a job manifest file #
+#########################################
+
+def read_job_manifest(filename):
+
+	manifest = configparser.ConfigParser()
+	if not manifest.read(filename):
+		raise ValueError('Could not read job manifest ' + str(filename) + '.')
+	if not 'JOB' in manifest:
+		raise ValueError('No [JOB] section in job manifest ' + str(filename) + '.')
+	m = manifest['JOB']
+	basedir = os.path.dirname(os.path.abspath(filename))
+
+	job = {}
+
+	# mandatory fields:
+	for key in ['DUT_CONFIG', 'SAMPLE']:
+		if not key in m:
+			raise ValueError(key + ' is not specified in job manifest ' + str(filename) + '.')
+
+	# DUT test configuration (path relative to the manifest file):
+	job['DUT_CONFIG'] = os.path.join(basedir, m['DUT_CONFIG'])
+	job['configDUT'] = configparser.ConfigParser()
+	if not job['configDUT'].read(job['DUT_CONFIG']):
+		raise ValueError('Could not read DUT configuration file ' + job['DUT_CONFIG'] + '.')
+	validate_DUT_config(job['configDUT'], job['DUT_CONFIG'])
+
+	# sample names (SAMPLE, or SAMPLE_FIRST ... SAMPLE_LAST for a step range FIRST:LAST):
+	base = m['SAMPLE'].strip()
+	if base == '':
+		raise ValueError('SAMPLE must not be empty.')
+	if 'STEPS' in m:
+		try:
+			first, last = [ int(x) for x in m['STEPS'].split(':') ]
+		except ValueError:
+			raise ValueError('Could not parse STEPS = ' + m['STEPS'] + ' (expected FIRST:LAST).')
+		if (first <= 0) or (last < first):
+			raise ValueError('Invalid step range STEPS = ' + m['STEPS'] + '.')
+		samples = [ base + '_' + str(k) for k in range(first, last+1) ]
+	else:
+		samples = [ base ]
+
+	# output directory (relative to the manifest file, default: same directory as the manifest):
+	job['OUTPUT_DIR'] = os.path.join(basedir, m.get('OUTPUT_DIR', '.'))
+	job['samples'] = samples
+	for s in samples:
+		if os.path.exists(os.path.join(job['OUTPUT_DIR'], s + '.dat')):
+			raise ValueError('Data / log file ' + s + '.dat exists in ' + job['OUTPUT_DIR'] + '.')
+
+	# tester station (optional, default: [PSU1], [PSU2] and [HEATERBLOCK] sections of the tester configuration):
+	job['STATION'] = m.get('STATION', None)
+
+	# fixture handler (optional): command to be run before each test, with {sample} replaced by the sample name
+	job['FIXTURE_COMMAND'] = m.get('FIXTURE_COMMAND', None)
+
+	return job
+
+
+##################################
+# run the tests of a job (steps) #
+##################################
+
+def run_job(configTESTER, job):
+
+	s = station(job['STATION'], configTESTER, job['configDUT'])
+	os.makedirs(job['OUTPUT_DIR'], exist_ok=True)
+
+	N_fail = 0
+	try:
+		# connect and configure (missing DUT test parameters raise an error before any test is started):
+		s.connect()
+		for samplename in job['samples']:
+
+			if job['FIXTURE_COMMAND'] is not None:
+				cmd = shlex.split(job['FIXTURE_COMMAND'].replace('{sample}', samplename))
+				logger.info('Running fixture command ' + ' '.join(cmd) + '...')
+				if subprocess.run(cmd).returncode != 0:
+					raise RuntimeError('Fixture command failed before test of ' + samplename + '.')
+
+			logger.info('Testing ' + samplename + '...')
+			if s.run(samplename, job['OUTPUT_DIR']):
+				logger.info('Test of ' + samplename + ' completed (' + str(s.N_done) + ' data points).')
+			else:
+				logger.warning('Test of ' + samplename + ' failed: ' + repr(s.error))
+				N_fail = N_fail + 1
+
+	finally:
+		s.close()
+
+	return N_fail
@@ -3,10 +3,13 @@ Python class for abstract power supply objects.
 Classes of specific real-world power supplies will derive from this class.
 """
 
-import time
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from numpy.polynomial.polynomial import polyval
-from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.curvetrace_tools import get_logger, get_log_station, set_log_station
+from pypsucurvetrace.timing import phase_timer
 
 import pypsucurvetrace.powersupply_VOLTCRAFT as powersupply_VOLTCRAFT
 import pypsucurvetrace.powersupply_KORAD as powersupply_KORAD
@@ -24,7 +27,10 @@ logger = get_logger('powersupply')
 #    .turnOff()   	    turn PSU output off
 #    .turnOn()   	    turn PSU output on
 #    .read()                read current voltage, current, and limiter mode (voltage or current limiter active)
-#    #### .settletime()             estimated settle time to attain stable voltage + current at PSU output after changing the setpoint (s)
+#    .setVoltage_steps(voltage, wait_stable), .setCurrent_steps(current, wait_stable), .turnOff_steps(), .turnOn_steps(), .read_steps(N): I/O steps of the above, for blocking or asyncio I/O (see psu_io.py and powersupply_async.py)
+#    .invalidate_setpoints() forget the cached setpoints, so that the next setpoints are sent to the PSU (e.g. after reconnecting the PSU)
+#    .settletime(value)     estimated settle time to attain stable voltage at PSU output after changing the voltage setpoint to value (s)
+#    .timer                 phase_timer object for timing instrumentation (disabled by default)
 #    .VMAX                  max. supported voltage (V)
 #    .VMIN                  min. supported voltage (V)
 #    .IMAX                  max. supported current (V)
@@ -36,6 +42,8 @@ logger = get_logger('powersupply')
 #    .VOFFSETMAX            max. offset of V read vs set
 #    .MAXSETTLETIME         max. time allowed to attain stable output values (will complain if output not stable after this time) (s)
 #    .READIDLETIME          idle time between readings for checking if output values of newly set voltage/current values are at set point, or when checking if consecutive measurement readings are consistent (s)
+#    .SETTIME               nominal time of a voltage or current setting command (s), used for run-time estimates
+#    .READTIME              nominal time of a reading (s), used for run-time estimates
 #    .V_SET_CALPOLY         tuple of polynomial coefficients ai, such that for a desired voltage output x the correct setpoint y is given by y(x) = a0 + a1*x + a2*x^2 + ...
 #    .V_READ_CALPOLY        tuple of polynomial coefficients ai, such that for a given voltage reading the true input voltage y is given by y(x) = a0 + a1*x + a2*x^2 + ...
 #    .I_SET_CALPOLY         same as I_SET_CALPOLY, but for I setting
@@ -47,6 +55,8 @@ logger = get_logger('powersupply')
 #    .TEST_VIDLE            voltage limit for idle conditions during test (V)
 #    .TEST_IIDLE            current limit for idle conditions during test (A)
 #    .TEST_N                number of test voltage steps (V)
+#    .TEST_VSTEP_MAX        max. voltage step size for adaptive sweeps (V), or None for sweeps with fixed step size
+#    .TEST_ADAPTIVE_ITOL    tolerance of current deviation from linear interpolation used to refine adaptive sweeps (A)
 #    .TEST_POLARITY         polarity of connections to the PSU (1 or -1)
 #    .COMMANDSET            commandset type string (indicating Voltcraft/Mason, Korad/RND, SCPI, etc.)
 #    .MODEL                 PSU model string
@@ -58,7 +68,7 @@ class PSU:
 	Abstract power supply (PSU) class
 	"""
 
-	def __init__(self, port=None, commandset=None, label=None, V_SET_CALPOLY=None, V_READ_CALPOLY=None, I_SET_CALPOLY=None, I_READ_CALPOLY=None):
+	def __init__(self, port=None, commandset=None, label=None, V_SET_CALPOLY=None, V_READ_CALPOLY=None, I_SET_CALPOLY=None, I_READ_CALPOLY=None, nominal=False):
 		'''
 		PSU(port, type, label)
 		port : serial port (string, example: port = '/dev/serial/by-id/XYZ_123_abc')
@@ -68,6 +78,7 @@ class PSU:
 			Riden / Ruiden: commandset = 'Riden'
 			Saluki / Maynuo: commandset = 'SALUKI'
 		label: label or name to be used to describe / identify the PSU unit (string)
+		nominal (optional): if True, do not connect to the PSU(s), but use the nominal specifications of the command set (for sweep plans and run-time estimates without hardware access, e.g. dry runs). The PSU object cannot be used for setting or reading the PSU.
 		'''
 
 		# init generic PSU:
@@ -106,6 +117,8 @@ class PSU:
 		self.TEST_VIDLE = 0.0
 		self.TEST_IIDLE = 0.0
 		self.TEST_N = 1
+		self.TEST_VSTEP_MAX = None
+		self.TEST_ADAPTIVE_ITOL = None
 		self.TEST_POLARITY = 1
 		self.LABEL = label
 		self.CONNECTED = False
@@ -114,6 +127,17 @@ class PSU:
 		# Last power value (for use with heaterblock):
 		self._last_power = 0.0
 
+		# Last voltage setpoint and current reading (for use with settle time estimator):
+		self._last_voltage_setpoint = None
+		self._last_current = 0.0
+		self._settle = None
+
+		# thread pool for parallel I/O with the units of a composite PSU:
+		self._pool = None
+
+		# timing instrumentation (disabled):
+		self.timer = phase_timer()
+
 		# check inputs:
 		if not port:
 			logger.error (label + ': cannot connect to power supply (no serial port specified).')
@@ -142,43 +166,50 @@ class PSU:
 					P = port[k]
 
 				if C == 'VOLTCRAFT':
-					PSU = powersupply_VOLTCRAFT.VOLTCRAFT(P,debug=False)
+					driver, specs, options = powersupply_VOLTCRAFT.VOLTCRAFT, powersupply_VOLTCRAFT.VOLTCRAFT_specs(), {}
 
 				elif C == 'KORAD':
-					PSU = powersupply_KORAD.KORAD(P,debug=False)
+					driver, specs, options = powersupply_KORAD.KORAD, powersupply_KORAD.KORAD_specs(), {}
 
 				elif C in [ "BK" , "BK9184B_HIGH" , "BK9185B_HIGH" ]:
-					PSU = powersupply_BK.BK(P,voltagemode='HIGH',debug=False)
+					driver, specs, options = powersupply_BK.BK, powersupply_BK.BK_specs('9185B_HIGH'), {'voltagemode': 'HIGH'}
 					C = 'BK'
 
 				elif C in [ "BK9184B_LOW" , "BK9185B_LOW" ]:
-					PSU = powersupply_BK.BK(P,voltagemode='LOW',debug=False)
+					driver, specs, options = powersupply_BK.BK, powersupply_BK.BK_specs('9185B_LOW'), {'voltagemode': 'LOW'}
 					C = 'BK'
 					
 				elif C == "RIDEN":
-				    PSU = powersupply_RIDEN.RIDEN(P, debug=False)
+				    driver, specs, options = powersupply_RIDEN.RIDEN, powersupply_RIDEN.RIDEN_specs(), {}
 				    
 				elif C == "RIDEN_6012P_6A":
-				    PSU = powersupply_RIDEN.RIDEN(P, currentmode='LOW', debug=False)
+				    driver, specs, options = powersupply_RIDEN.RIDEN, powersupply_RIDEN.RIDEN_specs('RD6012P_6A'), {'currentmode': 'LOW'}
 				    C = 'RIDEN'
 
 				elif C == "RIDEN_6012P_12A":
-				    PSU = powersupply_RIDEN.RIDEN(P, currentmode='HIGH', debug=False)
+				    driver, specs, options = powersupply_RIDEN.RIDEN, powersupply_RIDEN.RIDEN_specs('RD6012P_12A'), {'currentmode': 'HIGH'}
 				    C = 'RIDEN'
 				    
 				elif C == 'SALUKI':
-				    PSU = powersupply_SALUKI.SALUKI(P, debug=False)
+				    driver, specs, options = powersupply_SALUKI.SALUKI, powersupply_SALUKI.SALUKI_specs(), {}
 				    C = 'SALUKI'
 
 				elif C == 'VIRTUAL':
-					PSU = powersupply_VIRTUAL.VIRTUAL(P, debug=False)
+					driver, specs, options = powersupply_VIRTUAL.VIRTUAL, powersupply_VIRTUAL.VIRTUAL_specs(), {}
 					C = 'VIRTUAL'
 				
 				else:
 					raise RuntimeError ('Unknown commandset ' + C + '! Cannot continue...')
 
+				if nominal:
+					# nominal specifications only, no connection to the PSU:
+					PSU = nominal_unit(specs)
+				else:
+					PSU = driver(P, debug=False, **options)
+
 				PSU.COMMANDSET = C
 				PSU._PARENT_PSU = self
+				PSU._SETPOINTS = setpoint_cache(PSU)
 
 				self._PSU.append(PSU)
 
@@ -192,6 +223,8 @@ class PSU:
 			self.IRESREAD = self._PSU[0].IRESREAD
 			self.MAXSETTLETIME = self._PSU[0].MAXSETTLETIME
 			self.READIDLETIME = self._PSU[0].READIDLETIME
+			self.SETTIME = self._PSU[0].SETTIME
+			self.READTIME = self._PSU[0].READTIME
 			if num_PSU == 1:
 				self.MODEL = self._PSU[0].MODEL
 			else:
@@ -217,9 +250,19 @@ class PSU:
 					self.MAXSETTLETIME = self._PSU[k].MAXSETTLETIME
 				if self.READIDLETIME < self._PSU[k].READIDLETIME:
 					self.READIDLETIME = self._PSU[k].READIDLETIME
+				if self.SETTIME < self._PSU[k].SETTIME: # units are served in parallel, so the slowest unit counts
+					self.SETTIME = self._PSU[k].SETTIME
+				if self.READTIME < self._PSU[k].READTIME:
+					self.READTIME = self._PSU[k].READTIME
 
 			if num_PSU > 1:
 				self.PMAX = min (self.PMAX,self.VMAX*self.IMAX)
+			if num_PSU > 1 and not nominal:
+				# each unit has its own serial port, so talk to them in parallel:
+				self._pool = ThreadPoolExecutor(max_workers=num_PSU, thread_name_prefix=label, initializer=set_log_station, initargs=(get_log_station(),))
+
+			# settle time estimator for voltage steps:
+			self._settle = settle_estimator(t_min=self.READIDLETIME, t_max=self.MAXSETTLETIME)
 
 			self.CONNECTED = True
 
@@ -227,6 +270,33 @@ class PSU:
 	########################################################################################################
 	
 
+	def _on_units(self, fn, args=None):
+		"""
+		r = yield from PSU._on_units(fn, args=None)
+
+		I/O steps (see psu_io.py) of fn(unit, *args[k]) for each unit k of the PSU. The units of a composite PSU have separate serial ports, so they are served in parallel (by the thread pool of the PSU with blocking I/O, or by the event loop in coroutines).
+
+		INPUT:
+		fn: function returning the I/O steps for a unit
+		args (optional): list of argument tuples, one per unit (default: no arguments)
+
+		OUTPUT:
+		r: list of the return values of the I/O steps, one per unit
+		"""
+
+		if args is None:
+			args = [ () ]*len(self._PSU)
+
+		with self.timer.phase(self.LABEL + ' serial I/O'):
+			if len(self._PSU) == 1:
+				return [ (yield from fn(self._PSU[0], *args[0])) ]
+
+			return (yield psu_io.parallel([ fn(self._PSU[k], *args[k]) for k in range(len(self._PSU)) ], self._pool))
+
+
+	########################################################################################################
+	
+
 	def setVoltage(self,value,wait_stable):
 		"""
 		PSU.setVoltage(value,wait_stable)
@@ -241,6 +311,16 @@ class PSU:
 		(none)
 		"""
 
+		psu_io.run(self.setVoltage_steps(value,wait_stable))
+
+
+	def setVoltage_steps(self,value,wait_stable):
+		"""
+		PSU.setVoltage_steps(value,wait_stable)
+
+		I/O steps of PSU.setVoltage() (see psu_io.py)
+		"""
+
 		# make sure we're not trying to set a value that is not resolved by the setting resolution of the PSU,
 		# which will never give a stable output at the unresolved value		
 		value = round(value/self.VRESSET) * self.VRESSET
@@ -266,22 +346,17 @@ class PSU:
 			V.append(value)
 
 		for k in range(len(self._PSU)):
-			if self._PSU[k].COMMANDSET in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
-				
-				# determine corrected voltage setpoint:
-				VV = polyval(V[k], self.V_SET_CALPOLY)
-				
-				# set voltage at the PSU:
-				self._PSU[k].voltage(VV)
-				
-			else:
+			if self._PSU[k].COMMANDSET not in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
 				raise RuntimeError('Cannot set voltage on power supply with ' + self._PSU[k].COMMANDSET + ' command set.')
+
+		# determine corrected voltage setpoints and set voltage at the PSU(s):
+		yield from self._on_units( lambda unit, VV: unit._SETPOINTS.voltage_steps(VV) , [ (polyval(V[k], self.V_SET_CALPOLY),) for k in range(len(self._PSU)) ] )
 				
 		# update power output:
 		if value == 0.0:
 			self._last_power = 0.0
 
-# wait for stable output voltage:
+		# wait for stable output voltage:
 		if wait_stable:
 			stable = False
 			limit = 0 	# number of readings with current limiter ON
@@ -289,36 +364,58 @@ class PSU:
 			if self.MODEL == '9120A':
 				limit_max = 6 # The BK 9120A is a diva and needs a bit more convincing and pampering
 
+			# predict settle time from the size of the voltage step and the load current:
+			tol = 1.3*self.VRESREAD + self.VOFFSETMAX
+			if self._last_voltage_setpoint is None:
+				step = None
+			else:
+				step = abs(value - self._last_voltage_setpoint)
+			load = abs(self._last_current)
+			t_read = self._settle.predict(step, load, tol) # time of (first) readback after setting the voltage, see also PSU.settletime()
+
 			last_val = value
-			t0 = time.time() # start time (now)
-			while time.time()-t0 <= self.MAXSETTLETIME:
-              
+			num_read = 0
+			t0 = clock.time() # start time (now)
+			while clock.time()-t0 <= self.MAXSETTLETIME:
+
+				# wait until the scheduled readback time:
+				dt = t0 + t_read - clock.time()
+				if dt > 0.0:
+					with self.timer.phase(self.LABEL + ' settle wait'):
+						yield psu_io.sleep(dt)
+
 				# get new reading:
-				time.sleep(0.2)
-                
-				r = self.read()
+				r = yield from self.read_steps()
+				num_read += 1
 				delta = abs(r[0] - last_val)
-                
-                # don't try for too long if PSU hit the CC limit:
+
+				# don't try for too long if PSU hit the CC limit:
 				if r[2] == "CC":
 					limit += 1
 					if limit > limit_max:
 						break
-				
-                # 
-				elif delta <= 1.3*self.VRESREAD + self.VOFFSETMAX:
+
+				# 
+				elif delta <= tol:
 					stable = True
 					break
-				
-				# prepare next iteration:
+
+				# prepare next iteration (poll at short intervals after a missed prediction):
 				last_val = r[0]
-                
-			if not stable:
+				t_read = clock.time() - t0 + self.READIDLETIME
+
+			self.timer.count(self.LABEL + ' settle readbacks', num_read)
+			if stable:
+				# learn from this voltage step (if the output was stable at the first readback, the real settle time may have been shorter):
+				self._settle.observe(step, load, tol, clock.time()-t0, censored=(num_read == 1))
+			else:
 				if r[2] == "CC":
 					pass # voltage setpoint running into current limit mode. Skip waiting for stable output voltage...
 				else:
+					self.timer.count(self.LABEL + ' settle timeouts')
 					logger.warning (self.LABEL + ': voltage setpoint not reached after ' + str(self.MAXSETTLETIME) + ' s! Offset = ' + str(delta) + ' V')
 
+		self._last_voltage_setpoint = value
 
 
 	########################################################################################################
@@ -337,23 +434,31 @@ class PSU:
 		OUTPUT:
 		(none)
 		"""
+
+		psu_io.run(self.setCurrent_steps(value,wait_stable))
+
+
+	def setCurrent_steps(self,value,wait_stable):
+		"""
+		PSU.setCurrent_steps(value,wait_stable)
+
+		I/O steps of PSU.setCurrent() (see psu_io.py)
+		"""
 		
 		# make sure we're not trying to set a value that is not resolved by the setting resolution of the PSU,
 		# which will never give a stable output at the unresolved value		
 		value = round(value/self.IRESSET) * self.IRESSET
 
 		for k in range(len(self._PSU)):
-			if self._PSU[k].COMMANDSET in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
-							
-				# determine corrected current setpoint:
-				VV = polyval(value, self.I_SET_CALPOLY)
-				
-				# set current at the PSU:
-				self._PSU[k].current(VV)
-				
-			else:
+			if self._PSU[k].COMMANDSET not in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
 				raise RuntimeError('Cannot set current on power supply with ' + self._PSU[k].COMMANDSET + ' command set.')
 
+		# determine corrected current setpoint:
+		VV = polyval(value, self.I_SET_CALPOLY)
+
+		# set current at the PSU(s):
+		yield from self._on_units( lambda unit: unit._SETPOINTS.current_steps(VV) )
+
 		# update power output:
 		if value == 0.0:
 			self._last_power = 0.0
@@ -363,9 +468,9 @@ class PSU:
 			stable = False
 			limit = 0 	# number of readings with voltage limiter ON
 			limit_max = 2	# max. allowed number of voltage limit ON readings
-			t0 = time.time() # start time (now)
-			while not time.time() - t0 > self.MAXSETTLETIME:
-				r = self.read()
+			t0 = clock.time() # start time (now)
+			while not clock.time() - t0 > self.MAXSETTLETIME:
+				r = yield from self.read_steps()
 				delta = abs(r[1] - value)
 				if r[2] == "CV":
 					limit = limit + 1
@@ -375,11 +480,12 @@ class PSU:
 					stable = True
 					break
 				else:
-					time.sleep(self.READIDLETIME)
+					yield psu_io.sleep(self.READIDLETIME)
 			if not stable:
 				if r[2] == "CV":
 					pass # current setpoint running into voltage limit mode. Skip waiting for stable output current...
 				else:
+					self.timer.count(self.LABEL + ' settle timeouts')
 					logger.warning (self.LABEL + ': current setpoint not reached after ' + str(self.MAXSETTLETIME) + ' s! Offset = ' + str(delta) + ' A')
 
 
@@ -399,14 +505,26 @@ class PSU:
 		(none)
 		"""
 
-		for k in range(len(self._PSU)):
-			if self._PSU[k].COMMANDSET in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
-				self._PSU[k].output(False)
-				self._PSU[k].voltage(self.VMIN)
-				self._PSU[k].current(0.0)
+		psu_io.run(self.turnOff_steps())
 
-			else:
+
+	def turnOff_steps(self):
+		"""
+		PSU.turnOff_steps()
+
+		I/O steps of PSU.turnOff() (see psu_io.py)
+		"""
+
+		for k in range(len(self._PSU)):
+			if self._PSU[k].COMMANDSET not in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
 				raise RuntimeError('Cannot turn off power supply with ' + self._PSU[k].COMMANDSET + ' command set.')
+
+		def _off(unit):
+			yield from unit._SETPOINTS.output_steps(False)
+			yield from unit._SETPOINTS.voltage_steps(self.VMIN)
+			yield from unit._SETPOINTS.current_steps(0.0)
+
+		yield from self._on_units(_off)
 				
 		self._last_power = 0.0
 
@@ -428,13 +546,42 @@ class PSU:
 		(none)
 		"""
 
-		for k in range(len(self._PSU)):
-			if self._PSU[k].COMMANDSET in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
-				self._PSU[k].output(True)
+		psu_io.run(self.turnOn_steps())
 
-			else:
+
+	def turnOn_steps(self):
+		"""
+		PSU.turnOn_steps()
+
+		I/O steps of PSU.turnOn() (see psu_io.py)
+		"""
+
+		for k in range(len(self._PSU)):
+			if self._PSU[k].COMMANDSET not in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
 				raise RuntimeError('Cannot turn on power supply with ' + self._PSU[k].COMMANDSET + ' command set.')
 
+		yield from self._on_units( lambda unit: unit._SETPOINTS.output_steps(True) )
+
+
+	########################################################################################################
+
+
+	def invalidate_setpoints(self):
+		"""
+		PSU.invalidate_setpoints()
+
+		Forget the cached voltage and current setpoints of the PSU unit(s), so that the next setpoints are sent to the PSU even if they did not change (use this after reconnecting the PSU, or if the PSU settings were changed at the PSU front panel).
+
+		INPUT:
+		(none)
+
+		OUTPUT:
+		(none)
+		"""
+
+		for unit in self._PSU:
+			unit._SETPOINTS.invalidate()
+
 
 	########################################################################################################
 	
@@ -455,6 +602,16 @@ class PSU:
 		L: limiter mode, 'CV' = voltage limit, 'CC' = current limit (string)
 		"""
 
+		return psu_io.run(self.read_steps(N))
+
+
+	def read_steps(self,N=1):
+		"""
+		PSU.read_steps(N)
+
+		I/O steps of PSU.read() (see psu_io.py)
+		"""
+
 		V = []
 		I = []
 		L = []
@@ -465,27 +622,19 @@ class PSU:
 		if N < 1:
 			raise RuntimeError ('Number of consistent readings in a row must not be less than 1!')
 		
-		t0 = time.time()
+		t0 = clock.time()
 		while True:
 
-			v = []
-			i = []
-			l = []
-			
 			for k in range(len(self._PSU)):
-			
-				if self._PSU[k].COMMANDSET in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
-				    vv,ii,ll = self._PSU[k].reading()
-				    
-				    # add values to the list:
-				    v.append(vv)
-				    i.append(ii)
-				    l.append(ll)
-				
-				else:
+				if self._PSU[k].COMMANDSET not in [ 'KORAD' , 'VOLTCRAFT' , 'BK' , 'RIDEN' , 'SALUKI' , 'VIRTUAL' ]:
 					raise RuntimeError('Cannot read values from power supply with ' + self._PSU[k].COMMANDSET + ' command set.')
-					break
-			
+
+			# read all PSU units:
+			r = yield from self._on_units( lambda unit: psu_io.steps(unit, 'reading') )
+			v = [ x[0] for x in r ]
+			i = [ x[1] for x in r ]
+			l = [ x[2] for x in r ]
+
 			v = sum(v)
 			i = sum(i)/len(i)
 			if 'CC' in l:
@@ -523,10 +672,12 @@ class PSU:
                                         L = L[-(N-1):]
                                         
                                         # wait a little while before taking the next reading
-                                        time.sleep(self.READIDLETIME)
+                                        self.timer.count(self.LABEL + ' read retries')
+                                        yield psu_io.sleep(self.READIDLETIME)
 
-				if time.time() - t0 > self.MAXSETTLETIME:
+				if clock.time() - t0 > self.MAXSETTLETIME:
 					# getting consistent readings is taking too long; give up
+					self.timer.count(self.LABEL + ' read timeouts')
 					logger.info(self.LABEL + ': Could not get ' + str(N) + ' consistent readings in a row after ' + str(self.MAXSETTLETIME) + ' s! DUT drifting? Noise?')
 					break
 		
@@ -547,6 +698,7 @@ class PSU:
 		
 		# store power output:
 		self._last_power = V*I
+		self._last_current = I
 
 		return (V,I,L)
 		
@@ -554,5 +706,248 @@ class PSU:
 	########################################################################################################
 	
 
+	def settletime(self,value=None):
+		"""
+		PSU.settletime(value=None)
+		
+		Estimate settle time of the PSU output after changing the voltage setpoint (learned from previous voltage steps).
+		
+		INPUT:
+		value (optional): new voltage set-point value (float). If None, the settle time of a step of unknown size is returned.
+		
+		OUTPUT:
+		t: estimated settle time (s)
+		"""
+		
+		tol = 1.3*self.VRESREAD + self.VOFFSETMAX
+		if (value is None) or (self._last_voltage_setpoint is None):
+			step = None
+		else:
+			step = abs(value - self._last_voltage_setpoint)
+		return self._settle.predict(step, abs(self._last_current), tol)
+
+
+	########################################################################################################
+	
+
 	def get_last_power(self):
 	    return self._last_power
+
+
+
+########################################################################################################
+
+
+class settle_estimator:
+	"""
+	Estimator of the settle time of a PSU output after a voltage step, learned from previous voltage steps of the same PSU.
+
+	The settle time t is modelled as a first-order step response with dead time and load dependence:
+	t = a + b * ln(max(step/tol,1)) + c * load
+	The coefficients a, b, c are fitted to the most recent observations by weighted least squares, where older observations are given less weight (exponential forgetting).
+	"""
+
+	def __init__(self, t_min, t_max, t_default=0.2, N_max=50, N_min=5, shrink=0.8, forget=0.9):
+		'''
+		settle_estimator(t_min, t_max, t_default, N_max, N_min, shrink)
+		t_min: min. predicted settle time (s)
+		t_max: max. predicted settle time (s)
+		t_default: settle time used until enough observations are available (s)
+		N_max: number of most recent observations used for the fit
+		N_min: min. number of observations required for the fit
+		shrink: factor applied to censored observations (output was already stable at the first readback), to probe for shorter settle times
+		forget: weight factor applied to an observation for each newer observation
+		'''
+
+		self._t_min = t_min
+		self._t_max = t_max
+		self._t_default = t_default
+		self._N_max = N_max
+		self._N_min = N_min
+		self._shrink = shrink
+		self._forget = forget
+		self._obs = [] # list of observations (x_step, load, t)
+		self._coeff = None
+
+
+	def _x_step(self, step, tol):
+		if step is None:
+			return None
+		return np.log(max(step/tol, 1.0))
+
+
+	def predict(self, step, load, tol):
+		"""
+		settle_estimator.predict(step, load, tol)
+
+		Predict settle time.
+
+		INPUT:
+		step: size of the voltage step (V), or None if unknown
+		load: load current (A)
+		tol: voltage tolerance for stable output (V)
+
+		OUTPUT:
+		t: predicted settle time (s)
+		"""
+
+		x = self._x_step(step, tol)
+		if (x is None) or (self._coeff is None):
+			t = self._t_default
+		else:
+			t = self._coeff[0] + self._coeff[1]*x + self._coeff[2]*load
+		return min(max(t, self._t_min), self._t_max)
+
+
+	def observe(self, step, load, tol, t, censored=False):
+		"""
+		settle_estimator.observe(step, load, tol, t, censored)
+
+		Add observed settle time and update the model.
+
+		INPUT:
+		step: size of the voltage step (V), or None if unknown
+		load: load current (A)
+		tol: voltage tolerance for stable output (V)
+		t: observed settle time (s)
+		censored: flag indicating that the output may have been stable before t (bool)
+
+		OUTPUT:
+		(none)
+		"""
+
+		x = self._x_step(step, tol)
+		if x is None:
+			return
+		if censored:
+			t = self._shrink * t
+		self._obs.append( (x, load, t) )
+		self._obs = self._obs[-self._N_max:]
+
+		if len(self._obs) >= self._N_min:
+			u = np.array(self._obs)
+			w = np.sqrt( self._forget ** np.arange(len(u)-1, -1, -1) ) # weights of the observations (newest has weight 1)
+			A = np.column_stack( (np.ones(len(u)), u[:,0], u[:,1]) )
+			self._coeff = np.linalg.lstsq(A * w[:,None], u[:,2] * w, rcond=None)[0]
+
+
+########################################################################################################
+
+
+class setpoint_cache:
+	"""
+	Write-through cache of the setpoints of a PSU unit (driver object). Voltage and current setpoints are only sent to the unit if they differ from the last setpoint sent (after quantization to the setting resolution of the unit). Output on/off commands are always sent.
+
+	The cached setpoints are invalidated if the output is switched on or off (some PSUs change their setpoints when switching the output), if a command fails, or by calling invalidate() (e.g. after reconnecting the PSU).
+
+	The xyz_steps() methods are the I/O steps of the xyz() methods (see psu_io.py).
+	"""
+
+	def __init__(self, unit):
+		'''
+		setpoint_cache(unit)
+		unit: PSU driver object (with voltage(), current() and output() methods, or their I/O steps voltage_steps() etc., and VRESSET and IRESSET fields)
+		'''
+
+		self._unit = unit
+		self._values = {} # cached values ('V' and 'I': quantized setpoints, 'OUT': output state)
+		self.skipped = 0  # number of skipped setpoint commands
+
+
+	def _write(self, key, name, value, resolution):
+		q = round(value/resolution) if resolution > 0 else value
+		if self._values.get(key) == q:
+			self.skipped += 1
+			return
+		self._values.pop(key, None)
+		try:
+			yield from psu_io.steps(self._unit, name, value)
+		except:
+			self.invalidate()
+			raise
+		self._values[key] = q
+
+
+	def voltage(self, value):
+		"""
+		setpoint_cache.voltage(value)
+
+		Set voltage at the unit (if the voltage setpoint has changed).
+		"""
+
+		psu_io.run(self.voltage_steps(value))
+
+
+	def voltage_steps(self, value):
+		yield from self._write('V', 'voltage', value, self._unit.VRESSET)
+
+
+	def current(self, value):
+		"""
+		setpoint_cache.current(value)
+
+		Set current at the unit (if the current setpoint has changed).
+		"""
+
+		psu_io.run(self.current_steps(value))
+
+
+	def current_steps(self, value):
+		yield from self._write('I', 'current', value, self._unit.IRESSET)
+
+
+	def output(self, state):
+		"""
+		setpoint_cache.output(state)
+
+		Turn the output of the unit on or off.
+		"""
+
+		psu_io.run(self.output_steps(state))
+
+
+	def output_steps(self, state):
+		state = bool(state)
+		if self._values.get('OUT') != state:
+			self.invalidate()
+		try:
+			yield from psu_io.steps(self._unit, 'output', state)
+		except:
+			self.invalidate()
+			raise
+		self._values['OUT'] = state
+
+
+	def invalidate(self):
+		"""
+		setpoint_cache.invalidate()
+
+		Forget the cached setpoints, so that the next setpoints are sent to the unit. Units with their own cache of the device state (see RIDEN) are told to forget it as well.
+		"""
+
+		self._values = {}
+		if hasattr(self._unit, 'invalidate'):
+			self._unit.invalidate()
+
+
+
+class nominal_unit:
+	"""
+	PSU unit with the nominal specifications of a command set, without connection to the PSU (for sweep plans and run-time estimates without hardware access, e.g. dry runs). All commands raise a RuntimeError.
+	"""
+
+	def __init__(self, specs):
+		'''
+		nominal_unit(specs)
+		specs: dict with the VMIN, VMAX, ..., SETTIME, READTIME fields (see the xyz_specs() functions of the PSU drivers)
+		'''
+
+		self.MODEL = 'nominal specifications'
+		for key, value in specs.items():
+			setattr(self, key, value)
+
+
+	def _no_connection(self, *args):
+		raise RuntimeError('PSU unit with nominal specifications is not connected.')
+
+	output = voltage = current = reading = _no_connection
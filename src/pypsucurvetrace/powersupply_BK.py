@@ -4,9 +4,12 @@ Python class to control B&K power supplies
 
 import serial
 import sys
-import time
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 from math import ceil, log10
 from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.transcript import serial_port
+from pypsucurvetrace.scpi import scpi_transport
 
 # set up logger:
 logger = get_logger('powersupply_BK')
@@ -19,6 +22,23 @@ BK_SPECS = {
 		"9120A":	    ( 0.0, 32.0,   3.0 , 96,   0.0005,  0.0001,  0.0001, 0.00001, 0.012, 0.0002, 3.0 )   # 9120A, currently testing / under construction
 }
 
+BK_SETTIME = 0.05 # nominal time of a voltage or current setting command (s), used for run-time estimates
+BK_READTIME = 0.1 # nominal time of a reading (s), used for run-time estimates
+BK_NOMINAL_MODEL = '9185B_HIGH' # model assumed for run-time estimates without connecting to the PSU (dry run)
+
+def BK_specs(model=BK_NOMINAL_MODEL):
+	'''
+	specs = BK_specs(model=BK_NOMINAL_MODEL)
+
+	Specifications of a BK model (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the BK class). A KeyError is raised for unknown models.
+	'''
+
+	v = BK_SPECS[model]
+	return { 'VMIN': v[0], 'VMAX': v[1], 'IMAX': v[2], 'PMAX': v[3],
+		 'VRESSET': v[4], 'IRESSET': v[5], 'VRESREAD': v[6], 'IRESREAD': v[7],
+		 'VOFFSETMAX': v[8], 'IOFFSETMAX': v[9], 'MAXSETTLETIME': v[10], 'READIDLETIME': 0.02,
+		 'SETTIME': BK_SETTIME, 'READTIME': BK_READTIME }
+
 BK_TIMEOUT = 2.0
 
 def _BK_debug(s):
@@ -30,6 +50,7 @@ def _BK_debug(s):
 #    .voltage(voltage)
 #    .current(current)
 #    .reading()
+#    .output_steps(state), .voltage_steps(voltage), .current_steps(current), .reading_steps(): I/O steps of the above (see psu_io.py)
 #    .VMIN
 #    .VMAX
 #    .IMAX
@@ -41,6 +62,8 @@ def _BK_debug(s):
 #    .IOFFSETMAX
 #    .MAXSETTLETIME
 #    .READIDLETIME
+#    .SETTIME
+#    .READTIME
 #    .MODEL
 
 class BK(object):
@@ -71,19 +94,20 @@ class BK(object):
 
 				if parse_version(serial.__version__) >= parse_version('3.3') :
 					# open port with exclusive access:
-					self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=BK_TIMEOUT, exclusive = True)
+					self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=BK_TIMEOUT, exclusive = True)
 
 				else:
 					# open port (can't ask for exclusive access):
-					self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=BK_TIMEOUT)
+					self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=BK_TIMEOUT)
 
-				time.sleep(0.2) # wait a bit unit the port is really ready
+				clock.sleep(0.2) # wait a bit unit the port is really ready
 
 				self._Serial.flushInput()
 				self._Serial.flushOutput()
 				self._debug = bool(debug)
+				self._scpi = scpi_transport(self._Serial, 'B&K', debug=self._debug)
 
-				typestring = self._query('*IDN?', max_attempts = 1).split(",") # <manufacturer>,<model>,<serial number>,<firmware version>,0
+				typestring = psu_io.run(self._query('*IDN?', max_attempts = 1)).split(",") # <manufacturer>,<model>,<serial number>,<firmware version>,0
 
 				# break from the loop if successful connection:
 				break
@@ -93,7 +117,7 @@ class BK(object):
 				self._Serial.reset_input_buffer()
 				self._Serial.reset_output_buffer()
 				self._Serial.close()
-				time.sleep(1.5) # needs some time to calm down, BK 9120A needs a bit more than 1 second
+				clock.sleep(1.5) # needs some time to calm down, BK 9120A needs a bit more than 1 second
 
 		if typestring is None:
 			raise RuntimeError('Could not connect to B&k power supply.')
@@ -109,99 +133,71 @@ class BK(object):
 			elif '9120A' in typestring[1]:
 				self.MODEL = '9120A'
 				logger.warning ( 'B&K 9120A communication tends to be unreliable. Be careful...' )
+				self._scpi.compound = False # don't confuse the 9120A with compound queries
 			else:
 				logger.warning ( 'Unknown B&K model: ' + typestring[1] )
 				self.MODEL = '?????'
 
-			v = BK_SPECS[self.MODEL]
-			self.VMIN = v[0]
-			self.VMAX = v[1]
-			self.IMAX = v[2]
-			self.PMAX = v[3]
-			self.VRESSET = v[4]
-			self.IRESSET = v[5]
-			self.VRESREAD = v[6]
-			self.IRESREAD = v[7]
-			self.VOFFSETMAX = v[8]
-			self.IOFFSETMAX = v[9]
-			self.MAXSETTLETIME = v[10]
-			self.READIDLETIME = 0.02
+			for key, value in BK_specs(self.MODEL).items():
+				setattr(self, key, value)
 			
 			# helper fields to work around the issue with the readdout of the CV/CC limiter:
 			self._VLIMITSETTING = None
 			self._ILIMITSETTING = None
 
 			# Clear status and errors:
-			self._query('*CLS',answer=False)
+			psu_io.run(self._query('*CLS',answer=False))
 
 			# Reset to default:
-			self._query('*RST',answer=False)
+			psu_io.run(self._query('*RST',answer=False))
 
 			# Set voltage range
 			if self.MODEL == '9185B_HIGH':
-				self._query('SOURCE:VOLTAGE:RANGE HIGH',answer=False)
+				psu_io.run(self._query('SOURCE:VOLTAGE:RANGE HIGH',answer=False))
 			if self.MODEL == '9185B_LOW':
-				self._query('SOURCE:VOLTAGE:RANGE LOW',answer=False)
+				psu_io.run(self._query('SOURCE:VOLTAGE:RANGE LOW',answer=False))
 		except KeyError:
 		    raise RuntimeError('Unknown B&K model ' + self.MODEL)
 
 	
 	def _query(self, cmd, answer=True, attempt = 1, max_attempts = 10):
 		"""
-		tx/rx to/from PS
+		tx/rx to/from PS (I/O steps, see psu_io.py)
 		"""
-		
-		if attempt > max_attempts:
-			raise RuntimeError('B&K PSU does not respond to ' + cmd + ' command after 10 attempts. Giving up...')
-		elif attempt > 1:
-			if self._debug:
-				_BK_debug('*** Retrying (attempt ' + str(attempt) + ')...')
 
-		# clean the pipes:
-		self._Serial.flushOutput()
-		self._Serial.flushInput()
-
-		# send command to PSU:
-		if self._debug:
-			_BK_debug('B&K <- %s\n' % cmd)
-		self._Serial.write((cmd + '\n').encode())
-		self._Serial.flush() # wait until all data is written to the serial port
-
-		# read answer (if requested):
-		if not answer:
-			ans = None
-		else:
-			ans = self._Serial.readline().decode('utf-8').rstrip("\n\r")
-			if self._debug:
-				_BK_debug('B&K -> %s\n' % ans)
-			if ans == '':
-				if self._debug:
-					_BK_debug('*** No answer from B&K PSU! Command: ' + cmd)
-				self._Serial.flushOutput()			
-				time.sleep(0.1)
-				self._Serial.flushInput()
-				time.sleep(0.1)			
-				ans = self._query(cmd,True,attempt+1, max_attempts)
-				
-		return ans
+		return (yield from self._scpi.query(cmd, answer, attempt, max_attempts))
 		
 
 	def output(self, state):
 		"""
 		enable/disable the PS output
 		"""
+		psu_io.run(self.output_steps(state))
+
+
+	def output_steps(self, state):
+		"""
+		I/O steps of output() (see psu_io.py)
+		"""
 		state = int(bool(state))
 
 		if state:
-			self._query('OUTPUT ON',answer=False)
+			yield from self._query('OUTPUT ON',answer=False)
 		else:
-			self._query('OUTPUT OFF',answer=False)
+			yield from self._query('OUTPUT OFF',answer=False)
 
 
 	def voltage(self, volt):
 		"""
 		set voltage: silently saturates at VMIN and VMAX
 		"""
+		psu_io.run(self.voltage_steps(volt))
+
+
+	def voltage_steps(self, volt):
+		"""
+		I/O steps of voltage() (see psu_io.py)
+		"""
 		if volt > self.VMAX:
 			volt = self.VMAX
 		if volt < self.VMIN:
@@ -219,7 +215,7 @@ class BK(object):
 		cmd = 'SOURCE:VOLTAGE ' + fmt.format(volt)
 
 		# send command to PSU:
-		self._query(cmd,answer=False)
+		yield from self._query(cmd,answer=False)
 		
 		self._VLIMITSETTING = volt
 
@@ -228,6 +224,13 @@ class BK(object):
 		"""
 		set current: silently saturates at IMIN and IMAX
 		"""
+		psu_io.run(self.current_steps(current))
+
+
+	def current_steps(self, current):
+		"""
+		I/O steps of current() (see psu_io.py)
+		"""
 		if current > self.IMAX:
 			current = self.IMAX
 		if current < 0.0:
@@ -245,7 +248,7 @@ class BK(object):
 		cmd = 'SOURCE:CURRENT ' + fmt.format(current)
 		
 		# send command to PSU:
-		self._query(cmd,answer=False)
+		yield from self._query(cmd,answer=False)
 		self._ILIMITSETTING = current
 		
 		
@@ -253,44 +256,20 @@ class BK(object):
 		"""
 		read applied output voltage and current and if PS is in "CV" or "CC" mode
 		"""
-		
-		self._query('*CLS', answer=False)
-		
-		# read voltage:
-		k = 1
-		while True:
-			try:
-				if k > 10:
-					raise RuntimeException("Could not read voltage from B&K PSU!")
-				V = float (self._query('MEASURE:VOLTAGE?'))
-				break
-			except:
-				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
-				pass
+		return psu_io.run(self.reading_steps())
 
-		# read current:
-		k = 1
-		while True:
-			try:
-				if k > 10:
-					raise RuntimeException("Could not read current from B&K PSU!")
-				I = float (self._query('MEASURE:CURRENT?'))
-				break
-			except:
-				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
-				pass
 
+	def reading_steps(self):
+		"""
+		I/O steps of reading() (see psu_io.py)
+		"""
+		
 		# read output limit status:
 		if self.MODEL == '9120A':
 			# Reading the CV/CC mode from the PSU unit messes up the communication with the PSU
 			### THIS SOMEHOW MESSES UP THE COMMUNICATION WITH THE 9120A, so threat his unit differently (see above):				
 			### S = int(self._query('STATus:OPERation:CONDition?'))
+			V, I = yield from self._scpi.measure( [ 'MEASURE:VOLTAGE?' , 'MEASURE:CURRENT?' ] , lambda a: ( float(a[0]) , float(a[1]) ) )
 
 			# Try to guesstimate the CV/CC mode from the V and I readings:
 			S = 'CV'
@@ -304,20 +283,7 @@ class BK(object):
 						S = 'CC'
 
 		elif self.MODEL in ['9185B_HIGH' , '9185B_LOW' ]:
-		
-			k = 1
-			while True:
-				try:
-					if k > 10:
-						raise RuntimeException("Could not read output limit status from B&K PSU!")
-					S = self._query('OUTPUT:STATE?')
-					break
-				except:
-					k = k+1
-					self._Serial.reset_output_buffer()
-					self._Serial.reset_input_buffer()
-					time.sleep(0.05)
-					pass
+			V, I, S = yield from self._scpi.measure( [ 'MEASURE:VOLTAGE?' , 'MEASURE:CURRENT?' , 'OUTPUT:STATE?' ] , lambda a: ( float(a[0]) , float(a[1]) , a[2] ) )
 					
 		else:
 			raise RuntimeError('Cannot determine CV/CC mode for B&K model ' + self.MODEL)
@@ -9,8 +9,10 @@ Python class to control KORAD (RND) power supplies
 
 import serial
 import sys
-import time
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.transcript import serial_port
 
 # set up logger:
 logger = get_logger('powersupply_KORAD')
@@ -30,7 +32,25 @@ KORAD_SPECS = {
 		"KWR103":	( 0.0, 60.5, 15.0, 300, 0.001,  0.001, 0.001, 0.001, 0.0, 0.0, 2.0 )   # confirmed (with the RND incarnation of the KWR103
 }
 
+KORAD_SETTIME = 0.04 # nominal time of a voltage or current setting command (s), used for run-time estimates
+KORAD_READTIME = 0.12 # nominal time of a reading (s), used for run-time estimates
+KORAD_NOMINAL_MODEL = 'KA3005P' # model assumed for run-time estimates without connecting to the PSU (dry run)
+
+def KORAD_specs(model=KORAD_NOMINAL_MODEL):
+	'''
+	specs = KORAD_specs(model=KORAD_NOMINAL_MODEL)
+
+	Specifications of a KORAD model (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the KORAD class). A KeyError is raised for unknown models.
+	'''
+
+	v = KORAD_SPECS[model]
+	return { 'VMIN': v[0], 'VMAX': v[1], 'IMAX': v[2], 'PMAX': v[3],
+		 'VRESSET': v[4], 'IRESSET': v[5], 'VRESREAD': v[6], 'IRESREAD': v[7],
+		 'VOFFSETMAX': v[8], 'IOFFSETMAX': v[9], 'MAXSETTLETIME': v[10], 'READIDLETIME': v[10]/50,
+		 'SETTIME': KORAD_SETTIME, 'READTIME': KORAD_READTIME }
+
 KORAD_TIMEOUT = 2.0
+KORAD_CMD_GAP = 0.03 # min. time between a command without answer and the next command (s)
 
 def _KORAD_debug(s):
 	sys.stdout.write(s)
@@ -41,6 +61,7 @@ def _KORAD_debug(s):
 #    .voltage(voltage)
 #    .current(current)
 #    .reading()
+#    .output_steps(state), .voltage_steps(voltage), .current_steps(current), .reading_steps(): I/O steps of the above (see psu_io.py)
 #    .VMIN
 #    .VMAX
 #    .IMAX
@@ -53,6 +74,8 @@ def _KORAD_debug(s):
 #    .IOFFSETMAX
 #    .MAXSETTLETIME
 #    .READIDLETIME
+#    .SETTIME
+#    .READTIME
 #    .MODEL
 
 class KORAD(object):
@@ -71,19 +94,24 @@ class KORAD(object):
 		from pkg_resources import parse_version
 		if parse_version(serial.__version__) >= parse_version('3.3') :
 			# open port with exclusive access:
-			self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=KORAD_TIMEOUT, exclusive = True)
+			self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=KORAD_TIMEOUT, exclusive = True)
 
 		else:
 			# open port (can't ask for exclusive access):
-			self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=KORAD_TIMEOUT)
+			self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=KORAD_TIMEOUT)
 
-		time.sleep(0.2) # wait a bit unit the port is really ready
+		clock.sleep(0.2) # wait a bit unit the port is really ready
 
 		self._Serial.flushInput()
 		self._Serial.flushOutput()
+		self._io = psu_io.port(self._Serial)
 		self._debug = bool(debug)
+
+		# state of the serial line:
+		self._healthy = False # True if the last query was answered (line is in sync, no need to clean the pipes)
+		self._last_write = None # time of the last command without answer
 		try:
-			typestring = self._query('*IDN?').split(" ")
+			typestring = psu_io.run(self._query('*IDN?')).split(" ")
 
 			# parse typestring:
 			if len(typestring) < 2:
@@ -112,19 +140,8 @@ class KORAD(object):
 				logger.warning ( 'Unknown KORAD model: ' + typestring[1] )
 				self.MODEL = '?????'
 
-			v = KORAD_SPECS[self.MODEL]
-			self.VMIN = v[0]
-			self.VMAX = v[1]
-			self.IMAX = v[2]
-			self.PMAX = v[3]
-			self.VRESSET = v[4]
-			self.IRESSET = v[5]
-			self.VRESREAD = v[6]
-			self.IRESREAD = v[7]
-			self.VOFFSETMAX = v[8]
-			self.IOFFSETMAX = v[9]
-			self.MAXSETTLETIME = v[10]
-			self.READIDLETIME = self.MAXSETTLETIME/50
+			for key, value in KORAD_specs(self.MODEL).items():
+				setattr(self, key, value)
 
 		except serial.SerialTimeoutException:
 		    raise RuntimeError('No KORAD powersupply connected to ' + port)
@@ -133,86 +150,155 @@ class KORAD(object):
 	
 	def _query(self, cmd, answer=True, attempt = 1):
 		"""
-		tx/rx to/from PS
+		tx/rx to/from PS (I/O steps, see psu_io.py)
 		"""
 
 		if attempt > 10:
 			raise RuntimeError('KORAD PSU does not respond to ' + cmd + ' command after 10 attempts. Giving up...')
 		elif attempt > 1:
 			if self._debug:
-				_pps_debug('*** Retrying (attempt ' + str(attempt) + ')...')
+				_KORAD_debug('*** Retrying (attempt ' + str(attempt) + ')...')
 
-		# just in case, make sure the buffers are empty before doing anything:
-		# (it seems some KORADs tend to have issues with stuff dangling in their serial buffers)
-		self._Serial.reset_output_buffer()
-		self._Serial.reset_input_buffer()
-		time.sleep(0.03)
+		if self._healthy:
+			# line is in sync, just give the PSU time to digest the previous command:
+			yield from self._wait_cmd_gap()
+		else:
+			# make sure the buffers are empty before doing anything:
+			# (it seems some KORADs tend to have issues with stuff dangling in their serial buffers)
+			yield self._io.reset_output_buffer()
+			yield self._io.reset_input_buffer()
+			yield psu_io.sleep(0.03)
 
 		if self._debug: _KORAD_debug('KORAD <- %s\n' % cmd)
-		self._Serial.write((cmd + '\n').encode())
-		
+		yield self._io.write((cmd + '\n').encode())
+
 		if not answer:
 			ans = None
+			self._last_write = clock.monotonic()
 		else:
-			ans = self._Serial.readline().decode('utf-8').rstrip("\n\r")
+			ans = (yield self._io.readline()).decode('utf-8').rstrip("\n\r")
 			if self._debug: _KORAD_debug('KORAD -> %s\n' % ans)
+			self._healthy = ans != ''
 			if ans == '':
 				### _KORAD_debug('*** No answer from KORAD PSU! Command: ' + cmd)
-				self._Serial.flushOutput()			
-				time.sleep(0.1)
-				self._Serial.flushInput()
-				time.sleep(0.1)			
-				ans = self._query(cmd,True,attempt+1)
+				yield self._io.flushOutput()
+				yield psu_io.sleep(0.1)
+				yield self._io.flushInput()
+				yield psu_io.sleep(0.1)
+				ans = yield from self._query(cmd,True,attempt+1)
 
 		return ans
 
+	def _wait_cmd_gap(self):
+		"""
+		wait until the PSU had enough time to process the last command without answer (I/O steps)
+		"""
+		if self._last_write is not None:
+			yield psu_io.sleep(self._last_write + KORAD_CMD_GAP - clock.monotonic())
+			self._last_write = None
+
+	def _query_pipelined(self, cmds):
+		"""
+		send queries back-to-back and read all answers (only if the line is in sync)
+		returns list of answers, or None if the line is not in sync or an answer is missing (the line is then out of sync)
+		(I/O steps)
+		"""
+		if not self._healthy:
+			return None
+
+		yield from self._wait_cmd_gap()
+		if self._debug: _KORAD_debug('KORAD <- %s\n' % ' '.join(cmds))
+		yield self._io.write(''.join([ c + '\n' for c in cmds ]).encode())
+
+		ans = []
+		try:
+			for c in cmds:
+				ans.append((yield self._io.readline()).decode('utf-8').rstrip("\n\r"))
+				if ans[-1] == '':
+					break
+		except UnicodeDecodeError:
+			ans.append('')
+		if self._debug: _KORAD_debug('KORAD -> %s\n' % ' '.join(ans))
+
+		if '' in ans:
+			self._healthy = False
+			return None
+		return ans
+
 	def output(self, state):
 		"""
 		enable/disable the PS output
 		"""
+		psu_io.run(self.output_steps(state))
+
+
+	def output_steps(self, state):
+		"""
+		I/O steps of output() (see psu_io.py)
+		"""
 		state = int(bool(state))
 
 		if self.MODEL == "KWR103":
-			self._query('OUT:%d' % state,answer=False)
+			yield from self._query('OUT:%d' % state,answer=False)
 		else:
-			self._query('OUT%d' % state,answer=False)
+			yield from self._query('OUT%d' % state,answer=False)
 
 
 	def voltage(self, voltage):
 		"""
 		set voltage: silently saturates at VMIN and VMAX
 		"""
+		psu_io.run(self.voltage_steps(voltage))
+
+
+	def voltage_steps(self, voltage):
+		"""
+		I/O steps of voltage() (see psu_io.py)
+		"""
 		if voltage > self.VMAX:
 			voltage = self.VMAX
 		if voltage < self.VMIN:
 			voltage = self.VMIN
 		voltage = round (1000*voltage) / 1000
 		if self.MODEL == "KWR103":
-			self._query('VSET:' + str(voltage),answer=False)
+			yield from self._query('VSET:' + str(voltage),answer=False)
 		else:
-			self._query('VSET1:' + str(voltage),answer=False)
+			yield from self._query('VSET1:' + str(voltage),answer=False)
 
 
 	def current(self, current):
 		"""
 		set current: silently saturates at IMIN and IMAX
 		"""
+		psu_io.run(self.current_steps(current))
+
+
+	def current_steps(self, current):
+		"""
+		I/O steps of current() (see psu_io.py)
+		"""
 		if current > self.IMAX:
 			current = self.IMAX
 		if current < 0.0:
 			current = 0.0
 		current = round (1000*current) / 1000
-		self._query('ISET:' + str(current),answer=False)
 		if self.MODEL == "KWR103":
-			self._query('ISET:' + str(current),answer=False)
+			yield from self._query('ISET:' + str(current),answer=False)
 		else:
-			self._query('ISET1:' + str(current),answer=False)
+			yield from self._query('ISET1:' + str(current),answer=False)
 
 
 	def reading(self):
 		"""
 		read applied output voltage and current and if PS is in "CV" or "CC" mode
 		"""
+		return psu_io.run(self.reading_steps())
+
+
+	def reading_steps(self):
+		"""
+		I/O steps of reading() (see psu_io.py)
+		"""
 		if self.MODEL == "KWR103":
 			Vq = 'VOUT?'
 			Iq = 'IOUT?'
@@ -221,19 +307,34 @@ class KORAD(object):
 			Vq = 'VOUT1?'
 			Iq = 'IOUT1?'
 
+		# if the line is in sync, send all queries in one go:
+		r = yield from self._query_pipelined([Vq, Iq, 'STATUS?'])
+		if r is not None:
+			try:
+				V = float(r[0])
+				I = float(r[1])
+				if r[2].encode()[0] & 0b00000001: # test bit-1 for CV or CC
+					S = 'CV'
+				else:
+					S = 'CC'
+				return (V, I, S)
+			except ValueError:
+				# garbled answer, resync and use the single queries below:
+				self._healthy = False
+
 		# read voltage:
 		k = 1
 		while True:
 			try:
 				if k > 10:
 					raise RuntimeException("Could not read voltage from KORAD PSU!")
-				V = float (self._query(Vq))
+				V = float((yield from self._query(Vq)))
 				break
-			except:
+			except Exception:
 				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
+				yield self._io.reset_output_buffer()
+				yield self._io.reset_input_buffer()
+				yield psu_io.sleep(0.05)
 				pass
 
 		# read current:
@@ -242,13 +343,13 @@ class KORAD(object):
 			try:
 				if k > 10:
 					raise RuntimeException("Could not read current from KORAD PSU!")
-				I = float (self._query(Iq))
+				I = float((yield from self._query(Iq)))
 				break
-			except:
+			except Exception:
 				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
+				yield self._io.reset_output_buffer()
+				yield self._io.reset_input_buffer()
+				yield psu_io.sleep(0.05)
 				pass
 
 		# read output limit status:
@@ -257,17 +358,17 @@ class KORAD(object):
 			try:
 				if k > 10:
 					raise RuntimeException("Could not read output limit status from KORAD PSU!")
-				S = self._query('STATUS?')
+				S = yield from self._query('STATUS?')
 				if S.encode()[0] & 0b00000001: # test bit-1 for CV or CC
 					S = 'CV'
 				else:
 					S = 'CC'
 				break
-			except:
+			except Exception:
 				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
+				yield self._io.reset_output_buffer()
+				yield self._io.reset_input_buffer()
+				yield psu_io.sleep(0.05)
 				pass
 
 		return (V, I, S)
@@ -4,9 +4,11 @@ Python class to control RIDEN (RUIDEN) RDxxxx power supplies
 
 # Useful information about RIDEN Modbus registers and other details: https://github.com/ShayBox/Riden
 
-import time
-import minimalmodbus
+import sys
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.transcript import modbus_instrument
 
 # set up logger:
 logger = get_logger('powersupply_RIDEN')
@@ -21,6 +23,23 @@ RIDEN_SPECS = {
 		"RD6012P_12A":	( 0.0, 60.0, 12.0,  720,  0.001,  0.001,  0.0, 0.0, 1.8 ) , # 6012P in high-current mode (0..12A at 1 mA resolution), confirmed working
 }
 
+RIDEN_SETTIME = 0.02 # nominal time of a voltage or current setting command (s), used for run-time estimates
+RIDEN_READTIME = 0.03 # nominal time of a reading (s), used for run-time estimates
+RIDEN_NOMINAL_MODEL = 'RD6012P_6A' # model assumed for run-time estimates without connecting to the PSU (dry run)
+
+def RIDEN_specs(model=RIDEN_NOMINAL_MODEL):
+	'''
+	specs = RIDEN_specs(model=RIDEN_NOMINAL_MODEL)
+
+	Specifications of a RIDEN model (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the RIDEN class). A KeyError is raised for unknown models.
+	'''
+
+	v = RIDEN_SPECS[model]
+	return { 'VMIN': v[0], 'VMAX': v[1], 'IMAX': v[2], 'PMAX': v[3],
+		 'VRESSET': v[4], 'IRESSET': v[5], 'VRESREAD': v[4], 'IRESREAD': v[5],
+		 'VOFFSETMAX': v[6], 'IOFFSETMAX': v[7], 'MAXSETTLETIME': v[8], 'READIDLETIME': v[8]/5,
+		 'SETTIME': RIDEN_SETTIME, 'READTIME': RIDEN_READTIME }
+
 RIDEN_TIMEOUT = 1.0
 
 MAX_COMM_ATTEMPTS = 10
@@ -34,6 +53,8 @@ def _RIDEN_debug(s):
 #    .voltage(voltage)
 #    .current(current)
 #    .reading()
+#    .output_steps(state), .voltage_steps(voltage), .current_steps(current), .reading_steps(): I/O steps of the above (see psu_io.py)
+#    .invalidate()
 #    .VMIN
 #    .VMAX
 #    .IMAX
@@ -46,6 +67,8 @@ def _RIDEN_debug(s):
 #    .IOFFSETMAX
 #    .MAXSETTLETIME
 #    .READIDLETIME
+#    .SETTIME
+#    .READTIME
 #    .MODEL
 
 class RIDEN(object):
@@ -63,13 +86,17 @@ class RIDEN(object):
 		'''
 		
 		self._debug = bool(debug)
+
+		# register map cache (register -> last value written to the PSU):
+		self._registers = {}
 		
 		# open and configure ModBus/serial port:
 		try:
-		    self._instrument = minimalmodbus.Instrument(port=port, slaveaddress=1)
+		    self._instrument = modbus_instrument(port=port, slaveaddress=1)
 		    self._instrument.serial.baudrate = baud
 		    self._instrument.serial.timeout = 1.0
-		    time.sleep(0.2) # wait a bit unit the port is really ready
+		    self._io = psu_io.port(self._instrument)
+		    clock.sleep(0.2) # wait a bit unit the port is really ready
 		except:
 		    raise RuntimeError('Could not connect to RIDEN powersupply at ' + port)
 
@@ -78,7 +105,7 @@ class RIDEN(object):
 		try:
 	        # OCP and OVP max values:
 		    OCP_max = OVP_max = None
-		    mdl = self._get_register(0)
+		    mdl = psu_io.run(self._get_register(0))
 		    if 60060 <= mdl <= 60064:
 		        # RD6006
 		        self.MODEL = 'RD6006'
@@ -103,11 +130,11 @@ class RIDEN(object):
 		        # RD6012P
 		        if currentmode == 'LOW':
 		            self.MODEL = 'RD6012P_6A'
-		            self._set_register(20,0) # set low-current mode
+		            psu_io.run(self._set_register(20,0)) # set low-current mode
 		            OCP_max = 6.1
 		        else:
 		            self.MODEL = 'RD6012P_12A'
-		            self._set_register(20,1) # set high-current mode
+		            psu_io.run(self._set_register(20,1)) # set high-current mode
 		            OCP_max = 12.1
 		        OVP_max = 61.0
 
@@ -124,18 +151,8 @@ class RIDEN(object):
 		        logger.warning ( 'Unknown RIDEN model ID: ' + mdl )
 		        self.MODEL = '<unknown>'
 
-		    self.VMIN          = RIDEN_SPECS[self.MODEL][0]
-		    self.VMAX          = RIDEN_SPECS[self.MODEL][1]
-		    self.IMAX          = RIDEN_SPECS[self.MODEL][2]
-		    self.PMAX          = RIDEN_SPECS[self.MODEL][3]
-		    self.VRESSET       = RIDEN_SPECS[self.MODEL][4]
-		    self.VRESREAD      = RIDEN_SPECS[self.MODEL][4]
-		    self.IRESSET       = RIDEN_SPECS[self.MODEL][5]
-		    self.IRESREAD      = RIDEN_SPECS[self.MODEL][5]
-		    self.VOFFSETMAX    = RIDEN_SPECS[self.MODEL][6]
-		    self.IOFFSETMAX    = RIDEN_SPECS[self.MODEL][7]
-		    self.MAXSETTLETIME = RIDEN_SPECS[self.MODEL][8]
-		    self.READIDLETIME  = self.MAXSETTLETIME/5
+		    for key, value in RIDEN_specs(self.MODEL).items():
+		        setattr(self, key, value)
 		    
 		except KeyError:
 		    raise RuntimeError('Unknown RIDEN powersupply type/model ' + self.MODEL)
@@ -148,35 +165,60 @@ class RIDEN(object):
 		    logger.warning( 'Cannot adjust OVP and OCP limits of the ' + self.MODEL + ' power supply.' )
 		else:
 		    logger.info ( 'Adjusting OVP to ' + str(OVP_max) + ' V and and OCP to ' + str(OCP_max) + ' A.' )
-		    R = [82, 86, 90, 94, 98, 102, 106, 110, 114, 118] # OVP registers (OCP are +1)
+		    # memory presets M0...M9 are at registers 80...119 (V, I, OVP, OCP each), write the OVP and OCP registers of each preset in one go (leave the V and I presets alone):
 		    mul_U = self._voltage_multiplier()
 		    mul_I = self._current_multiplier()
-		    for r in R:
-		       self._set_register(r, OVP_max*mul_U)
-		       self._set_register(r+1, OCP_max*mul_I)
+		    for r in range(82, 120, 4):
+		       psu_io.run(self._set_N_registers(r, [ OVP_max*mul_U, OCP_max*mul_I ]))
 
 
 	def _set_register(self, register, value):
+	    # write register (skip if the register value is known to be unchanged), I/O steps (see psu_io.py):
+	    value = int(value)
+	    if self._registers.get(register) == value:
+	        return
+	    self._registers.pop(register, None)
 	    k = 1
 	    while k <= MAX_COMM_ATTEMPTS:
 	        try:
-        	    self._instrument.write_register(register, int(value))
-        	    break # break from the loop if communication was successful
-        	except:
-        	    k += 1
-        	    pass # keep trying
+	            yield self._io.write_register(register, value)
+	            break # break from the loop if communication was successful
+	        except Exception:
+	            k += 1
+	            pass # keep trying
 	    if k > MAX_COMM_ATTEMPTS:
 	        raise RuntimeError('Communication with RIDEN ' + self.MODEL + ' at ' + self._instrument.serial.port + ' failed.')
-            
+	    self._registers[register] = value
+
+
+	def _set_N_registers(self, register_start, values):
+	    # write block of registers in one transaction (I/O steps):
+	    values = [ int(v) for v in values ]
+	    for r in range(register_start, register_start+len(values)):
+	        self._registers.pop(r, None)
+	    k = 1
+	    while k <= MAX_COMM_ATTEMPTS:
+	        try:
+	            yield self._io.write_registers(register_start, values)
+	            break # break from the loop if communication was successful
+	        except Exception:
+	            k += 1
+	            pass # keep trying
+	    if k > MAX_COMM_ATTEMPTS:
+	        raise RuntimeError('Communication with RIDEN ' + self.MODEL + ' at ' + self._instrument.serial.port + ' failed.')
+	    for r in range(len(values)):
+	        self._registers[register_start+r] = values[r]
+
 
 	def _get_register(self, register):
+	    # read register (I/O steps):
 	    value = None
 	    k = 1
 	    while k <= MAX_COMM_ATTEMPTS:
 	        try:
-        	    value = self._instrument.read_register(register)
+        	    value = yield self._io.read_register(register)
         	    break # break from the loop if communication was successful
-	        except:
+	        except Exception:
         	    k += 1
         	    pass # keep trying
 	    if k > MAX_COMM_ATTEMPTS:
@@ -186,13 +228,14 @@ class RIDEN(object):
 
 
 	def _get_N_registers(self, register_start, N):
+	    # read block of registers in one transaction (I/O steps):
 	    value = None
 	    k = 1
 	    while k <= MAX_COMM_ATTEMPTS:
 	        try:
-        	    values = self._instrument.read_registers(register_start, N)
+        	    values = yield self._io.read_registers(register_start, N)
         	    break # break from the loop if communication was successful
-	        except:
+	        except Exception:
         	    k += 1
         	    pass # keep trying
 	    if k > MAX_COMM_ATTEMPTS:
@@ -201,57 +244,92 @@ class RIDEN(object):
 	    return values
 
 
+	def invalidate(self):
+		"""
+		forget the cached register values, so that the next writes are sent to the PSU (see setpoint_cache in powersupply.py)
+		"""
+		self._registers = {}
+
+
 	def output(self, state):
 		"""
 		enable/disable the PS output
 		"""
+		psu_io.run(self.output_steps(state))
+
+
+	def output_steps(self, state):
+		"""
+		I/O steps of output() (see psu_io.py)
+		"""
 		state = int(bool(state))
-		self._set_register(18, state)
+		self._registers.pop(18, None) # always send the output state
+		yield from self._set_register(18, state)
+
+		# forget the setpoints (see setpoint_cache in powersupply.py):
+		self._registers.pop(8, None)
+		self._registers.pop(9, None)
 
 
 	def voltage(self, voltage):
 		"""
 		set voltage: silently saturates at VMIN and VMAX
 		"""
+		psu_io.run(self.voltage_steps(voltage))
+
+
+	def voltage_steps(self, voltage):
+		"""
+		I/O steps of voltage() (see psu_io.py)
+		"""
 		if voltage > self.VMAX:
 			voltage = self.VMAX
 		if voltage < self.VMIN:
 			voltage = self.VMIN
             
-		self._set_register(8, round(voltage*self._voltage_multiplier()))
-		
-		## time.sleep(0.5)
-		
-		u = self.reading()
+		yield from self._set_register(8, round(voltage*self._voltage_multiplier()))
 		
 
 	def current(self, current):
 		"""
 		set current: silently saturates at IMIN and IMAX
 		"""
+		psu_io.run(self.current_steps(current))
+
+
+	def current_steps(self, current):
+		"""
+		I/O steps of current() (see psu_io.py)
+		"""
         
 		if current > self.IMAX:
 			current = self.IMAX
 		if current < 0.0:
 			current = 0.0
 		
-		self._set_register(9, round(current*self._current_multiplier()))
+		yield from self._set_register(9, round(current*self._current_multiplier()))
 
 
 	def reading(self):
 		"""
 		read applied output voltage and current and if PS is in "CV" or "CC" mode
 		"""
+		return psu_io.run(self.reading_steps())
+
+
+	def reading_steps(self):
+		"""
+		I/O steps of reading() (see psu_io.py)
+		"""
 		
-		# read voltage and current registers:
+		# read registers 10 (voltage) ... 17 (CV or CC?) in one go:
 		V_mult = self._voltage_multiplier()
 		I_mult = self._current_multiplier()
-		u = self._get_N_registers(10,2)
+		u = yield from self._get_N_registers(10,8)
 		V = u[0] / V_mult
 		I = u[1] / I_mult
         
-		# check register 17 (CV or CC?)
-		if self._get_register(17) == 1:
+		if u[7] == 1:
 		    S = 'CC'
 		else:
 		    S = 'CV'
@@ -285,7 +363,7 @@ class RIDEN(object):
 		"""
 		
 		if 'RIDEN6012P' in self.MODEL:
-		    if self._get_register(20) == 0:
+		    if psu_io.run(self._get_register(20)) == 0:
 		        multi = 10000.0
 		    else:
 		        multi = 1000.0
@@ -4,9 +4,12 @@ Python class to control SALUKI / MAYNUO power supplies
 
 import serial
 import sys
-import time
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 from math import ceil, log10
 from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.transcript import serial_port
+from pypsucurvetrace.scpi import scpi_transport
 
 # set up logger:
 logger = get_logger('powersupply_SALUKI')
@@ -21,6 +24,23 @@ SALUKI_SPECS = {
 		
 }
 
+SALUKI_SETTIME = 0.05 # nominal time of a voltage or current setting command (s), used for run-time estimates
+SALUKI_READTIME = 0.1 # nominal time of a reading (s), used for run-time estimates
+SALUKI_NOMINAL_MODEL = 'SPS831' # model assumed for run-time estimates without connecting to the PSU (dry run)
+
+def SALUKI_specs(model=SALUKI_NOMINAL_MODEL):
+	'''
+	specs = SALUKI_specs(model=SALUKI_NOMINAL_MODEL)
+
+	Specifications of a SALUKI model (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the SALUKI class). A KeyError is raised for unknown models.
+	'''
+
+	v = SALUKI_SPECS[model]
+	return { 'VMIN': v[0], 'VMAX': v[1], 'IMAX': v[2], 'PMAX': v[3],
+		 'VRESSET': v[4], 'IRESSET': v[5], 'VRESREAD': v[6], 'IRESREAD': v[7],
+		 'VOFFSETMAX': v[8], 'IOFFSETMAX': v[9], 'MAXSETTLETIME': v[10], 'READIDLETIME': 0.02,
+		 'SETTIME': SALUKI_SETTIME, 'READTIME': SALUKI_READTIME }
+
 SALUKI_TIMEOUT = 2.0
 
 def _SALUKI_debug(s):
@@ -32,6 +52,7 @@ def _SALUKI_debug(s):
 #    .voltage(voltage)
 #    .current(current)
 #    .reading()
+#    .output_steps(state), .voltage_steps(voltage), .current_steps(current), .reading_steps(): I/O steps of the above (see psu_io.py)
 #    .VMIN
 #    .VMAX
 #    .IMAX
@@ -43,6 +64,8 @@ def _SALUKI_debug(s):
 #    .IOFFSETMAX
 #    .MAXSETTLETIME
 #    .READIDLETIME
+#    .SETTIME
+#    .READTIME
 #    .MODEL
 
 class SALUKI(object):
@@ -70,19 +93,20 @@ class SALUKI(object):
 			
 				if parse_version(serial.__version__) >= parse_version('3.3') :
 					# open port with exclusive access:
-					self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=SALUKI_TIMEOUT, exclusive = True)
+					self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=SALUKI_TIMEOUT, exclusive = True)
 
 				else:
 					# open port (can't ask for exclusive access):
-					self._Serial = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=SALUKI_TIMEOUT)
+					self._Serial = serial_port(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=SALUKI_TIMEOUT)
 
-				time.sleep(0.2) # wait a bit unit the port is really ready
+				clock.sleep(0.2) # wait a bit unit the port is really ready
 				
 				self._Serial.flushInput()
 				self._Serial.flushOutput()
 				self._debug = bool(debug)
+				self._scpi = scpi_transport(self._Serial, 'SALUKI', debug=self._debug)
 
-				typestring = self._query('*IDN?', max_attempts = 1) # <manufacturer>,<model>,<serial number>,<firmware version>,0
+				typestring = psu_io.run(self._query('*IDN?', max_attempts = 1)) # <manufacturer>,<model>,<serial number>,<firmware version>,0
 
 				# break from the loop if successful connection:
 				break
@@ -92,7 +116,7 @@ class SALUKI(object):
 				self._Serial.reset_input_buffer()
 				self._Serial.reset_output_buffer()
 				self._Serial.close()
-				time.sleep(1.0) # needs some time to calm down
+				clock.sleep(1.0) # needs some time to calm down
 
 		if typestring is None:
 			raise RuntimeError('Could not connect to SALUKI power supply.')
@@ -130,29 +154,18 @@ class SALUKI(object):
 				logger.warning ( 'Unknown SALUKI model: ' + typestring[1] )
 				self.MODEL = '?????'
 
-			v = SALUKI_SPECS[self.MODEL]
-			self.VMIN = v[0]
-			self.VMAX = v[1]
-			self.IMAX = v[2]
-			self.PMAX = v[3]
-			self.VRESSET = v[4]
-			self.IRESSET = v[5]
-			self.VRESREAD = v[6]
-			self.IRESREAD = v[7]
-			self.VOFFSETMAX = v[8]
-			self.IOFFSETMAX = v[9]
-			self.MAXSETTLETIME = v[10]
-			self.READIDLETIME = 0.02
+			for key, value in SALUKI_specs(self.MODEL).items():
+				setattr(self, key, value)
 			
 			# helper fields to work around the missing readdout of the CV/CC mode:
 			self._VLIMITSETTING = None
 			self._ILIMITSETTING = None
 
 			# Clear status and errors:
-			self._query('*CLS',answer=False)
+			psu_io.run(self._query('*CLS',answer=False))
 
 			# Reset to default:
-			self._query('*RST',answer=False)
+			psu_io.run(self._query('*RST',answer=False))
 
 		except KeyError:
 		    raise RuntimeError('Unknown SALUKI model ' + self.MODEL)
@@ -160,60 +173,42 @@ class SALUKI(object):
 	
 	def _query(self, cmd, answer=True, attempt = 1, max_attempts = 10):
 		"""
-		tx/rx to/from PS
+		tx/rx to/from PS (I/O steps, see psu_io.py)
 		"""
-		
-		if attempt > max_attempts:
-			raise RuntimeError('SALUKI PSU does not respond to ' + cmd + ' command after 10 attempts. Giving up...')
-		elif attempt > 1:
-			if self._debug:
-				_SALUKI_debug('*** Retrying (attempt ' + str(attempt) + ')...')
 
-		# clean the pipes:
-		self._Serial.flushOutput()
-		self._Serial.flushInput()
-
-		# send command to PSU:
-		if self._debug:
-			_SALUKI_debug('SALUKI <- %s\n' % cmd)
-		self._Serial.write((cmd + '\n').encode())
-		self._Serial.flush() # wait until all data is written to the serial port
-
-		# read answer (if requested):
-		if not answer:
-			ans = None
-		else:
-			ans = self._Serial.readline().decode('utf-8').rstrip("\n\r")
-			if self._debug:
-				_SALUKI_debug('SALUKI -> %s\n' % ans)
-			if ans == '':
-				if self._debug:
-					_SALUKI_debug('*** No answer from SALUKI PSU! Command: ' + cmd)
-				self._Serial.flushOutput()			
-				time.sleep(0.1)
-				self._Serial.flushInput()
-				time.sleep(0.1)			
-				ans = self._query(cmd,True,attempt+1, max_attempts)
-				
-		return ans
+		return (yield from self._scpi.query(cmd, answer, attempt, max_attempts))
 		
 
 	def output(self, state):
 		"""
 		enable/disable the PS output
 		"""
+		psu_io.run(self.output_steps(state))
+
+
+	def output_steps(self, state):
+		"""
+		I/O steps of output() (see psu_io.py)
+		"""
 		state = int(bool(state))
 
 		if state:
-			self._query('OUTPUT 1',answer=False)
+			yield from self._query('OUTPUT 1',answer=False)
 		else:
-			self._query('OUTPUT 0',answer=False)
+			yield from self._query('OUTPUT 0',answer=False)
 
 
 	def voltage(self, volt):
 		"""
 		set voltage: silently saturates at VMIN and VMAX
 		"""
+		psu_io.run(self.voltage_steps(volt))
+
+
+	def voltage_steps(self, volt):
+		"""
+		I/O steps of voltage() (see psu_io.py)
+		"""
 		if volt > self.VMAX:
 			volt = self.VMAX
 		if volt < self.VMIN:
@@ -231,7 +226,7 @@ class SALUKI(object):
 		cmd = 'VOLTAGE ' + fmt.format(volt)
 
 		# send command to PSU:
-		self._query(cmd,answer=False)
+		yield from self._query(cmd,answer=False)
 		
 		self._VLIMITSETTING = volt
 
@@ -240,6 +235,13 @@ class SALUKI(object):
 		"""
 		set current: silently saturates at IMIN and IMAX
 		"""
+		psu_io.run(self.current_steps(current))
+
+
+	def current_steps(self, current):
+		"""
+		I/O steps of current() (see psu_io.py)
+		"""
 		if current > self.IMAX:
 			current = self.IMAX
 		if current < 0.0:
@@ -257,7 +259,7 @@ class SALUKI(object):
 		cmd = 'CURRENT ' + fmt.format(current)
 		
 		# send command to PSU:
-		self._query(cmd,answer=False)
+		yield from self._query(cmd,answer=False)
 		self._ILIMITSETTING = current
 		
 		
@@ -265,38 +267,16 @@ class SALUKI(object):
 		"""
 		read applied output voltage and current and if PS is in "CV" or "CC" mode
 		"""
-		
-		self._query('*CLS', answer=False)
-		
-		# read voltage:
-		k = 1
-		while True:
-			try:
-				if k > 10:
-					raise RuntimeException("Could not read voltage from SALUKI PSU!")
-				V = float (self._query('MEASURE:VOLTAGE?'))
-				break
-			except:
-				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
-				pass
+		return psu_io.run(self.reading_steps())
 
-		# read current:
-		k = 1
-		while True:
-			try:
-				if k > 10:
-					raise RuntimeException("Could not read current from SALUKI PSU!")
-				I = float (self._query('MEASURE:CURRENT?'))
-				break
-			except:
-				k = k+1
-				self._Serial.reset_output_buffer()
-				self._Serial.reset_input_buffer()
-				time.sleep(0.05)
-				pass
+
+	def reading_steps(self):
+		"""
+		I/O steps of reading() (see psu_io.py)
+		"""
+		
+		# read voltage and current:
+		V, I = yield from self._scpi.measure( [ 'MEASURE:VOLTAGE?' , 'MEASURE:CURRENT?' ] , lambda a: ( float(a[0]) , float(a[1]) ) )
 
 		# determine / guess output limit status:
 		# (see email from sales01@salukitec.com 20 March 2023: The internal judgment standard of the instrument is that if the difference between the actual current and the current setting value is within 1mA, it will display CC (constant current); if the difference between the actual voltage and the voltage setting value is within 5mV, it will display CV (constant voltage). Errors are all exceeded, nothing is displayed (neither CV nor CC are displayed)
@@ -2,7 +2,21 @@
 Virtual power supply driver for hardware-free runs.
 """
 
-import math
+from pypsucurvetrace.dut_models import triode
+
+
+def VIRTUAL_specs(model="VIRTUAL"):
+    """
+    specs = VIRTUAL_specs(model="VIRTUAL")
+
+    Specifications of the VIRTUAL PSU (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the VIRTUAL class).
+    """
+
+    _ = model
+    return {"VMIN": 0.0, "VMAX": 300.0, "IMAX": 10.0, "PMAX": 300.0,
+            "VRESSET": 0.001, "IRESSET": 0.001, "VRESREAD": 0.001, "IRESREAD": 0.001,
+            "VOFFSETMAX": 0.0, "IOFFSETMAX": 0.0, "MAXSETTLETIME": 0.2, "READIDLETIME": 0.01,
+            "SETTIME": 0.0, "READTIME": 0.0}
 
 
 class _VirtualDUTBus:
@@ -10,9 +24,51 @@ class _VirtualDUTBus:
     Shared state for VIRTUAL PSU channels.
     """
 
+    # default bus: VIRTUAL PSU units in the order they were created (channel 0: PSU1, channel 1: PSU2, further channels report zero current):
     channels = []
 
 
+class virtual_DUT(object):
+    """
+    DUT connected to the VIRTUAL PSU units of PSU1 (channel 0) and PSU2 (channel 1). Use one virtual_DUT per tester station.
+    """
+
+    def __init__(self, model=None):
+        """
+        virtual_DUT(model=None)
+        model: DUT model object (see dut_models, default: triode)
+        """
+
+        if model is None:
+            model = triode()
+        self.model = model
+        self.channels = ([], []) # VIRTUAL units of PSU1 and PSU2 (several units of a stacked PSU are connected in series)
+
+    def connect(self, unit, channel):
+        """
+        connect(unit, channel)
+
+        Connect a VIRTUAL PSU unit to channel 0 (PSU1) or channel 1 (PSU2) of the DUT.
+        """
+
+        if unit in _VirtualDUTBus.channels:
+            _VirtualDUTBus.channels.remove(unit)
+        unit._dut = self
+        unit._channel_idx = channel
+        self.channels[channel].append(unit)
+
+    def currents(self):
+        """
+        I1, I2 = currents()
+
+        DUT currents at the present output voltages of PSU1 and PSU2.
+        """
+
+        V = [sum(u._effective_output_voltage() for u in ch) for ch in self.channels]
+        I1, I2 = self.model.I(V[0], V[1])
+        return float(I1), float(I2)
+
+
 class VIRTUAL(object):
     """
     Minimal software-only PSU driver implementing the same API as real drivers.
@@ -23,18 +79,8 @@ class VIRTUAL(object):
         _ = debug
 
         self.MODEL = "VIRTUAL"
-        self.VMIN = 0.0
-        self.VMAX = 300.0
-        self.IMAX = 10.0
-        self.PMAX = 300.0
-        self.VRESSET = 0.001
-        self.IRESSET = 0.001
-        self.VRESREAD = 0.001
-        self.IRESREAD = 0.001
-        self.VOFFSETMAX = 0.0
-        self.IOFFSETMAX = 0.0
-        self.MAXSETTLETIME = 0.2
-        self.READIDLETIME = 0.01
+        for key, value in VIRTUAL_specs().items():
+            setattr(self, key, value)
 
         self._out = False
         self._vset = 0.0
@@ -42,19 +88,9 @@ class VIRTUAL(object):
         self._channel_idx = len(_VirtualDUTBus.channels)
         _VirtualDUTBus.channels.append(self)
 
-        # Static triode model parameters (Koren-like softplus formulation).
-        self._mu = 20.0
-        self._kg1 = 1200.0
-        self._kp = 300.0
-        self._kvb = 300.0
-        self._ex = 1.4
-        self._kg2 = 1e-4
-        self._eg = 1.5
-
-    @staticmethod
-    def _softplus(x):
-        # Numerically stable log(1 + exp(x)).
-        return math.log1p(math.exp(-abs(x))) + max(x, 0.0)
+        # DUT model of the default bus (see virtual_DUT for DUTs connected to specific PSUs):
+        self._dut = None
+        self._model = triode()
 
     def _effective_output_voltage(self):
         if not self._out:
@@ -86,31 +122,17 @@ class VIRTUAL(object):
         if not self._out:
             return 0.0, 0.0, "CV"
 
-        # Use channel 0 as anode supply (Va), channel 1 as grid supply (Vg).
-        # Additional channels are accepted and report zero current.
-        Va = 0.0
-        Vg = 0.0
-        if len(_VirtualDUTBus.channels) > 0:
-            ch_a = _VirtualDUTBus.channels[0]
-            Va = ch_a._effective_output_voltage()
-        if len(_VirtualDUTBus.channels) > 1:
-            ch_g = _VirtualDUTBus.channels[1]
-            Vg = ch_g._effective_output_voltage()
-
-        # Static Koren-style triode model:
-        # E1 = (Va/Kp) * ln(1 + exp(Kp * (1/mu + Vg/sqrt(Kvb + Va^2))))
-        # Ia = E1^Ex / Kg1
-        va = max(Va, 0.0)
-        denom = math.sqrt(self._kvb + va * va)
-        arg = self._kp * ((1.0 / self._mu) + (Vg / denom))
-        e1 = (va / self._kp) * self._softplus(arg)
-        ia = (max(e1, 0.0) ** self._ex) / self._kg1
-        ig = self._kg2 * (max(Vg, 0.0) ** self._eg)
-
-        if self._channel_idx == 0:
-            current = ia
-        elif self._channel_idx == 1:
-            current = ig
+        if self._dut is not None:
+            I = self._dut.currents()
+        else:
+            # default bus: use channel 0 as PSU1 (anode), channel 1 as PSU2 (grid):
+            V = [0.0, 0.0]
+            for k in range(min(len(_VirtualDUTBus.channels), 2)):
+                V[k] = _VirtualDUTBus.channels[k]._effective_output_voltage()
+            I = self._model.I(V[0], V[1])
+
+        if self._channel_idx < 2:
+            current = float(I[self._channel_idx])
         else:
             current = 0.0
 
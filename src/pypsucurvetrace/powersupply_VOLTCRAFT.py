@@ -7,8 +7,11 @@ import serial
 import sys
 import math
 import warnings
-import time
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
 from pypsucurvetrace.curvetrace_tools import get_logger
+from pypsucurvetrace.transcript import serial_port
+from pypsucurvetrace.arbiter import get_arbiter
 
 # set up logger:
 logger = get_logger('powersupply_VOLTCRAFT')
@@ -27,7 +30,27 @@ PPS_MODELS = { (36.2,  7.0) : "PPS11360", # confirmed
 		       (18.2,  12.0): "PPS11810"  # added MB 2019-01-10
 		     }
 
-PPS_TIMEOUT = 2.0
+PPS_SETTIME = 0.1 # nominal time of a voltage or current setting command (s), used for run-time estimates
+PPS_READTIME = 0.1 # nominal time of a reading (s), used for run-time estimates
+PPS_NOMINAL_MODEL = 'PPS16005' # model assumed for run-time estimates without connecting to the PSU (dry run)
+
+def VOLTCRAFT_specs(model=PPS_NOMINAL_MODEL):
+	'''
+	specs = VOLTCRAFT_specs(model=PPS_NOMINAL_MODEL)
+
+	Specifications of a VOLTCRAFT PPS model (dict with the VMIN, VMAX, ..., SETTIME, READTIME fields of the VOLTCRAFT class). A KeyError is raised for unknown models.
+	'''
+
+	VMAX, IMAX = { m: limits for limits, m in PPS_MODELS.items() }[model]
+	# Determined experimentally with Voltcraft PPS-16005:
+	return { 'VMIN': 0.9, 'VMAX': VMAX, 'IMAX': IMAX, 'PMAX': math.floor(VMAX * IMAX),
+		 'VRESSET': 0.1, 'IRESSET': 0.1, 'VRESREAD': 0.1, 'IRESREAD': 0.01, # VRESREAD = 0.12 ?
+		 'VOFFSETMAX': 0.0, 'IOFFSETMAX': 0.0, 'MAXSETTLETIME': 5, 'READIDLETIME': 0.2,
+		 'SETTIME': PPS_SETTIME, 'READTIME': PPS_READTIME }
+
+PPS_TIMEOUT = 2.0 # max. time to wait for a complete answer (s)
+PPS_MAX_ATTEMPTS = 10
+PPS_LOCK_TIMEOUT = 30.0 # max. time to wait for the serial port if another thread is using it (s, longer than a query with all retries)
 
 def _pps_debug(s):
 	sys.stdout.write(s)
@@ -38,6 +61,8 @@ def _pps_debug(s):
 #    .voltage(voltage)
 #    .current(current)
 #    .reading()
+#    .output_steps(state), .voltage_steps(voltage), .current_steps(current), .reading_steps(): I/O steps of the above (see psu_io.py)
+#    .stats
 #    .VMIN
 #    .VMAX
 #    .IMAX
@@ -49,6 +74,8 @@ def _pps_debug(s):
 #    .VOFFSETMAX
 #    .MAXSETTLETIME
 #    .READIDLETIME
+#    .SETTIME
+#    .READTIME
 #    .MODEL
 
 
@@ -68,23 +95,25 @@ class VOLTCRAFT(object):
 		from pkg_resources import parse_version
 		if parse_version(serial.__version__) >= parse_version('3.3') :
 			# open port with exclusive access:
-			self._Serial = serial.Serial(port, timeout=PPS_TIMEOUT, exclusive = True)
+			self._Serial = serial_port(port, timeout=PPS_TIMEOUT, exclusive = True)
 
 		else:
 			# open port (can't ask for exclusive access):
-			self._Serial = serial.Serial(port, timeout=PPS_TIMEOUT)
+			self._Serial = serial_port(port, timeout=PPS_TIMEOUT)
 
 		self._Serial.flushInput()
 		self._Serial.flushOutput()
-		self._SERIAL_locked = False
+		self._io = psu_io.port(self._Serial)
+		self._bus = get_arbiter(port) # arbiter for access to the serial port by different threads
+
+		# communication statistics (number of answered queries, number of retries, total and max. time of answered queries in s):
+		self.stats = { 'queries': 0, 'retries': 0, 'time': 0.0, 'max_time': 0.0 }
 		
 		self._debug = bool(debug)
 
 		try:
 		    model = self.limits()
 		    self.MODEL = PPS_MODELS[model]
-		    self.VMAX = model[0]
-		    self.IMAX = model[1]
 		    
 		    if self.MODEL in ("PPS11603", "PPS13610", "PPS11815"):
 		        logger.warning ( 'Operation of VOLTCRAFT ' + self.MODEL + ' with pypsucurvetrace is untested -- be careful!' )
@@ -102,42 +131,37 @@ class VOLTCRAFT(object):
 		if not (prom is None):
 		    self.use_preset(prom)
 		    
-		# Determined experimentally with Voltcraft PPS-16005:
-		self.VMIN = 0.9
-		self.VRESSET = 0.1
-		self.IRESSET = 0.1
-		# self.VRESREAD = 0.12
-		self.VRESREAD = 0.1
-		self.IRESREAD = 0.01
-		self.VOFFSETMAX = 0.0
-		self.IOFFSETMAX = 0.0
-		self.MAXSETTLETIME = 5
-		self.READIDLETIME = 0.2
-		self.PMAX = math.floor(self.VMAX * self.IMAX)
+		for key, value in VOLTCRAFT_specs(self.MODEL).items():
+			setattr(self, key, value)
 
 
 	########################################################################################################
 
 
-	def get_SERIAL_lock(self):
+	def get_SERIAL_lock(self, timeout=None):
 		'''
-		VOLTCRAFT.get_SERIAL_lock()
+		VOLTCRAFT.get_SERIAL_lock(timeout=None)
 		
 		Lock serial port for exclusive access (important if different threads / processes are trying to use the port). Make sure to release the lock after using the port (see VOLTCRAFT.release_SERIAL_lock()!
 		
 		INPUT:
-		(none)
+		timeout: max. time to wait for the port (s, default: PPS_LOCK_TIMEOUT). A RuntimeError is raised if the port is not available in time.
 		
 		OUTPUT:
 		(none)
 		'''
 
-		# wait until the serial port is unlocked:
-		while self._SERIAL_locked:
-			time.sleep(0.01)
-			
-		# lock the port:
-		self._SERIAL_locked = True
+		psu_io.run(self._get_SERIAL_lock(timeout))
+
+
+	def _get_SERIAL_lock(self, timeout=None):
+		# I/O steps of get_SERIAL_lock() (see psu_io.py)
+
+		# wait until the serial port is available, and lock it:
+		if timeout is None:
+			timeout = PPS_LOCK_TIMEOUT
+		if not (yield psu_io.acquire(self._bus, timeout)):
+			raise RuntimeError('VOLTCRAFT PSU: timeout waiting for access to serial port ' + self._bus.name + ' (port is held by another thread).')
 
 
 	########################################################################################################
@@ -157,71 +181,59 @@ class VOLTCRAFT(object):
 		'''
 
 		# release the lock:
-		self._SERIAL_locked = False
+		self._bus.release()
 
-	def _query(self, cmd, attempt = 1, have_lock = False):
+	def _query(self, cmd, have_lock = False):
 		"""
-		tx/rx to/from PS
+		tx/rx to/from PS (I/O steps, see psu_io.py)
 		"""
 
 		if not have_lock:
-			self.get_SERIAL_lock()
-
-		if attempt > 10:
-			raise RuntimeError('Voltcraft PSU does not respond to ' + cmd + ' command after 10 attempts. Giving up...')
-		elif attempt > 1:
-			if self._debug:
-				_pps_debug('*** Retrying (attempt ' + str(attempt) + ')...')
-
-		if self._debug: _pps_debug("PPS <- %s<CR>\n" % cmd)
-		self._Serial.write((cmd + '\r').encode())
-
-		b = []
-		retry = False
-		if self._debug: _pps_debug("PPS -> ")
-
-		# read answer byte by byte:
-		answerOK = False
-		while True:
-			
-			b.append(self._Serial.read(1).decode('utf-8'))
-			if self._debug: _pps_debug(b[-1].replace('\r', '<CR>'))
-
-			# if there was no answer:
-			if b[-1] == "":
-				if self._debug:
-					_pps_debug('*** No response from Voltcraft PSU! Command: ' + cmd)
-				break
-
-			# if last three entries are OK\r, the answer is complete:
-			if b[-3:] == list("OK\r"):
-				answerOK = True
-				break
-
-		if self._debug: _pps_debug('\n')
+			yield from self._get_SERIAL_lock()
 
-		if not answerOK:
-			self._Serial.flushOutput()			
-			time.sleep(0.2)
-			self._Serial.flushInput()
-			time.sleep(0.2)			
-			b = self._query(cmd,attempt+1, have_lock=True)
-
-		else:
-			b = "".join(b[:-4])
+		try:
+			for attempt in range(1, PPS_MAX_ATTEMPTS+1):
+
+				if attempt > 1:
+					# no (complete) answer to the last attempt, clean the pipes and try again:
+					self.stats['retries'] += 1
+					if self._debug:
+						_pps_debug('*** Retrying (attempt ' + str(attempt) + ')...')
+					yield self._io.flushOutput()
+					yield psu_io.sleep(0.2)
+					yield self._io.flushInput()
+					yield psu_io.sleep(0.2)
+
+				t0 = clock.monotonic()
+				if self._debug: _pps_debug("PPS <- %s<CR>\n" % cmd)
+				yield self._io.write((cmd + '\r').encode())
+
+				# read the answer up to the final OK\r (or until the timeout of the port has expired):
+				b = yield self._io.read_until(b'OK\r')
+				if self._debug: _pps_debug("PPS -> %s\n" % b.decode('utf-8', errors='replace').replace('\r', '<CR>'))
+
+				if b.endswith(b'OK\r'):
+					dt = clock.monotonic() - t0
+					self.stats['queries'] += 1
+					self.stats['time'] += dt
+					self.stats['max_time'] = max(self.stats['max_time'], dt)
+					return b[:-3].decode('utf-8')[:-1] # answer without <CR>OK<CR>
 
+				if self._debug:
+					_pps_debug('*** No response from Voltcraft PSU! Command: ' + cmd + '\n')
 
-		if not have_lock:
-			self.release_SERIAL_lock()
+			raise RuntimeError('Voltcraft PSU does not respond to ' + cmd + ' command after ' + str(PPS_MAX_ATTEMPTS) + ' attempts. Giving up...')
 
-		return b
+		finally:
+			if not have_lock:
+				self.release_SERIAL_lock()
 
 
 	def limits(self):
 		"""
 		get maximum voltage and current from PS
 		"""
-		s = self._query("GMAX")
+		s = psu_io.run(self._query("GMAX"))
 		self.IMULT = 100. if s == "362700" else 10.
 		V = int(s[0:3]) / 10.
 		I = int(s[3:6]) / self.IMULT
@@ -231,30 +243,54 @@ class VOLTCRAFT(object):
 		"""
 		enable/disable the PS output
 		"""
+		psu_io.run(self.output_steps(state))
+
+	def output_steps(self, state):
+		"""
+		I/O steps of output() (see psu_io.py)
+		"""
 		state = int(not bool(state))
-		self._query("SOUT%d" % state)
+		yield from self._query("SOUT%d" % state)
 
 	def voltage(self, voltage):
 		"""
 		set voltage: silently saturates at VMIN and VMAX
 		"""
+		psu_io.run(self.voltage_steps(voltage))
+
+	def voltage_steps(self, voltage):
+		"""
+		I/O steps of voltage() (see psu_io.py)
+		"""
 		voltage = max(min(int(float(voltage) * 10), int(self.VMAX*10)), self.VMIN)
 		voltage = round(voltage/self.VRESSET) * self.VRESSET
-		self._query("VOLT%03d" % voltage)
+		yield from self._query("VOLT%03d" % voltage)
 
 	def current(self, current):
 		"""
 		set current: silently saturates at 0 and IMAX
 		"""
+		psu_io.run(self.current_steps(current))
+
+	def current_steps(self, current):
+		"""
+		I/O steps of current() (see psu_io.py)
+		"""
 		current = max(min(int(float(current) * self.IMULT), int(self.IMAX * self.IMULT)), 0)
 		current = round(current/self.IRESSET) * self.IRESSET
-		self._query("CURR%03d" % current)
+		yield from self._query("CURR%03d" % current)
 
 	def reading(self):
 		"""
 		read applied output voltage and current and if PS is in "CV" or "CC" mode
 		"""
-		s = self._query("GETD")
+		return psu_io.run(self.reading_steps())
+
+	def reading_steps(self):
+		"""
+		I/O steps of reading() (see psu_io.py)
+		"""
+		s = yield from self._query("GETD")
 		V = int(s[0:4]) / 100.
 		I = int(s[4:8]) / 100.
 		MODE = bool(int(s[8]))
@@ -0,0 +1,185 @@
+"""
+Asyncio interface for power supply drivers and PSU objects.
+The protocol logic of the drivers and of the PSU objects is written as I/O steps (see psu_io.py). The blocking API runs these steps with blocking I/O, the async API runs the same steps in coroutines with non-blocking reads from the serial ports. The waits for the answers of several PSUs therefore overlap on one asyncio event loop, without a thread per PSU:
+
+	async def main():
+		PSU1 = async_PSU(powersupply.PSU(port1, 'KORAD', 'PSU1'))
+		PSU2 = async_PSU(powersupply.PSU(port2, 'RIDEN', 'PSU2'))
+		...
+		(V1, I1, L1), (V2, I2, L2) = await read_all([PSU1, PSU2])
+
+	asyncio.run(main())
+
+Connecting to the PSUs (creating the driver / PSU objects) uses blocking I/O. Drivers without serial I/O (VIRTUAL) are called directly. A PSU must not be used by several coroutines, or by a coroutine and a thread, at the same time.
+"""
+
+import asyncio
+import pypsucurvetrace.psu_io as psu_io
+
+
+# async_driver:
+#    await .output(state)
+#    await .voltage(voltage)
+#    await .current(current)
+#    await .reading()
+#    all other fields (VMIN, VMAX, ..., MODEL) as in the blocking driver
+#
+# async_PSU:
+#    await .setVoltage(value, wait_stable)
+#    await .setCurrent(value, wait_stable)
+#    await .turnOff()
+#    await .turnOn()
+#    await .read(N)
+#    all other fields and methods without I/O (VMAX, ..., TEST_xyz, CONNECTED, CONFIGURED, settletime(), get_last_power(), ...) as in the blocking PSU object
+
+
+class _async_object(object):
+	"""
+	Base class for the asyncio interfaces of blocking objects
+	"""
+
+	def __init__(self, obj):
+		'''
+		_async_object(obj)
+		obj: blocking object
+		'''
+
+		# set fields directly in __dict__, so that __getattr__ / __setattr__ only forward the fields of the blocking object:
+		self.__dict__['_object'] = obj
+
+
+	def __getattr__(self, name):
+		return getattr(self._object, name)
+
+
+	def __setattr__(self, name, value):
+		setattr(self._object, name, value)
+
+
+	async def _run(self, name, *args):
+		# run the I/O steps of the blocking method name in the current coroutine:
+		return await psu_io.run_async(psu_io.steps(self._object, name, *args))
+
+
+class async_driver(_async_object):
+	"""
+	Asyncio interface to a PSU driver object (KORAD, BK, RIDEN, VOLTCRAFT, SALUKI, VIRTUAL)
+	"""
+
+	async def output(self, state):
+		'''
+		await output(state)
+
+		Turn PSU output on or off (see output() of the blocking driver).
+		'''
+
+		return await self._run('output', state)
+
+
+	async def voltage(self, voltage):
+		'''
+		await voltage(voltage)
+
+		Set voltage (see voltage() of the blocking driver).
+		'''
+
+		return await self._run('voltage', voltage)
+
+
+	async def current(self, current):
+		'''
+		await current(current)
+
+		Set current limit (see current() of the blocking driver).
+		'''
+
+		return await self._run('current', current)
+
+
+	async def reading(self):
+		'''
+		V, I, L = await reading()
+
+		Read voltage, current and limiter mode (see reading() of the blocking driver).
+		'''
+
+		return await self._run('reading')
+
+
+class async_PSU(_async_object):
+	"""
+	Asyncio interface to a PSU object (see powersupply.PSU)
+	"""
+
+	async def setVoltage(self, value, wait_stable):
+		'''
+		await setVoltage(value, wait_stable)
+
+		Set PSU voltage (see PSU.setVoltage).
+		'''
+
+		return await self._run('setVoltage', value, wait_stable)
+
+
+	async def setCurrent(self, value, wait_stable):
+		'''
+		await setCurrent(value, wait_stable)
+
+		Set PSU current limit (see PSU.setCurrent).
+		'''
+
+		return await self._run('setCurrent', value, wait_stable)
+
+
+	async def turnOff(self):
+		'''
+		await turnOff()
+
+		Turn PSU output off (see PSU.turnOff).
+		'''
+
+		return await self._run('turnOff')
+
+
+	async def turnOn(self):
+		'''
+		await turnOn()
+
+		Turn PSU output on (see PSU.turnOn).
+		'''
+
+		return await self._run('turnOn')
+
+
+	async def read(self, N=1):
+		'''
+		V, I, L = await read(N=1)
+
+		Read PSU output (see PSU.read).
+		'''
+
+		return await self._run('read', N)
+
+
+async def read_all(PSUs, N=None):
+	'''
+	r = await read_all(PSUs, N=None)
+
+	Read the outputs of several async_PSU objects at the same time.
+
+	INPUT:
+	PSUs: list of async_PSU objects
+	N (optional): number of consistent readings required from each PSU (default: NSTABLEREADINGS of each PSU)
+
+	OUTPUT:
+	r: list of readings (V, I, L) of the PSUs. Readings of PSUs that are not configured are [0.0, 0.0, 'NONE'].
+	'''
+
+	async def _read(p):
+		if not p.CONFIGURED:
+			return [0.0, 0.0, 'NONE']
+		if N is None:
+			return await p.read(p.NSTABLEREADINGS)
+		return await p.read(N)
+
+	return list(await asyncio.gather(*[ _read(p) for p in PSUs ]))
@@ -0,0 +1,508 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Emulators of the PSU communication protocols, for tests and benchmarks of the PSU drivers without PSU hardware.
+
+Each emulator runs in a background thread and serves the serial port given in its "port" field. The PSU drivers talk to this port in the same way as to the serial port of a real PSU (ASCII protocols of KORAD, BK, SALUKI and VOLTCRAFT; Modbus RTU protocol of RIDEN). The PSU output is loaded with a resistor (or any other load function), and the emulators respond to the commands with configurable latency, reading noise, and dropped bytes.
+
+Usage:
+	E = KORAD_emulator(load=100.0, latency=0.01)
+	E.start()
+	P = powersupply.PSU(E.port, 'KORAD', 'PSU1')
+	...
+	E.close()
+
+The ASCII protocols are served at a TCP socket on localhost (port = 'socket://127.0.0.1:NNNNN', opened by the drivers with pyserial's serial_for_url). Data written by a driver is handed over to the emulator right away, so that resetting the output buffer of the port does not discard commands that the emulator has not read yet (the drivers reset their buffers right after writing commands without answer). A pseudo terminal would lose such commands. The Modbus protocol is served at a pseudo terminal (POSIX only), because minimalmodbus only opens real serial ports. This is safe because Modbus requests are always answered before the next request is sent.
+
+The emulators can also be started from the command line, e.g. for benchmarks with curvetrace:
+	python -m pypsucurvetrace.psu_emulator KORAD --latency 0.01
+'''
+
+import os
+import re
+import random
+import select
+import socket
+import threading
+import time
+
+
+class psu_emulator(threading.Thread):
+	'''
+	Base class of the PSU emulators
+	'''
+
+	TERMINATOR = b'\n' # end of command from the driver (ASCII protocols)
+	TRANSPORT  = 'socket' # 'socket' (TCP socket on localhost) or 'pty' (pseudo terminal)
+
+	def __init__(self, load=100.0, latency=0.0, noise=0.0, drop=0.0, seed=None):
+		'''
+		psu_emulator(load=100.0, latency=0.0, noise=0.0, drop=0.0, seed=None)
+		load: load resistance at the PSU output (Ohm), or function I = load(V) for other loads (monotonically increasing current)
+		latency: response time of the PSU (s)
+		noise: standard deviation of the relative noise of the voltage and current readings
+		drop: probability of dropping a byte of the responses (0...1)
+		seed: seed of the random generator for noise and dropped bytes (optional)
+		'''
+
+		threading.Thread.__init__(self, daemon=True)
+
+		if callable(load):
+			self._load = load
+		else:
+			R = float(load)
+			self._load = lambda V: V / R
+
+		self.latency = float(latency)
+		self.noise   = float(noise)
+		self.drop    = float(drop)
+		self._rng    = random.Random(seed)
+
+		# state of the PSU output:
+		self.vset = 0.0
+		self.iset = 0.0
+		self.on   = False
+
+		# statistics:
+		self.received = 0 # number of bytes received
+		self.requests = 0 # number of requests received
+		self.dropped  = 0 # number of dropped bytes
+
+		if self.TRANSPORT == 'pty':
+			# pseudo terminal (keep the slave end open, so that the master end does not see a hangup if the driver closes and re-opens the port):
+			import tty
+			self._master, self._slave = os.openpty()
+			tty.setraw(self._slave)
+			self.port = os.ttyname(self._slave)
+		else:
+			# TCP socket on localhost (the driver may close and re-open the port, the emulator then serves the new connection):
+			self._server = socket.create_server(('127.0.0.1', 0))
+			self._conn = None
+			self.port = 'socket://127.0.0.1:' + str(self._server.getsockname()[1])
+		self._do_run = True
+
+
+	def output(self):
+		'''
+		V, I, mode = output()
+
+		PSU output voltage, current and limiter mode ('CV' or 'CC'), without noise.
+		'''
+
+		if not self.on:
+			return 0.0, 0.0, 'CV'
+		I = self._load(self.vset)
+		if I <= self.iset:
+			return self.vset, I, 'CV'
+
+		# current limit: find voltage where the load draws the limit current (bisection):
+		a, b = 0.0, self.vset
+		for k in range(60):
+			V = 0.5*(a+b)
+			if self._load(V) > self.iset:
+				b = V
+			else:
+				a = V
+		return a, self.iset, 'CC'
+
+
+	def reading(self):
+		'''
+		V, I, mode = reading()
+
+		PSU output as read by the PSU meters (with noise).
+		'''
+
+		V, I, mode = self.output()
+		if self.noise > 0.0:
+			V = V * (1.0 + self._rng.gauss(0.0, self.noise))
+			I = I * (1.0 + self._rng.gauss(0.0, self.noise))
+		return max(V, 0.0), max(I, 0.0), mode
+
+
+	def _receive(self):
+		# wait for data from the driver (returns b'' if there is none):
+		if self.TRANSPORT == 'pty':
+			r, _, _ = select.select([self._master], [], [], 0.05)
+			if not r:
+				return b''
+			try:
+				return os.read(self._master, 1024)
+			except OSError:
+				return b''
+
+		r, _, _ = select.select([self._server] + ([self._conn] if self._conn else []), [], [], 0.05)
+		if self._server in r:
+			# new connection (replaces the old one):
+			if self._conn:
+				self._conn.close()
+			self._conn, _ = self._server.accept()
+			self._conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # no Nagle delay of the short responses
+			return b''
+		if not r:
+			return b''
+		try:
+			data = self._conn.recv(1024)
+		except OSError:
+			data = b''
+		if not data:
+			# connection closed by the driver:
+			self._conn.close()
+			self._conn = None
+		return data
+
+
+	def run(self):
+		buf = b''
+		while self._do_run:
+			data = self._receive()
+			if not data:
+				continue
+			self.received += len(data)
+			buf += data
+			while True:
+				request, buf = self._split(buf)
+				if request is None:
+					break
+				self.requests += 1
+				answer = self.respond(request)
+				if answer:
+					if self.latency > 0.0:
+						time.sleep(self.latency)
+					self._send(answer)
+
+
+	def _split(self, buf):
+		# split first complete request from the input buffer (ASCII protocols: one command per line):
+		k = buf.find(self.TERMINATOR)
+		if k < 0:
+			return None, buf
+		return buf[:k], buf[k+len(self.TERMINATOR):]
+
+
+	def _send(self, data):
+		# send answer, and drop bytes at random:
+		if self.drop > 0.0:
+			keep = bytes( b for b in data if self._rng.random() >= self.drop )
+			self.dropped += len(data) - len(keep)
+			data = keep
+		if self.TRANSPORT == 'pty':
+			os.write(self._master, data)
+		elif self._conn:
+			self._conn.sendall(data)
+
+
+	def respond(self, request):
+		'''
+		answer = respond(request)
+
+		Process a request (bytes) and return the answer (bytes, or None if there is no answer).
+		'''
+
+		raise NotImplementedError
+
+
+	def close(self):
+		'''
+		close()
+
+		Stop the emulator thread and close the port.
+		'''
+
+		self._do_run = False
+		if self.is_alive():
+			self.join()
+		if self.TRANSPORT == 'pty':
+			os.close(self._master)
+			os.close(self._slave)
+		else:
+			if self._conn:
+				self._conn.close()
+			self._server.close()
+
+
+class KORAD_emulator(psu_emulator):
+	'''
+	KORAD / RND power supply (KA3005P command set, or KWR103 if model = 'KWR103')
+	'''
+
+	def __init__(self, model='KA3005P', **kwargs):
+		psu_emulator.__init__(self, **kwargs)
+		self.model = model
+
+	def respond(self, request):
+		cmd = request.decode(errors='replace').strip().upper()
+		if cmd == '*IDN?':
+			return ('KORAD ' + self.model + ' V5.8 SN:00000001\n').encode()
+
+		if cmd.startswith('OUT'):
+			self.on = cmd[-1] == '1' # OUT1 / OUT:1
+			return None
+
+		# KA3005P commands have a channel number ("VSET1:5.0"), KWR103 commands have none ("VSET:5.0"):
+		m = re.match(r'^(VSET|ISET|VOUT|IOUT|STATUS)1?:?(\??)(.*)$', cmd)
+		if m is None:
+			return None
+		name, query, value = m.groups()
+		V, I, mode = self.reading()
+		if name == 'VSET' and not query:
+			self.vset = float(value)
+		elif name == 'ISET' and not query:
+			self.iset = float(value)
+		elif name == 'VOUT':
+			return '{:05.2f}\n'.format(V).encode()
+		elif name == 'IOUT':
+			return '{:.3f}\n'.format(I).encode()
+		elif name == 'STATUS':
+			# bit 0: CV mode, bit 6: output on
+			return bytes([ int(mode == 'CV') + 64*int(self.on) ]) + b'\n'
+		return None
+
+
+class SCPI_emulator(psu_emulator):
+	'''
+	Base class for power supplies with SCPI-like command sets (BK, SALUKI)
+	'''
+
+	IDN = ''
+	COMMANDS = {} # command -> 'VSET', 'ISET', 'ON', 'OFF', 'V?', 'I?', 'MODE?'
+
+	stb = 0 # status byte (bit 2 is set by unknown commands, cleared by *CLS)
+
+	def respond(self, request):
+		# several commands can be sent on one line ("MEASURE:VOLTAGE?;:MEASURE:CURRENT?"), the answers are returned on one line ("12.3400;0.56700"):
+		answers = [ self._command(self._strip_root(c.strip())) for c in request.decode(errors='replace').upper().split(';') ]
+		answers = [ a for a in answers if a is not None ]
+		if not answers:
+			return None
+		return (';'.join(answers) + '\n').encode()
+
+	@staticmethod
+	def _strip_root(cmd):
+		# a leading colon (root of the command tree) is only allowed before SCPI subsystem commands, not before IEEE 488.2 common commands (':*STB?' is an unknown command):
+		if cmd.startswith(':') and not cmd.startswith(':*'):
+			return cmd[1:]
+		return cmd
+
+	def _command(self, cmd):
+		if cmd == '*IDN?':
+			return self.IDN
+		if cmd == '*STB?':
+			return str(self.stb)
+		if cmd == '*CLS':
+			self.stb = 0
+			return None
+		if cmd == '*RST' or cmd.startswith('SOURCE:VOLTAGE:RANGE'):
+			return None
+		action = self.COMMANDS.get(cmd)
+		if action is None:
+			# set commands with value ("VOLTAGE 5.000"):
+			name, _, value = cmd.rpartition(' ')
+			action = self.COMMANDS.get(name)
+		V, I, mode = self.reading()
+		if action == 'VSET':
+			self.vset = float(value)
+		elif action == 'ISET':
+			self.iset = float(value)
+		elif action == 'ON':
+			self.on = True
+		elif action == 'OFF':
+			self.on = False
+		elif action == 'V?':
+			return '{:.4f}'.format(V)
+		elif action == 'I?':
+			return '{:.5f}'.format(I)
+		elif action == 'MODE?':
+			return mode
+		else:
+			self.stb |= 0b00000100 # error queue not empty
+		return None
+
+
+class BK_emulator(SCPI_emulator):
+	'''
+	B&K Precision 9185B power supply
+	'''
+
+	IDN = 'B&K Precision,9185B,000000000001,1.0,0'
+	COMMANDS = {
+		'SOURCE:VOLTAGE':   'VSET',
+		'SOURCE:CURRENT':   'ISET',
+		'OUTPUT ON':        'ON',
+		'OUTPUT OFF':       'OFF',
+		'MEASURE:VOLTAGE?': 'V?',
+		'MEASURE:CURRENT?': 'I?',
+		'OUTPUT:STATE?':    'MODE?',
+	}
+
+
+class SALUKI_emulator(SCPI_emulator):
+	'''
+	SALUKI SPS831 power supply
+	'''
+
+	IDN = 'SALUKI,SPS831,000000000001,1.0'
+	COMMANDS = {
+		'VOLTAGE':          'VSET',
+		'CURRENT':          'ISET',
+		'OUTPUT 1':         'ON',
+		'OUTPUT 0':         'OFF',
+		'MEASURE:VOLTAGE?': 'V?',
+		'MEASURE:CURRENT?': 'I?',
+	}
+
+
+class VOLTCRAFT_emulator(psu_emulator):
+	'''
+	VOLTCRAFT PPS11360 power supply (36.2 V, 7 A)
+	'''
+
+	TERMINATOR = b'\r'
+
+	def respond(self, request):
+		cmd = request.decode(errors='replace').strip().upper()
+		V, I, mode = self.reading()
+		data = ''
+		if cmd == 'GMAX':
+			data = '362700\r'
+		elif cmd.startswith('SOUT'):
+			self.on = cmd[4:] == '0' # SOUT0 turns the output on
+		elif cmd.startswith('VOLT'):
+			self.vset = int(cmd[4:]) / 10.0
+		elif cmd.startswith('CURR'):
+			self.iset = int(cmd[4:]) / 100.0
+		elif cmd == 'GETD':
+			data = '{:04d}{:04d}{:d}\r'.format(int(round(V*100)), int(round(I*100)), int(mode == 'CC'))
+		else:
+			return None
+		return (data + 'OK\r').encode()
+
+
+def _crc16(data):
+	# Modbus CRC16 (little endian byte order in the frame):
+	crc = 0xFFFF
+	for b in data:
+		crc ^= b
+		for k in range(8):
+			if crc & 1:
+				crc = (crc >> 1) ^ 0xA001
+			else:
+				crc >>= 1
+	return bytes([ crc & 0xFF, crc >> 8 ])
+
+
+class RIDEN_emulator(psu_emulator):
+	'''
+	RIDEN RD6006P power supply (Modbus RTU, slave address 1)
+	'''
+
+	TRANSPORT = 'pty' # minimalmodbus only opens serial ports
+
+	def __init__(self, **kwargs):
+		psu_emulator.__init__(self, **kwargs)
+		self.registers = { 0: 60065 } # model ID (RD6006P)
+		self._Vmult = 1000.0
+		self._Imult = 10000.0
+
+	def _split(self, buf):
+		# split first complete Modbus RTU frame from the input buffer:
+		if len(buf) < 2:
+			return None, buf
+		if buf[1] in [3, 6]:
+			n = 8
+		elif buf[1] == 16:
+			if len(buf) < 7:
+				return None, buf
+			n = 9 + buf[6]
+		else:
+			return None, b'' # unknown function, discard
+		if len(buf) < n:
+			return None, buf
+		return buf[:n], buf[n:]
+
+	def _register(self, r):
+		V, I, mode = self.reading()
+		if r == 10:
+			return int(round(V*self._Vmult))
+		if r == 11:
+			return int(round(I*self._Imult))
+		if r == 17:
+			return int(mode == 'CC')
+		return self.registers.get(r, 0)
+
+	def _write(self, r, value):
+		self.registers[r] = value
+		if r == 8:
+			self.vset = value / self._Vmult
+		elif r == 9:
+			self.iset = value / self._Imult
+		elif r == 18:
+			self.on = value == 1
+
+	def respond(self, request):
+		if _crc16(request[:-2]) != request[-2:] or request[0] != 1:
+			return None # corrupted frame or other slave: no answer
+		fc = request[1]
+		r = int.from_bytes(request[2:4], 'big')
+		if fc == 3:
+			N = int.from_bytes(request[4:6], 'big')
+			data = b''.join( self._register(r+k).to_bytes(2, 'big') for k in range(N) )
+			answer = bytes([ 1, 3, len(data) ]) + data
+		elif fc == 6:
+			self._write(r, int.from_bytes(request[4:6], 'big'))
+			answer = request[:6]
+		else:
+			N = int.from_bytes(request[4:6], 'big')
+			for k in range(N):
+				self._write(r+k, int.from_bytes(request[7+2*k:9+2*k], 'big'))
+			answer = request[:6]
+		return answer + _crc16(answer)
+
+
+EMULATORS = {
+	'KORAD':     KORAD_emulator,
+	'BK':        BK_emulator,
+	'SALUKI':    SALUKI_emulator,
+	'VOLTCRAFT': VOLTCRAFT_emulator,
+	'RIDEN':     RIDEN_emulator,
+}
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description='Emulate a PSU at a local serial port URL or pseudo terminal (for tests and benchmarks of the PSU drivers without PSU hardware).')
+	parser.add_argument('type', choices=sorted(EMULATORS), help='PSU type')
+	parser.add_argument('--load', type=float, default=100.0, help='load resistance at the PSU output (Ohm)')
+	parser.add_argument('--latency', type=float, default=0.0, help='response time (s)')
+	parser.add_argument('--noise', type=float, default=0.0, help='relative noise of the readings')
+	parser.add_argument('--drop', type=float, default=0.0, help='probability of dropping a response byte')
+	args = parser.parse_args()
+
+	E = EMULATORS[args.type](load=args.load, latency=args.latency, noise=args.noise, drop=args.drop)
+	E.start()
+	print(args.type + ' emulator running at ' + E.port + ' (press CTRL+C to stop)...')
+	try:
+		while True:
+			time.sleep(1.0)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		E.close()
+		print('\n' + str(E.requests) + ' requests served, ' + str(E.dropped) + ' bytes dropped.')
+
+
+if __name__ == '__main__':
+	main()
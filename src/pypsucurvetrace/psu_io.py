@@ -0,0 +1,416 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+I/O steps of the PSU drivers, run with blocking I/O or in asyncio coroutines.
+
+The protocol logic of the drivers (commands, answers, retries, waits) is written as generators that yield I/O steps instead of calling the serial port / Modbus instrument directly. The result of each step is sent back into the generator, errors of a step are raised at the yield:
+
+	def reading_steps(self):
+		yield self._io.write(b'VOUT1?\\n')     # self._io = psu_io.port(self._Serial)
+		ans = yield self._io.readline()
+		yield psu_io.sleep(0.05)
+		...
+		return (V, I, S)
+
+run() executes the steps with blocking I/O, so the blocking driver API is a thin shim:
+
+	def reading(self):
+		return psu_io.run(self.reading_steps())
+
+run_async() executes the same steps in a coroutine. The serial ports are read without blocking (see async_serial and async_modbus), so that the waits for the answers of several PSUs overlap on one asyncio event loop, without a thread per PSU (see powersupply_async.py).
+'''
+
+import asyncio
+import pypsucurvetrace.clock as clock
+
+
+POLL_INTERVAL = 0.001 # polling interval for ports that cannot be watched by the event loop, and for buses held by other threads (s)
+
+
+########################################################################################################
+
+
+class call:
+	'''
+	I/O step: method call of a port object (serial port, Modbus instrument, or their recorder / player, see transcript.py). Use the port proxy to make the steps:
+		ans = yield port(serial_port).readline()
+	'''
+
+	def __init__(self, port, name, args, kwargs):
+		self._port = port
+		self._name = name
+		self._args = args
+		self._kwargs = kwargs
+
+	def run(self):
+		return getattr(self._port.device, self._name)(*self._args, **self._kwargs)
+
+	async def run_async(self):
+		return await self._port.async_device().call_async(self._name, self._args, self._kwargs)
+
+
+class sleep:
+	'''
+	I/O step: wait on the clock in use (see clock.py)
+	'''
+
+	def __init__(self, seconds):
+		self.seconds = seconds
+
+	def run(self):
+		clock.sleep(self.seconds)
+
+	async def run_async(self):
+		await clock.sleep_async(self.seconds)
+
+
+class acquire:
+	'''
+	I/O step: take a bus shared with other threads or coroutines (see arbiter.py). The result is True if the bus was acquired within the timeout (s, None: wait forever).
+	'''
+
+	def __init__(self, bus, timeout=None):
+		self._bus = bus
+		self._timeout = timeout
+
+	def run(self):
+		return self._bus.acquire(self._timeout)
+
+	async def run_async(self):
+		return await self._bus.acquire_async(self._timeout)
+
+
+class parallel:
+	'''
+	I/O step: run several generators of I/O steps at the same time (e.g. for the units of a composite PSU, which have separate serial ports). The result is the list of the return values of the generators.
+	'''
+
+	def __init__(self, steps, pool=None):
+		'''
+		parallel(steps, pool=None)
+		steps: list of generators of I/O steps
+		pool: thread pool for blocking I/O (concurrent.futures executor). Without a pool, the generators are run one after the other with blocking I/O. In coroutines, the generators are always run at the same time (no threads needed).
+		'''
+
+		self._steps = steps
+		self._pool = pool
+
+	def run(self):
+		if self._pool is None:
+			return [ run(s) for s in self._steps ]
+		futures = [ self._pool.submit(run, s) for s in self._steps ]
+		return [ f.result() for f in futures ]
+
+	async def run_async(self):
+		return list(await asyncio.gather(*[ run_async(s) for s in self._steps ]))
+
+
+class port:
+	'''
+	Proxy of a port object, which turns method calls into I/O steps:
+		p = port(serial_port)
+		yield p.write(b'*IDN?\\n')
+		ans = yield p.readline()
+	'''
+
+	def __init__(self, device):
+		'''
+		port(device)
+		device: serial port object (see serial_port() in transcript.py) or Modbus instrument (see modbus_instrument() in transcript.py)
+		'''
+
+		self.device = device
+		self._async = None
+
+	def __getattr__(self, name):
+		if name.startswith('__'):
+			raise AttributeError(name)
+
+		def _step(*args, **kwargs):
+			return call(self, name, args, kwargs)
+
+		return _step
+
+	def async_device(self):
+		'''
+		a = async_device()
+
+		Asynchronous adapter of the port object (see async_device()), created at the first use.
+		'''
+
+		if self._async is None:
+			self._async = async_device(self.device)
+		return self._async
+
+
+########################################################################################################
+
+
+def run(steps):
+	'''
+	r = run(steps)
+
+	Run the I/O steps of a generator with blocking I/O, and return the return value of the generator.
+	'''
+
+	result = error = None
+	while True:
+		try:
+			if error is None:
+				step = steps.send(result)
+			else:
+				step = steps.throw(error)
+		except StopIteration as e:
+			return e.value
+		try:
+			result, error = step.run(), None
+		except Exception as e:
+			result, error = None, e
+		except BaseException:
+			steps.close() # clean up (e.g. release buses) before giving up (KeyboardInterrupt, task cancelled)
+			raise
+
+
+async def run_async(steps):
+	'''
+	r = await run_async(steps)
+
+	Run the I/O steps of a generator in a coroutine, and return the return value of the generator.
+	'''
+
+	result = error = None
+	while True:
+		try:
+			if error is None:
+				step = steps.send(result)
+			else:
+				step = steps.throw(error)
+		except StopIteration as e:
+			return e.value
+		try:
+			result, error = await step.run_async(), None
+		except Exception as e:
+			result, error = None, e
+		except BaseException:
+			steps.close() # clean up (e.g. release buses) before giving up (KeyboardInterrupt, task cancelled)
+			raise
+
+
+def steps(obj, name, *args):
+	'''
+	r = yield from steps(obj, name, *args)
+
+	I/O steps of the method call obj.name(*args): the steps of obj.name_steps(*args) if the object has I/O steps for this method, or a blocking call of obj.name(*args) otherwise (e.g. drivers without serial I/O).
+	'''
+
+	fn = getattr(obj, name + '_steps', None)
+	if fn is None:
+		return getattr(obj, name)(*args)
+	return (yield from fn(*args))
+
+
+########################################################################################################
+
+
+def async_device(device):
+	'''
+	a = async_device(device)
+
+	Asynchronous adapter of a port object, with the method call_async(name, args, kwargs): the object itself if it has this method (recorder / player, see transcript.py), async_modbus for Modbus instruments, async_serial for serial ports.
+	'''
+
+	if hasattr(type(device), 'call_async'): # look at the class, the player answers to any method name
+		return device
+	if hasattr(device, 'read_registers'):
+		return async_modbus(device)
+	return async_serial(device)
+
+
+class async_serial:
+	'''
+	Non-blocking access to a pyserial port object in coroutines. Reads wait for the data with the event loop (or by polling the input buffer if the event loop cannot watch the port), and time out after the timeout of the port. Calls that do not wait for the PSU (write, buffer resets) are passed on to the port object.
+	'''
+
+	ASYNC_CALLS = [ 'read', 'read_until', 'readline', 'flush' ]
+
+	def __init__(self, device):
+		'''
+		async_serial(device)
+		device: pyserial port object
+		'''
+
+		self._device = device
+
+
+	async def call_async(self, name, args, kwargs):
+		'''
+		result = await call_async(name, args, kwargs)
+
+		Call method name of the port without blocking the event loop.
+		'''
+
+		if name in self.ASYNC_CALLS:
+			return await getattr(self, name)(*args, **kwargs)
+		return getattr(self._device, name)(*args, **kwargs)
+
+
+	async def read(self, size=1):
+		return await self._read(lambda data: len(data) >= size)
+
+
+	async def read_until(self, expected=b'\n', size=None):
+		return await self._read(lambda data: data.endswith(expected) or (size is not None and len(data) >= size))
+
+
+	async def readline(self):
+		return await self.read_until(b'\n')
+
+
+	async def flush(self):
+		# wait until all data is written, by polling the output buffer instead of blocking in tcdrain():
+		while getattr(self._device, 'out_waiting', 0) > 0:
+			await asyncio.sleep(POLL_INTERVAL)
+
+
+	async def _read(self, complete):
+		# read byte by byte until complete(data) or timeout (so that no data beyond the answer is taken from the port):
+		loop = asyncio.get_running_loop()
+		timeout = self._device.timeout
+		t_end = None if timeout is None else loop.time() + timeout
+		data = bytearray()
+		while not complete(data):
+			if self._device.in_waiting > 0:
+				data += self._device.read(1)
+				continue
+			t = None if t_end is None else t_end - loop.time()
+			if (t is not None) and (t <= 0.0):
+				break # timeout
+			await self._readable(loop, t)
+		return bytes(data)
+
+
+	async def _readable(self, loop, timeout):
+		# wait until there is data to read at the port, or until the timeout has expired:
+		try:
+			fd = self._device.fileno()
+			ready = loop.create_future()
+			loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+		except (AttributeError, OSError, ValueError, NotImplementedError):
+			# port without file descriptor, or event loop that cannot watch it (e.g. on Windows):
+			await asyncio.sleep(POLL_INTERVAL if timeout is None else min(POLL_INTERVAL, timeout))
+			return
+		try:
+			await asyncio.wait_for(ready, timeout)
+		except asyncio.TimeoutError:
+			pass
+		finally:
+			loop.remove_reader(fd)
+
+
+def _crc16(data):
+	# CRC of Modbus RTU frames (low byte first):
+	crc = 0xFFFF
+	for b in data:
+		crc ^= b
+		for k in range(8):
+			if crc & 1:
+				crc = (crc >> 1) ^ 0xA001
+			else:
+				crc >>= 1
+	return bytes([ crc & 0xFF, crc >> 8 ])
+
+
+class async_modbus:
+	'''
+	Non-blocking Modbus RTU master in coroutines, talking to the slave of a minimalmodbus.Instrument at its serial port. Supports the register functions used by the RIDEN driver (read_register, read_registers, write_register and write_registers, with the default function codes of minimalmodbus). Failed transactions raise an IOError, like in minimalmodbus. Other calls are passed on to the instrument.
+	'''
+
+	ASYNC_CALLS = [ 'read_register', 'read_registers', 'write_register', 'write_registers' ]
+
+	def __init__(self, instrument):
+		'''
+		async_modbus(instrument)
+		instrument: minimalmodbus.Instrument object
+		'''
+
+		self._instrument = instrument
+		self._serial = async_serial(instrument.serial)
+		self._t_last = None # time of the last transaction
+
+
+	async def call_async(self, name, args, kwargs):
+		'''
+		result = await call_async(name, args, kwargs)
+
+		Call method name of the instrument without blocking the event loop.
+		'''
+
+		if name in self.ASYNC_CALLS:
+			return await getattr(self, name)(*args, **kwargs)
+		return getattr(self._instrument, name)(*args, **kwargs)
+
+
+	async def read_register(self, registeraddress):
+		return (await self.read_registers(registeraddress, 1))[0]
+
+
+	async def read_registers(self, registeraddress, number_of_registers):
+		# function code 3 (read holding registers), answer: function code, byte count, data
+		N = int(number_of_registers)
+		answer = await self._transaction(bytes([3]) + int(registeraddress).to_bytes(2, 'big') + N.to_bytes(2, 'big'), 2 + 2*N)
+		return [ int.from_bytes(answer[2+2*k:4+2*k], 'big') for k in range(N) ]
+
+
+	async def write_register(self, registeraddress, value):
+		await self.write_registers(registeraddress, [ value ])
+
+
+	async def write_registers(self, registeraddress, values):
+		# function code 16 (write multiple registers), answer: function code, start address, number of registers
+		data = b''.join( int(v).to_bytes(2, 'big') for v in values )
+		await self._transaction(bytes([16]) + int(registeraddress).to_bytes(2, 'big') + len(values).to_bytes(2, 'big') + bytes([len(data)]) + data, 5)
+
+
+	async def _transaction(self, request, N):
+		# send request PDU, return answer PDU of N bytes:
+		port = self._instrument.serial
+		address = self._instrument.address
+		frame = bytes([address]) + request
+		frame += _crc16(frame)
+
+		# silent interval between frames (3.5 characters of 11 bits):
+		if self._t_last is not None:
+			await clock.sleep_async(self._t_last + 3.5*11/port.baudrate - clock.monotonic())
+
+		try:
+			port.reset_input_buffer()
+			port.write(frame)
+
+			# exception answers are 5 bytes long (address, function code + 0x80, exception code, CRC):
+			answer = await self._serial.read(5)
+			if (len(answer) == 5) and (answer[1] == request[0] | 0x80):
+				if _crc16(answer[:-2]) == answer[-2:]:
+					raise IOError('Modbus slave ' + str(address) + ' at ' + str(port.port) + ' reported exception code ' + str(answer[2]) + '.')
+			elif len(answer) == 5:
+				answer += await self._serial.read(N + 3 - 5)
+		finally:
+			self._t_last = clock.monotonic()
+
+		if len(answer) == 0:
+			raise IOError('No answer from Modbus slave ' + str(address) + ' at ' + str(port.port) + '.')
+		if (len(answer) != N + 3) or (_crc16(answer[:-2]) != answer[-2:]) or (answer[0] != address) or (answer[1] != request[0]):
+			raise IOError('Invalid answer from Modbus slave ' + str(address) + ' at ' + str(port.port) + ': ' + answer.hex())
+		return answer[1:-2]
@@ -0,0 +1,170 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+SCPI transport for PSUs with SCPI-like command sets at a serial port (used by the BK and SALUKI drivers).
+
+Commands are sent one per line, answers are terminated by a newline. Several queries can be sent on one line ("MEASURE:VOLTAGE?;:MEASURE:CURRENT?;*STB?"), so that the answers ("12.34;0.567;0") are read in a single round trip. Whether an instrument understands such compound queries is determined at the first attempt; instruments that do not are queried one command at a time.
+
+The query() and measure() methods are generators of I/O steps (see psu_io.py), which the drivers run with blocking I/O or in coroutines:
+	ans = yield from transport.query('*IDN?')
+'''
+
+import sys
+import pypsucurvetrace.psu_io as psu_io
+from pypsucurvetrace.curvetrace_tools import get_logger
+
+# set up logger:
+logger = get_logger('scpi')
+
+# bits of the status byte (*STB?) indicating errors or events that need to be cleared with *CLS:
+STB_ERROR_BITS = 0b00100100 # bit 2: error/event queue not empty, bit 5: event status bit
+
+
+def compound_command(cmds):
+	'''
+	line = compound_command(cmds)
+
+	Join commands to one line. SCPI subsystem commands are joined with ';:' (so that each command starts at the root of the command tree), IEEE 488.2 common commands (*STB? etc.) with ';' (a colon is not allowed before common commands).
+	'''
+
+	line = cmds[0]
+	for c in cmds[1:]:
+		if c.startswith('*'):
+			line += ';' + c
+		else:
+			line += ';:' + c
+	return line
+
+
+class scpi_transport:
+	'''
+	SCPI command transport at a serial port
+	'''
+
+	def __init__(self, port, name, debug=False):
+		'''
+		scpi_transport(port, name, debug=False)
+		port: serial port object (see serial_port() in transcript.py)
+		name: name of the instrument, used in messages (string)
+		debug: flag for debugging info (bool)
+		'''
+
+		self._Serial = port
+		self._io = psu_io.port(port)
+		self._name = name
+		self._debug = bool(debug)
+		self.compound = None # compound queries supported? (None = not yet known)
+
+
+	def _debug_msg(self, s):
+		if self._debug:
+			sys.stdout.write(s)
+			sys.stdout.flush()
+
+
+	def query(self, cmd, answer=True, attempt=1, max_attempts=10):
+		"""
+		ans = query(cmd, answer=True, attempt=1, max_attempts=10)
+
+		Send command and read answer (if answer = True). If there is no answer, clean the pipes and try again (up to max_attempts times). I/O steps, see psu_io.py.
+		"""
+
+		if attempt > max_attempts:
+			raise RuntimeError(self._name + ' PSU does not respond to ' + cmd + ' command after ' + str(max_attempts) + ' attempts. Giving up...')
+		elif attempt > 1:
+			self._debug_msg('*** Retrying (attempt ' + str(attempt) + ')...')
+
+		# clean the pipes:
+		yield self._io.flushOutput()
+		yield self._io.flushInput()
+
+		# send command to PSU:
+		self._debug_msg(self._name + ' <- %s\n' % cmd)
+		yield self._io.write((cmd + '\n').encode())
+		yield self._io.flush() # wait until all data is written to the serial port
+
+		# read answer (if requested):
+		if not answer:
+			ans = None
+		else:
+			ans = (yield self._io.readline()).decode('utf-8').rstrip("\n\r")
+			self._debug_msg(self._name + ' -> %s\n' % ans)
+			if ans == '':
+				self._debug_msg('*** No answer from ' + self._name + ' PSU! Command: ' + cmd)
+				yield self._io.flushOutput()
+				yield psu_io.sleep(0.1)
+				yield self._io.flushInput()
+				yield psu_io.sleep(0.1)
+				ans = yield from self.query(cmd, True, attempt+1, max_attempts)
+
+		return ans
+
+
+	def _compound_query(self, cmds):
+		# send queries on one line, return list of answers (or None if the answer does not match the queries):
+		max_attempts = 10 if self.compound else 1 # don't insist if we don't know yet whether the PSU understands compound queries
+		try:
+			ans = [ a.strip() for a in (yield from self.query(compound_command(cmds), max_attempts=max_attempts)).split(';') ]
+		except (RuntimeError, UnicodeDecodeError):
+			ans = []
+		if len(ans) == len(cmds):
+			if self.compound is None:
+				logger.debug(self._name + ' PSU supports compound queries.')
+				self.compound = True
+			return ans
+		if self.compound is None:
+			logger.debug(self._name + ' PSU does not support compound queries, using single queries.')
+			self.compound = False
+		return None
+
+
+	def measure(self, cmds, parse, attempts=10):
+		"""
+		x = measure(cmds, parse, attempts=10)
+
+		Send queries and parse the answers. The queries are sent as a compound query if the PSU supports this (together with a status byte query, and the status is cleared with *CLS if the PSU reports an error). Otherwise, the status is cleared with *CLS and the queries are sent one by one. I/O steps, see psu_io.py.
+
+		INPUT:
+		cmds: list of queries
+		parse: function that converts the list of answers to the result (raises ValueError if an answer is garbled)
+		attempts: number of attempts before giving up
+
+		OUTPUT:
+		x: result of parse()
+		"""
+
+		for k in range(attempts):
+			try:
+				if self.compound is not False:
+					ans = yield from self._compound_query(cmds + ['*STB?'])
+					if ans is not None:
+						if int(ans[-1]) & STB_ERROR_BITS:
+							yield from self.query('*CLS', answer=False)
+						return parse(ans[:-1])
+
+				yield from self.query('*CLS', answer=False)
+				ans = []
+				for c in cmds:
+					ans.append((yield from self.query(c)))
+				return parse(ans)
+
+			except ValueError:
+				# garbled answer, try again:
+				yield self._io.reset_output_buffer()
+				yield self._io.reset_input_buffer()
+				yield psu_io.sleep(0.05)
+
+		raise RuntimeError('Could not read ' + ', '.join(cmds) + ' from ' + self._name + ' PSU!')
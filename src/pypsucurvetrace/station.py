@@ -0,0 +1,302 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Run tests on several tester stations (PSU1 / PSU2 / heaterblock sets) concurrently from one process.
+'''
+
+import configparser
+import os
+import threading
+import time
+
+import pypsucurvetrace.heaterblock as heaterblock
+from pypsucurvetrace.curvetrace_tools import connect_PSU, connect_virtual_DUT, configure_test_PSU, configure_test_settings, concurrent_PSU_reader, get_logger, set_log_station
+from pypsucurvetrace.sweep import compile_sweep_plan, sweep_journal
+from pypsucurvetrace.ctrace import check_test_setup, journal_plan, run_test
+
+
+# set up logger:
+logger = get_logger('station')
+
+
+#########################################################
+# extract the config sections of one station (NAME:...) #
+#########################################################
+
+def station_config(configTESTER, name=None):
+
+	# map the [NAME:PSU1], [NAME:PSU2], [NAME:HEATERBLOCK] and [NAME:VIRTUAL_DUT] sections to [PSU1], [PSU2], [HEATERBLOCK] and [VIRTUAL_DUT] (use the plain sections if there is no station name):
+	if name is None:
+		prefix = ''
+	else:
+		prefix = name + ':'
+	config = configparser.ConfigParser()
+	for label in ['PSU1', 'PSU2', 'HEATERBLOCK', 'VIRTUAL_DUT']:
+		section = prefix + label
+		if section in configTESTER:
+			config[label] = dict(configTESTER[section])
+
+	if not ( ('PSU1' in config) or ('PSU2' in config) ):
+		raise ValueError('No PSU sections for station ' + str(name) + ' in the configuration file (expected [' + prefix + 'PSU1] and/or [' + prefix + 'PSU2]).')
+
+	return config
+
+
+class station_stopped(Exception):
+	'''
+	Test of a station stopped on request (see station.stop())
+	'''
+	pass
+
+
+class station:
+	'''
+	Tester station (PSU1, PSU2 and heaterblock of one test fixture) running DUT tests without user interaction.
+	'''
+
+	def __init__(self, name, configTESTER, configDUT):
+		'''
+		station(name, configTESTER, configDUT)
+		name: station name (prefix of the [NAME:PSU1], [NAME:PSU2] and [NAME:HEATERBLOCK] sections in the tester configuration, or None for the [PSU1], [PSU2] and [HEATERBLOCK] sections)
+		configTESTER: tester configuration (curvetrace_config.txt)
+		configDUT: DUT test configuration (all test parameters must be specified, there is no user prompting)
+		'''
+
+		self.name       = name
+		self.samplename = None
+		self.status     = 'waiting'
+		self.N_done     = 0 # number of data points written
+		self.N_total    = 0 # number of points in the sweep plan
+		self.error      = None
+
+		self._logger = logger # messages from the thread of the station are tagged with the station name (see run_stations())
+		self._stop = threading.Event()
+		self._config  = station_config(configTESTER, name)
+		self._configDUT = configDUT
+
+		self.PSU1 = self.PSU2 = self.HEATER = None
+		self._reader = self._logfile = self._journal = None
+
+
+	def connect(self):
+		'''
+		station.connect()
+
+		Connect and configure the PSUs and the heaterblock, and compile the sweep plan. Missing test parameters raise an error (no user prompting).
+		'''
+
+		self.PSU1 = connect_PSU(self._config, 'PSU1', self._logger)
+		self.PSU2 = connect_PSU(self._config, 'PSU2', self._logger)
+		connect_virtual_DUT(self._config, self.PSU1, self.PSU2, self._logger)
+
+		self.HEATER = heaterblock.heater( config=self._config, target_temperature=0.0, DUT_PSU1=self.PSU1, DUT_PSU2=self.PSU2 )
+		self.HEATER.turn_off()
+
+		for label in ['PSU1', 'PSU2']:
+			if label in self._configDUT:
+				setattr(self, label, configure_test_PSU(getattr(self, label), self._logger, self._configDUT[label], interactive=False))
+			else:
+				setattr(self, label, configure_test_PSU(getattr(self, label), self._logger, interactive=False))
+		if not ( self.PSU1.CONFIGURED or self.PSU2.CONFIGURED ):
+			raise ValueError('No power supply configured.')
+
+		self.settings = configure_test_settings(self._configDUT, self._logger, interactive=False)
+		self.HEATER.set_target_temperature(self.settings['T_TARGET'], self.settings['T_TOL'])
+		self.PSU1, self.PSU2 = check_test_setup(self.PSU1, self.PSU2, self._configDUT, self.settings, self._logger, interactive=False)
+
+		self.sweep_plan = compile_sweep_plan(self.PSU1, self.PSU2, self.settings['IDLESECS'], self.settings['PREHEATSECS'])
+		self.N_total = len(self.sweep_plan)
+
+		# keep start values for idle voltages as configured (for later tests):
+		self._VIDLE_ini = [ self.PSU1.TEST_VIDLE, self.PSU2.TEST_VIDLE ]
+
+		self._reader = concurrent_PSU_reader([self.PSU1, self.PSU2])
+		self.status = 'ready'
+
+
+	def _progress(self, N_done, N_total):
+		self.N_done = N_done
+		self.status = 'running'
+		if self._stop.is_set():
+			raise station_stopped('Test stopped after ' + str(N_done) + ' of ' + str(N_total) + ' data points.')
+
+
+	def stop(self):
+		'''
+		station.stop()
+
+		Ask the station to stop the running test. The test stops after the current data point (or after the pre-heat), and the PSU outputs are turned off.
+		'''
+
+		self._stop.set()
+
+
+	def run(self, samplename, outdir='.'):
+		'''
+		station.run(samplename, outdir='.')
+
+		Run the test of one sample (data file: samplename.dat in directory outdir, no terminal output except for log messages). Errors are logged and kept in station.error.
+		'''
+
+		self.samplename = samplename
+		self.N_done = 0
+		self.error = None
+		self._stop.clear()
+		V_steps = [ self.sweep_plan['V1'][self.sweep_plan['j2'] == 0] , self.sweep_plan['V2'][self.sweep_plan['j1'] == 0] ]
+
+		try:
+			logfilename = os.path.join(outdir, samplename + '.dat')
+			if os.path.exists(logfilename):
+				raise ValueError('Data / log file ' + logfilename + ' exists.')
+			self._logfile = open(logfilename, 'w')
+			self._logger.info('Logging output to ' + logfilename + '...')
+			self._journal = sweep_journal(os.path.join(outdir, samplename + '.journal'), journal_plan(V_steps, self.PSU1, self.PSU2, self.settings))
+
+			# reset initial values for idle conditions:
+			self.PSU1.TEST_VIDLE, self.PSU2.TEST_VIDLE = self._VIDLE_ini
+
+			self.status = 'pre-heat' if self.settings['PREHEATSECS'] > 0.0 else 'running'
+			run_test(self.PSU1, self.PSU2, self.HEATER, self._reader, self.sweep_plan, self.settings, samplename, self._logfile, self._journal, terminal_output=False, progress=self._progress, logger=self._logger)
+			self.status = 'done'
+		except station_stopped as e:
+			self.error = e
+			self.status = 'stopped'
+			self._logger.info(str(e))
+		except Exception as e:
+			self.error = e
+			self.status = 'FAILED'
+			self._logger.warning('Oooops, something went wrong during testing: ' + repr(e))
+		finally:
+			# make sure the DUT is not powered after the test (also if the test failed half-way, so that the DUT can be swapped safely):
+			self._outputs_off()
+			if self._journal is not None:
+				self._journal.close()
+				self._journal = None
+			if self._logfile is not None:
+				self._logfile.close()
+				self._logfile = None
+
+		return self.error is None
+
+
+	def _outputs_off(self):
+		# turn off the PSU outputs (this also sets them to VMIN and 0 A):
+		for p in [self.PSU1, self.PSU2]:
+			try:
+				if p is not None and p.CONNECTED:
+					p.turnOff()
+			except Exception as e:
+				self._logger.warning('Could not turn off PSU ' + p.LABEL + ': ' + repr(e))
+
+
+	def close(self):
+		'''
+		station.close()
+
+		Turn off the PSUs and the heater.
+		'''
+
+		self._outputs_off()
+		if self.HEATER is not None:
+			try:
+				self.HEATER.turn_off()
+				self.HEATER.terminate_controller_thread()
+			except Exception as e:
+				self._logger.warning('Could not turn off heater: ' + repr(e))
+		if self._reader is not None:
+			self._reader.close()
+			self._reader = None
+
+
+	def progress_text(self):
+		if self.status == 'running':
+			return self.name + ': ' + str(self.N_done) + '/' + str(self.N_total)
+		return self.name + ': ' + self.status
+
+
+def _run_and_close(s, samplename):
+	set_log_station(s.name)
+	s.run(samplename)
+	s.close()
+
+
+#########################################
+# run several stations at the same time #
+#########################################
+
+def run_stations(configTESTER, jobs, interval=1.0):
+
+	# jobs: list of (station name, DUT config file, sample name)
+
+	# set up all stations before starting any test, so that configuration errors show up right away:
+	stations = []
+	try:
+		for name, cfgfile, samplename in jobs:
+			if name in [ s.name for s in stations ]:
+				raise ValueError('Station ' + name + ' is used more than once.')
+			if os.path.exists(samplename + '.dat'):
+				raise ValueError('Data / log file ' + samplename + '.dat exists.')
+			configDUT = configparser.ConfigParser()
+			if not configDUT.read(cfgfile):
+				raise ValueError('Could not read DUT configuration file ' + cfgfile + '.')
+			s = station(name, configTESTER, configDUT)
+			stations.append(s)
+			logger.info('Setting up station ' + name + ' (' + samplename + ')...')
+			set_log_station(name) # the worker threads of the station (PSU reader, heater controller) inherit the station name for their log messages
+			try:
+				s.connect()
+			finally:
+				set_log_station(None)
+	except Exception:
+		for s in stations:
+			s.close()
+		raise
+
+	# run the stations in separate threads:
+	threads = [ threading.Thread(target=_run_and_close, args=(s, job[2]), name=s.name, daemon=True) for s, job in zip(stations, jobs) ]
+	for t in threads:
+		t.start()
+
+	# shared progress display:
+	msg = ''
+	try:
+		while any([ t.is_alive() for t in threads ]):
+			print (' '*len(msg), end='\r')
+			msg = 'Progress -- ' + ' | '.join([ s.progress_text() for s in stations ])
+			print (msg, end='\r')
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		# let the stations finish their current serial transactions before turning them off:
+		logger.info('Caught keyboard interrupt, stopping all stations...')
+		for s in stations:
+			s.stop()
+		try:
+			for t in threads:
+				t.join()
+		except KeyboardInterrupt:
+			logger.warning('Caught second keyboard interrupt, turning off all stations without waiting for them to stop.')
+		for s in stations:
+			s.close()
+		raise
+	print (' '*len(msg), end='\r')
+
+	for s in stations:
+		if s.error is None:
+			logger.info(s.name + ': test of ' + s.samplename + ' completed (' + str(s.N_done) + ' data points).')
+		else:
+			logger.warning(s.name + ': test of ' + s.samplename + ' failed: ' + repr(s.error))
+
+	return stations
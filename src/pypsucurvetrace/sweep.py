@@ -0,0 +1,470 @@
+"""
+Helper functions for the voltage sweeps of the curvetrace program
+"""
+
+import json
+import os
+import numpy as np
+from pypsucurvetrace.curvetrace_tools import get_logger
+
+# set up logger:
+logger = get_logger('sweep')
+
+
+#####################################
+# current limit of PSU at voltage V #
+#####################################
+
+def current_limit(PSU, V):
+	'''
+	I = current_limit(PSU, V)
+
+	Determine the current limit of a PSU at the voltage V, based on the current and power limits of the DUT test configuration and the power capability of the PSU.
+
+	INPUT:
+	PSU: PSU object
+	V: voltage setting (V)
+
+	OUTPUT:
+	I: current limit (A)
+	'''
+
+	# Determine current limit (based on DUT limits):
+	if V > 0.0:
+		I = min (PSU.TEST_ILIMIT,PSU.TEST_PLIMIT/V)
+	else:
+		I = PSU.TEST_ILIMIT
+
+	# Check if current limit is within power capability of PSU (and adjust if necessary):
+	if (V*I) > PSU.PMAX:
+		I = PSU.PMAX / V
+
+	return I
+
+
+##############
+# sweep plan #
+##############
+
+# data type of the sweep plan table (one row per point, in the order of measurement with V1 as the inner loop):
+SWEEP_PLAN_DTYPE = np.dtype([
+	('j2', np.int32),		# index of the V2 step
+	('j1', np.int32),		# index of the V1 step
+	('n2', np.int64),		# V2 setting in counts of the PSU2 voltage setting resolution (VRESSET)
+	('n1', np.int64),		# V1 setting in counts of the PSU1 voltage setting resolution (VRESSET)
+	('V2', np.float64),		# V2 setting (V)
+	('V1', np.float64),		# V1 setting (V)
+	('I2LIM', np.float64),		# PSU2 current limit (A)
+	('I1LIM', np.float64),		# PSU1 current limit (A)
+	('preheat', np.float64),	# pre-heat time before the point (s)
+	('idle', np.float64)		# idle time before each reading of the point (s)
+])
+
+
+def voltage_counts(PSU):
+	'''
+	n = voltage_counts(PSU)
+
+	Determine the voltage steps of a PSU test configuration as integer counts of the voltage setting resolution of the PSU (VRESSET). This avoids the accumulation of rounding errors of floating-point voltage steps.
+
+	INPUT:
+	PSU: PSU object
+
+	OUTPUT:
+	n: voltage steps in counts of VRESSET (numpy array of int). If the PSU is not configured, n = [0].
+	'''
+
+	if not PSU.CONFIGURED:
+		return np.array([0], dtype=np.int64)
+
+	n_start = int(round(PSU.TEST_VSTART/PSU.VRESSET))
+	if PSU.TEST_VSTEP == 0:
+		return np.array([n_start], dtype=np.int64)
+
+	n_end  = int(round(PSU.TEST_VEND/PSU.VRESSET))
+	n_step = max(int(round(PSU.TEST_VSTEP/PSU.VRESSET)), 1)
+	if n_start <= n_end:
+		return np.arange(n_start, n_end+1, n_step, dtype=np.int64)
+	else:
+		return np.arange(n_start, n_end-1, -n_step, dtype=np.int64)
+
+
+def compile_sweep_plan(PSU1, PSU2, T_idle=0.0, T_preheat=0.0):
+	'''
+	plan = compile_sweep_plan(PSU1, PSU2, T_idle=0.0, T_preheat=0.0)
+
+	Compile the full table of the sweep points of a curvetrace test run (before any hardware is touched).
+
+	INPUT:
+	PSU1, PSU2: PSU objects with test configuration
+	T_idle: idle time before each reading (s)
+	T_preheat: pre-heat time before the first point (s)
+
+	OUTPUT:
+	plan: sweep plan (numpy structured array of SWEEP_PLAN_DTYPE, V1 is the inner loop)
+	'''
+
+	n1 = voltage_counts(PSU1)
+	n2 = voltage_counts(PSU2)
+
+	plan = np.zeros(len(n1)*len(n2), dtype=SWEEP_PLAN_DTYPE)
+	plan['j2'] = np.repeat(np.arange(len(n2)), len(n1))
+	plan['j1'] = np.tile(np.arange(len(n1)), len(n2))
+	plan['n2'] = n2[plan['j2']]
+	plan['n1'] = n1[plan['j1']]
+	if PSU1.CONFIGURED:
+		plan['V1'] = plan['n1'] * PSU1.VRESSET
+		plan['I1LIM'] = [ current_limit(PSU1, V) for V in plan['V1'] ]
+	if PSU2.CONFIGURED:
+		plan['V2'] = plan['n2'] * PSU2.VRESSET
+		plan['I2LIM'] = [ current_limit(PSU2, V) for V in plan['V2'] ]
+	plan['idle'] = T_idle
+	if len(plan) > 0:
+		plan['preheat'][0] = T_preheat
+
+	return plan
+
+
+#####################################
+# estimate duration of a sweep plan #
+#####################################
+
+def estimate_duration(plan, PSU1, PSU2, N_rep=1, pulsed=False):
+	'''
+	t = estimate_duration(plan, PSU1, PSU2, N_rep=1, pulsed=False)
+
+	Estimate the duration of a sweep plan from the timing models of the PSUs (nominal command and reading times of the PSU drivers, and the settle time estimate of the PSUs). Curves that end early at the current / power limit and adaptive steps make the actual run shorter, so the estimate is an upper limit.
+
+	INPUT:
+	plan: sweep plan (see compile_sweep_plan)
+	PSU1, PSU2: PSU objects
+	N_rep: number of repeated readings per point
+	pulsed: flag for pulsed measurements (single fast reading, return to idle after each reading)
+
+	OUTPUT:
+	t: estimated duration (s)
+	'''
+
+	t_set = [] # time for setting current limit and voltage and waiting for the output to settle
+	t_read = 0.0 # time for reading the PSUs (concurrently)
+	t_to_idle = 0.0 # time for switching the PSUs to idle conditions
+	for p in [PSU1, PSU2]:
+		if not p.CONFIGURED:
+			t_set.append(0.0)
+			continue
+		t_set.append( 2*p.SETTIME + p.settletime() + p.READTIME )
+		if pulsed:
+			N = 1
+		else:
+			N = p.NSTABLEREADINGS
+		t_read = max( t_read, N*p.READTIME + (N-1)*p.READIDLETIME )
+		t_to_idle = t_to_idle + 2*p.SETTIME
+
+	n_curves = len(np.unique(plan['j2']))
+
+	# readings at all points:
+	t = np.sum( N_rep * (t_set[0] + t_read + plan['idle']) )
+	if pulsed:
+		# switch PSU2 to test conditions and back to idle with every reading:
+		t = t + len(plan) * N_rep * (t_set[1] + t_to_idle)
+	else:
+		# idle periods, then PSU2 returns to test conditions:
+		t = t + np.sum( N_rep * (plan['idle'] > 0) * (t_to_idle + t_set[1]) )
+
+	# PSU2 set to a new step at the start of each curve, pre-heat:
+	t = t + n_curves * t_set[1] + np.sum(plan['preheat'])
+
+	return float(t)
+
+
+##################################
+# coarse grid for adaptive sweep #
+##################################
+
+def coarse_indices(N, k):
+	'''
+	idx = coarse_indices(N, k)
+
+	Determine the indices of the coarse start grid of an adaptive sweep. The coarse grid contains every k-th point of the fine grid, and always includes the first and last point of the fine grid.
+
+	INPUT:
+	N: number of points in the fine grid (int)
+	k: number of fine-grid steps per coarse-grid step (int)
+
+	OUTPUT:
+	idx: list of fine-grid indices (list of int)
+	'''
+
+	if N < 1:
+		return []
+	k = max(int(k), 1)
+	idx = list(range(0, N, k))
+	if idx[-1] != N-1:
+		idx.append(N-1)
+	return idx
+
+
+#################################
+# refine grid of adaptive sweep #
+#################################
+
+def refine_indices(idx, I, limited, I_tol):
+	'''
+	new_idx = refine_indices(idx, I, limited, I_tol)
+
+	Determine the fine-grid indices to be measured in the next refinement pass of an adaptive sweep. An interval between two measured points is refined (split in half) if:
+	* the current at a neighbouring point deviates by more than I_tol from the straight line through its neighbours (i.e., the slope of the curve changes a lot), or
+	* the limiter flag changes between the two points (to locate the onset of the current / power limit), or
+	* there are not yet enough points to judge the curvature.
+
+	INPUT:
+	idx: fine-grid indices of the points measured so far (list of int, ascending)
+	I: current values measured at the idx points (list of float)
+	limited: limiter flags of the idx points (list of bool)
+	I_tol: tolerance of the current deviation from linear interpolation (A)
+
+	OUTPUT:
+	new_idx: fine-grid indices of points to be measured next (list of int, ascending)
+	'''
+
+	n = len(idx)
+	refine = [False]*(n-1) # refinement flags of the intervals between the idx points
+
+	if n == 2:
+		refine[0] = True
+
+	for j in range(1, n-1):
+		i = j-1
+		k = j+1
+		if limited[i] or limited[j] or limited[k]:
+			continue
+		# deviation of I[j] from the line through the neighbouring points:
+		I_lin = I[i] + (I[k]-I[i]) * (idx[j]-idx[i]) / (idx[k]-idx[i])
+		if abs(I[j]-I_lin) > I_tol:
+			refine[i] = True
+			refine[j] = True
+
+	for j in range(n-1):
+		if limited[j] != limited[j+1]:
+			refine[j] = True
+
+	new_idx = []
+	for j in range(n-1):
+		if refine[j] and idx[j+1]-idx[j] > 1:
+			new_idx.append( (idx[j]+idx[j+1])//2 )
+
+	return new_idx
+
+
+#################################################
+# length of an upward sweep with limit breaking #
+#################################################
+
+def upward_sweep_length(limited, limit_max):
+	'''
+	n = upward_sweep_length(limited, limit_max)
+
+	Determine the number of points that an upward sweep would record, given the limiter flags of the points in upward order. An upward sweep stops at the point where the current / power limiter is on for limit_max consecutive points (this point is not recorded). This is used to write sweeps that were measured in a different order (e.g., downwards in a serpentine sweep) in the same way as a plain upward sweep.
+
+	INPUT:
+	limited: limiter flags of the points in upward order (list of bool)
+	limit_max: number of consecutive limited points that stops the sweep (int)
+
+	OUTPUT:
+	n: number of points recorded by the upward sweep (int)
+	'''
+
+	limit = 0
+	for j in range(len(limited)):
+		if not limited[j]:
+			limit = 0
+		else:
+			limit = limit + 1
+			if limit >= limit_max:
+				return j
+	return len(limited)
+
+
+
+#######################################
+# prediction of current / power limit #
+#######################################
+
+class limit_predictor:
+	'''
+	Predict the PSU1 current at the next V1 step of a sweep from the points already measured, so that points that would run into the current / power limit can be skipped before they are set at the PSU. Two predictions are used:
+	* linear interpolation between the points measured on the current curve next to V1 on both sides, or linear extrapolation from the two points next to V1 if V1 is outside the range of the measured points (for a sweep in one direction, these are the last two points measured)
+	* the shape of the previous curve (the change of its current between the measured V1 next to the next V1 and the next V1 is added to the current at the measured V1). Beyond the ends of the previous curve, its shape is extrapolated linearly from its last two points.
+	The lower of the available predictions is used, so that points are only skipped if the predictions agree that the limit will be exceeded.
+	'''
+
+	def __init__(self):
+		self._cur_V = []
+		self._cur_I = []
+		self._prev_V = np.array([])
+		self._prev_I = np.array([])
+
+	def new_curve(self):
+		'''
+		Start a new curve (the current curve becomes the previous curve).
+		'''
+		if len(np.unique(self._cur_V)) > 1:
+			self._prev_V, k = np.unique(self._cur_V, return_index=True) # sorted, without repeated V values
+			self._prev_I = np.array(self._cur_I)[k]
+		self._cur_V = []
+		self._cur_I = []
+
+	def add(self, V, I, limited):
+		'''
+		Add a measured point of the current curve (points with the limiter on are ignored).
+
+		INPUT:
+		V: voltage setting (V)
+		I: current measurement (A)
+		limited: limiter flag of the point (bool)
+		'''
+		if not limited:
+			self._cur_V.append(V)
+			self._cur_I.append(I)
+
+	def _previous_curve(self, V):
+		# current of the previous curve at V (linear extrapolation beyond its ends):
+		V_prev, I_prev = self._prev_V, self._prev_I
+		if V < V_prev[0]:
+			return I_prev[0] + (I_prev[1]-I_prev[0])/(V_prev[1]-V_prev[0])*(V-V_prev[0])
+		if V > V_prev[-1]:
+			return I_prev[-1] + (I_prev[-1]-I_prev[-2])/(V_prev[-1]-V_prev[-2])*(V-V_prev[-1])
+		return np.interp(V, V_prev, I_prev)
+
+	def predict(self, V):
+		'''
+		I = predict(V)
+
+		Predict the current at voltage V.
+
+		INPUT:
+		V: voltage setting (V)
+
+		OUTPUT:
+		I: predicted current (A), or None if there is not enough data for a prediction
+		'''
+
+		I = []
+		if len(self._cur_V) > 0:
+			k = np.argsort(self._cur_V, kind='stable')
+			cur_V = np.array(self._cur_V)[k]
+			cur_I = np.array(self._cur_I)[k]
+		if len(self._cur_V) > 1:
+			# points next to V (both sides, or the two nearest points on one side):
+			n = min(max(int(np.searchsorted(cur_V, V)), 1), len(cur_V)-1)
+			V1, V2 = cur_V[n-1:n+1]
+			I1, I2 = cur_I[n-1:n+1]
+			if V2 != V1:
+				I.append( I2 + (I2-I1)/(V2-V1)*(V-V2) )
+		if len(self._cur_V) > 0 and len(self._prev_V) > 1:
+			n = int(np.argmin(abs(cur_V - V))) # measured point next to V
+			I.append( cur_I[n] + self._previous_curve(V) - self._previous_curve(cur_V[n]) )
+		if len(I) == 0:
+			return None
+		return min(I)
+
+
+
+#############################################
+# checkpoint journal of a curve-tracing run #
+#############################################
+
+class sweep_journal:
+	'''
+	Checkpoint journal of a curve-tracing run. The journal file records the sweep plan (the V1 and V2 steps and other test parameters), the (V1, V2) points that were written to the data file, and the curves (V2 steps) that were completed. An interrupted run can be resumed from the journal, skipping all points that are already in the data file.
+
+	Journal file format (one entry per line):
+	plan <JSON dict of the sweep plan>
+	point <V2 index> <V1 index>
+	curve <V2 index>
+	'''
+
+	def __init__(self, filename, plan, resume=False):
+		'''
+		journal = sweep_journal(filename, plan, resume=False)
+
+		Start a new journal, or continue an existing journal (resume = True).
+
+		INPUT:
+		filename: name of the journal file (string)
+		plan: sweep plan (dict, must be JSON serialisable)
+		resume: if True, continue the existing journal file (the plan in the file must match the plan given here)
+		'''
+
+		self.filename = filename
+		self.plan = json.loads(json.dumps(plan)) # normalise (e.g., tuples to lists)
+		self.points = set()
+		self.curves = set()
+
+		if resume:
+			if not os.path.exists(filename):
+				raise RuntimeError('Cannot resume: journal file ' + filename + ' does not exist.')
+			with open(filename, 'r') as f:
+				for line in f:
+					u = line.split(None, 1)
+					if len(u) == 0:
+						continue
+					if u[0] == 'plan':
+						if json.loads(u[1]) != self.plan:
+							raise RuntimeError('Cannot resume: the test configuration does not match the sweep plan in the journal file ' + filename + '.')
+					elif u[0] == 'point':
+						j2, j1 = u[1].split()
+						self.points.add( (int(j2), int(j1)) )
+					elif u[0] == 'curve':
+						self.curves.add( int(u[1]) )
+					else:
+						logger.warning('Ignoring unknown entry in journal file ' + filename + ': ' + line.strip())
+			logger.info('Resuming from journal ' + filename + ' (' + str(len(self.curves)) + ' curves and ' + str(len(self.points)) + ' points done).')
+			self._f = open(filename, 'a')
+
+		else:
+			self._f = open(filename, 'w')
+			self._write('plan ' + json.dumps(self.plan))
+
+	def _write(self, line):
+		self._f.write(line + '\n')
+		self._f.flush()
+		os.fsync(self._f.fileno())
+
+	def point_done(self, j2, j1):
+		'''
+		Return True if the point (V2 index j2, V1 index j1) is already in the data file.
+		'''
+		return (j2 in self.curves) or ( (j2, j1) in self.points )
+
+	def curve_done(self, j2):
+		'''
+		Return True if the curve with V2 index j2 has been completed.
+		'''
+		return j2 in self.curves
+
+	def add_point(self, j2, j1):
+		'''
+		Record that the point (V2 index j2, V1 index j1) has been written to the data file.
+		'''
+		self.points.add( (j2, j1) )
+		self._write('point ' + str(j2) + ' ' + str(j1))
+
+	def add_curve(self, j2):
+		'''
+		Record that the curve with V2 index j2 has been completed.
+		'''
+		self.curves.add(j2)
+		self._write('curve ' + str(j2))
+
+	def close(self, remove=False):
+		'''
+		Close the journal file, and remove it if remove = True (after the run is complete).
+		'''
+		if not self._f.closed:
+			self._f.close()
+		if remove:
+			try:
+				os.remove(self.filename)
+			except OSError as e:
+				logger.warning('Could not remove journal file ' + self.filename + ': ' + repr(e))
@@ -21,11 +21,11 @@
 
 try:
 	import sys
-	import time
 	from digitemp.master import UART_Adapter
 	from digitemp.device import AddressableDevice
 	from digitemp.device import DS18B20
 	from pypsucurvetrace.curvetrace_tools import get_logger 
+	from pypsucurvetrace.arbiter import get_arbiter
 except ImportError as e:
 	print (e)
 	raise
@@ -33,6 +33,8 @@ except ImportError as e:
 # set up logger:
 logger = get_logger('temperaturesensor_MAXIM')
 
+UART_LOCK_TIMEOUT = 10.0 # max. time to wait for the UART if another thread is using it (s)
+
 
 # check Python version and print warning if we're running version < 3:
 if ( sys.version_info[0] < 3 ):
@@ -61,6 +63,9 @@ class temperaturesensor_MAXIM:
 		OUTPUT:
 		(none)
 		'''
+
+		self._port = serialport
+		self._bus = get_arbiter(serialport) # arbiter for access to the UART by different threads
 		
 		try:
 
@@ -82,8 +87,6 @@ class temperaturesensor_MAXIM:
 				else:
 					self._sensor = DS18B20(bus, rom=romcode)
 					self._ROMcode = romcode
-				
-				self._UART_locked = False
 
 			if not hasattr(self,'_sensor'):
 				self.warning( 'Could not initialize MAXIM DS1820 temperature sensor.' )
@@ -96,25 +99,24 @@ class temperaturesensor_MAXIM:
 	########################################################################################################
 
 
-	def get_UART_lock(self):
+	def get_UART_lock(self, timeout=None):
 		'''
-		temperaturesensor_MAXIM.get_UART_lock()
+		temperaturesensor_MAXIM.get_UART_lock(timeout=None)
 		
 		Lock UART port for exclusive access (important if different threads / processes are trying to use the port). Make sure to release the lock after using the port (see temperaturesensor_MAXIM.release_UART_lock()!
 		
 		INPUT:
-		(none)
+		timeout: max. time to wait for the port (s, default: UART_LOCK_TIMEOUT). A RuntimeError is raised if the port is not available in time.
 		
 		OUTPUT:
 		(none)
 		'''
 
-		# wait until the serial port is unlocked:
-		while self._UART_locked == True:
-			time.sleep(0.01)
-			
-		# lock the port:
-		self._UART_locked = True
+		# wait until the serial port is available, and lock it:
+		if timeout is None:
+			timeout = UART_LOCK_TIMEOUT
+		if not self._bus.acquire(timeout):
+			raise RuntimeError('Timeout waiting for access to UART ' + self._port + ' (port is held by another thread).')
 
 
 	########################################################################################################
@@ -133,11 +135,8 @@ class temperaturesensor_MAXIM:
 		(none)
 		'''
 
-		# release the lock:
-		self._UART_locked = False
-		
-		# sleep to allow access to T sensor from others
-		time.sleep(0.013)
+		# release the lock (the next thread waiting for the UART gets it right away):
+		self._bus.release()
 
 
 	
@@ -162,12 +161,16 @@ class temperaturesensor_MAXIM:
 		unit = '?';
 		try:
 			self.get_UART_lock()
+		except RuntimeError as e:
+			self.warning( 'could not read sensor: ' + str(e) )
+			return temp,unit
+		try:
 			temp = self._sensor.get_temperature()
-			self.release_UART_lock()
 			unit = 'deg.C'
 		except:
-			self.release_UART_lock()
 			self.warning( 'could not read sensor!' )
+		finally:
+			self.release_UART_lock()
 
 		return temp,unit
 
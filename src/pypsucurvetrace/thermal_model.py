@@ -0,0 +1,158 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+First-order thermal model of the heater block, fitted from the temperature and power values logged by the heater controller:
+
+	C * dT/dt = P - (T - T_amb) / R
+
+C: heat capacity of the block (J/K)
+R: thermal resistance from the block to the ambient (K/W)
+T_amb: ambient temperature (°C)
+P: heat input to the block (heater power plus DUT power, W)
+
+The model is used for feedforward control of the heater power (power needed to hold the target temperature) and to predict the time until the block temperature is within tolerance.
+'''
+
+import numpy as np
+from collections import deque
+
+
+class thermal_model:
+	'''
+	First-order thermal model of the heater block
+	'''
+
+	def __init__(self, max_samples=600, min_samples=30, min_T_span=0.5):
+		'''
+		thermal_model(max_samples=600, min_samples=30, min_T_span=0.5)
+		max_samples: number of logged samples used for the fit (the oldest samples are discarded)
+		min_samples: min. number of samples needed for a fit
+		min_T_span: min. temperature span of the samples needed for a fit (K, the temperature must have changed enough to tell the heating and cooling terms apart)
+		'''
+
+		self._samples = deque(maxlen=int(max_samples))
+		self._min_samples = int(min_samples)
+		self._min_T_span = float(min_T_span)
+
+		# model parameters (None until fitted):
+		self.C = None
+		self.R = None
+		self.T_amb = None
+
+
+	def add_sample(self, t, T, P):
+		'''
+		thermal_model.add_sample(t, T, P)
+
+		Log a sample: time t (s), temperature T (°C), and heat input P (W) applied from time t on.
+		'''
+
+		self._samples.append((float(t), float(T), float(P)))
+
+
+	def is_valid(self):
+		'''
+		ok = thermal_model.is_valid()
+
+		Return True if the model has been fitted and is physically meaningful.
+		'''
+
+		return self.C is not None
+
+
+	def tau(self):
+		'''
+		tau = thermal_model.tau()
+
+		Return the time constant of the block (s), or None if the model is not valid.
+		'''
+
+		if not self.is_valid():
+			return None
+		return self.R * self.C
+
+
+	def fit(self):
+		'''
+		ok = thermal_model.fit()
+
+		Fit the model parameters to the logged samples by linear least squares of dT/dt = a*P + b*T + c. The parameters are only updated if the fit is physically meaningful (a > 0, b < 0).
+
+		OUTPUT:
+		ok: True if the model is valid after the fit
+		'''
+
+		if len(self._samples) < self._min_samples:
+			return self.is_valid()
+
+		x = np.array(self._samples)
+		t, T, P = x[:,0], x[:,1], x[:,2]
+		dt = np.diff(t)
+		k = dt > 0.0
+		if np.count_nonzero(k) < self._min_samples - 1:
+			return self.is_valid()
+		if np.ptp(T) < self._min_T_span or np.ptp(P) <= 0.0:
+			return self.is_valid()
+
+		dTdt = np.diff(T)[k] / dt[k]
+		A = np.column_stack((P[:-1][k], T[:-1][k], np.ones(np.count_nonzero(k))))
+		a, b, c = np.linalg.lstsq(A, dTdt, rcond=None)[0]
+
+		if a > 0.0 and b < 0.0:
+			self.C = 1.0 / a
+			self.R = -a / b
+			self.T_amb = -c / b
+
+		return self.is_valid()
+
+
+	def steady_state_power(self, T):
+		'''
+		P = thermal_model.steady_state_power(T)
+
+		Return the heat input needed to hold the block at temperature T (W), or None if the model is not valid.
+		'''
+
+		if not self.is_valid():
+			return None
+		return (T - self.T_amb) / self.R
+
+
+	def settling_time(self, T, T_target, T_tol, P_min, P_max):
+		'''
+		dt = thermal_model.settling_time(T, T_target, T_tol, P_min, P_max)
+
+		Predict the time needed to bring the block temperature from T to within T_target +/- T_tol, using full heat input (P_max) for heating or min. heat input (P_min) for cooling.
+
+		OUTPUT:
+		dt: predicted time (s), or None if the model is not valid or the target range cannot be reached
+		'''
+
+		if not self.is_valid():
+			return None
+
+		if T < T_target - T_tol:
+			T_end, P = T_target - T_tol, P_max
+		elif T > T_target + T_tol:
+			T_end, P = T_target + T_tol, P_min
+		else:
+			return 0.0
+
+		# the temperature approaches T_inf exponentially:
+		T_inf = self.T_amb + self.R * P
+		if (T_end - T_inf) * (T - T_inf) <= 0.0 or abs(T_end - T_inf) >= abs(T - T_inf):
+			return None # T_end is not between T and T_inf
+		return self.tau() * np.log((T - T_inf) / (T_end - T_inf))
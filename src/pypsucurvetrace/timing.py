@@ -0,0 +1,173 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Timing instrumentation of test runs: time spent in the phases of each point, event counters, and run summary.
+'''
+
+import threading
+import pypsucurvetrace.clock as clock
+
+
+# phases of a point, in the order of the columns of the timing file:
+POINT_PHASES = [ 'heater wait', 'idle', 'set PSU2', 'set PSU1', 'read' ]
+
+
+class _no_phase:
+	# do-nothing context (timer disabled)
+	def __enter__(self):
+		return self
+	def __exit__(self, *args):
+		return False
+
+_NO_PHASE = _no_phase()
+
+
+class _phase:
+	# context for timing one phase
+	def __init__(self, timer, name):
+		self._timer = timer
+		self._name = name
+	def __enter__(self):
+		self._t0 = clock.monotonic()
+		return self
+	def __exit__(self, *args):
+		self._timer.add(self._name, clock.monotonic() - self._t0)
+		return False
+
+
+class phase_timer:
+	'''
+	Accumulate the time spent in the phases of a test run (monotonic clock) and count events (retries, timeouts). If the timer is disabled, all methods return right away.
+	'''
+
+	def __init__(self, enabled=False, file=None):
+		'''
+		phase_timer(enabled=False, file=None)
+		enabled: flag to enable timing (bool)
+		file: file object for the phase times of each point (optional)
+		'''
+
+		self.enabled  = enabled
+		self.totals   = {} # total time per phase (s)
+		self.calls    = {} # number of timed calls per phase
+		self.counters = {} # event counters
+		self._point   = None # phase times of the current point
+		self._file    = file
+		self._lock    = threading.Lock() # the units of composite PSUs are served by several threads
+
+		if self.enabled and self._file is not None:
+			print('% Phase times of each point (s)', file=self._file)
+			print('% Columns: PSU1 voltage setting (V), PSU2 voltage setting (V), ' + ', '.join(POINT_PHASES) + ', total', file=self._file)
+
+
+	def phase(self, name):
+		'''
+		with timer.phase(name): ...
+
+		Time the code in the with block as phase "name".
+		'''
+
+		if not self.enabled:
+			return _NO_PHASE
+		return _phase(self, name)
+
+
+	def add(self, name, dt):
+		'''
+		timer.add(name, dt)
+
+		Add time dt (s) to phase "name".
+		'''
+
+		if not self.enabled:
+			return
+		with self._lock:
+			self.totals[name] = self.totals.get(name, 0.0) + dt
+			self.calls[name] = self.calls.get(name, 0) + 1
+			if (self._point is not None) and (name in self._point):
+				self._point[name] += dt
+
+
+	def count(self, name, n=1):
+		'''
+		timer.count(name, n=1)
+
+		Add n to event counter "name".
+		'''
+
+		if not self.enabled:
+			return
+		with self._lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+
+	def start_point(self):
+		'''
+		timer.start_point()
+
+		Start collecting the phase times of a new point.
+		'''
+
+		if not self.enabled:
+			return
+		self._point = { p: 0.0 for p in POINT_PHASES }
+		self._t_point = clock.monotonic()
+
+
+	def end_point(self, V1, V2):
+		'''
+		timer.end_point(V1, V2)
+
+		Write the phase times of the current point to the timing file.
+		'''
+
+		if not self.enabled:
+			return
+		t = clock.monotonic() - self._t_point
+		self.add('point', t)
+		if self._file is not None:
+			print( ' '.join( [ '{:.4f}'.format(V1), '{:.4f}'.format(V2) ] + [ '{:.4f}'.format(self._point[p]) for p in POINT_PHASES ] + [ '{:.4f}'.format(t) ] ), file=self._file)
+		self._point = None
+
+
+	def summary(self):
+		'''
+		lines = timer.summary()
+
+		Summary table of phase times and event counters (list of text lines).
+		'''
+
+		lines = [ '{:<24s} {:>10s} {:>8s} {:>10s}'.format('Phase', 'Total (s)', 'Calls', 'Mean (ms)') ]
+		for name in sorted(self.totals):
+			lines.append( '{:<24s} {:>10.3f} {:>8d} {:>10.2f}'.format(name, self.totals[name], self.calls[name], 1000*self.totals[name]/self.calls[name]) )
+		for name in sorted(self.counters):
+			lines.append( '{:<24s} {:>10d}'.format(name, self.counters[name]) )
+		return lines
+
+
+	def close(self):
+		'''
+		timer.close()
+
+		Write the summary to the timing file and close the file.
+		'''
+
+		if self._file is not None:
+			if self.enabled:
+				for l in self.summary():
+					print('% ' + l, file=self._file)
+			self._file.close()
+			self._file = None
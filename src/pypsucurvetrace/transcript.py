@@ -0,0 +1,294 @@
+# This file is part of pypsucurvetrace, a toolbox for I/V curve tracing of electronic parts using programmable power supplies.
+#
+# pypsucurvetrace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypsucurvetrace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pypsucurvetrace.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Record and replay the communication of the PSU drivers with the PSUs (serial ports of the KORAD, BK, SALUKI and VOLTCRAFT drivers, Modbus instrument of the RIDEN driver).
+
+A recorder wraps the serial port / Modbus instrument of a driver and writes every call (request, response, start time and duration) to a transcript file (one JSON object per line). A player plays a transcript back in place of the serial port / Modbus instrument, with the recorded latencies (optionally scaled). The latencies are waited on the clock in use (see clock.py), so that replays on the virtual clock take no real time. Recorders and players also serve the I/O steps of drivers run in coroutines (see call_async and psu_io.py).
+
+The drivers open their ports with serial_port() and modbus_instrument(). Ports registered with record() or replay() are recorded or replayed, all other ports are opened as usual.
+'''
+
+import json
+import serial
+import minimalmodbus
+import pypsucurvetrace.clock as clock
+import pypsucurvetrace.psu_io as psu_io
+
+
+# calls that only manage the port buffers (may be skipped or repeated in a replay without changing the PSU communication):
+BUFFER_CALLS = [ 'reset_input_buffer', 'reset_output_buffer', 'flushInput', 'flushOutput', 'flush' ]
+
+# ports to be recorded or replayed (port -> session):
+_sessions = {}
+
+
+def _encode(x):
+	# make x JSON serializable (bytes as hex strings):
+	if isinstance(x, (bytes, bytearray)):
+		return { 'hex': bytes(x).hex() }
+	if isinstance(x, (list, tuple)):
+		return [ _encode(v) for v in x ]
+	if isinstance(x, dict):
+		return { k: _encode(v) for k, v in x.items() }
+	return x
+
+
+def _decode(x):
+	if isinstance(x, dict) and 'hex' in x:
+		return bytes.fromhex(x['hex'])
+	if isinstance(x, list):
+		return [ _decode(v) for v in x ]
+	if isinstance(x, dict):
+		return { k: _decode(v) for k, v in x.items() }
+	return x
+
+
+class recorder:
+	'''
+	Wrapper of a serial port / Modbus instrument object, which records all method calls to a transcript file.
+	'''
+
+	def __init__(self, device, port, file):
+		'''
+		recorder(device, port, file)
+		device: serial port or Modbus instrument object
+		port: port name (string)
+		file: file object of the transcript (text mode)
+		'''
+
+		# set fields directly in __dict__, so that __getattr__ / __setattr__ only forward the fields of the device:
+		self.__dict__['_device'] = device
+		self.__dict__['_file'] = file
+		self.__dict__['_t0'] = clock.monotonic()
+		self.__dict__['_async'] = None # asynchronous adapter of the device (see call_async)
+		print(json.dumps({ 'port': port }), file=file)
+		file.flush()
+
+
+	def __getattr__(self, name):
+		x = getattr(self._device, name)
+		if not callable(x):
+			return x
+
+		def _call(*args, **kwargs):
+			t = clock.monotonic()
+			try:
+				result = x(*args, **kwargs)
+			except Exception as e:
+				self._record(name, args, kwargs, t, error=e)
+				raise
+			self._record(name, args, kwargs, t, result=result)
+			return result
+
+		return _call
+
+
+	async def call_async(self, name, args, kwargs):
+		'''
+		result = await call_async(name, args, kwargs)
+
+		Call method name of the device in a coroutine (see psu_io.py), and record the call.
+		'''
+
+		if self._async is None:
+			self.__dict__['_async'] = psu_io.async_device(self._device)
+		t = clock.monotonic()
+		try:
+			result = await self._async.call_async(name, args, kwargs)
+		except Exception as e:
+			self._record(name, args, kwargs, t, error=e)
+			raise
+		self._record(name, args, kwargs, t, result=result)
+		return result
+
+
+	def _record(self, name, args, kwargs, t, result=None, error=None):
+		# write call that started at time t to the transcript:
+		event = { 'call': name, 'args': _encode(list(args)) }
+		if kwargs:
+			event['kwargs'] = _encode(kwargs)
+		if error is None:
+			event['result'] = _encode(result)
+		else:
+			event['error'] = repr(error)
+		event['t'] = round(t - self._t0, 6)
+		event['dt'] = round(clock.monotonic() - t, 6)
+		print(json.dumps(event), file=self._file)
+		self._file.flush()
+
+
+	def __setattr__(self, name, value):
+		setattr(self._device, name, value)
+
+
+	def close(self):
+		try:
+			self._device.close()
+		finally:
+			self._file.close()
+
+
+class player:
+	'''
+	Stand-in for a serial port / Modbus instrument object, which plays back a transcript.
+	'''
+
+	def __init__(self, filename, scale=1.0):
+		'''
+		player(filename, scale=1.0)
+		filename: transcript file
+		scale: scale factor for the recorded latencies (0: no waiting)
+		'''
+
+		with open(filename, 'r') as f:
+			lines = [ json.loads(l) for l in f if l.strip() ]
+		if len(lines) == 0 or 'port' not in lines[0]:
+			raise ValueError('Invalid transcript file ' + filename + '.')
+
+		self.port    = lines[0]['port']
+		self.serial  = self # Modbus instruments: instrument.serial.port etc.
+		self._events = lines[1:]
+		self._next   = 0
+		self._scale  = float(scale)
+		self._file   = filename
+
+
+	def __getattr__(self, name):
+		if name.startswith('__'):
+			raise AttributeError(name)
+
+		def _call(*args, **kwargs):
+			return self._play(name, list(args), kwargs)
+
+		return _call
+
+
+	def _play(self, name, args, kwargs):
+		event = self._next_event(name, args, kwargs)
+		if event is None:
+			return None
+		clock.sleep(self._scale * event['dt'])
+		return self._result(event)
+
+
+	async def call_async(self, name, args, kwargs):
+		'''
+		result = await call_async(name, args, kwargs)
+
+		Play call of method name in a coroutine (see psu_io.py), waiting for the recorded latency without blocking the event loop.
+		'''
+
+		event = self._next_event(name, list(args), kwargs)
+		if event is None:
+			return None
+		await clock.sleep_async(self._scale * event['dt'])
+		return self._result(event)
+
+
+	def _next_event(self, name, args, kwargs):
+		# next event of the transcript, which must match the call (None for buffer calls that were not recorded at this point):
+		if self._next >= len(self._events):
+			if name in BUFFER_CALLS:
+				return None
+			raise RuntimeError('End of transcript ' + self._file + ' reached at ' + name + str(tuple(args)) + '.')
+
+		event = self._events[self._next]
+		if event['call'] != name:
+			if name in BUFFER_CALLS:
+				return None # buffer call that was not recorded at this point, nothing to play
+			raise RuntimeError('Call ' + name + str(tuple(args)) + ' does not match the transcript ' + self._file + ' (expected ' + event['call'] + ' at t = ' + str(event['t']) + ' s).')
+		if _decode(event['args']) != args or _decode(event.get('kwargs', {})) != kwargs:
+			raise RuntimeError('Arguments of ' + name + str(tuple(args)) + ' do not match the transcript ' + self._file + ' (expected ' + str(tuple(_decode(event['args']))) + ' at t = ' + str(event['t']) + ' s).')
+
+		self._next += 1
+		return event
+
+
+	def _result(self, event):
+		if 'error' in event:
+			raise IOError('Replayed error: ' + event['error'])
+		return _decode(event.get('result'))
+
+
+	def done(self):
+		'''
+		d = done()
+
+		True if all calls of the transcript have been played.
+		'''
+
+		return self._next >= len(self._events)
+
+
+	def close(self):
+		pass
+
+
+def record(port, filename):
+	'''
+	record(port, filename)
+
+	Record the communication with the PSU at the given port to the transcript file.
+	'''
+
+	_sessions[port] = ( 'record', filename, None )
+
+
+def replay(port, filename, scale=1.0):
+	'''
+	replay(port, filename, scale=1.0)
+
+	Replay the transcript file in place of the PSU at the given port, with the recorded latencies multiplied by scale.
+	'''
+
+	_sessions[port] = ( 'replay', filename, scale )
+
+
+def _open_serial(port, **kwargs):
+	# URLs (e.g. socket://127.0.0.1:NNNNN of the PSU emulator) are opened by the URL handlers of pyserial:
+	if '://' in port:
+		return serial.serial_for_url(port, **kwargs)
+	return serial.Serial(port, **kwargs)
+
+
+def serial_port(port, **kwargs):
+	'''
+	p = serial_port(port, **kwargs)
+
+	Open serial port (see serial.serial_for_url, port can be a device name or a URL like socket://host:port), or the recorder / player of the port.
+	'''
+
+	if port not in _sessions:
+		return _open_serial(port, **kwargs)
+	mode, filename, scale = _sessions[port]
+	if mode == 'replay':
+		return player(filename, scale)
+	return recorder(_open_serial(port, **kwargs), port, open(filename, 'w'))
+
+
+def modbus_instrument(port, slaveaddress):
+	'''
+	i = modbus_instrument(port, slaveaddress)
+
+	Open Modbus instrument (see minimalmodbus.Instrument), or the recorder / player of the port.
+	'''
+
+	if port not in _sessions:
+		return minimalmodbus.Instrument(port=port, slaveaddress=slaveaddress)
+	mode, filename, scale = _sessions[port]
+	if mode == 'replay':
+		return player(filename, scale)
+	return recorder(minimalmodbus.Instrument(port=port, slaveaddress=slaveaddress), port, open(filename, 'w'))
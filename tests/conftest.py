@@ -12,14 +12,18 @@ if str(SRC) not in sys.path:
 
 
 # Allow importing hardware driver modules in environments without instrument libs.
-if "minimalmodbus" not in sys.modules:
+try:
+    import minimalmodbus  # noqa: F401
+except ImportError:
     class _DummyInstrument:  # pragma: no cover - not used by virtual tests
         def __init__(self, *args, **kwargs):
             pass
 
     sys.modules["minimalmodbus"] = types.SimpleNamespace(Instrument=_DummyInstrument)
 
-if "serial" not in sys.modules:
+try:
+    import serial  # noqa: F401
+except ImportError:
     class _DummySerial:  # pragma: no cover - not used by virtual tests
         def __init__(self, *args, **kwargs):
             pass
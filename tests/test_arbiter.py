@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pypsucurvetrace.arbiter import bus_arbiter, get_arbiter
+
+
+@pytest.mark.virtual_hw
+def test_waiting_threads_get_the_bus_in_order_of_their_requests():
+    bus = bus_arbiter("COM1")
+    order = []
+
+    def _user(k):
+        with bus:
+            order.append(k)
+
+    bus.acquire()
+    threads = []
+    for k in range(5):
+        t = threading.Thread(target=_user, args=(k,))
+        t.start()
+        threads.append(t)
+        while len(bus._queue) < k + 1:  # wait until the thread is queued
+            time.sleep(1e-3)
+    bus.release()
+    for t in threads:
+        t.join(timeout=5.0)
+
+    assert order == [0, 1, 2, 3, 4]
+    assert bus.stats["acquisitions"] == 6
+    assert bus.stats["contended"] == 5
+    assert bus.stats["max_wait_time"] > 0.0
+
+
+@pytest.mark.virtual_hw
+def test_acquire_times_out_and_owner_may_reacquire():
+    bus = bus_arbiter()
+    with bus:
+        with bus:  # nested acquisition by the same thread
+            pass
+        result = []
+        t = threading.Thread(target=lambda: result.append(bus.acquire(timeout=0.05)))
+        t.start()
+        t.join()
+        assert result == [False]
+        assert bus.stats["timeouts"] == 1
+
+    # bus is free again:
+    t = threading.Thread(target=lambda: result.append(bus.acquire(timeout=0.05) and bus.release() is None))
+    t.start()
+    t.join()
+    assert result == [False, True]
+    with pytest.raises(RuntimeError):
+        bus.release()
+
+
+@pytest.mark.virtual_hw
+def test_drivers_on_the_same_port_share_the_arbiter():
+    assert get_arbiter("/dev/ttyUSB_test") is get_arbiter("/dev/ttyUSB_test")
+    assert get_arbiter("/dev/ttyUSB_test") is not get_arbiter("/dev/ttyUSB_other")
+
+
+@pytest.mark.virtual_hw
+def test_hold_raises_if_the_bus_is_not_available_in_time():
+    bus = bus_arbiter("COM2")
+    held, done = threading.Event(), threading.Event()
+
+    def _owner():
+        with bus:
+            held.set()
+            done.wait(5.0)
+
+    t = threading.Thread(target=_owner)
+    t.start()
+    held.wait(5.0)
+    with pytest.raises(RuntimeError):
+        with bus.hold(timeout=0.05):
+            pass
+    done.set()
+    t.join()
+    assert bus.stats["timeouts"] == 1
+
+    with bus.hold(timeout=0.05):
+        assert bus._owner is threading.current_thread()
+    assert bus._owner is None
+
+
+@pytest.mark.virtual_hw
+def test_tasks_wait_for_the_bus_without_blocking_the_event_loop():
+    bus = bus_arbiter("COM3")
+    order = []
+
+    async def _user(k):
+        assert await bus.acquire_async(timeout=5.0)
+        assert await bus.acquire_async()  # nested acquisition by the same task
+        order.append(k)
+        await asyncio.sleep(0.01)
+        bus.release()
+        bus.release()
+
+    async def _cancelled():
+        await bus.acquire_async()
+
+    async def _main():
+        bus.acquire()  # held by the main task
+        waiters = [asyncio.ensure_future(_user(k)) for k in range(3)]
+        c = asyncio.ensure_future(_cancelled())
+        await asyncio.sleep(0.01)
+        assert len(bus._queue) == 4
+        c.cancel()
+        await asyncio.sleep(0.01)
+        assert len(bus._queue) == 3
+        assert await asyncio.ensure_future(bus.acquire_async(timeout=0.02)) is False
+        assert await bus.acquire_async(timeout=0.02)  # the main task may reacquire
+        bus.release()
+        bus.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(_main())
+    assert order == [0, 1, 2]
+    assert bus._owner is None and not bus._queue
+    assert bus.stats["timeouts"] == 1
@@ -0,0 +1,93 @@
+import configparser
+import time
+
+import pypsucurvetrace.clock as clock_mod
+import pytest
+
+from pypsucurvetrace.clock import virtual_clock
+from pypsucurvetrace.ctrace import virtual_tester
+from pypsucurvetrace.job import read_job_manifest, run_job
+
+
+TESTER_CONFIG = """
+[PSU1]
+COMPORT = VIRTUAL_A
+TYPE = VIRTUAL
+
+[PSU2]
+COMPORT = VIRTUAL_G
+TYPE = VIRTUAL
+"""
+
+DUT_CONFIG = """
+[PSU1]
+VSTART = 0
+VEND = 100
+VSTEP = 10
+IMAX = 0.05
+PMAX = 5
+IIDLE = 0.005
+VIDLE = 100
+PIDLEMAX = 1
+
+[PSU2]
+VSTART = 0
+VEND = 2
+VSTEP = 1
+IMAX = 0.01
+PMAX = 1
+VIDLE = 1
+VIDLEMIN = 0
+VIDLEMAX = 5
+IIDLE = 0.01
+IDLE_GM = 0.005
+
+[EXTRA]
+IDLESECS = 2
+PREHEATSECS = 600
+"""
+
+
+def test_virtual_clock_advances_without_waiting():
+    c = virtual_clock(t0=100.0, tick=0.0)
+    t = time.monotonic()
+    c.sleep(3600.0)
+    assert time.monotonic() - t < 1.0
+    assert c.time() == 3700.0
+    assert c.elapsed() == 3600.0
+
+    # every reading advances the clock by one tick, so polling loops time out:
+    c = virtual_clock(tick=0.5)
+    assert c.time() == 0.5 and c.monotonic() == 1.0
+
+
+def test_virtual_tester_requires_virtual_psus_without_heater():
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG + "\n[A:PSU1]\nCOMPORT = ('V1', 'V2')\nTYPE = ('VIRTUAL', 'VIRTUAL')\n")
+    assert virtual_tester(config)
+
+    config["A:PSU2"] = {"COMPORT": "/dev/ttyUSB0", "TYPE": "KORAD"}
+    assert not virtual_tester(config)
+
+    config.remove_section("A:PSU2")
+    config["HEATERBLOCK"] = {"PSU_TYPE": "VIRTUAL"}
+    assert not virtual_tester(config)
+
+
+@pytest.mark.virtual_hw
+def test_virtual_sweep_with_preheat_and_idle_takes_no_wall_time(tmp_path, monkeypatch):
+    c = virtual_clock()
+    monkeypatch.setattr(clock_mod, "_clock", c)
+    (tmp_path / "dut.txt").write_text(DUT_CONFIG)
+    (tmp_path / "job.txt").write_text("[JOB]\nDUT_CONFIG = dut.txt\nSAMPLE = DUT\n")
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG)
+
+    t = time.monotonic()
+    assert run_job(config, read_job_manifest(str(tmp_path / "job.txt"))) == 0
+    assert time.monotonic() - t < 10.0
+
+    # 10 minutes of pre-heating plus 2 s of idling at each of the 33 points:
+    assert c.elapsed() > 600.0 + 33 * 2.0
+    data = (tmp_path / "DUT.dat").read_text().splitlines()
+    assert len([l for l in data if not l.startswith("%")]) == 33
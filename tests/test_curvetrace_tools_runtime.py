@@ -1,6 +1,13 @@
+import logging
+import threading
+
 import pytest
 
+import pypsucurvetrace.clock as clock_mod
 import pypsucurvetrace.curvetrace_tools as tools
+import pypsucurvetrace.powersupply as ps_mod
+from pypsucurvetrace.clock import virtual_clock
+from tests.virtual_drivers import BarrierPSUDriver
 
 
 class _DummyLogger:
@@ -18,7 +25,7 @@ class _DummyPowerSupplyFactory:
     def __init__(self):
         self.last = None
 
-    def __call__(self, port=None, commandset=None, label=None, *_args):
+    def __call__(self, port=None, commandset=None, label=None, *_args, nominal=False):
         class _DummyPSU:
             CONNECTED = False
 
@@ -115,10 +122,96 @@ def test_do_idle_upper_clamp_uses_max(monkeypatch):
         clock["t"] += 0.02
         return clock["t"]
 
-    monkeypatch.setattr(tools.time, "time", fake_time)
-    monkeypatch.setattr(tools.time, "sleep", lambda *_: None)
+    monkeypatch.setattr(clock_mod, "time", fake_time)
+    monkeypatch.setattr(clock_mod, "sleep", lambda *_: None)
 
     tools.do_idle(reg, fix, _FakeHeater(), seconds=0.05, file=None, wait_for_TEMP=False)
 
     assert reg.TEST_VIDLE == reg.TEST_VIDLE_MAX
     assert reg.last_voltage == reg.TEST_VIDLE_MAX
+
+
+@pytest.mark.virtual_hw
+def test_do_idle_without_terminal_output_prints_nothing(monkeypatch, capsys):
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock())
+    tools.do_idle(_FakePSU(regulate=True), _FakePSU(regulate=False), _FakeHeater(), seconds=0.05, terminal_output=False)
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.virtual_hw
+def test_log_messages_are_tagged_with_the_station_of_the_thread(monkeypatch):
+    log = tools.get_logger("test_station_tag")
+    record = log.makeRecord(log.name, logging.INFO, __file__, 0, "hello", (), None)
+    handler = log.handlers[0]
+
+    handler.filter(record)
+    assert handler.format(record) == "INFO (test_station_tag): hello"
+
+    tools.set_log_station("A")
+    try:
+        handler.filter(record)
+        assert handler.format(record) == "INFO (A/test_station_tag): hello"
+        reader = tools.concurrent_PSU_reader([_barrier_psu(monkeypatch, None)[0]])
+    finally:
+        tools.set_log_station(None)
+    try:
+        # the worker threads of the reader log for the station that created the reader:
+        assert reader._pool.submit(tools.get_log_station).result() == "A"
+    finally:
+        reader.close()
+
+
+def _barrier_psu(monkeypatch, barrier, value=1.0, configured=True):
+    # PSU object with a barrier driver (read() only returns if the other PSUs are read at the same time)
+    drv = BarrierPSUDriver(barrier)
+    drv.last_voltage = value
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
+    psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU")
+    psu.CONFIGURED = configured
+    psu.NSTABLEREADINGS = 1
+    return psu, drv
+
+
+@pytest.mark.virtual_hw
+def test_concurrent_psu_reader_reads_psus_simultaneously(monkeypatch):
+    barrier = threading.Barrier(2, timeout=2.0)
+    psu1, _ = _barrier_psu(monkeypatch, barrier, value=1.0)
+    psu2, _ = _barrier_psu(monkeypatch, barrier, value=2.0)
+    reader = tools.concurrent_PSU_reader([psu1, psu2])
+    try:
+        r = reader.read()
+    finally:
+        reader.close()
+
+    assert r[0][0] == 1.0
+    assert r[1][0] == 2.0
+    assert abs(reader.timestamps[0] - reader.timestamps[1]) < 0.5
+
+
+@pytest.mark.virtual_hw
+def test_concurrent_psu_reader_skips_unconfigured_psu(monkeypatch):
+    psu1, _ = _barrier_psu(monkeypatch, None)
+    psu2, drv2 = _barrier_psu(monkeypatch, None, configured=False)
+    reader = tools.concurrent_PSU_reader([psu1, psu2])
+    try:
+        r = reader.read()
+    finally:
+        reader.close()
+
+    assert r[1] == [0.0, 0.0, "NONE"]
+    assert reader.timestamps[1] is None
+    assert drv2.readings == 0
+
+
+@pytest.mark.virtual_hw
+def test_concurrent_psu_reader_fast_reading_overrides_nstablereadings(monkeypatch):
+    psu, drv = _barrier_psu(monkeypatch, None)
+    psu.NSTABLEREADINGS = 3
+    reader = tools.concurrent_PSU_reader([psu])
+    try:
+        reader.read()
+        assert drv.readings == 3
+        reader.read(N=1)
+        assert drv.readings == 4
+    finally:
+        reader.close()
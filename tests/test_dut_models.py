@@ -0,0 +1,64 @@
+import configparser
+import math
+
+import numpy as np
+import pytest
+
+from pypsucurvetrace.dut_models import MODELS, get_model
+from pypsucurvetrace.job import read_job_manifest, run_job
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_models_evaluate_grids_in_one_call(name):
+    model = get_model(name)
+    V1, V2 = np.meshgrid(np.linspace(0.0, 100.0, 11), np.linspace(-3.0, 6.0, 7))
+    I1, I2 = model.I(V1, V2)
+    assert I1.shape == I2.shape == V1.shape
+    assert np.all(np.isfinite(I1)) and np.all(I1 >= 0.0)
+    assert np.all(np.isfinite(I2)) and np.all(I2 >= 0.0)
+
+    # same result as point by point:
+    i1, i2 = model.I(V1[3, 4], V2[3, 4])
+    assert i1 == pytest.approx(I1[3, 4]) and i2 == pytest.approx(I2[3, 4])
+
+
+def test_triode_model_matches_koren_formula():
+    model = get_model("triode")
+    va, vg = 200.0, -2.0
+    e1 = (va / 300.0) * math.log1p(math.exp(300.0 * (1.0 / 20.0 + vg / math.sqrt(300.0 + va * va))))
+    ia, ig = model.I(va, vg)
+    assert ia == pytest.approx(e1**1.4 / 1200.0) and ig == 0.0
+
+
+def test_model_parameters_and_unknown_names():
+    model = get_model("Mosfet", VTH="2.0", K=1.0)
+    i, _ = model.I(10.0, 4.0)
+    assert i == pytest.approx(0.5 * 2.0**2 * (1.0 + 0.01 * 10.0))
+
+    with pytest.raises(ValueError, match="Unknown parameter"):
+        get_model("mosfet", mu=20)
+    with pytest.raises(ValueError, match="Unknown DUT model"):
+        get_model("thyristor")
+
+
+@pytest.mark.virtual_hw
+def test_stations_simulate_their_own_dut_model(tmp_path):
+    (tmp_path / "dut.txt").write_text(
+        "[PSU1]\nVSTART = 0\nVEND = 10\nVSTEP = 5\nIMAX = 1\nPMAX = 10\n\n"
+        "[PSU2]\nVSTART = 5\nVEND = 5\nIMAX = 0.01\nPMAX = 1\n\n"
+        "[EXTRA]\nIDLESECS = 0\nPREHEATSECS = 0\n"
+    )
+    (tmp_path / "job.txt").write_text("[JOB]\nDUT_CONFIG = dut.txt\nSAMPLE = DUT\nSTATION = B\n")
+    config = configparser.ConfigParser()
+    config.read_string(
+        "[A:PSU1]\nCOMPORT = A1\nTYPE = VIRTUAL\n[A:PSU2]\nCOMPORT = A2\nTYPE = VIRTUAL\n"
+        "[B:PSU1]\nCOMPORT = B1\nTYPE = VIRTUAL\n[B:PSU2]\nCOMPORT = B2\nTYPE = VIRTUAL\n"
+        "[B:VIRTUAL_DUT]\nMODEL = MOSFET\nVTH = 3\nK = 0.1\nLAMBDA = 0\n"
+    )
+
+    assert run_job(config, read_job_manifest(str(tmp_path / "job.txt"))) == 0
+    data = [l.split() for l in (tmp_path / "DUT.dat").read_text().splitlines() if not l.startswith("%")]
+    # drain current at Vgs = 5 V: 0 A at Vds = 0, linear region at 5 V, saturation at 10 V (0.5 * 0.1 * 2^2 = 0.2 A):
+    I1 = [float(x[3]) for x in data]
+    assert I1[0] == pytest.approx(0.0, abs=1e-3)
+    assert I1[-1] == pytest.approx(0.2, abs=2e-3)
@@ -0,0 +1,211 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("simple_pid")
+
+import pypsucurvetrace.heaterblock as heaterblock
+
+
+class _FakeSensor:
+    def __init__(self, *args, **kwargs):
+        self.reads = 0
+        self.threads = set()
+
+    def temperature(self):
+        self.reads += 1
+        self.threads.add(threading.current_thread().name)
+        return 20.0 + 0.01 * self.reads, "deg.C"
+
+
+class _FakePSU:
+    PMAX = 50.0
+    VMAX = 30.0
+    IMAX = 3.0
+
+    def __init__(self, *args, **kwargs):
+        self.voltages = []
+        self.active = 0  # number of threads talking to the PSU right now
+        self.max_active = 0
+
+    def _access(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        time.sleep(1e-3)
+        self.active -= 1
+
+    def setVoltage(self, value, wait_stable=True):
+        self._access()
+        self.voltages.append(value)
+
+    def setCurrent(self, value, wait_stable=True):
+        self._access()
+
+    def turnOn(self):
+        self._access()
+
+    def turnOff(self):
+        self._access()
+
+
+def _config(period, model=False):
+    return {
+        "HEATERBLOCK": {
+            "TBUFFER_NUM": "3",
+            "TBUFFER_INTERVAL": "0",
+            "TEMPSENS_TYPE": "DS1820",
+            "TEMPSENS_COMPORT": "COM_T",
+            "PSU_COMPORT": "COM_P",
+            "PSU_TYPE": "VIRTUAL",
+            "HEATER_RESISTANCE": "10",
+            "KP": "1",
+            "KI": "0",
+            "KD": "0",
+            "CONTROL_PERIOD": str(period),
+            "THERMAL_MODEL": str(int(model)),
+        }
+    }
+
+
+@pytest.fixture
+def make_heater(monkeypatch):
+    monkeypatch.setattr(heaterblock, "TSENS", _FakeSensor)
+    monkeypatch.setattr(heaterblock, "PSU", _FakePSU)
+    heaters = []
+
+    def _make(period, model=False):
+        h = heaterblock.heater(_config(period, model))
+        heaters.append(h)
+        return h
+
+    yield _make
+    for h in heaters:
+        h.terminate_controller_thread()
+
+
+@pytest.mark.virtual_hw
+def test_controller_reads_sensor_at_the_control_period(make_heater):
+    h = make_heater(0.05)
+    assert h.wait_for_temperature_sample(timeout=1.0)
+    time.sleep(0.3)
+    h.terminate_controller_thread()
+
+    stats = h.get_controller_stats()
+    assert 3 <= stats["iterations"] <= 10  # not a busy loop
+    assert h._TSENS.reads == stats["iterations"]
+    assert not h.controller_is_running()
+
+
+@pytest.mark.virtual_hw
+def test_temperature_is_served_from_the_sample_cache(make_heater):
+    h = make_heater(10.0)  # controller reads once, then sleeps
+    while h.get_temperature_sample()[1] is None:
+        time.sleep(1e-3)
+    reads = h._TSENS.reads
+
+    T, t = h.get_temperature_sample()
+    for _ in range(100):
+        assert h.get_temperature(do_read=True) == T
+    assert h._TSENS.reads == reads  # no bus transactions
+    assert h._TSENS.threads == {h._controller.name}
+
+    # without the controller, the sensor is read directly:
+    h.terminate_controller_thread()
+    assert h.get_temperature(do_read=True) > T
+    assert h._TSENS.reads == reads + 1
+
+
+@pytest.mark.virtual_hw
+def test_deadline_misses_are_counted(make_heater, monkeypatch):
+    slow = _FakeSensor()
+
+    def _slow_temperature():
+        time.sleep(0.05)
+        return _FakeSensor.temperature(slow)
+
+    monkeypatch.setattr(slow, "temperature", _slow_temperature)
+    monkeypatch.setattr(heaterblock, "TSENS", lambda *args, **kwargs: slow)
+    h = make_heater(0.02)
+    time.sleep(0.3)
+    h.terminate_controller_thread()
+
+    stats = h.get_controller_stats()
+    assert stats["deadline_misses"] == stats["iterations"]
+    assert stats["max_lateness"] > 0.0
+    assert stats["iterations"] <= 7  # missed periods are skipped, not caught up
+
+
+@pytest.mark.virtual_hw
+def test_thermal_model_is_off_by_default(make_heater):
+    config = _config(0.01)
+    del config["HEATERBLOCK"]["THERMAL_MODEL"]
+    h = heaterblock.heater(config)
+    h.terminate_controller_thread()
+    assert h.get_thermal_model() is None
+    assert h.predict_stable_delay() is None
+
+
+@pytest.mark.virtual_hw
+def test_controller_uses_feedforward_from_thermal_model(make_heater):
+    h = make_heater(0.01, model=True)
+    model = h.get_thermal_model()
+    model.C, model.R, model.T_amb = 100.0, 1.0, 20.0  # as if fitted: 20 W needed to hold 40 °C
+    h.set_target_temperature(40.0, 0.5)
+    h.turn_on()
+    while not h._controller._feedforward:
+        time.sleep(1e-3)
+    n = len(h._PSU.voltages)
+    while len(h._PSU.voltages) < n + 2:
+        time.sleep(1e-3)
+    h.terminate_controller_thread()
+
+    P = h._PSU.voltages[-1] ** 2 / 10.0
+    assert P > 30.0  # PID output (~20 W with KP = 1) plus feedforward (20 W)
+    assert h.predict_stable_delay() is not None
+
+
+@pytest.mark.virtual_hw
+def test_heater_psu_is_not_used_by_two_threads_at_once(make_heater):
+    h = make_heater(0.001)
+    h.set_target_temperature(40.0, 0.5)
+    for _ in range(50):
+        h.turn_on()
+        h.turn_off()
+    h.turn_on()
+    h.terminate_controller_thread()
+
+    assert h.get_controller_stats()["iterations"] > 5
+    assert h._PSU.max_active == 1
+
+
+@pytest.mark.virtual_hw
+def test_failed_sensor_reading_is_a_skipped_sample(make_heater, monkeypatch):
+    sensor = _FakeSensor()
+    answers = [(None, "?")] * 3  # e.g. sensor bus held by another thread for too long
+
+    def _temperature():
+        if answers:
+            return answers.pop()
+        return _FakeSensor.temperature(sensor)
+
+    monkeypatch.setattr(sensor, "temperature", _temperature)
+    monkeypatch.setattr(heaterblock, "TSENS", lambda *args, **kwargs: sensor)
+    h = make_heater(0.01)
+    assert h.wait_for_temperature_sample(timeout=1.0)
+    assert h.controller_is_running()
+    h.terminate_controller_thread()
+
+    stats = h.get_controller_stats()
+    assert stats["skipped_samples"] == 3
+    assert stats["iterations"] == 3 + sensor.reads
+
+
+@pytest.mark.virtual_hw
+def test_waiting_for_stable_temperature_without_terminal_output_prints_nothing(make_heater, capsys):
+    h = make_heater(0.01)
+    h.set_target_temperature(20.3, 0.1)  # the fake sensor warms up by 0.01 K per reading
+    h.turn_on()
+    assert h.wait_for_stable_T(terminal_output=False) > 0.0
+    h.terminate_controller_thread()
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,246 @@
+import configparser
+import sys
+
+import pytest
+
+from pypsucurvetrace.job import read_job_manifest, run_job
+
+
+TESTER_CONFIG = """
+[PSU1]
+COMPORT = VIRTUAL_A
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+
+[PSU2]
+COMPORT = VIRTUAL_G
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+"""
+
+DUT_CONFIG = """
+[PSU1]
+VSTART = 0
+VEND = 20
+VSTEP = 10
+IMAX = 0.05
+PMAX = 5
+
+[PSU2]
+VSTART = 0
+VEND = 0
+IMAX = 0.01
+PMAX = 1
+
+[EXTRA]
+IDLESECS = 0
+PREHEATSECS = 0
+"""
+
+
+def _write_job(tmp_path, job, dut=DUT_CONFIG):
+    (tmp_path / "dut.txt").write_text(dut)
+    (tmp_path / "job.txt").write_text("[JOB]\nDUT_CONFIG = dut.txt\n" + job)
+    return str(tmp_path / "job.txt")
+
+
+def test_read_job_manifest_expands_step_range(tmp_path):
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\nSTEPS = 3:5\nOUTPUT_DIR = out\n"))
+    assert job["samples"] == ["DUT_3", "DUT_4", "DUT_5"]
+    assert job["OUTPUT_DIR"] == str(tmp_path / "out")
+    assert job["STATION"] is None
+
+
+def test_read_job_manifest_refuses_missing_or_existing(tmp_path):
+    with pytest.raises(ValueError, match="SAMPLE"):
+        read_job_manifest(_write_job(tmp_path, ""))
+
+    (tmp_path / "DUT_2.dat").write_text("")
+    with pytest.raises(ValueError, match="exists"):
+        read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\nSTEPS = 1:2\n"))
+
+
+@pytest.mark.parametrize("broken, message", [
+    (("IMAX = 0.05\n", ""), "IMAX"),
+    (("VSTEP = 10\n", "VSTEP = ten\n"), "ten"),
+    (("IDLESECS = 0\n", "IDLESECS = 10\n"), "VIDLE"),
+    (("PREHEATSECS = 0\n", "PREHEATSECS = -1\n"), "Pre-heat"),
+])
+def test_read_job_manifest_validates_dut_config_before_connecting(tmp_path, monkeypatch, broken, message):
+    import pypsucurvetrace.station as station_mod
+
+    def _connect(*args, **kwargs):
+        raise AssertionError("PSU connected while reading the job manifest")
+
+    monkeypatch.setattr(station_mod, "connect_PSU", _connect)
+    dut = DUT_CONFIG.replace(*broken, 1)
+    with pytest.raises(ValueError, match=message) as e:
+        read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\n", dut))
+    assert "dut.txt" in str(e.value)
+
+
+@pytest.mark.virtual_hw
+def test_run_job_runs_all_steps_with_fixture_command(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fixture = sys.executable + " -c \"open('{sample}.fixture', 'w')\""
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\nSTEPS = 1:2\nOUTPUT_DIR = out\nFIXTURE_COMMAND = " + fixture + "\n"))
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG)
+
+    assert run_job(config, job) == 0
+    for k in [1, 2]:
+        data = (tmp_path / "out" / ("DUT_%d.dat" % k)).read_text().splitlines()
+        assert len([l for l in data if not l.startswith("%")]) == 3
+        assert "%% * Sample: DUT_%d" % k in data
+        assert (tmp_path / ("DUT_%d.fixture" % k)).exists()
+
+
+@pytest.mark.virtual_hw
+def test_failed_test_turns_psus_off_before_next_fixture_command(tmp_path, monkeypatch):
+    import pypsucurvetrace.job as job_mod
+    import pypsucurvetrace.station as station_mod
+
+    stations = []
+
+    def _failing_run_test(PSU1, PSU2, *args, **kwargs):
+        stations.append((PSU1, PSU2))
+        for p in [PSU1, PSU2]:
+            p.setVoltage(5.0, False)
+            p.setCurrent(0.01, False)
+            p.turnOn()
+        raise RuntimeError("serial dropout")
+
+    outputs = []
+
+    def _fixture(cmd):
+        # state of the PSU outputs when the fixture handler swaps the DUT:
+        if stations:
+            outputs.append([u._out for p in stations[-1] for u in p._PSU])
+        return type("done", (), {"returncode": 0})()
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(station_mod, "run_test", _failing_run_test)
+    monkeypatch.setattr(job_mod.subprocess, "run", _fixture)
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\nSTEPS = 1:2\nFIXTURE_COMMAND = swap {sample}\n"))
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG)
+
+    assert run_job(config, job) == 2
+    assert outputs == [[False, False]]
+    PSU1, PSU2 = stations[-1]
+    assert [u._vset for p in [PSU1, PSU2] for u in p._PSU] == [0.0, 0.0]
+
+
+@pytest.mark.virtual_hw
+def test_pulsed_points_go_from_idle_to_test_conditions_and_back(tmp_path, monkeypatch):
+    import pypsucurvetrace.clock as clock_mod
+    import pypsucurvetrace.powersupply as ps_mod
+    from pypsucurvetrace.clock import virtual_clock
+
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock(tick=0.0))
+    events = []
+    setVoltage = ps_mod.PSU.setVoltage
+
+    def _setVoltage(self, value, wait_stable):
+        t = clock_mod.time()
+        setVoltage(self, value, wait_stable)
+        events.append((self.LABEL, float(value), wait_stable, t, clock_mod.time()))
+
+    monkeypatch.setattr(ps_mod.PSU, "setVoltage", _setVoltage)
+    dut = DUT_CONFIG.replace("PMAX = 5\n", "PMAX = 5\nVIDLE = 5\nIIDLE = 0.01\n")
+    dut = dut.replace("VEND = 0\n", "VEND = 2\nVSTEP = 1\nVIDLE = 0.5\nIIDLE = 0.01\n")
+    dut = dut.replace("PREHEATSECS = 0\n", "PREHEATSECS = 0\nPULSED = 1\n")
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\n", dut))
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG)
+
+    assert run_job(config, job) == 0
+
+    data = [l.split() for l in (tmp_path / "DUT.dat").read_text().splitlines() if not l.startswith("%")]
+    assert len(data) == 9
+
+    # outputs on at VMIN, then idle conditions before the first pulse:
+    events = [e for e in events if e[:3] != ("PSU1", 0.0, False) and e[:3] != ("PSU2", 0.0, False)]
+    assert [e[:3] for e in events[:2]] == [("PSU1", 5.0, True), ("PSU2", 0.5, True)]
+    pulses = events[2:]
+    assert len(pulses) == 4 * len(data)
+    for k, line in enumerate(data):
+        start, test, idle1, idle2 = pulses[4*k:4*k+4]
+        V1, V2 = float(line[0]), float(line[5])
+        assert [e[:3] for e in (start, test, idle1, idle2)] == [
+            ("PSU2", V2, True), ("PSU1", V1, True), ("PSU1", 5.0, False), ("PSU2", 0.5, False),
+        ]
+        # column 12: from the first test setpoint until the return to idle, including the settle times of both PSUs:
+        assert float(line[11]) == pytest.approx(idle1[3] - start[3], abs=1e-3)
+        assert float(line[11]) >= (start[4] - start[3]) + (test[4] - test[3]) - 1e-3 > 0.0
+
+
+@pytest.mark.virtual_hw
+@pytest.mark.parametrize("limit_predict", [None, 0.1])
+def test_adaptive_steps_locate_the_limit_onset_with_few_points(tmp_path, monkeypatch, limit_predict):
+    import pypsucurvetrace.clock as clock_mod
+    from pypsucurvetrace.clock import virtual_clock
+
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock())
+    monkeypatch.chdir(tmp_path)
+    dut = DUT_CONFIG.replace("VEND = 20\nVSTEP = 10\nIMAX = 0.05\n", "VEND = 20\nVSTEP = 0.5\nVSTEP_MAX = 4\nIMAX = 0.047\n")
+    if limit_predict is not None:
+        dut = dut.replace("PREHEATSECS = 0\n", "PREHEATSECS = 0\nLIMIT_PREDICT = %g\n" % limit_predict)
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\n", dut))
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG + "\n[VIRTUAL_DUT]\nMODEL = RESISTOR\nR1 = 200\n")
+
+    assert run_job(config, job) == 0
+
+    data = [[float(x) for x in l.split()[:10]] for l in (tmp_path / "DUT.dat").read_text().splitlines() if not l.startswith("%")]
+    V1 = [u[0] for u in data]
+    assert V1 == sorted(V1)
+    ok = [u for u in data if u[4] == 0]
+    limited = [u for u in data if u[4] == 1]
+
+    # 200 Ohm at 0.047 A: limit onset at 9.4 V
+    assert all(u[3] == pytest.approx(u[0] / 200, abs=1e-3) and u[0] < 9.4 for u in ok)
+    assert all(u[0] > 9.4 for u in limited)
+    # far fewer points than the fixed steps up to the limit (19):
+    assert len(data) <= 8
+    if limit_predict is None:
+        # the onset is located to one fine step:
+        assert limited and min(u[0] for u in limited) - max(u[0] for u in ok) == pytest.approx(0.5)
+    else:
+        # no point is set where the predicted current plus the margin exceeds the limit, the curve ends one fine step before that:
+        assert not limited
+        assert max(V1) / 200 * (1 + limit_predict) <= 0.047 < (max(V1) + 0.5) / 200 * (1 + limit_predict)
+
+
+@pytest.mark.virtual_hw
+@pytest.mark.parametrize("serpentine", [0, 1])
+def test_limit_prediction_does_not_set_the_predicted_over_limit_step(tmp_path, monkeypatch, serpentine):
+    import pypsucurvetrace.clock as clock_mod
+    import pypsucurvetrace.powersupply as ps_mod
+    from pypsucurvetrace.clock import virtual_clock
+
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock())
+    setpoints = []
+    setVoltage = ps_mod.PSU.setVoltage
+
+    def _setVoltage(self, value, wait_stable):
+        if self.LABEL == "PSU1":
+            setpoints.append(float(value))
+        setVoltage(self, value, wait_stable)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ps_mod.PSU, "setVoltage", _setVoltage)
+    dut = DUT_CONFIG.replace("VSTEP = 10\nIMAX = 0.05\n", "VSTEP = 1\nIMAX = 0.047\n")
+    dut = dut.replace("VEND = 0\n", "VEND = 2\nVSTEP = 1\n")
+    dut = dut.replace("PREHEATSECS = 0\n", "PREHEATSECS = 0\nLIMIT_PREDICT = 0.1\nSERPENTINE = %d\n" % serpentine)
+    job = read_job_manifest(_write_job(tmp_path, "SAMPLE = DUT\n", dut))
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG + "\n[VIRTUAL_DUT]\nMODEL = RESISTOR\nR1 = 200\n")
+
+    assert run_job(config, job) == 0
+
+    # 200 Ohm at 0.047 A with 10% margin: the steps above 8.545 V are not set at all
+    assert max(setpoints) == 8.0
+    data = [l.split() for l in (tmp_path / "DUT.dat").read_text().splitlines() if not l.startswith("%")]
+    assert len(data) == 3 * 9
+    assert all(u[4] == "0" for u in data)
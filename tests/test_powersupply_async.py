@@ -0,0 +1,147 @@
+import asyncio
+import sys
+import threading
+
+import pypsucurvetrace.clock as clock_mod
+import pypsucurvetrace.powersupply as ps_mod
+import pytest
+
+from pypsucurvetrace.clock import virtual_clock
+from pypsucurvetrace.powersupply_async import async_driver, async_PSU, read_all
+
+serial = pytest.importorskip("serial")
+if not hasattr(serial, "serial_for_url"):
+    pytest.skip("pyserial is not installed", allow_module_level=True)
+if sys.platform.startswith("win"):
+    pytest.skip("pseudo terminals are not available", allow_module_level=True)
+
+import pypsucurvetrace.powersupply_BK as bk_mod
+import pypsucurvetrace.powersupply_KORAD as korad_mod
+import pypsucurvetrace.powersupply_SALUKI as saluki_mod
+import pypsucurvetrace.powersupply_VOLTCRAFT as voltcraft_mod
+import pypsucurvetrace.psu_emulator as emu
+
+
+def _riden_mod():
+    minimalmodbus = pytest.importorskip("minimalmodbus")
+    if not hasattr(minimalmodbus, "__version__"):
+        pytest.skip("minimalmodbus is not installed")
+    import pypsucurvetrace.powersupply_RIDEN as riden_mod
+
+    return riden_mod
+
+
+class _Rendezvous:
+    # once a barrier is set, the next request is only answered when all emulators sharing the barrier have received a request
+    barrier = None
+
+    def respond(self, request):
+        barrier, self.barrier = self.barrier, None
+        if barrier is not None:
+            barrier.wait()
+        return super().respond(request)
+
+
+@pytest.fixture
+def emulator():
+    started = []
+
+    def _start(cls, **kwargs):
+        e = type("_Rendezvous" + cls.__name__, (_Rendezvous, cls), {})(**kwargs)
+        e.start()
+        started.append(e)
+        return e
+
+    yield _start
+    for e in started:
+        e.close()
+
+
+@pytest.mark.virtual_hw
+def test_async_drivers_overlap_serial_waits_without_threads(emulator):
+    riden_mod = _riden_mod()
+    drivers = [
+        (emulator(emu.KORAD_emulator, load=100.0, latency=0.02), korad_mod.KORAD, 0.01),
+        (emulator(emu.BK_emulator, load=100.0, latency=0.02), bk_mod.BK, 0.01),
+        (emulator(emu.SALUKI_emulator, load=100.0, latency=0.02), saluki_mod.SALUKI, 0.01),
+        (emulator(emu.VOLTCRAFT_emulator, load=100.0, latency=0.02), voltcraft_mod.VOLTCRAFT, 0.01),
+        (emulator(emu.RIDEN_emulator, load=10.0, latency=0.02), riden_mod.RIDEN, 0.1),
+    ]
+    psus = [async_driver(cls(e.port)) for e, cls, _ in drivers]
+
+    async def _main():
+        n_threads = threading.active_count()
+        for psu in psus:
+            await psu.voltage(1.0)
+            await psu.current(1.0)
+            await psu.output(True)
+
+        # the emulators answer only once all drivers wait for their readings at the same time:
+        barrier = threading.Barrier(len(drivers), timeout=5.0)
+        for e, _, _ in drivers:
+            e.barrier = barrier
+        readings = await asyncio.gather(*[psu.reading() for psu in psus])
+        assert threading.active_count() == n_threads
+        return readings
+
+    readings = asyncio.run(_main())
+    for (V, I, S), (_, _, I_load) in zip(readings, drivers):
+        assert S == "CV"
+        assert V == pytest.approx(1.0)
+        assert I == pytest.approx(I_load, abs=0.01)
+    # fields are forwarded to the blocking driver:
+    assert psus[0].MODEL == "KA3005P"
+    assert psus[4].MODEL == "RD6006P"
+
+    # the blocking API still works on the same drivers:
+    assert psus[0]._object.reading() == readings[0]
+
+
+@pytest.mark.virtual_hw
+def test_async_psu_reads_emulated_psus_at_the_same_time(emulator):
+    riden_mod = _riden_mod()
+    korad = emulator(emu.KORAD_emulator, load=100.0)
+    riden = emulator(emu.RIDEN_emulator, load=10.0)
+    PSU1 = async_PSU(ps_mod.PSU(port=korad.port, commandset="KORAD", label="PSU1"))
+    PSU2 = async_PSU(ps_mod.PSU(port=riden.port, commandset="RIDEN", label="PSU2"))
+    PSU1.CONFIGURED = PSU2.CONFIGURED = True
+    PSU1.NSTABLEREADINGS = PSU2.NSTABLEREADINGS = 2
+    PSU3 = async_PSU(ps_mod.PSU(port="VIRTUAL_3", commandset="VIRTUAL", label="PSU3"))  # not configured
+
+    async def _main():
+        for p, V in [(PSU1, 5.0), (PSU2, 0.5)]:
+            await p.turnOn()
+            await p.setCurrent(0.2, False)
+            await p.setVoltage(V, True)
+        korad.barrier = riden.barrier = threading.Barrier(2, timeout=5.0)
+        return await read_all([PSU1, PSU2, PSU3])
+
+    (V1, I1, L1), (V2, I2, L2), r3 = asyncio.run(_main())
+    assert (V1, L1) == (pytest.approx(5.0), "CV")
+    assert I1 == pytest.approx(0.05)
+    assert (V2, L2) == (pytest.approx(0.5), "CV")
+    assert I2 == pytest.approx(0.05)
+    assert r3 == [0.0, 0.0, "NONE"]
+
+
+@pytest.mark.virtual_hw
+def test_async_psu_reads_virtual_triode(monkeypatch):
+    c = virtual_clock(tick=0.0)
+    monkeypatch.setattr(clock_mod, "_clock", c)
+    anode = async_PSU(ps_mod.PSU(port="VIRTUAL_A", commandset="VIRTUAL", label="PSU1"))
+    grid = async_PSU(ps_mod.PSU(port="VIRTUAL_G", commandset="VIRTUAL", label="PSU2"))
+    anode.CONFIGURED = grid.CONFIGURED = True
+    anode.NSTABLEREADINGS = grid.NSTABLEREADINGS = 1
+
+    async def _main():
+        for p in [anode, grid]:
+            await p.turnOn()
+            await p.setCurrent(10.0, False)
+        await asyncio.gather(anode.setVoltage(200.0, True), grid.setVoltage(1.0, True))
+        return await read_all([anode, grid])
+
+    (va, ia, _), (vg, _, _) = asyncio.run(_main())
+    assert abs(va - 200.0) < 1e-9 and abs(vg - 1.0) < 1e-9
+    assert ia > 0.0
+    # the settling waits of the PSUs run on the virtual clock:
+    assert c.elapsed() > 0.0
@@ -1,7 +1,10 @@
+import threading
+
+import pypsucurvetrace.clock as clock_mod
 import pypsucurvetrace.powersupply as ps_mod
 import pytest
 
-from tests.virtual_drivers import VirtualPSUDriver
+from tests.virtual_drivers import BarrierPSUDriver, VirtualPSUDriver
 
 
 @pytest.mark.virtual_hw
@@ -25,7 +28,7 @@ def test_set_current_wait_unstable_does_not_crash(monkeypatch):
         read_idle_time=0.0,
     )
     monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
-    monkeypatch.setattr(ps_mod.time, "sleep", lambda *_: None)
+    monkeypatch.setattr(clock_mod, "sleep", lambda *_: None)
 
     psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
     psu.setCurrent(1.0, wait_stable=True)
@@ -44,7 +47,7 @@ def test_read_averages_consistent_measurements(monkeypatch):
         read_idle_time=0.0,
     )
     monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
-    monkeypatch.setattr(ps_mod.time, "sleep", lambda *_: None)
+    monkeypatch.setattr(clock_mod, "sleep", lambda *_: None)
 
     psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
     v, i, limit = psu.read(N=2)
@@ -74,6 +77,27 @@ def test_composite_psu_uses_longest_read_idle_time(monkeypatch):
     assert psu.READIDLETIME == 0.2
 
 
+@pytest.mark.virtual_hw
+def test_composite_psu_reads_units_in_parallel(monkeypatch):
+    barrier = threading.Barrier(2, timeout=5.0)
+    drvs = [
+        BarrierPSUDriver(barrier, read_sequence=[(10.0, 0.2, "CV")]),
+        BarrierPSUDriver(barrier, read_sequence=[(5.0, 0.4, "CC")]),
+    ]
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drvs.pop(0))
+
+    psu = ps_mod.PSU(
+        port=("VIRTUAL_A", "VIRTUAL_B"),
+        commandset=("KORAD", "KORAD"),
+        label="PSU_STACK",
+    )
+    v, i, limit = psu.read()
+
+    assert abs(v - 15.0) < 1e-9
+    assert abs(i - 0.3) < 1e-9
+    assert limit == "CC"
+
+
 @pytest.mark.virtual_hw
 def test_runtime_virtual_commandset_smoke():
     psu = ps_mod.PSU(port="VIRTUAL", commandset="VIRTUAL", label="PSU1")
@@ -127,3 +151,93 @@ def test_runtime_virtual_triode_respects_psu_polarity_mapping():
     _, ia_more_negative_grid, _ = anode.read()
 
     assert ia_more_negative_grid < ia_less_negative_grid
+
+
+@pytest.mark.virtual_hw
+def test_set_voltage_learns_shorter_settle_time(monkeypatch):
+    clock = {"t": 0.0}
+
+    def fake_sleep(dt):
+        clock["t"] += dt
+
+    monkeypatch.setattr(clock_mod, "time", lambda: clock["t"])
+    monkeypatch.setattr(clock_mod, "sleep", fake_sleep)
+
+    drv = VirtualPSUDriver(max_settle_time=2.0, read_idle_time=0.01)
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
+
+    psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
+    psu.setVoltage(0.0, wait_stable=True)
+    assert abs(psu.settletime(1.0) - 0.2) < 1e-9
+
+    # output of the virtual driver settles immediately, so the readback should be scheduled earlier and earlier:
+    for k in range(40):
+        psu.setVoltage(float(k % 2), wait_stable=True)
+    assert psu.settletime(0.0) < 0.1
+
+
+class _CountingDriver(VirtualPSUDriver):
+    # records all setpoint commands sent to the unit
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.commands = []
+
+    def output(self, state):
+        self.commands.append(("OUT", bool(state)))
+        super().output(state)
+
+    def voltage(self, value):
+        self.commands.append(("V", value))
+        super().voltage(value)
+
+    def current(self, value):
+        self.commands.append(("I", value))
+        super().current(value)
+
+
+@pytest.mark.virtual_hw
+def test_setpoint_cache_skips_unchanged_setpoints(monkeypatch):
+    drv = _CountingDriver(vres_set=0.01, ires_set=0.001)
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
+
+    psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
+    psu.turnOff()
+    psu.turnOff()
+    assert drv.commands == [("OUT", False), ("V", 0.0), ("I", 0.0), ("OUT", False)]
+
+    drv.commands.clear()
+    psu.setCurrent(0.1, wait_stable=False)
+    psu.setVoltage(5.0, wait_stable=False)
+    psu.setCurrent(0.1004, wait_stable=False)  # same setpoint after quantization
+    psu.setVoltage(5.0, wait_stable=False)
+    psu.setVoltage(5.01, wait_stable=False)
+    assert [c for c, v in drv.commands] == ["I", "V", "V"]
+    assert drv._SETPOINTS.skipped == 4
+
+    # switching the output or explicit invalidation makes the next setpoints go to the unit again:
+    drv.commands.clear()
+    psu.turnOn()
+    psu.setVoltage(5.01, wait_stable=False)
+    psu.invalidate_setpoints()
+    psu.setCurrent(0.1, wait_stable=False)
+    assert [c for c, v in drv.commands] == ["OUT", "V", "I"]
+
+
+@pytest.mark.virtual_hw
+def test_setpoint_cache_resends_after_failed_command(monkeypatch):
+    drv = _CountingDriver()
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
+    psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
+    psu.setVoltage(1.0, wait_stable=False)
+
+    def _fail(value):
+        raise RuntimeError("no answer")
+
+    drv.voltage = _fail
+    with pytest.raises(RuntimeError):
+        psu.setVoltage(2.0, wait_stable=False)
+    del drv.voltage
+
+    drv.commands.clear()
+    psu.setVoltage(1.0, wait_stable=False)
+    assert drv.commands == [("V", 1.0)]
@@ -0,0 +1,262 @@
+import sys
+import threading
+import time
+
+import pytest
+
+serial = pytest.importorskip("serial")
+if not hasattr(serial, "serial_for_url"):
+    pytest.skip("pyserial is not installed", allow_module_level=True)
+if sys.platform.startswith("win"):
+    pytest.skip("pseudo terminals are not available", allow_module_level=True)
+
+import pypsucurvetrace.powersupply_BK as bk_mod
+import pypsucurvetrace.powersupply_KORAD as korad_mod
+import pypsucurvetrace.powersupply_SALUKI as saluki_mod
+import pypsucurvetrace.powersupply_VOLTCRAFT as voltcraft_mod
+import pypsucurvetrace.psu_emulator as emu
+
+
+@pytest.fixture
+def emulator():
+    started = []
+
+    def _start(cls, **kwargs):
+        e = cls(**kwargs)
+        e.start()
+        started.append(e)
+        return e
+
+    yield _start
+    for e in started:
+        e.close()
+
+
+def _set_and_read(psu, V, I):
+    psu.voltage(V)
+    psu.current(I)
+    psu.output(True)
+    return psu.reading()
+
+
+@pytest.mark.virtual_hw
+def test_korad_driver_reads_cv_and_cc_at_emulated_load(emulator):
+    e = emulator(emu.KORAD_emulator, load=100.0)
+    psu = korad_mod.KORAD(e.port)
+    assert psu.MODEL == "KA3005P"
+
+    assert _set_and_read(psu, 5.0, 1.0) == (5.0, 0.05, "CV")
+    V, I, S = _set_and_read(psu, 5.0, 0.02)
+    assert S == "CC"
+    assert I == pytest.approx(0.02)
+    assert V == pytest.approx(2.0)
+    psu._Serial.close()
+
+
+class _NoCurrentAnswerOnce(emu.KORAD_emulator):
+    # ignores the first current query
+    def respond(self, request):
+        if request.startswith(b"IOUT") and not getattr(self, "ignored", False):
+            self.ignored = True
+            return None
+        return super().respond(request)
+
+
+@pytest.mark.virtual_hw
+def test_korad_driver_resyncs_after_missing_answer(emulator):
+    e = emulator(_NoCurrentAnswerOnce, load=100.0)
+    psu = korad_mod.KORAD(e.port)
+    psu._Serial.timeout = 0.2
+
+    psu.voltage(5.0)
+    psu.current(1.0)
+    psu.output(True)
+    assert psu._healthy
+    # pipelined queries miss the current answer, then the single queries after the resync succeed:
+    assert psu.reading() == (5.0, 0.05, "CV")
+    assert e.ignored
+    assert psu._healthy
+    assert psu.reading() == (5.0, 0.05, "CV")
+    psu._Serial.close()
+
+
+@pytest.mark.virtual_hw
+@pytest.mark.parametrize(
+    "emulator_cls, driver",
+    [
+        (emu.BK_emulator, bk_mod.BK),
+        (emu.SALUKI_emulator, saluki_mod.SALUKI),
+        (emu.VOLTCRAFT_emulator, voltcraft_mod.VOLTCRAFT),
+    ],
+)
+def test_serial_drivers_read_emulated_load(emulator, emulator_cls, driver):
+    e = emulator(emulator_cls, load=50.0)
+    psu = driver(e.port)
+    V, I, S = _set_and_read(psu, 10.0, 1.0)
+    assert V == pytest.approx(10.0)
+    assert I == pytest.approx(0.2)
+    assert S == "CV"
+    psu._Serial.close()
+
+
+@pytest.mark.virtual_hw
+def test_riden_driver_reads_emulated_load(emulator):
+    minimalmodbus = pytest.importorskip("minimalmodbus")
+    if not hasattr(minimalmodbus, "__version__"):
+        pytest.skip("minimalmodbus is not installed")
+    import pypsucurvetrace.powersupply_RIDEN as riden_mod
+
+    e = emulator(emu.RIDEN_emulator, load=10.0)
+    psu = riden_mod.RIDEN(e.port)
+    assert psu.MODEL == "RD6006P"
+    assert e.requests == 11  # model ID, block writes of the OVP/OCP registers of the 10 presets
+    assert [e.registers[r] for r in (82, 83, 118, 119)] == [61000] * 4
+    assert 80 not in e.registers and 81 not in e.registers  # V and I presets are left alone
+
+    e.requests = 0
+    V, I, S = _set_and_read(psu, 1.0, 0.05)
+    assert S == "CC"
+    assert I == pytest.approx(0.05)
+    assert V == pytest.approx(0.5)
+    assert e.requests == 4  # voltage, current, output, reading
+
+    # unchanged setpoints are not sent again (unless the output was switched):
+    e.requests = 0
+    psu.current(0.05)
+    psu.current(0.05)
+    assert e.requests == 1
+    psu._instrument.serial.close()
+
+
+@pytest.mark.virtual_hw
+def test_riden_setpoints_are_sent_after_invalidation(emulator):
+    minimalmodbus = pytest.importorskip("minimalmodbus")
+    if not hasattr(minimalmodbus, "__version__"):
+        pytest.skip("minimalmodbus is not installed")
+    import pypsucurvetrace.powersupply as ps_mod
+
+    e = emulator(emu.RIDEN_emulator, load=10.0)
+    psu = ps_mod.PSU(port=e.port, commandset="RIDEN", label="PSU1")
+    psu.setVoltage(1.0, wait_stable=False)
+    psu.setCurrent(0.05, wait_stable=False)
+
+    # setpoint changed at the PSU front panel:
+    e.registers[8] = 2000
+    e.vset = 2.0
+    e.requests = 0
+    psu.setVoltage(1.0, wait_stable=False)
+    assert e.requests == 0
+
+    psu.invalidate_setpoints()
+    psu.setVoltage(1.0, wait_stable=False)
+    assert e.requests == 1
+    assert e.vset == pytest.approx(1.0)
+    psu._PSU[0]._instrument.serial.close()
+
+
+@pytest.mark.virtual_hw
+def test_emulator_latency_noise_and_dropped_bytes(emulator):
+    e = emulator(emu.KORAD_emulator, latency=0.05, noise=0.01, drop=1.0, seed=1)
+    port = serial.serial_for_url(e.port, timeout=0.2)
+    port.write(b"*IDN?\n")
+    assert port.readline() == b""
+    assert e.requests == 1
+    assert e.dropped > 0
+
+    e.drop = 0.0
+    e.vset, e.iset, e.on = 10.0, 1.0, True
+    readings = set()
+    for k in range(5):
+        port.write(b"VOUT1?\n")
+        readings.add(float(port.readline()))
+    assert len(readings) > 1
+    assert all(abs(V - 10.0) < 0.5 for V in readings)
+    port.close()
+
+
+@pytest.mark.virtual_hw
+def test_bk_driver_reads_with_one_compound_query(emulator):
+    e = emulator(emu.BK_emulator, load=50.0)
+    psu = bk_mod.BK(e.port)
+    _set_and_read(psu, 10.0, 0.1)
+    assert psu._scpi.compound
+
+    e.requests = 0
+    assert psu.reading() == (5.0, 0.1, "CC")
+    assert e.requests == 1
+
+    # status is only cleared if the PSU reports an error:
+    e.stb = 4
+    psu.reading()
+    assert e.requests == 3
+    assert e.stb == 0
+    psu._Serial.close()
+
+
+class _NoCompoundSALUKI(emu.SALUKI_emulator):
+    # ignores lines with several commands
+    def respond(self, request):
+        if b";" in request:
+            return None
+        return super().respond(request)
+
+
+@pytest.mark.virtual_hw
+def test_saluki_driver_falls_back_to_single_queries(emulator):
+    e = emulator(_NoCompoundSALUKI, load=50.0)
+    psu = saluki_mod.SALUKI(e.port)
+    psu._Serial.timeout = 0.2
+    _set_and_read(psu, 10.0, 1.0)
+    assert psu._scpi.compound is False
+
+    e.requests = 0
+    assert psu.reading() == (10.0, 0.2, "CV")
+    assert e.requests == 3  # *CLS and two queries
+    psu._Serial.close()
+
+
+class _NoReadingAnswerOnce(emu.VOLTCRAFT_emulator):
+    # ignores the first GETD query
+    def respond(self, request):
+        if request == b"GETD" and not getattr(self, "ignored", False):
+            self.ignored = True
+            return None
+        return super().respond(request)
+
+
+@pytest.mark.virtual_hw
+def test_voltcraft_driver_retries_and_counts_queries(emulator):
+    e = emulator(_NoReadingAnswerOnce, load=50.0)
+    psu = voltcraft_mod.VOLTCRAFT(e.port)
+    psu._Serial.timeout = 0.2
+
+    assert _set_and_read(psu, 10.0, 1.0) == (10.0, 0.2, "CV")
+    assert psu.stats["queries"] == 5  # GMAX, VOLT, CURR, SOUT, GETD
+    assert psu.stats["retries"] == 1
+    assert 0.0 < psu.stats["max_time"] <= psu.stats["time"] < 0.2
+    psu._Serial.close()
+
+
+@pytest.mark.virtual_hw
+def test_voltcraft_driver_gives_up_if_port_is_held(emulator, monkeypatch):
+    e = emulator(emu.VOLTCRAFT_emulator, load=50.0)
+    psu = voltcraft_mod.VOLTCRAFT(e.port)
+    monkeypatch.setattr(voltcraft_mod, "PPS_LOCK_TIMEOUT", 0.05)
+
+    held, done = threading.Event(), threading.Event()
+
+    def _owner():
+        with psu._bus:
+            held.set()
+            done.wait(5.0)
+
+    t = threading.Thread(target=_owner)
+    t.start()
+    held.wait(5.0)
+    with pytest.raises(RuntimeError, match="timeout"):
+        psu.reading()
+    done.set()
+    t.join()
+    assert psu._bus.stats["timeouts"] == 1
+    assert psu.reading() == (0.0, 0.0, "CV")
+    psu._Serial.close()
@@ -0,0 +1,224 @@
+import configparser
+import threading
+
+import pytest
+
+import pypsucurvetrace.station as station_mod
+from pypsucurvetrace.station import station_config, run_stations
+
+
+TESTER_CONFIG = """
+[A:PSU1]
+COMPORT = VIRTUAL_A
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+
+[A:PSU2]
+COMPORT = VIRTUAL_G
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+
+[B:PSU1]
+COMPORT = VIRTUAL_B
+TYPE = VIRTUAL
+"""
+
+DUT_CONFIG = """
+[PSU1]
+VSTART = 0
+VEND = 20
+VSTEP = 10
+IMAX = 0.05
+PMAX = 5
+
+[PSU2]
+VSTART = 0
+VEND = 2
+VSTEP = 2
+IMAX = 0.01
+PMAX = 1
+POLARITY = -1
+
+[EXTRA]
+IDLESECS = 0
+PREHEATSECS = 0
+"""
+
+
+def _tester_config():
+    config = configparser.ConfigParser()
+    config.read_string(TESTER_CONFIG)
+    return config
+
+
+def test_station_config_maps_station_sections():
+    config = station_config(_tester_config(), "A")
+    assert config.has_section("PSU1") and config.has_section("PSU2")
+    assert not config.has_section("HEATERBLOCK")
+    assert config["PSU2"]["COMPORT"] == "VIRTUAL_G"
+
+    with pytest.raises(ValueError):
+        station_config(_tester_config(), "C")
+
+
+@pytest.mark.virtual_hw
+def test_run_stations_writes_one_data_file_per_station(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dut.txt").write_text(DUT_CONFIG)
+
+    stations = run_stations(_tester_config(), [("A", "dut.txt", "S1")], interval=0.01)
+
+    assert stations[0].error is None
+    data = [l for l in (tmp_path / "S1.dat").read_text().splitlines() if not l.startswith("%")]
+    assert len(data) == 3 * 2
+    assert not (tmp_path / "S1.journal").exists()
+
+
+@pytest.mark.virtual_hw
+def test_keyboard_interrupt_stops_stations_before_closing_them(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dut.txt").write_text(DUT_CONFIG)
+
+    first_point = threading.Event()
+    progress = station_mod.station._progress
+
+    def _progress(self, N_done, N_total):
+        # hold the station at the first data point until it is asked to stop:
+        first_point.set()
+        self._stop.wait(5.0)
+        progress(self, N_done, N_total)
+
+    def _interrupt(self):
+        # Ctrl-C while the main thread updates the progress display:
+        first_point.wait(5.0)
+        raise KeyboardInterrupt
+
+    closed_while_running = []
+    close = station_mod.station.close
+
+    def _close(self):
+        if threading.current_thread() is threading.main_thread():
+            closed_while_running.append(any(t.name == self.name for t in threading.enumerate()))
+        close(self)
+
+    monkeypatch.setattr(station_mod.station, "_progress", _progress)
+    monkeypatch.setattr(station_mod.station, "close", _close)
+    monkeypatch.setattr(station_mod.station, "progress_text", _interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        run_stations(_tester_config(), [("A", "dut.txt", "S1")], interval=0.01)
+
+    assert closed_while_running == [False]
+    data = [l for l in (tmp_path / "S1.dat").read_text().splitlines() if not l.startswith("%")]
+    assert len(data) == 1
+    assert (tmp_path / "S1.journal").exists()  # the test can be resumed
+
+
+@pytest.mark.virtual_hw
+def test_run_stations_refuses_missing_parameters(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dut.txt").write_text(DUT_CONFIG.replace("VEND = 20\n", ""))
+
+    with pytest.raises(ValueError, match="VEND"):
+        run_stations(_tester_config(), [("A", "dut.txt", "S1")])
+    assert not (tmp_path / "S1.dat").exists()
+
+
+MOSFET_TESTER_CONFIG = """
+[PSU1]
+COMPORT = VIRTUAL_A
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+
+[PSU2]
+COMPORT = VIRTUAL_G
+TYPE = VIRTUAL
+NUMSTABLEREAD = 1
+
+[VIRTUAL_DUT]
+model = mosfet
+"""
+
+MOSFET_DUT_CONFIG = """
+[PSU1]
+VSTART = 0
+VEND = 20
+VSTEP = 1
+IMAX = 2
+PMAX = 10
+
+[PSU2]
+VSTART = 4
+VEND = 8
+VSTEP = 0.5
+IMAX = 0.01
+PMAX = 1
+
+[EXTRA]
+IDLESECS = 0
+PREHEATSECS = 0
+SERPENTINE = %d
+"""
+
+
+def _run_mosfet(tmp_path, monkeypatch, serpentine, samplename):
+    import pypsucurvetrace.clock as clock_mod
+    import pypsucurvetrace.ctrace as ctrace_mod
+    from pypsucurvetrace.clock import virtual_clock
+    from pypsucurvetrace.station import station
+
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock())
+    points = []
+    measure_point = getattr(ctrace_mod.measure_point, "original", ctrace_mod.measure_point)
+
+    def _measure_point(PSU1, PSU2, HEATER, reader, V1, V2, *args, **kwargs):
+        u, is_limited = measure_point(PSU1, PSU2, HEATER, reader, V1, V2, *args, **kwargs)
+        points.append((V2, V1, is_limited))
+        return u, is_limited
+
+    _measure_point.original = measure_point
+    monkeypatch.setattr(ctrace_mod, "measure_point", _measure_point)
+    tester = configparser.ConfigParser()
+    tester.read_string(MOSFET_TESTER_CONFIG)
+    dut = configparser.ConfigParser()
+    dut.read_string(MOSFET_DUT_CONFIG % serpentine)
+    s = station(None, tester, dut)
+    s.connect()
+    try:
+        assert s.run(samplename, str(tmp_path))
+    finally:
+        s.close()
+    data = [l.split()[:5] for l in (tmp_path / (samplename + ".dat")).read_text().splitlines() if not l.startswith("%")]
+    return data, points
+
+
+@pytest.mark.virtual_hw
+def test_serpentine_sweep_does_not_drive_extra_points_into_the_limiter(tmp_path, monkeypatch):
+    data, points = _run_mosfet(tmp_path, monkeypatch, 0, "plain")
+    data_s, points_s = _run_mosfet(tmp_path, monkeypatch, 1, "serpentine")
+
+    assert data_s == data
+    N_down = 4  # downward curves running into the limiter
+    assert len(points_s) <= len(points) + 2 * N_down
+    assert sum(p[2] for p in points_s) <= sum(p[2] for p in points) + 2 * N_down
+
+
+@pytest.mark.virtual_hw
+def test_resumed_serpentine_sweep_keeps_sweep_direction(tmp_path, monkeypatch):
+    import pypsucurvetrace.station as station_mod
+    from pypsucurvetrace.sweep import sweep_journal
+
+    class _ResumedJournal(sweep_journal):
+        # first curve was completed before the run was interrupted:
+        def curve_done(self, j2):
+            return j2 == 0 or sweep_journal.curve_done(self, j2)
+
+        def point_done(self, j2, j1):
+            return j2 == 0 or sweep_journal.point_done(self, j2, j1)
+
+    monkeypatch.setattr(station_mod, "sweep_journal", _ResumedJournal)
+    data, points = _run_mosfet(tmp_path, monkeypatch, 1, "resumed")
+
+    # second curve (V2 = 4.5 V) is swept downwards, as in the uninterrupted run:
+    assert points[0][0] == 4.5
+    assert points[0][1] == 20.0
@@ -0,0 +1,201 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pypsucurvetrace.sweep import (
+    coarse_indices,
+    refine_indices,
+    upward_sweep_length,
+    limit_predictor,
+    sweep_journal,
+    compile_sweep_plan,
+    estimate_duration,
+)
+
+
+def test_coarse_indices_include_last_point():
+    assert coarse_indices(10, 4) == [0, 4, 8, 9]
+    assert coarse_indices(9, 4) == [0, 4, 8]
+    assert coarse_indices(1, 4) == [0]
+
+
+def test_refine_indices_skips_linear_segments():
+    idx = [0, 4, 8, 12]
+    current = [0.0, 1.0, 2.0, 3.0]
+    assert refine_indices(idx, current, [False] * 4, I_tol=0.01) == []
+
+
+def test_refine_indices_splits_around_kink_and_limiter_onset():
+    idx = [0, 4, 8, 12, 16]
+    current = [0.0, 0.0, 0.0, 2.0, 2.5]
+    limited = [False, False, False, False, True]
+    new_idx = refine_indices(idx, current, limited, I_tol=0.1)
+    # kink at index 8 refines both neighbouring intervals, limiter onset refines the last interval:
+    assert new_idx == [6, 10, 14]
+
+
+def test_upward_sweep_length_stops_at_consecutive_limited_points():
+    assert upward_sweep_length([False, False, False], 2) == 3
+    # single limited point is recorded, the sweep stops at the second one in a row:
+    assert upward_sweep_length([False, True, False, True, True, True], 2) == 4
+    assert upward_sweep_length([True, True], 2) == 1
+
+
+def test_limit_predictor_uses_lower_of_line_and_previous_curve():
+    pred = limit_predictor()
+    assert pred.predict(1.0) is None
+
+    # previous curve: quadratic
+    for V in [0.0, 1.0, 2.0, 3.0, 4.0]:
+        pred.add(V, V**2, False)
+    pred.new_curve()
+
+    # current curve: linear so far, limited points are ignored
+    pred.add(0.0, 0.0, False)
+    pred.add(1.0, 1.0, False)
+    pred.add(2.0, 2.0, False)
+    pred.add(3.0, 5.0, True)
+
+    # line: 3.0, previous curve shape: 2.0 + (9 - 4) = 7.0
+    assert pred.predict(3.0) == 3.0
+    # beyond the previous curve its shape is extrapolated (2.0 + 23 - 4), the line is lower:
+    assert pred.predict(5.0) == 5.0
+    assert pred.predict(6.0) == 6.0
+
+
+def test_limit_predictor_interpolates_between_points_measured_out_of_order():
+    pred = limit_predictor()
+    # coarse points of an adaptive sweep, then a refinement point:
+    for V, I in [(0.0, 0.0), (4.0, 4.0), (8.0, 12.0), (12.0, 20.0)]:
+        pred.add(V, I, False)
+    pred.add(6.0, 7.0, False)
+
+    # neighbours on both sides (not the last two points measured):
+    assert pred.predict(5.0) == pytest.approx(5.5)
+    assert pred.predict(10.0) == pytest.approx(16.0)
+    # beyond the measured points: the two highest points
+    assert pred.predict(14.0) == pytest.approx(24.0)
+
+
+def test_limit_predictor_extrapolates_previous_curve_from_single_point():
+    pred = limit_predictor()
+    for V in [0.0, 1.0, 2.0]:
+        pred.add(V, 2 * V, False)
+    pred.new_curve()
+
+    # first point of a downward sweep at the end of the previous curve, then one step beyond it:
+    pred.add(2.0, 5.0, False)
+    assert pred.predict(3.0) == pytest.approx(7.0)
+
+
+def test_sweep_journal_resume_skips_recorded_points(tmp_path):
+    plan = {"V1": [0.0, 1.0, 2.0], "V2": [0.0, -1.0], "NREP": 1}
+    fn = str(tmp_path / "DUT.journal")
+
+    journal = sweep_journal(fn, plan)
+    journal.add_point(0, 0)
+    journal.add_point(0, 1)
+    journal.add_point(0, 2)
+    journal.add_curve(0)
+    journal.add_point(1, 0)
+    journal.close()
+
+    journal = sweep_journal(fn, plan, resume=True)
+    assert journal.curve_done(0)
+    assert not journal.curve_done(1)
+    assert journal.point_done(1, 0)
+    assert not journal.point_done(1, 1)
+    journal.close(remove=True)
+    assert not (tmp_path / "DUT.journal").exists()
+
+
+def test_sweep_journal_resume_rejects_different_plan(tmp_path):
+    fn = str(tmp_path / "DUT.journal")
+    sweep_journal(fn, {"V1": [0.0, 1.0], "V2": [0.0]}).close()
+
+    with pytest.raises(RuntimeError):
+        sweep_journal(fn, {"V1": [0.0, 2.0], "V2": [0.0]}, resume=True)
+
+
+def _test_psu(configured=True, **kwargs):
+    p = SimpleNamespace(
+        CONFIGURED=configured,
+        VRESSET=0.01,
+        PMAX=100.0,
+        TEST_VSTART=0.0,
+        TEST_VEND=0.0,
+        TEST_VSTEP=0.0,
+        TEST_ILIMIT=1.0,
+        TEST_PLIMIT=10.0,
+        SETTIME=0.05,
+        READTIME=0.1,
+        READIDLETIME=0.02,
+        NSTABLEREADINGS=1,
+        settletime=lambda value=None: 0.2,
+    )
+    for k, v in kwargs.items():
+        setattr(p, k, v)
+    return p
+
+
+def test_compile_sweep_plan_uses_integer_voltage_grid():
+    psu1 = _test_psu(TEST_VSTART=0.0, TEST_VEND=0.3, TEST_VSTEP=0.1)
+    psu2 = _test_psu(TEST_VSTART=0.0, TEST_VEND=-2.0, TEST_VSTEP=1.0)
+    plan = compile_sweep_plan(psu1, psu2, T_idle=1.5, T_preheat=60.0)
+
+    assert len(plan) == 4 * 3
+    assert list(plan["n1"][:4]) == [0, 10, 20, 30]
+    assert list(plan["n2"][::4]) == [0, -100, -200]
+    # V1 is the inner loop, values are exact multiples of VRESSET:
+    assert plan["V1"][3] == 30 * 0.01
+    assert list(plan["j2"][:5]) == [0, 0, 0, 0, 1]
+    # power limit applies at 0.3 V only if I*V > PLIMIT:
+    assert plan["I1LIM"][3] == 1.0
+    assert plan["preheat"][0] == 60.0 and plan["preheat"][1:].sum() == 0.0
+    assert all(plan["idle"] == 1.5)
+
+
+def test_estimate_duration_counts_settle_read_idle_and_preheat():
+    psu1 = _test_psu(TEST_VSTART=0.0, TEST_VEND=1.0, TEST_VSTEP=1.0)
+    psu2 = _test_psu(configured=False)
+    plan = compile_sweep_plan(psu1, psu2, T_idle=0.0, T_preheat=10.0)
+
+    # per point: 2 set commands + settle + verify reading + measurement reading
+    t_point = 2 * 0.05 + 0.2 + 0.1 + 0.1
+    assert estimate_duration(plan, psu1, psu2, N_rep=2) == pytest.approx(10.0 + 2 * 2 * t_point)
+
+
+def test_dry_run_compiles_plan_without_opening_any_driver(tmp_path, monkeypatch, capsys):
+    import sys
+    import pypsucurvetrace.ctrace as ctrace_mod
+    import pypsucurvetrace.powersupply_KORAD as powersupply_KORAD
+    import pypsucurvetrace.powersupply_RIDEN as powersupply_RIDEN
+
+    def _open(*args, **kwargs):
+        raise AssertionError("driver opened in dry run")
+
+    monkeypatch.setattr(powersupply_KORAD, "KORAD", _open)
+    monkeypatch.setattr(powersupply_RIDEN, "RIDEN", _open)
+    monkeypatch.setattr(ctrace_mod.heaterblock, "heater", _open)
+    monkeypatch.setattr(ctrace_mod, "connect_virtual_DUT", _open)
+
+    (tmp_path / "curvetrace_config.txt").write_text(
+        "[PSU1]\nCOMPORT = /dev/does-not-exist-1\nTYPE = KORAD\nNUMSTABLEREAD = 2\n"
+        "[PSU2]\nCOMPORT = ('/dev/does-not-exist-2', '/dev/does-not-exist-3')\nTYPE = ('RIDEN', 'RIDEN')\nNUMSTABLEREAD = 1\n"
+        "[HEATERBLOCK]\nTEMPSENSOR_COMPORT = /dev/does-not-exist-4\n"
+    )
+    (tmp_path / "dut.txt").write_text(
+        "[PSU1]\nVSTART = 0\nVEND = 10\nVSTEP = 1\nIMAX = 0.1\nPMAX = 1\nPOLARITY = 1\n"
+        "[PSU2]\nVSTART = 0\nVEND = 2\nVSTEP = 1\nIMAX = 0.01\nPMAX = 1\nPOLARITY = 1\n"
+        "[EXTRA]\nIDLESECS = 0\nPREHEATSECS = 0\n"
+    )
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["curvetrace", "--nohello", "-n", "-c", str(tmp_path / "dut.txt")])
+
+    ctrace_mod.ctrace()
+
+    out = capsys.readouterr().out
+    assert "3 curves x 11 steps = 33 points" in out
+    assert "Estimated duration: 0:00:" in out
+    assert not list(tmp_path.glob("*.dat"))
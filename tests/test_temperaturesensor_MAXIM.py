@@ -0,0 +1,57 @@
+import importlib
+import sys
+import threading
+import types
+
+import pytest
+
+
+@pytest.fixture
+def maxim(monkeypatch):
+    # 1-wire library with a bus without any devices:
+    class _Bus:
+        def __init__(self, port):
+            pass
+
+    class _AddressableDevice:
+        def __init__(self, bus):
+            pass
+
+        def get_connected_ROMs(self):
+            return None
+
+    digitemp = types.ModuleType("digitemp")
+    master = types.SimpleNamespace(UART_Adapter=_Bus)
+    device = types.SimpleNamespace(AddressableDevice=_AddressableDevice, DS18B20=object)
+    monkeypatch.setitem(sys.modules, "digitemp", digitemp)
+    monkeypatch.setitem(sys.modules, "digitemp.master", master)
+    monkeypatch.setitem(sys.modules, "digitemp.device", device)
+    monkeypatch.delitem(sys.modules, "pypsucurvetrace.temperaturesensor_MAXIM", raising=False)
+    return importlib.import_module("pypsucurvetrace.temperaturesensor_MAXIM")
+
+
+@pytest.mark.virtual_hw
+def test_sensor_without_devices_reads_nothing(maxim):
+    sensor = maxim.temperaturesensor_MAXIM("/dev/ttyUSB_nodevice")
+    assert sensor.temperature() == (None, "?")
+
+
+@pytest.mark.virtual_hw
+def test_sensor_gives_up_if_uart_is_held(maxim, monkeypatch):
+    sensor = maxim.temperaturesensor_MAXIM("/dev/ttyUSB_held")
+    monkeypatch.setattr(maxim, "UART_LOCK_TIMEOUT", 0.05)
+
+    held, done = threading.Event(), threading.Event()
+
+    def _owner():
+        with sensor._bus:
+            held.set()
+            done.wait(5.0)
+
+    t = threading.Thread(target=_owner)
+    t.start()
+    held.wait(5.0)
+    assert sensor.temperature() == (None, "?")
+    done.set()
+    t.join()
+    assert sensor._bus.stats["timeouts"] == 1
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from pypsucurvetrace.thermal_model import thermal_model
+
+
+def _simulate(model, C=200.0, R=2.0, T_amb=22.0, dt=1.0, n=300, seed=1):
+    # first-order block heated with a power step, T readings quantized like a DS18B20 (1/16 K):
+    rng = np.random.default_rng(seed)
+    T = T_amb
+    for k in range(n):
+        P = 20.0 if k < n // 2 else 5.0
+        model.add_sample(k * dt, np.round((T + rng.normal(0, 0.01)) * 16) / 16, P)
+        T += dt * (P - (T - T_amb) / R) / C
+    return T
+
+
+@pytest.mark.virtual_hw
+def test_fit_recovers_block_parameters():
+    model = thermal_model()
+    assert not model.fit()  # no samples yet
+    assert model.steady_state_power(50.0) is None
+
+    _simulate(model)
+    assert model.fit()
+    assert model.C == pytest.approx(200.0, rel=0.15)
+    assert model.R == pytest.approx(2.0, rel=0.15)
+    assert model.T_amb == pytest.approx(22.0, abs=1.0)
+    assert model.steady_state_power(42.0) == pytest.approx(10.0, rel=0.15)
+
+
+@pytest.mark.virtual_hw
+def test_fit_needs_temperature_change():
+    model = thermal_model()
+    for k in range(100):
+        model.add_sample(k, 25.0, 1.0 + k % 2)
+    assert not model.fit()
+
+
+@pytest.mark.virtual_hw
+def test_settling_time():
+    model = thermal_model()
+    model.C, model.R, model.T_amb = 100.0, 1.0, 20.0  # tau = 100 s
+
+    assert model.settling_time(40.0, 40.0, 0.5, P_min=0.0, P_max=40.0) == 0.0
+    # heating at full power towards T_inf = 60 °C:
+    dt = model.settling_time(20.0, 40.0, 0.0, P_min=0.0, P_max=40.0)
+    assert dt == pytest.approx(100.0 * np.log(2.0))
+    # cooling towards T_amb:
+    dt = model.settling_time(60.0, 40.0, 0.0, P_min=0.0, P_max=40.0)
+    assert dt == pytest.approx(100.0 * np.log(2.0))
+    # target out of reach:
+    assert model.settling_time(20.0, 80.0, 1.0, P_min=0.0, P_max=40.0) is None
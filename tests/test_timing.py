@@ -0,0 +1,87 @@
+import io
+
+import pypsucurvetrace.powersupply as ps_mod
+import pytest
+
+from pypsucurvetrace.timing import phase_timer
+from tests.virtual_drivers import VirtualPSUDriver
+
+
+def test_disabled_timer_records_nothing():
+    timer = phase_timer()
+    timer.start_point()
+    with timer.phase("read"):
+        pass
+    timer.count("PSU1 read retries")
+    timer.end_point(1.0, 2.0)
+    assert timer.totals == {} and timer.counters == {}
+
+
+def test_timer_writes_point_phases_and_summary():
+    f = io.StringIO()
+    f.close = lambda: None
+    timer = phase_timer(True, f)
+
+    timer.start_point()
+    timer.add("set PSU1", 0.25)
+    timer.add("PSU1 serial I/O", 0.1)  # not a point phase, only in the totals
+    timer.add("read", 0.5)
+    timer.end_point(10.0, -1.0)
+    timer.close()
+
+    lines = f.getvalue().splitlines()
+    data = [l for l in lines if not l.startswith("%")]
+    assert len(data) == 1
+    cols = [float(x) for x in data[0].split()]
+    assert cols[:7] == [10.0, -1.0, 0.0, 0.0, 0.0, 0.25, 0.5]
+    assert timer.calls["point"] == 1
+    assert any("PSU1 serial I/O" in l for l in lines if l.startswith("%"))
+
+
+@pytest.mark.virtual_hw
+def test_psu_counts_read_retries(monkeypatch):
+    drv = VirtualPSUDriver(
+        read_sequence=[(1.0, 0.1, "CV"), (1.5, 0.1, "CV"), (1.5, 0.1, "CV")],
+        vres_read=0.01,
+        read_idle_time=0.0,
+    )
+    monkeypatch.setattr(ps_mod.powersupply_KORAD, "KORAD", lambda *a, **k: drv)
+
+    psu = ps_mod.PSU(port="VIRTUAL", commandset="KORAD", label="PSU1")
+    psu.timer = phase_timer(True)
+    psu.read(N=2)
+
+    assert psu.timer.counters["PSU1 read retries"] == 1
+    assert psu.timer.calls["PSU1 serial I/O"] == 3
+
+
+@pytest.mark.virtual_hw
+def test_timing_file_is_closed_when_the_test_fails(tmp_path, monkeypatch):
+    import configparser
+
+    import pypsucurvetrace.ctrace as ctrace_mod
+    from pypsucurvetrace.station import station
+    from tests.test_job import DUT_CONFIG, TESTER_CONFIG
+
+    timers = []
+
+    def _failing_trace_curves(PSU1, PSU2, *args):
+        timers.append((PSU1.timer, PSU1.timer._file))
+        raise RuntimeError("serial dropout")
+
+    monkeypatch.setattr(ctrace_mod, "trace_curves", _failing_trace_curves)
+    tester = configparser.ConfigParser()
+    tester.read_string(TESTER_CONFIG)
+    dut = configparser.ConfigParser()
+    dut.read_string(DUT_CONFIG + "TIMING = 1\n")
+    s = station(None, tester, dut)
+    s.connect()
+    try:
+        assert not s.run("S", str(tmp_path))
+    finally:
+        s.close()
+
+    timer, file = timers[0]
+    assert timer.enabled and file.closed
+    assert not s.PSU1.timer.enabled and not s.PSU2.timer.enabled
+    assert (tmp_path / "S.timing").exists()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+
+import pypsucurvetrace.clock as clock_mod
+import pypsucurvetrace.powersupply_KORAD as korad_mod
+import pypsucurvetrace.transcript as transcript
+import pytest
+
+from pypsucurvetrace.clock import virtual_clock
+
+
+class _FakeKORADSerial:
+    # answers the KORAD queries of the driver, each reply takes 50 ms
+    RESPONSES = {"*IDN?": "KORAD KA3005P V5.8 SN:123", "VOUT1?": "12.34", "IOUT1?": "0.123", "STATUS?": "A"}
+
+    def __init__(self, *args, **kwargs):
+        self._cmds = []
+
+    def write(self, data):
+        self._cmds += [c for c in data.decode().split() if c.endswith("?")]
+        return len(data)
+
+    def readline(self):
+        clock_mod.sleep(0.05)
+        return (self.RESPONSES[self._cmds.pop(0)] + "\n").encode()
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    monkeypatch.setattr(transcript, "_sessions", {})
+    monkeypatch.setattr(transcript.serial, "Serial", _FakeKORADSerial, raising=False)
+    monkeypatch.setattr(clock_mod, "_clock", virtual_clock(tick=0.0))
+
+
+@pytest.mark.virtual_hw
+def test_record_and_replay_korad_session(tmp_path, sessions):
+    filename = str(tmp_path / "korad.transcript")
+
+    transcript.record("/dev/ttyKORAD", filename)
+    psu = korad_mod.KORAD("/dev/ttyKORAD")
+    psu.voltage(5.0)
+    assert psu.reading() == (12.34, 0.123, "CV")
+    psu._Serial.close()
+
+    events = [json.loads(l) for l in open(filename)]
+    assert events[0] == {"port": "/dev/ttyKORAD"}
+    writes = [bytes.fromhex(e["args"][0]["hex"]) for e in events[1:] if e["call"] == "write"]
+    assert writes == [b"*IDN?\n", b"VSET1:5.0\n", b"VOUT1?\nIOUT1?\nSTATUS?\n"]
+    assert all(e["dt"] == pytest.approx(0.05) for e in events if e.get("call") == "readline")
+
+    # replay without the PSU, with half the recorded latencies:
+    transcript.replay("/dev/ttyKORAD", filename, scale=0.5)
+    c = virtual_clock(tick=0.0)
+    clock_mod.set_clock(c)
+    t = time.monotonic()
+    psu = korad_mod.KORAD("/dev/ttyKORAD")
+    psu.voltage(5.0)
+    assert psu.reading() == (12.34, 0.123, "CV")
+    assert psu._Serial.done()
+    assert time.monotonic() - t < 1.0
+    # 4 replies of 25 ms each, plus the waits of the driver itself:
+    assert c.elapsed() == pytest.approx(4 * 0.025 + 0.2 + 2 * 0.03)
+
+
+@pytest.mark.virtual_hw
+def test_replay_refuses_commands_that_differ_from_the_transcript(tmp_path, sessions):
+    filename = str(tmp_path / "korad.transcript")
+    transcript.record("/dev/ttyKORAD", filename)
+    korad_mod.KORAD("/dev/ttyKORAD").voltage(5.0)
+
+    transcript.replay("/dev/ttyKORAD", filename)
+    psu = korad_mod.KORAD("/dev/ttyKORAD")
+    with pytest.raises(RuntimeError, match="do not match the transcript"):
+        psu.voltage(6.0)
+
+
+@pytest.mark.virtual_hw
+def test_transcript_is_replayed_in_coroutines(tmp_path, sessions):
+    from pypsucurvetrace.powersupply_async import async_driver
+
+    filename = str(tmp_path / "korad.transcript")
+    transcript.record("/dev/ttyKORAD", filename)
+    psu = korad_mod.KORAD("/dev/ttyKORAD")
+    psu.voltage(5.0)
+    psu.reading()
+
+    transcript.replay("/dev/ttyKORAD", filename)
+    c = virtual_clock(tick=0.0)
+    clock_mod.set_clock(c)
+    psu = korad_mod.KORAD("/dev/ttyKORAD")
+
+    async def _main():
+        await async_driver(psu).voltage(5.0)
+        return await async_driver(psu).reading()
+
+    assert asyncio.run(_main()) == (12.34, 0.123, "CV")
+    assert psu._Serial.done()
+    # same replies and waits as in the blocking replay:
+    assert c.elapsed() == pytest.approx(4 * 0.05 + 0.2 + 2 * 0.03)
@@ -34,6 +34,8 @@ class VirtualPSUDriver:
         self.IOFFSETMAX = ioffset_max
         self.MAXSETTLETIME = max_settle_time
         self.READIDLETIME = read_idle_time
+        self.SETTIME = 0.0
+        self.READTIME = 0.0
 
         self.COMMANDSET = "KORAD"
         self.output_enabled = False
@@ -54,3 +56,17 @@ class VirtualPSUDriver:
         if self._read_sequence:
             return self._read_sequence.pop(0)
         return (self.last_voltage, self.last_current, "CV")
+
+
+class BarrierPSUDriver(VirtualPSUDriver):
+    # reading() only returns if the other drivers sharing the barrier are read at the same time
+    def __init__(self, barrier=None, **kwargs):
+        super().__init__(**kwargs)
+        self._barrier = barrier
+        self.readings = 0
+
+    def reading(self):
+        if self._barrier is not None:
+            self._barrier.wait()
+        self.readings += 1
+        return super().reading()